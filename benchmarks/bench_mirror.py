@@ -0,0 +1,92 @@
+"""Measure the latency of data queries answered from the local mirror.
+
+A synthetic dataflow is written to a temporary mirror, and random queries of a few ref areas and
+indicators are answered from it, including the conversion to the schema of `build_df_from_json`.
+
+Usage:
+    uv run --extra mirror python benchmarks/bench_mirror.py --observations 1000000
+"""
+
+import argparse
+import json
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parents[1] / "datawarehouse_mcp"))
+
+from mirror import Mirror
+from schemas import DataQuery
+from sdmx_parser import build_df_from_json
+from structure import parse_dataflow_structure
+from synthetic import make_sdmx_json
+
+OBSERVATIONS_PER_SERIES = 20
+
+
+def main() -> int:
+    """Run the benchmark and print the results as JSON."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--observations", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--max-p95-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    payload = make_sdmx_json(args.observations // OBSERVATIONS_PER_SERIES, OBSERVATIONS_PER_SERIES)
+    json_structure = payload["data"]["structure"]
+    structure = parse_dataflow_structure("BENCH", json_structure)
+    data = build_df_from_json(payload["data"])
+    ref_areas = [code.id for code in structure.get_dimension("REF_AREA").codes]
+    indicators = [code.id for code in structure.get_dimension("INDICATOR").codes]
+    rng = random.Random(0)
+
+    with tempfile.TemporaryDirectory() as directory:
+        mirror = Mirror(Path(directory))
+        start = time.perf_counter()
+        mirror.write("BENCH", data, json_structure, "2025-01-01T00:00:00")
+        write_seconds = time.perf_counter() - start
+        size_mib = (Path(directory) / "BENCH.arrow").stat().st_size / 2**20
+
+        start = time.perf_counter()
+        mirror.read_structure("BENCH")
+        load_seconds = time.perf_counter() - start
+
+        timings: list[float] = []
+        num_rows = 0
+        for _ in range(args.queries):
+            query = DataQuery(
+                dataflow_id="BENCH",
+                ref_areas=tuple(sorted(rng.sample(ref_areas, 3))),
+                indicators=tuple(sorted(rng.sample(indicators, 2))),
+            )
+            start = time.perf_counter()
+            num_rows += len(mirror.read(query, {"startPeriod": "1975"}, structure))
+            timings.append(time.perf_counter() - start)
+
+    timings_ms = sorted(seconds * 1000 for seconds in timings)
+    p95_ms = timings_ms[int(len(timings_ms) * 0.95) - 1]
+    print(
+        json.dumps(
+            {
+                "benchmark": "mirror",
+                "observations": len(data),
+                "file_mib": round(size_mib, 1),
+                "write_seconds": round(write_seconds, 2),
+                "load_ms": round(load_seconds * 1000, 2),
+                "rows_per_query": round(num_rows / args.queries, 1),
+                "p50_ms": round(statistics.median(timings_ms), 2),
+                "p95_ms": round(p95_ms, 2),
+            }
+        )
+    )
+    if args.max_p95_ms is not None and p95_ms > args.max_p95_ms:
+        print(f"p95 latency {p95_ms:.2f} ms is above {args.max_p95_ms} ms", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
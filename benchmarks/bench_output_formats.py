@@ -0,0 +1,55 @@
+"""Compare the size and rendering time of the output formats of `get_data_for_dataflow`.
+
+Usage:
+    uv run python benchmarks/bench_output_formats.py --observations 100000
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parents[1] / "datawarehouse_mcp"))
+
+from formatters import OUTPUT_FORMATS
+from sdmx_parser import build_df_from_json
+from synthetic import make_sdmx_json
+
+OBSERVATIONS_PER_SERIES = 20
+
+
+def main() -> int:
+    """Run the benchmark and print the results as JSON."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--observations", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    payload = make_sdmx_json(args.observations // OBSERVATIONS_PER_SERIES, OBSERVATIONS_PER_SERIES)
+    data = build_df_from_json(payload["data"])
+
+    results: dict[str, dict[str, float]] = {}
+    for name, formatter in OUTPUT_FORMATS.items():
+        timings: list[float] = []
+        output = ""
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            output = formatter(data)
+            timings.append(time.perf_counter() - start)
+        results[name] = {
+            "seconds": round(min(timings), 4),
+            "size_mib": round(len(output.encode()) / 2**20, 2),
+        }
+
+    table = results["table"]
+    for result in results.values():
+        result["speedup"] = round(table["seconds"] / result["seconds"], 1)
+        result["size_reduction"] = round(table["size_mib"] / result["size_mib"], 1)
+
+    print(json.dumps({"benchmark": "output_formats", "observations": len(data), **results}))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
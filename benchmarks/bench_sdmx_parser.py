@@ -0,0 +1,125 @@
+"""Compare the columnar SDMX-JSON parser against the previous row-based implementation.
+
+Usage:
+    uv run python benchmarks/bench_sdmx_parser.py --observations 1000000 --min-speedup 5
+"""
+
+import argparse
+import json
+import sys
+import time
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parents[1] / "datawarehouse_mcp"))
+
+from sdmx_parser import build_df_from_json
+from synthetic import make_sdmx_json
+
+OBSERVATIONS_PER_SERIES = 20
+
+
+def build_df_from_json_rows(json_data: dict[str, Any]) -> pd.DataFrame:
+    """Row-based parser that `build_df_from_json` replaced, kept as the reference."""
+    data_structure = json_data["structure"]
+    dimensions = {
+        "observation": [d["id"] for d in data_structure["dimensions"]["observation"]],
+        "series": [d["id"] for d in data_structure["dimensions"]["series"]],
+    }
+    attributes = {
+        "observation": [a["id"] for a in data_structure["attributes"]["observation"]],
+        "series": [a["id"] for a in data_structure["attributes"]["series"]],
+    }
+    value_lookups = {
+        (structure_type, dimension_type): {
+            (i, val_pos): val["id"]
+            for i, component in enumerate(data_structure[structure_type][dimension_type])
+            for val_pos, val in enumerate(component["values"])
+        }
+        for structure_type in ("dimensions", "attributes")
+        for dimension_type in ("observation", "series")
+    }
+
+    def get_values(ids: list[Any], structure_type: str, dimension_type: str) -> list[str | None]:
+        lookup = value_lookups[(structure_type, dimension_type)]
+        return [lookup.get((i, id_val)) for i, id_val in enumerate(ids)]
+
+    data = json_data["dataSets"][0]["series"]
+    rows = [
+        (
+            get_values([int(x) for x in obs_dims.split(":")], "dimensions", "observation")
+            + [None] * (len(dimensions["observation"]) - len(obs_dims.split(":")))
+            + get_values([int(x) for x in series_id.split(":")], "dimensions", "series")
+            + [None] * (len(dimensions["series"]) - len(series_id.split(":")))
+            + get_values(obs_attrs[1:], "attributes", "observation")
+            + get_values(series_data["attributes"], "attributes", "series")
+            + [None] * (len(attributes["series"]) - len(series_data["attributes"]))
+            + [obs_attrs[0]]
+        )
+        for series_id, series_data in data.items()
+        if "observations" in series_data and "attributes" in series_data
+        for obs_dims, obs_attrs in series_data["observations"].items()
+    ]
+    column_names = (
+        dimensions["observation"]
+        + dimensions["series"]
+        + attributes["observation"]
+        + attributes["series"]
+        + ["OBS_VALUE"]
+    )
+    return pd.DataFrame(rows, columns=column_names)
+
+
+def best_time(func: Callable[[], pd.DataFrame], repeat: int) -> tuple[float, pd.DataFrame]:
+    """Return the best wall time of `repeat` runs and the result of the last one."""
+    timings: list[float] = []
+    result = pd.DataFrame()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main() -> int:
+    """Run the benchmark and print the results as JSON."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--observations", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--min-speedup", type=float, default=None)
+    args = parser.parse_args()
+
+    payload = make_sdmx_json(args.observations // OBSERVATIONS_PER_SERIES, OBSERVATIONS_PER_SERIES)
+    json_data = payload["data"]
+
+    rows_time, expected = best_time(lambda: build_df_from_json_rows(json_data), args.repeat)
+    columnar_time, result = best_time(lambda: build_df_from_json(json_data), args.repeat)
+
+    pd.testing.assert_frame_equal(
+        result.astype(object).where(result.notna(), None),
+        expected.astype(object).where(expected.notna(), None),
+    )
+
+    speedup = rows_time / columnar_time
+    print(
+        json.dumps(
+            {
+                "benchmark": "build_df_from_json",
+                "observations": len(result),
+                "rows_seconds": round(rows_time, 4),
+                "columnar_seconds": round(columnar_time, 4),
+                "speedup": round(speedup, 2),
+            }
+        )
+    )
+
+    if args.min_speedup is not None and speedup < args.min_speedup:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
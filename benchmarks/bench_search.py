@@ -0,0 +1,101 @@
+"""Measure the latency of indicator searches.
+
+A synthetic index of indicators with names drawn from a small vocabulary is built, and random
+queries of one to three words, some of them prefixes or with a typo, are run against it.
+
+Usage:
+    uv run python benchmarks/bench_search.py --indicators 20000
+"""
+
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parents[1] / "datawarehouse_mcp"))
+
+from schemas import IndicatorEntry
+from search import IndicatorIndex
+
+VOCABULARY = (
+    "births deaths mortality rate children under five measles vaccine coverage stunting wasting "
+    "overweight school enrolment completion primary secondary water sanitation hygiene poverty "
+    "birth registration child marriage labour violence adolescent women female male population "
+    "neonatal infant maternal anaemia breastfeeding immunisation diphtheria tetanus pertussis "
+    "polio tuberculosis malaria hiv antiretroviral treatment prevalence incidence literacy"
+)
+WORDS = VOCABULARY.split()
+
+
+def make_entries(num_indicators: int, rng: random.Random) -> list[IndicatorEntry]:
+    """Indicators spread over 50 dataflows, with names and descriptions of random words."""
+    return [
+        IndicatorEntry(
+            dataflow_id=f"DF_{i % 50}",
+            indicator=f"IND_{i}",
+            name=" ".join(rng.sample(WORDS, 5)),
+            description=" ".join(rng.sample(WORDS, 12)),
+        )
+        for i in range(num_indicators)
+    ]
+
+
+def make_query(rng: random.Random) -> str:
+    """One to three words, the first of them possibly cut or with a typo."""
+    words = rng.sample(WORDS, rng.randint(1, 3))
+    first = words[0]
+    if len(first) > 5:  # noqa: PLR2004
+        variant = rng.randrange(3)
+        if variant == 1:
+            words[0] = first[:4]
+        elif variant == 2:  # noqa: PLR2004
+            position = rng.randrange(len(first))
+            words[0] = first[:position] + first[position + 1 :]
+    return " ".join(words)
+
+
+def main() -> int:
+    """Run the benchmark and print the results as JSON."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--indicators", type=int, default=20_000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--max-p95-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    entries = make_entries(args.indicators, rng)
+    start = time.perf_counter()
+    index = IndicatorIndex(entries)
+    build_seconds = time.perf_counter() - start
+
+    timings: list[float] = []
+    for _ in range(args.queries):
+        query = make_query(rng)
+        start = time.perf_counter()
+        index.search(query)
+        timings.append(time.perf_counter() - start)
+
+    timings_ms = sorted(seconds * 1000 for seconds in timings)
+    p95_ms = timings_ms[int(len(timings_ms) * 0.95) - 1]
+    print(
+        json.dumps(
+            {
+                "benchmark": "search",
+                "indicators": len(entries),
+                "build_seconds": round(build_seconds, 2),
+                "p50_ms": round(statistics.median(timings_ms), 2),
+                "p95_ms": round(p95_ms, 2),
+            }
+        )
+    )
+    if args.max_p95_ms is not None and p95_ms > args.max_p95_ms:
+        print(f"p95 latency {p95_ms:.2f} ms is above {args.max_p95_ms} ms", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
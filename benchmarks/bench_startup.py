@@ -0,0 +1,145 @@
+"""Measure the cold start of the server: import cost per module and time to first response.
+
+Import costs come from `python -X importtime` in a fresh interpreter, best of `--repeat` runs:
+the cumulative time of every server module (including the modules it is the first to import),
+the heaviest third-party packages, and the cost of the modules the tools import on first use.
+
+Time to first response is measured as an MCP client spawning the server with the stdio
+transport, from the start of the process to the end of every step of a session: `initialize`,
+`list_tools`, `get_available_dataflows` and a first `get_data_for_dataflow`, answered by a local
+stub of the SDMX API serving the DM fixture.
+
+Usage:
+    uv run python benchmarks/bench_startup.py --repeat 5
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import TextIO
+
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+from stub_server import StubSdmxServer
+
+SERVER_DIR = Path(__file__).parents[1] / "datawarehouse_mcp"
+FIXTURE = Path(__file__).parents[1] / "tests" / "fixtures" / "dm_sdmx.json"
+STUBBED_SERVER = Path(__file__).with_name("stubbed_server.py")
+SERVER_MODULES = sorted(path.stem for path in SERVER_DIR.glob("*.py"))
+# Modules the tools import on first use, e.g. with the first data query
+FIRST_USE_MODULES = ("handlers", "formatters")
+TOP_PACKAGES = 10
+
+
+def import_times(statement: str) -> dict[str, float]:
+    """Cumulative import time in milliseconds of every module imported by `statement`."""
+    result = subprocess.run(  # noqa: S603
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=SERVER_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times: dict[str, float] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        times[name.strip()] = int(cumulative) / 1000
+    return times
+
+
+def best_import_times(statement: str, repeat: int) -> dict[str, float]:
+    """Lowest cumulative import time of every module over `repeat` runs."""
+    runs = [import_times(statement) for _ in range(repeat)]
+    return {name: round(min(run.get(name, 0.0) for run in runs), 1) for name in runs[0]}
+
+
+def bench_imports(repeat: int) -> dict[str, object]:
+    """Import cost of the server at startup and of the modules imported on first use."""
+    startup = best_import_times("import server", repeat)
+    first_use = best_import_times(f"import server, {', '.join(FIRST_USE_MODULES)}", repeat)
+    packages = {
+        name: cumulative
+        for name, cumulative in startup.items()
+        if "." not in name and name not in SERVER_MODULES
+    }
+    return {
+        "server_import_ms": startup["server"],
+        "modules_ms": {name: startup[name] for name in SERVER_MODULES if name in startup},
+        "top_packages_ms": dict(
+            sorted(packages.items(), key=lambda item: item[1], reverse=True)[:TOP_PACKAGES]
+        ),
+        "first_use_ms": {name: first_use.get(name, 0.0) for name in FIRST_USE_MODULES},
+        "pandas_loaded_at_startup": "pandas" in startup,
+    }
+
+
+async def first_responses(sdmx_url: str, errlog: TextIO) -> dict[str, float]:
+    """Seconds from spawning the server to the end of every step of a stdio session."""
+    parameters = StdioServerParameters(
+        command=sys.executable,
+        args=[str(STUBBED_SERVER), sdmx_url, "--transport", "stdio"],
+    )
+    timings: dict[str, float] = {}
+    start = time.perf_counter()
+    async with (
+        stdio_client(parameters, errlog=errlog) as streams,
+        ClientSession(*streams) as session,
+    ):
+        await session.initialize()
+        timings["initialize"] = time.perf_counter() - start
+        await session.list_tools()
+        timings["list_tools"] = time.perf_counter() - start
+        await session.call_tool("get_available_dataflows", {})
+        timings["get_available_dataflows"] = time.perf_counter() - start
+        result = await session.call_tool(
+            "get_data_for_dataflow",
+            {"dataflow_id": "DM", "ref_areas": "", "indicators": "", "output_format": "csv"},
+        )
+        timings["get_data_for_dataflow"] = time.perf_counter() - start
+    text = "".join(getattr(item, "text", "") for item in result.content)
+    if result.isError or '"error"' in text:
+        msg = f"Tool call failed: {text[:500]}"
+        raise RuntimeError(msg)
+    return timings
+
+
+def bench_first_responses(repeat: int) -> dict[str, float]:
+    """Median time to the end of every step of a stdio session, in milliseconds."""
+    # The server logs to stderr, which would otherwise be mixed with the results
+    with StubSdmxServer({"DM": FIXTURE.read_bytes()}) as stub, Path(os.devnull).open("w") as errlog:
+        runs = [asyncio.run(first_responses(stub.base_url, errlog)) for _ in range(repeat)]
+    return {
+        f"{step}_ms": round(statistics.median(run[step] for run in runs) * 1000, 1)
+        for step in runs[0]
+    }
+
+
+def main() -> int:
+    """Run the benchmark and print the results as JSON."""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", type=Path, default=None, help="Write the results to a file")
+    args = parser.parse_args()
+
+    results = {
+        "imports": bench_imports(args.repeat),
+        "stdio_time_to_response": bench_first_responses(args.repeat),
+    }
+    print(json.dumps(results, indent=2))
+    if args.output is not None:
+        args.output.write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
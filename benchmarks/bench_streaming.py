@@ -0,0 +1,109 @@
+"""Compare peak memory of parsing a whole SDMX-JSON body against the streaming parser.
+
+The payload is generated and each parser runs in separate processes, as the peak memory of a
+process carries over to its children on Linux. The streaming parser is fed the body in chunks, as
+it would be while downloading it.
+
+Usage:
+    uv run python benchmarks/bench_streaming.py --observations 1000000
+"""
+
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parents[1] / "datawarehouse_mcp"))
+
+from http_client import STREAM_CHUNK_SIZE
+from sdmx_parser import build_df_from_json
+from streaming_parser import SdmxJsonStreamParser
+from synthetic import make_sdmx_json
+
+OBSERVATIONS_PER_SERIES = 20
+PARSERS = ("whole", "streaming")
+
+
+def parse(path: Path, parser: str, max_rows: int | None) -> pd.DataFrame:
+    """Parse the body in `path` with one of the parsers."""
+    if parser == "whole":
+        return build_df_from_json(json.loads(path.read_bytes())["data"])
+
+    stream_parser = SdmxJsonStreamParser(max_rows=max_rows)
+    with path.open("rb") as fp:
+        while chunk := fp.read(STREAM_CHUNK_SIZE):
+            stream_parser.feed(chunk)
+    return stream_parser.close()
+
+
+def run_worker(path: Path, parser: str, max_rows: int | None) -> None:
+    """Parse the body and print timing and memory, in a child process."""
+    baseline_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    data = parse(path, parser, max_rows)
+    seconds = time.perf_counter() - start
+    peak_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    print(
+        json.dumps(
+            {
+                "observations": len(data),
+                "seconds": round(seconds, 4),
+                # ru_maxrss is in KiB on Linux; the baseline is the process after its imports
+                "peak_rss_increase_mib": round((peak_kib - baseline_kib) / 1024, 1),
+                "frame_mib": round(data.memory_usage(deep=True).sum() / 2**20, 1),
+            }
+        )
+    )
+
+
+def main() -> int:
+    """Run the benchmark and print the results as JSON."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--observations", type=int, default=1_000_000)
+    parser.add_argument("--max-rows", type=int, default=None)
+    parser.add_argument("--worker", choices=("write", *PARSERS), help=argparse.SUPPRESS)
+    parser.add_argument("--path", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker == "write":
+        num_series = args.observations // OBSERVATIONS_PER_SERIES
+        payload = make_sdmx_json(num_series, OBSERVATIONS_PER_SERIES)
+        args.path.write_text(json.dumps(payload))
+        return 0
+    if args.worker is not None:
+        run_worker(args.path, args.worker, args.max_rows)
+        return 0
+
+    def run(worker: str, path: Path) -> str:
+        command = [
+            sys.executable,
+            __file__,
+            f"--observations={args.observations}",
+            f"--worker={worker}",
+            f"--path={path}",
+        ]
+        if args.max_rows is not None:
+            command.append(f"--max-rows={args.max_rows}")
+        return subprocess.run(command, capture_output=True, check=True, text=True).stdout  # noqa: S603
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / "data.json"
+        run("write", path)
+        results = {
+            "payload_mib": round(path.stat().st_size / 2**20, 1),
+            **{name: json.loads(run(name, path)) for name in PARSERS},
+        }
+
+    print(json.dumps({"benchmark": "streaming", **results}))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
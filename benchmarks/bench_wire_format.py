@@ -0,0 +1,123 @@
+"""Compare SDMX-JSON and SDMX-CSV as wire formats for data responses.
+
+The payloads are generated and each format is decoded into a DataFrame in separate processes, as
+the peak memory of a process carries over to its children on Linux. Payload size (raw and gzipped,
+as sent by the SDMX API), wall time and peak memory are reported as JSON.
+
+Usage:
+    uv run python benchmarks/bench_wire_format.py --observations 1000000
+"""
+
+import argparse
+import gzip
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parents[1] / "datawarehouse_mcp"))
+
+from sdmx_parser import build_df_from_csv, build_df_from_json
+from structure import parse_dataflow_structure
+from synthetic import make_sdmx_json
+
+OBSERVATIONS_PER_SERIES = 20
+WIRE_FORMATS = ("json", "csv")
+
+
+def write_payloads(directory: Path, observations: int) -> None:
+    """Write the same synthetic response as SDMX-JSON and SDMX-CSV, plus its structure."""
+    payload = make_sdmx_json(observations // OBSERVATIONS_PER_SERIES, OBSERVATIONS_PER_SERIES)
+    (directory / "data.json").write_text(json.dumps(payload))
+    (directory / "structure.json").write_text(json.dumps(payload["data"]["structure"]))
+
+    data = build_df_from_json(payload["data"])
+    data = data.astype(object).where(data.notna(), None)
+    data.insert(0, "DATAFLOW", "UNICEF:SYNTHETIC(1.0)")
+    data.to_csv(directory / "data.csv", index=False)
+
+
+def decode(directory: Path, wire_format: str) -> pd.DataFrame:
+    """Decode the response body of a wire format, like the server does after downloading it."""
+    body = (directory / f"data.{wire_format}").read_bytes()
+    if wire_format == "json":
+        return build_df_from_json(json.loads(body)["data"])
+
+    structure_json = json.loads((directory / "structure.json").read_text())
+    return build_df_from_csv(body, parse_dataflow_structure("SYNTHETIC", structure_json))
+
+
+def run_worker(directory: Path, wire_format: str) -> None:
+    """Decode one wire format and print its timing and memory, in a child process."""
+    baseline_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    data = decode(directory, wire_format)
+    seconds = time.perf_counter() - start
+    peak_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    print(
+        json.dumps(
+            {
+                "observations": len(data),
+                "seconds": round(seconds, 4),
+                # ru_maxrss is in KiB on Linux; the baseline is the process after its imports
+                "baseline_rss_mib": round(baseline_kib / 1024, 1),
+                "peak_rss_mib": round(peak_kib / 1024, 1),
+                "frame_mib": round(data.memory_usage(deep=True).sum() / 2**20, 1),
+            }
+        )
+    )
+
+
+def main() -> int:
+    """Run the benchmark and print the results as JSON."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--observations", type=int, default=1_000_000)
+    parser.add_argument("--worker", choices=("write", *WIRE_FORMATS), help=argparse.SUPPRESS)
+    parser.add_argument("--directory", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker == "write":
+        write_payloads(args.directory, args.observations)
+        return 0
+    if args.worker is not None:
+        run_worker(args.directory, args.worker)
+        return 0
+
+    def run(worker: str, directory: str) -> str:
+        return subprocess.run(  # noqa: S603
+            [
+                sys.executable,
+                __file__,
+                f"--observations={args.observations}",
+                f"--worker={worker}",
+                f"--directory={directory}",
+            ],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout
+
+    results: dict[str, dict[str, float]] = {}
+    with tempfile.TemporaryDirectory() as directory:
+        run("write", directory)
+        for wire_format in WIRE_FORMATS:
+            output = run(wire_format, directory)
+            body = (Path(directory) / f"data.{wire_format}").read_bytes()
+            results[wire_format] = {
+                "payload_mib": round(len(body) / 2**20, 1),
+                "payload_gzip_mib": round(len(gzip.compress(body, compresslevel=6)) / 2**20, 1),
+                **json.loads(output),
+            }
+
+    print(json.dumps({"benchmark": "wire_format", **results}))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
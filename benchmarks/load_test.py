@@ -0,0 +1,360 @@
+"""Load test of the MCP server with many concurrent client sessions.
+
+A local stub of the SDMX API serves the DM fixture and a synthetic dataflow (`LOAD`), and the
+server is started against it in a subprocess with the chosen transport. N client sessions then
+call a weighted mix of the tools, with random ref areas and indicators so that most data queries
+miss the caches, until the duration is over.
+
+The report has the throughput, p50/p95/p99 latency and error rate of every tool and overall, and
+the RSS of the server process over time (read from `/proc`, so on Linux only).
+
+Faults can be injected into the stub with `--slow-rate`/`--slow-seconds` and `--error-rate`, to
+measure the tail latency and error rate with a degraded SDMX API. The report then also has the
+retries, hedged requests and circuit breaker events of the server (from its `/metrics` route).
+
+To load test a server running elsewhere (e.g. a pod), start the stub on a reachable address with
+`--stub-host`/`--stub-port`, run the server with `stubbed_server.py <stub URL>`, and pass its MCP
+endpoint with `--url` (and `--pid` for its RSS if it runs on the same host).
+
+Usage:
+    uv run python benchmarks/load_test.py --sessions 50 --duration 60 --output load.json
+    uv run python benchmarks/load_test.py --transport streamable-http --sessions 20
+    uv run python benchmarks/load_test.py --slow-rate 0.05 --slow-seconds 5 --error-rate 0.02
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from contextlib import AbstractAsyncContextManager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+import httpx
+from mcp import ClientSession
+from mcp.client.sse import sse_client
+from mcp.client.streamable_http import streamablehttp_client
+from mcp.types import CallToolResult
+from stub_server import StubSdmxServer, random_faults
+from synthetic import SERIES_DIMENSIONS, make_sdmx_json
+
+FIXTURE = Path(__file__).parents[1] / "tests" / "fixtures" / "dm_sdmx.json"
+STUBBED_SERVER = Path(__file__).with_name("stubbed_server.py")
+DEFAULT_MIX = "get_data_for_dataflow=6,get_all_indicators_for_dataflow=3,get_available_dataflows=1"
+OBSERVATIONS_PER_SERIES = 20
+ENDPOINTS = {"sse": "/sse", "streamable-http": "/mcp"}
+TOOLS = ("get_available_dataflows", "get_all_indicators_for_dataflow", "get_data_for_dataflow")
+UPSTREAM_EVENTS_METRIC = "datawarehouse_upstream_events_total"
+
+
+@dataclass
+class Call:
+    """Outcome of a tool call."""
+
+    tool: str
+    start: float
+    latency: float
+    ok: bool
+
+
+class Workload:
+    """Arguments of the tool calls, drawn at random from the dataflows of the stub."""
+
+    def __init__(self, num_series: int, seed: int) -> None:
+        """Create the workload of a synthetic `LOAD` dataflow of `num_series` series."""
+        num_ref_areas = dict(SERIES_DIMENSIONS)["REF_AREA"]
+        num_indicators = min(dict(SERIES_DIMENSIONS)["INDICATOR"], -(-num_series // num_ref_areas))
+        self.ref_areas = [f"REF_AREA_{i}" for i in range(min(num_series, num_ref_areas))]
+        self.indicators = [f"INDICATOR_{i}" for i in range(num_indicators)]
+        self.rng = random.Random(seed)
+
+    def arguments(self, tool: str) -> dict[str, Any]:
+        """Arguments of a call to `tool`."""
+        if tool == "get_available_dataflows":
+            return {}
+        if tool == "get_all_indicators_for_dataflow":
+            return {"dataflow_id": self.rng.choice(["DM", "LOAD"])}
+        ref_areas = self.rng.sample(self.ref_areas, min(3, len(self.ref_areas)))
+        indicators = self.rng.sample(self.indicators, min(2, len(self.indicators)))
+        return {
+            "dataflow_id": "LOAD",
+            "ref_areas": "+".join(ref_areas),
+            "indicators": "+".join(indicators),
+            "output_format": "csv",
+        }
+
+
+def parse_mix(mix: str) -> dict[str, float]:
+    """Parse `tool=weight,...` into the weight of every tool."""
+    weights: dict[str, float] = {}
+    for item in mix.split(","):
+        tool, _, weight = item.partition("=")
+        if tool.strip() not in TOOLS:
+            msg = f"Unsupported tool in the mix: {tool}. Must be one of {', '.join(TOOLS)}"
+            raise ValueError(msg)
+        weights[tool.strip()] = float(weight or 1)
+    return weights
+
+
+def is_error(result: CallToolResult) -> bool:
+    """Whether a tool call failed, either as an MCP error or with an `error` in its response."""
+    if result.isError:
+        return True
+    text = "".join(getattr(item, "text", "") for item in result.content)
+    try:
+        return "error" in json.loads(text)
+    except ValueError:
+        return False
+
+
+def connect(url: str, transport: str) -> AbstractAsyncContextManager[Any]:
+    """Client streams of the transport."""
+    if transport == "sse":
+        return sse_client(url)
+    return streamablehttp_client(url)
+
+
+async def run_session(  # noqa: PLR0913
+    url: str,
+    transport: str,
+    weights: dict[str, float],
+    workload: Workload,
+    start_delay: float,
+    deadline: float,
+    calls: list[Call],
+    failed_sessions: list[str],
+) -> None:
+    """Open a client session and call tools until the deadline."""
+    await asyncio.sleep(start_delay)
+    tools, tool_weights = list(weights), list(weights.values())
+    try:
+        async with connect(url, transport) as streams, ClientSession(*streams[:2]) as session:
+            await session.initialize()
+            while time.perf_counter() < deadline:
+                tool = workload.rng.choices(tools, tool_weights)[0]
+                start = time.perf_counter()
+                try:
+                    ok = not is_error(await session.call_tool(tool, workload.arguments(tool)))
+                except Exception:  # noqa: BLE001
+                    ok = False
+                calls.append(Call(tool, start, time.perf_counter() - start, ok))
+    except Exception as e:  # noqa: BLE001
+        failed_sessions.append(repr(e))
+
+
+def read_rss_mib(pid: int) -> float | None:
+    """Resident set size of a process, or `None` if it can't be read."""
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+async def sample_rss(pid: int, start: float, interval: float, samples: list[list[float]]) -> None:
+    """Sample the RSS of a process every `interval` seconds until cancelled."""
+    while True:
+        rss_mib = read_rss_mib(pid)
+        if rss_mib is not None:
+            samples.append([round(time.perf_counter() - start, 1), round(rss_mib, 1)])
+        await asyncio.sleep(interval)
+
+
+def summarize(calls: list[Call], duration: float) -> dict[str, float]:
+    """Throughput, latency percentiles and error rate of calls."""
+    latencies_ms = sorted(call.latency * 1000 for call in calls)
+    errors = sum(not call.ok for call in calls)
+
+    def percentile(fraction: float) -> float:
+        return round(latencies_ms[max(0, math.ceil(len(latencies_ms) * fraction) - 1)], 1)
+
+    return {
+        "calls": len(calls),
+        "throughput_per_second": round(len(calls) / duration, 2),
+        "p50_ms": round(statistics.median(latencies_ms), 1),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "error_rate": round(errors / len(calls), 4),
+    }
+
+
+async def run_load(args: argparse.Namespace, url: str, pid: int | None) -> dict[str, Any]:
+    """Run the sessions against the server and report the results."""
+    weights = parse_mix(args.mix)
+    calls: list[Call] = []
+    failed_sessions: list[str] = []
+    rss_samples: list[list[float]] = []
+    start = time.perf_counter()
+    deadline = start + args.ramp_up + args.duration
+    sampler = (
+        asyncio.create_task(sample_rss(pid, start, args.rss_interval, rss_samples))
+        if pid is not None
+        else None
+    )
+    num_series = max(1, args.observations // OBSERVATIONS_PER_SERIES)
+    await asyncio.gather(
+        *(
+            run_session(
+                url,
+                args.transport,
+                weights,
+                Workload(num_series, seed=session),
+                args.ramp_up * session / args.sessions,
+                deadline,
+                calls,
+                failed_sessions,
+            )
+            for session in range(args.sessions)
+        )
+    )
+    if sampler is not None:
+        sampler.cancel()
+
+    # Calls during the ramp-up are left out, so the report is of the steady state
+    measured = [call for call in calls if call.start >= start + args.ramp_up]
+    if not measured:
+        msg = f"No tool call completed. Failed sessions: {failed_sessions[:3]}"
+        raise RuntimeError(msg)
+    by_tool: defaultdict[str, list[Call]] = defaultdict(list)
+    for call in measured:
+        by_tool[call.tool].append(call)
+    return {
+        "transport": args.transport,
+        "sessions": args.sessions,
+        "duration_seconds": args.duration,
+        "failed_sessions": len(failed_sessions),
+        "overall": summarize(measured, args.duration),
+        "tools": {
+            tool: summarize(tool_calls, args.duration) for tool, tool_calls in by_tool.items()
+        },
+        "rss_mib": {
+            "max": max((rss for _, rss in rss_samples), default=None),
+            "samples": rss_samples,
+        },
+    }
+
+
+def read_upstream_events(base_url: str) -> dict[str, float]:
+    """Retries, hedged requests and circuit breaker events from the `/metrics` route of a server."""
+    response = httpx.get(f"{base_url}/metrics", timeout=10)
+    response.raise_for_status()
+    events: dict[str, float] = {}
+    for line in response.text.splitlines():
+        if line.startswith(f'{UPSTREAM_EVENTS_METRIC}{{event="'):
+            labels, value = line.rsplit(" ", 1)
+            events[labels.split('"')[1]] = float(value)
+    return events
+
+
+def free_port() -> int:
+    """A free local TCP port."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float) -> None:
+    """Wait until a local TCP port accepts connections."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    msg = f"The server didn't start listening on port {port} in {timeout} seconds"
+    raise TimeoutError(msg)
+
+
+def main() -> int:
+    """Start the stub and the server, run the load test and print the report as JSON."""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of steady load")
+    parser.add_argument("--ramp-up", type=float, default=5, help="Seconds to open the sessions")
+    parser.add_argument("--transport", choices=list(ENDPOINTS), default="sse")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Weighted tools, `tool=weight,...`")
+    parser.add_argument(
+        "--observations",
+        type=int,
+        default=20_000,
+        help="Observations of every response of the synthetic dataflow",
+    )
+    parser.add_argument("--rss-interval", type=float, default=1.0)
+    parser.add_argument("--url", default=None, help="MCP endpoint of an already running server")
+    parser.add_argument("--pid", type=int, default=None, help="Process of the --url server")
+    parser.add_argument("--stub-host", default="127.0.0.1")
+    parser.add_argument("--stub-port", type=int, default=0)
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Share of slow SDMX responses")
+    parser.add_argument("--slow-seconds", type=float, default=1.0, help="Delay of slow responses")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of SDMX 503 errors")
+    parser.add_argument("--output", type=Path, default=None, help="Write the report to a file")
+    args = parser.parse_args()
+
+    num_series = max(1, args.observations // OBSERVATIONS_PER_SERIES)
+    bodies = {
+        "DM": FIXTURE.read_bytes(),
+        "LOAD": json.dumps(make_sdmx_json(num_series, OBSERVATIONS_PER_SERIES)).encode(),
+    }
+    faults = (
+        random_faults(args.slow_rate, args.slow_seconds, args.error_rate)
+        if args.slow_rate > 0 or args.error_rate > 0
+        else None
+    )
+    with StubSdmxServer(bodies, host=args.stub_host, port=args.stub_port, faults=faults) as stub:
+        server: subprocess.Popen[bytes] | None = None
+        if args.url is None:
+            port = free_port()
+            server = subprocess.Popen(  # noqa: S603
+                [
+                    sys.executable,
+                    str(STUBBED_SERVER),
+                    stub.base_url,
+                    "--port",
+                    str(port),
+                    "--transport",
+                    args.transport,
+                ],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            wait_for_port(port, timeout=30)
+            url, pid = f"http://127.0.0.1:{port}{ENDPOINTS[args.transport]}", server.pid
+        else:
+            print(f"SDMX stub listening on {stub.base_url}", file=sys.stderr)
+            url, pid = args.url, args.pid
+        try:
+            report = asyncio.run(run_load(args, url, pid))
+            if faults is not None:
+                report["faults"] = {
+                    "slow_rate": args.slow_rate,
+                    "slow_seconds": args.slow_seconds,
+                    "error_rate": args.error_rate,
+                }
+                if server is not None:
+                    report["upstream_events"] = read_upstream_events(f"http://127.0.0.1:{port}")
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=10)
+
+    print(json.dumps(report, indent=2))
+    if args.output is not None:
+        args.output.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+"""Local stub of the SDMX API, serving recorded or synthetic SDMX-JSON responses.
+
+Every request for `data/<dataflow>/...` is answered with the whole response registered for that
+dataflow, whatever its key and parameters, so the server modules can be measured end to end
+without network access. Requests for unknown dataflows get the 404 `NoResultsFound` of the SDMX
+API.
+
+Faults can be injected to test the behaviour of the server with a failing SDMX API: a `faults`
+function gets the number of every request (from 1) and returns the `Fault` to inject into it, if
+any, e.g. `random_faults` for a share of slow and failing requests.
+"""
+
+import random
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import TracebackType
+from urllib.parse import urlsplit
+
+
+@dataclass(frozen=True)
+class Fault:
+    """Fault injected into a response of the stub."""
+
+    # Seconds to wait before answering
+    delay_seconds: float = 0.0
+    # Status to answer with instead of the body, e.g. 503
+    status: int | None = None
+    # Close the connection without answering
+    drop: bool = False
+
+
+def random_faults(
+    slow_rate: float = 0.0,
+    slow_seconds: float = 1.0,
+    error_rate: float = 0.0,
+    seed: int = 0,
+) -> Callable[[int], Fault | None]:
+    """Faults of a share of the requests, drawn at random.
+
+    Args:
+        slow_rate: Share of the requests answered after `slow_seconds`.
+        slow_seconds: Delay of the slow requests.
+        error_rate: Share of the requests answered with a 503.
+        seed: Seed of the random draws.
+    """
+    rng = random.Random(seed)
+    lock = threading.Lock()
+
+    def faults(_: int) -> Fault | None:
+        with lock:
+            draw = rng.random()
+        if draw < error_rate:
+            return Fault(status=HTTPStatus.SERVICE_UNAVAILABLE)
+        if draw < error_rate + slow_rate:
+            return Fault(delay_seconds=slow_seconds)
+        return None
+
+    return faults
+
+
+class StubSdmxServer:
+    """SDMX API stub running in a background thread.
+
+    Usage:
+        with StubSdmxServer({"DM": body}) as server:
+            http_client.BASE_URL = server.base_url
+    """
+
+    def __init__(
+        self,
+        bodies: dict[str, bytes],
+        host: str = "127.0.0.1",
+        port: int = 0,
+        faults: Callable[[int], Fault | None] | None = None,
+    ) -> None:
+        """Create the server.
+
+        Args:
+            bodies: SDMX-JSON body returned for every dataflow ID.
+            host: Address to listen on.
+            port: Port to listen on, a free one if 0.
+            faults: Fault to inject into every request, by request number (from 1).
+        """
+        self.bodies = bodies
+        self.faults = faults
+        self.num_requests = 0
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        """Base URL to use instead of the SDMX API's, e.g. `http://127.0.0.1:41234/`."""
+        host, port = self._server.server_address[:2]
+        return f"http://{host!s}:{port}/"
+
+    def __enter__(self) -> "StubSdmxServer":
+        """Start serving in a background thread."""
+        self._thread.start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        """Stop serving."""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _make_handler(self) -> type[BaseHTTPRequestHandler]:
+        stub = self
+        lock = threading.Lock()
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self) -> None:  # noqa: N802
+                with lock:
+                    stub.num_requests += 1
+                    request_number = stub.num_requests
+                fault = stub.faults(request_number) if stub.faults is not None else None
+                if fault is not None:
+                    time.sleep(fault.delay_seconds)
+                    if fault.drop:
+                        self.close_connection = True
+                        return
+                    if fault.status is not None:
+                        self._send(HTTPStatus(fault.status), b"Injected fault", "text/plain")
+                        return
+                parts = urlsplit(self.path).path.strip("/").split("/")
+                body = stub.bodies.get(parts[1]) if len(parts) > 1 and parts[0] == "data" else None
+                if body is None:
+                    self._send(HTTPStatus.NOT_FOUND, b"NoResultsFound", "text/plain")
+                else:
+                    self._send(HTTPStatus.OK, body, "application/json")
+
+            def _send(self, status: HTTPStatus, body: bytes, content_type: str) -> None:
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", content_type)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client gave up on the request, e.g. a hedged request that lost
+                    self.close_connection = True
+
+            def log_message(self, format: str, *args: object) -> None:  # noqa: A002
+                """Don't log every request to stderr."""
+
+        return Handler
@@ -0,0 +1,38 @@
+"""Run the MCP server against another SDMX API, e.g. the stub of `stub_server.py`.
+
+Usage:
+    uv run python benchmarks/stubbed_server.py http://127.0.0.1:41234/ --port 6100
+"""
+
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parents[1] / "datawarehouse_mcp"))
+
+import http_client
+from config import config
+from server import mcp, serve
+
+
+def main() -> None:
+    """Point the HTTP client at the given SDMX API and serve the MCP server."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("sdmx_url", help="Base URL of the SDMX API")
+    parser.add_argument("--port", type=int, default=config.server.port)
+    parser.add_argument(
+        "--transport",
+        choices=["stdio", "sse", "streamable-http"],
+        default=config.server.transport,
+    )
+    args = parser.parse_args()
+
+    http_client.BASE_URL = args.sdmx_url
+    mcp.settings.host = "127.0.0.1"
+    mcp.settings.port = args.port
+    asyncio.run(serve(args.transport))
+
+
+if __name__ == "__main__":
+    main()
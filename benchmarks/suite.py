@@ -0,0 +1,314 @@
+"""Offline benchmark suite of the server, against a local stub of the SDMX API.
+
+Three SDMX-JSON responses are measured:
+
+- `small`: the recorded DM response of `tests/fixtures`.
+- `medium`: `benchmarks/fixtures/medium.json.gz` if it has been recorded with `--record`,
+  otherwise a synthetic response of `--medium-observations`.
+- `large`: a synthetic response of `--large-observations` (millions by default).
+
+For each of them the suite measures:
+
+- the throughput of `build_df_from_json` and of the streaming parser (best of `--repeat` runs),
+- the end-to-end latency of the `get_data_for_dataflow` tool through FastMCP, served by the stub,
+  with empty caches (cold) and with the result cached (warm),
+- the cost of rendering the largest page of the data in every output format (best of `--repeat`),
+- the peak memory of a cold tool call, with memray if installed, otherwise tracemalloc.
+
+Results are written as JSON. With `--baseline`, they are compared against a previous run and the
+suite fails if any metric regressed by more than `--max-regression`. 95th percentiles are reported
+but not compared, as they are too noisy over a few runs.
+
+Usage:
+    uv run python benchmarks/suite.py --output results.json
+    uv run python benchmarks/suite.py --quick --baseline baseline.json --max-regression 0.25
+    uv run python benchmarks/suite.py --record   # record the medium response from the SDMX API
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).parents[1] / "datawarehouse_mcp"))
+
+import http_client
+from cache import clear_caches
+from config import config
+from constants import BASE_URL
+from formatters import OUTPUT_FORMATS
+from sdmx_parser import build_df_from_json
+from server import mcp
+from streaming_parser import SdmxJsonStreamParser
+from stub_server import StubSdmxServer
+from synthetic import make_sdmx_json
+
+try:
+    import memray
+except ImportError:
+    memray = None
+
+ROOT = Path(__file__).parents[1]
+SMALL_FIXTURE = ROOT / "tests" / "fixtures" / "dm_sdmx.json"
+MEDIUM_FIXTURE = Path(__file__).parent / "fixtures" / "medium.json.gz"
+# Query recorded as the medium response: under-five and infant mortality of every country
+MEDIUM_QUERY = "data/CME/.CME_MRY0T4+CME_MRM0.", {"format": "sdmx-json", "startPeriod": "1990"}
+OBSERVATIONS_PER_SERIES = 20
+STREAM_CHUNK_SIZE = 256 * 1024
+# Metrics where lower is better, by suffix; higher is better for the rest (e.g. `_per_second`)
+LOWER_IS_BETTER = ("_ms", "_seconds", "_mib", "_kib")
+# Metrics describing the input rather than the server
+NOT_COMPARED = ("observations", "body_mib", "format_rows")
+NOT_COMPARED_SUFFIXES = ("_p95_ms",)
+
+
+def load_bodies(medium_observations: int, large_observations: int) -> dict[str, bytes]:
+    """SDMX-JSON body of every size, by dataflow ID of the stub."""
+    if MEDIUM_FIXTURE.exists():
+        medium = gzip.decompress(MEDIUM_FIXTURE.read_bytes())
+    else:
+        medium = synthetic_body(medium_observations, seed=1)
+    return {
+        "small": SMALL_FIXTURE.read_bytes(),
+        "medium": medium,
+        "large": synthetic_body(large_observations, seed=2),
+    }
+
+
+def synthetic_body(num_observations: int, seed: int) -> bytes:
+    """Synthetic SDMX-JSON body with about `num_observations` observations."""
+    num_series = max(1, num_observations // OBSERVATIONS_PER_SERIES)
+    return json.dumps(make_sdmx_json(num_series, OBSERVATIONS_PER_SERIES, seed=seed)).encode()
+
+
+def measure(function: Callable[[], object], repeat: int) -> list[float]:
+    """Run a function `repeat` times and return the duration of every run, in seconds."""
+    timings: list[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def summarize(timings: list[float], prefix: str) -> dict[str, float]:
+    """Median and 95th percentile of timings in milliseconds."""
+    timings_ms = sorted(seconds * 1000 for seconds in timings)
+    p95_index = max(0, round(len(timings_ms) * 0.95) - 1)
+    return {
+        f"{prefix}_p50_ms": round(statistics.median(timings_ms), 3),
+        f"{prefix}_p95_ms": round(timings_ms[p95_index], 3),
+    }
+
+
+def bench_parsers(body: bytes, repeat: int) -> dict[str, float]:
+    """Throughput of the whole-body and the streaming SDMX-JSON parsers."""
+
+    def parse_whole() -> None:
+        build_df_from_json(json.loads(body)["data"])
+
+    def parse_streaming() -> None:
+        parser = SdmxJsonStreamParser()
+        for start in range(0, len(body), STREAM_CHUNK_SIZE):
+            parser.feed(body[start : start + STREAM_CHUNK_SIZE])
+        parser.close()
+
+    num_observations = len(build_df_from_json(json.loads(body)["data"]))
+    results: dict[str, float] = {"observations": num_observations}
+    for name, function in (("parse", parse_whole), ("stream_parse", parse_streaming)):
+        best_seconds = min(measure(function, repeat))
+        results[f"{name}_seconds"] = round(best_seconds, 4)
+        results[f"{name}_observations_per_second"] = round(num_observations / best_seconds)
+    return results
+
+
+async def call_tool(dataflow_id: str) -> str:
+    """Get all the data of a dataflow through FastMCP, as an MCP client would."""
+    content = await mcp.call_tool(
+        "get_data_for_dataflow",
+        {"dataflow_id": dataflow_id, "ref_areas": "", "indicators": "", "output_format": "csv"},
+    )
+    text = "".join(getattr(item, "text", "") for item in content)
+    if '"error"' in text[:20]:
+        msg = f"Tool call failed: {text[:500]}"
+        raise RuntimeError(msg)
+    return text
+
+
+def bench_tool(dataflow_id: str, repeat: int) -> dict[str, float]:
+    """End-to-end latency of the tool, with empty caches and with the result cached."""
+
+    async def run() -> tuple[list[float], list[float], int]:
+        cold: list[float] = []
+        warm: list[float] = []
+        response_size = 0
+        try:
+            for _ in range(repeat):
+                clear_caches()
+                start = time.perf_counter()
+                response_size = len(await call_tool(dataflow_id))
+                cold.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                await call_tool(dataflow_id)
+                warm.append(time.perf_counter() - start)
+        finally:
+            await http_client.close_http_client()
+        return cold, warm, response_size
+
+    cold, warm, response_size = asyncio.run(run())
+    return {
+        **summarize(cold, "tool_cold"),
+        **summarize(warm, "tool_warm"),
+        "response_kib": round(response_size / 1024, 1),
+    }
+
+
+def bench_formatters(body: bytes, repeat: int) -> dict[str, float]:
+    """Time to render the largest page the server returns in every output format."""
+    data = build_df_from_json(json.loads(body)["data"]).iloc[: config.results.max_page_size]
+    results: dict[str, float] = {"format_rows": len(data)}
+    for name, formatter in OUTPUT_FORMATS.items():
+        timings = measure(lambda formatter=formatter: formatter(data), repeat)
+        results[f"format_{name}_ms"] = round(min(timings) * 1000, 3)
+    return results
+
+
+def bench_memory(dataflow_id: str) -> dict[str, float | str]:
+    """Peak memory allocated by a cold tool call."""
+    clear_caches()
+
+    async def run() -> None:
+        try:
+            await call_tool(dataflow_id)
+        finally:
+            await http_client.close_http_client()
+
+    if memray is not None:
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "tool.bin"
+            with memray.Tracker(path):
+                asyncio.run(run())
+            peak_bytes = memray.FileReader(path).metadata.peak_memory
+    else:
+        tracemalloc.start()
+        try:
+            asyncio.run(run())
+            peak_bytes = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return {
+        "tool_peak_mib": round(peak_bytes / 2**20, 1),
+        "memory_profiler": "memray" if memray is not None else "tracemalloc",
+    }
+
+
+def compare(
+    results: dict[str, dict[str, Any]],
+    baseline: dict[str, dict[str, Any]],
+    max_regression: float,
+) -> list[str]:
+    """Metrics of `results` that are more than `max_regression` worse than in `baseline`.
+
+    Returns:
+        list[str]: Description of every regression, e.g. `large.parse_seconds: 1.2 -> 1.8`.
+    """
+    regressions: list[str] = []
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            previous = baseline.get(name, {}).get(metric)
+            if not isinstance(value, int | float) or not isinstance(previous, int | float):
+                continue
+            if metric in NOT_COMPARED or metric.endswith(NOT_COMPARED_SUFFIXES) or previous <= 0:
+                continue
+            if metric.endswith(LOWER_IS_BETTER):
+                regressed = value > previous * (1 + max_regression)
+            else:
+                regressed = value < previous / (1 + max_regression)
+            if regressed:
+                regressions.append(f"{name}.{metric}: {previous} -> {value}")
+    return regressions
+
+
+def record_medium_fixture() -> None:
+    """Download the medium response from the SDMX API into `benchmarks/fixtures`."""
+    path, params = MEDIUM_QUERY
+    response = httpx.get(BASE_URL + path, params=params, timeout=300)
+    response.raise_for_status()
+    MEDIUM_FIXTURE.parent.mkdir(parents=True, exist_ok=True)
+    MEDIUM_FIXTURE.write_bytes(gzip.compress(response.content))
+    print(f"Recorded {len(response.content) / 2**20:.1f} MiB to {MEDIUM_FIXTURE}", file=sys.stderr)
+
+
+def main() -> int:
+    """Run the suite, write its results and compare them against the baseline."""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--medium-observations", type=int, default=100_000)
+    parser.add_argument("--large-observations", type=int, default=2_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--quick",
+        action="store_true",
+        help="Smaller large response and fewer repetitions, e.g. for CI",
+    )
+    parser.add_argument("--output", type=Path, default=None, help="Write the results to a file")
+    parser.add_argument("--baseline", type=Path, default=None, help="Results of a previous run")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    parser.add_argument("--record", action="store_true", help="Record the medium response")
+    args = parser.parse_args()
+
+    if args.record:
+        record_medium_fixture()
+        return 0
+    if args.quick:
+        args.large_observations = min(args.large_observations, 200_000)
+        args.repeat = min(args.repeat, 3)
+
+    bodies = load_bodies(args.medium_observations, args.large_observations)
+    results: dict[str, dict[str, Any]] = {}
+    with StubSdmxServer(bodies) as stub:
+        http_client.BASE_URL = stub.base_url
+        for name, body in bodies.items():
+            print(f"Measuring {name} ({len(body) / 2**20:.1f} MiB)", file=sys.stderr)
+            results[name] = {
+                "body_mib": round(len(body) / 2**20, 2),
+                **bench_parsers(body, args.repeat),
+                **bench_tool(name, args.repeat),
+                **bench_formatters(body, args.repeat),
+                **bench_memory(name),
+            }
+
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "quick": args.quick,
+        "results": results,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output is not None:
+        args.output.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+
+    if args.baseline is not None:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        regressions = compare(results, baseline["results"], args.max_regression)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
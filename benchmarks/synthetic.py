@@ -0,0 +1,90 @@
+import random
+from typing import Any
+
+# (id, number of codes) of the series dimensions of the synthetic dataflow, in key order
+SERIES_DIMENSIONS = [("REF_AREA", 250), ("INDICATOR", 80), ("SEX", 3), ("AGE", 8), ("RESIDENCE", 3)]
+SERIES_ATTRIBUTES = [("UNIT_MEASURE", 6), ("UNIT_MULTIPLIER", 3), ("SOURCE_LINK", 12)]
+OBSERVATION_ATTRIBUTES = [("OBS_STATUS", 4), ("OBS_CONF", 0), ("DATA_SOURCE", 40)]
+
+
+def make_sdmx_json(
+    num_series: int,
+    observations_per_series: int,
+    seed: int = 0,
+) -> dict[str, Any]:
+    """Build a synthetic SDMX-JSON data message shaped like the UNICEF responses.
+
+    Args:
+        num_series: Number of series in the message.
+        observations_per_series: Number of observations (years) of every series.
+        seed: Seed for the random values and attributes.
+
+    Returns:
+        dict[str, Any]: Decoded SDMX-JSON message, `{"data": {"dataSets": ..., "structure": ...}}`.
+    """
+    rng = random.Random(seed)
+    max_series = 1
+    for _, num_codes in SERIES_DIMENSIONS:
+        max_series *= num_codes
+    if num_series > max_series:
+        msg = f"At most {max_series} series are supported"
+        raise ValueError(msg)
+
+    series: dict[str, Any] = {}
+    for series_number in range(num_series):
+        positions: list[str] = []
+        remainder = series_number
+        for _, num_codes in SERIES_DIMENSIONS:
+            remainder, position = divmod(remainder, num_codes)
+            positions.append(str(position))
+
+        series[":".join(positions)] = {
+            "attributes": [rng.randrange(num_codes) for _, num_codes in SERIES_ATTRIBUTES],
+            "observations": {
+                str(period): [
+                    round(rng.uniform(0, 1000), 3),
+                    *(
+                        rng.randrange(num_codes) if num_codes else None
+                        for _, num_codes in OBSERVATION_ATTRIBUTES
+                    ),
+                ]
+                for period in range(observations_per_series)
+            },
+        }
+
+    return {
+        "data": {
+            "dataSets": [{"action": "Replace", "series": series}],
+            "structure": {
+                "dimensions": {
+                    "dataset": [],
+                    "series": [_component(id_, n) for id_, n in SERIES_DIMENSIONS],
+                    "observation": [
+                        {
+                            "id": "TIME_PERIOD",
+                            "name": "TIME_PERIOD",
+                            "values": [
+                                {"id": str(1970 + i), "name": str(1970 + i)}
+                                for i in range(observations_per_series)
+                            ],
+                        }
+                    ],
+                },
+                "attributes": {
+                    "dataSet": [],
+                    "series": [_component(id_, n) for id_, n in SERIES_ATTRIBUTES],
+                    "observation": [_component(id_, n) for id_, n in OBSERVATION_ATTRIBUTES],
+                },
+            },
+        }
+    }
+
+
+def _component(component_id: str, num_codes: int) -> dict[str, Any]:
+    return {
+        "id": component_id,
+        "name": component_id,
+        "values": [
+            {"id": f"{component_id}_{i}", "name": f"{component_id} {i}"} for i in range(num_codes)
+        ],
+    }
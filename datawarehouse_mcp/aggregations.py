@@ -0,0 +1,187 @@
+from collections.abc import Callable
+
+import numpy as np
+import pandas as pd
+from exceptions import DataWarehouseAPIError
+from pandas.api.typing import DataFrameGroupBy
+
+# Summary statistics of OBS_VALUE by the `group_by` columns
+STATISTICS = ("min", "max", "mean", "median", "sum", "count")
+OPERATIONS = ("latest", *STATISTICS, "yoy", "change", "top", "bottom")
+# Operations that only use the latest observation of every series
+LATEST_OPERATIONS = ("latest", "top", "bottom")
+# Observations of every series downloaded for them: the latest one can be missing, and the last
+# value before it is used instead
+LATEST_OBSERVATIONS = 5
+
+
+def aggregate(
+    data: pd.DataFrame,
+    series_dimensions: list[str],
+    operation: str,
+    group_by: list[str] | None = None,
+    n: int = 10,
+) -> pd.DataFrame:
+    """Aggregate observations into a small result, with vectorized pandas operations.
+
+    Operations:
+        - `latest`: Latest observation of every series with a value.
+        - `min`, `max`, `mean`, `median`, `sum`, `count`: Statistic of the observations of every
+          group of `group_by` columns, with the number of observations it is computed from.
+        - `yoy`: Change of every observation from the same period a year earlier in its series,
+          e.g. `2020-Q1` from `2019-Q1`; observations without one are left out.
+        - `change`: Change between the first and the latest observation of every series.
+        - `top`, `bottom`: `n` series with the highest or lowest latest value, ranked within
+          every group of `group_by` columns.
+
+    Args:
+        data: Observations, as returned by `handle_get_data_for_dataflow`.
+        series_dimensions: Dimensions identifying a series, i.e. every dimension but the period.
+        operation: One of `OPERATIONS`.
+        group_by: Columns to group by for statistics and rankings. Defaults to `INDICATOR`.
+        n: Number of series of `top` and `bottom`.
+
+    Returns:
+        pd.DataFrame: Aggregated data.
+
+    Raises:
+        DataWarehouseAPIError: If the operation, `group_by` columns or `n` are invalid.
+    """
+    if operation not in OPERATIONS:
+        msg = f"Invalid operation: {operation}. Must be one of {', '.join(OPERATIONS)}"
+        raise DataWarehouseAPIError(msg)
+    if n < 1:
+        msg = f"n must be at least 1, got {n}"
+        raise DataWarehouseAPIError(msg)
+
+    group_by = group_by or [c for c in ("INDICATOR",) if c in data.columns]
+    unknown = [column for column in group_by if column not in data.columns]
+    if unknown:
+        msg = (
+            f"Unknown group_by columns: {', '.join(unknown)}. "
+            f"Available columns: {', '.join(map(str, data.columns))}"
+        )
+        raise DataWarehouseAPIError(msg)
+
+    series_dimensions = [c for c in series_dimensions if c in data.columns]
+    observations = _sort_by_period(data[data["OBS_VALUE"].notna()])
+
+    if operation in STATISTICS:
+        return _statistic(observations, group_by, operation)
+    return _SERIES_OPERATIONS[operation](observations, series_dimensions, group_by, n)
+
+
+def _sort_by_period(data: pd.DataFrame) -> pd.DataFrame:
+    """Sort observations chronologically; periods are ISO-like strings, e.g. `2020` or `2020-Q1`.
+
+    Categories of the period column are in the order of the SDMX structure, which isn't always
+    chronological, so their string values are sorted instead.
+    """
+    periods = data["TIME_PERIOD"].astype(str).to_numpy()
+    order = np.argsort(periods, kind="stable")
+    return data.iloc[order].reset_index(drop=True)
+
+
+def _series(data: pd.DataFrame, series_dimensions: list[str]) -> DataFrameGroupBy:
+    # dropna=False keeps series with a missing dimension value (e.g. no breakdown by sex)
+    return data.groupby(series_dimensions, observed=True, sort=False, dropna=False)
+
+
+def _statistic(data: pd.DataFrame, group_by: list[str], statistic: str) -> pd.DataFrame:
+    grouped = data.groupby(group_by, observed=True, dropna=False)["OBS_VALUE"]
+    result = grouped.agg(["count"] if statistic == "count" else [statistic, "count"])
+    result = result.rename(columns={statistic: "OBS_VALUE", "count": "NUM_OBSERVATIONS"})
+    return result.reset_index()
+
+
+def _latest(
+    data: pd.DataFrame,
+    series_dimensions: list[str],
+    group_by: list[str],  # noqa: ARG001
+    n: int,  # noqa: ARG001
+) -> pd.DataFrame:
+    latest = _series(data, series_dimensions).tail(1)
+    return latest[[*series_dimensions, "TIME_PERIOD", "OBS_VALUE"]].reset_index(drop=True)
+
+
+def _year_over_year(
+    data: pd.DataFrame,
+    series_dimensions: list[str],
+    group_by: list[str],  # noqa: ARG001
+    n: int,  # noqa: ARG001
+) -> pd.DataFrame:
+    result = data[[*series_dimensions, "TIME_PERIOD", "OBS_VALUE"]].copy()
+    periods = result["TIME_PERIOD"].astype(str)
+    # Periods start with their year, e.g. `2020-Q1`, and `2021-Q1` is the same period a year later
+    years = pd.to_numeric(periods.str[:4], errors="coerce")
+    year_after = (years + 1).map("{:.0f}".format, na_action="ignore") + periods.str[4:]
+    previous = result[series_dimensions].assign(
+        PERIOD=year_after.to_numpy(), PREVIOUS_VALUE=result["OBS_VALUE"].to_numpy()
+    )
+    result = result.assign(PERIOD=periods.to_numpy()).merge(
+        previous, on=[*series_dimensions, "PERIOD"], how="inner"
+    )
+    result["CHANGE"] = result["OBS_VALUE"] - result["PREVIOUS_VALUE"]
+    result["PCT_CHANGE"] = _percent_change(result["CHANGE"], result["PREVIOUS_VALUE"])
+    result = result.drop(columns=["PERIOD", "PREVIOUS_VALUE"])
+    return result.sort_values(series_dimensions, kind="stable").reset_index(drop=True)
+
+
+def _change(
+    data: pd.DataFrame,
+    series_dimensions: list[str],
+    group_by: list[str],  # noqa: ARG001
+    n: int,  # noqa: ARG001
+) -> pd.DataFrame:
+    result = (
+        _series(data, series_dimensions)
+        .agg(
+            START_PERIOD=("TIME_PERIOD", "first"),
+            START_VALUE=("OBS_VALUE", "first"),
+            END_PERIOD=("TIME_PERIOD", "last"),
+            END_VALUE=("OBS_VALUE", "last"),
+        )
+        .reset_index()
+    )
+    result["CHANGE"] = result["END_VALUE"] - result["START_VALUE"]
+    result["PCT_CHANGE"] = _percent_change(result["CHANGE"], result["START_VALUE"])
+    return result
+
+
+def _ranking(ascending: bool) -> Callable[..., pd.DataFrame]:  # noqa: FBT001
+    def rank(
+        data: pd.DataFrame,
+        series_dimensions: list[str],
+        group_by: list[str],
+        n: int,
+    ) -> pd.DataFrame:
+        # Group by columns other than the series dimensions, e.g. `UNIT_MEASURE`, are taken from
+        # the latest observation of every series
+        extra = [c for c in group_by if c not in (*series_dimensions, "TIME_PERIOD", "OBS_VALUE")]
+        latest = _series(data, series_dimensions).tail(1)
+        columns = [*series_dimensions, *extra, "TIME_PERIOD", "OBS_VALUE"]
+        latest = latest[columns].reset_index(drop=True)
+        latest = latest.sort_values("OBS_VALUE", ascending=ascending, kind="stable")
+        if group_by:
+            groups = latest.groupby(group_by, observed=True, sort=False, dropna=False)
+            latest["RANK"] = groups.cumcount() + 1
+        else:
+            latest["RANK"] = np.arange(1, len(latest) + 1)
+        top = latest[latest["RANK"] <= n]
+        return top.sort_values([*group_by, "RANK"], kind="stable").reset_index(drop=True)
+
+    return rank
+
+
+def _percent_change(change: pd.Series, base: pd.Series) -> pd.Series:
+    """Change as a percentage of the base value, missing if the base is 0."""
+    return (change / base.where(base != 0) * 100).astype(np.float64)
+
+
+_SERIES_OPERATIONS: dict[str, Callable[..., pd.DataFrame]] = {
+    "latest": _latest,
+    "yoy": _year_over_year,
+    "change": _change,
+    "top": _ranking(ascending=False),
+    "bottom": _ranking(ascending=True),
+}
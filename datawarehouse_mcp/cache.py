@@ -0,0 +1,237 @@
+import asyncio
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Hashable
+from dataclasses import asdict, dataclass
+from logging import getLogger
+from typing import Any, Generic, Literal, TypeVar
+
+from exceptions import UpstreamUnavailableError
+from metrics import record_cache_lookup
+
+logger = getLogger(__name__)
+
+V = TypeVar("V")
+
+
+@dataclass
+class CacheStats:
+    """Counters of a `ResultCache`, to tune its TTL and size."""
+
+    hits: int = 0
+    misses: int = 0
+    coalesced: int = 0
+    stale: int = 0
+    # Lookups answered from a cached result containing the query, in whole or in part
+    subset: int = 0
+    partial: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    entries: int = 0
+    size_bytes: int = 0
+    max_bytes: int = 0
+    # Share of the lookups answered without a request: hits, coalesced and subset lookups
+    hit_ratio: float = 0.0
+
+
+@dataclass
+class _Entry(Generic[V]):
+    value: V
+    size: int
+    expires_at: float
+
+
+class ResultCache(Generic[V]):
+    """In-process cache with TTL expiry, size-based LRU eviction and request coalescing.
+
+    Concurrent `get_or_fetch` calls for a key that is not cached share a single in-flight fetch
+    (singleflight), so a burst of identical requests results in one upstream call. Cached values
+    are shared between callers and must be treated as read-only.
+
+    With `max_stale_seconds`, expired entries are kept that much longer, and returned by
+    `get_or_fetch` if fetching a fresh value fails because the SDMX API is unavailable.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        name: str,
+        ttl_seconds: float,
+        max_bytes: int,
+        sizeof: Callable[[V], int],
+        cacheable: Callable[[V], bool] | None = None,
+        max_stale_seconds: float = 0.0,
+    ) -> None:
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.max_stale_seconds = max_stale_seconds
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._cacheable = cacheable
+        self._entries: OrderedDict[Hashable, _Entry[V]] = OrderedDict()
+        self._in_flight: dict[Hashable, asyncio.Task[V]] = {}
+        self._size_bytes = 0
+        self._stats = CacheStats(max_bytes=max_bytes)
+        _caches[name] = self
+
+    def get(self, key: Hashable) -> V | None:
+        """Return the cached value for `key`, or `None` if it is missing or expired."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        now = time.monotonic()
+        if entry.expires_at <= now:
+            # Expired entries are kept while they may still be served stale
+            if entry.expires_at + self.max_stale_seconds <= now:
+                self._remove(key)
+                self._stats.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry.value
+
+    def peek(self, key: Hashable) -> V | None:
+        """Return the cached value for `key` if it is fresh, without marking it as recently used."""
+        entry = self._entries.get(key)
+        if entry is None or entry.expires_at <= time.monotonic():
+            return None
+        return entry.value
+
+    def get_stale(self, key: Hashable) -> V | None:
+        """Return the value for `key`, even expired if within `max_stale_seconds`."""
+        entry = self._entries.get(key)
+        if entry is None or entry.expires_at + self.max_stale_seconds <= time.monotonic():
+            return None
+        return entry.value
+
+    def put(self, key: Hashable, value: V) -> None:
+        """Cache `value`, evicting the least recently used entries to stay within `max_bytes`."""
+        size = self._sizeof(value)
+        if key in self._entries:
+            self._remove(key)
+        if size > self.max_bytes:
+            logger.info("Not caching %s entry of %s bytes, over the cache size", self.name, size)
+            return
+
+        while self._size_bytes + size > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self._stats.evictions += 1
+
+        self._entries[key] = _Entry(value, size, time.monotonic() + self.ttl_seconds)
+        self._size_bytes += size
+
+    async def get_or_fetch(
+        self,
+        key: Hashable,
+        fetch: Callable[[], Awaitable[V]],
+        *,
+        refresh_within_seconds: float = 0.0,
+    ) -> V:
+        """Return the cached value for `key`, fetching and caching it if needed.
+
+        Fetched values for which `cacheable` returns `False` are returned but not cached. If the
+        fetch fails with `UpstreamUnavailableError`, an expired value is returned if there is one
+        within `max_stale_seconds`.
+
+        Args:
+            key: Normalized key of the request.
+            fetch: Coroutine function producing the value on a cache miss.
+            refresh_within_seconds: Also fetch the value if the cached one expires within this
+                many seconds, e.g. to keep it cached until it is next needed.
+
+        Returns:
+            V: Cached, freshly fetched or (with the SDMX API unavailable) stale value.
+        """
+        value = self.get(key)
+        if value is not None and refresh_within_seconds > 0:
+            expires_in = self._entries[key].expires_at - time.monotonic()
+            value = value if expires_in > refresh_within_seconds else None
+        if value is not None:
+            self._stats.hits += 1
+            record_cache_lookup(self.name, "hit")
+            return value
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None and in_flight.get_loop() is asyncio.get_running_loop():
+            self._stats.coalesced += 1
+            record_cache_lookup(self.name, "coalesced")
+            return await asyncio.shield(in_flight)
+
+        self._stats.misses += 1
+        record_cache_lookup(self.name, "miss")
+        # The fetch runs in a task of its own, so that cancelling its caller (e.g. a client
+        # disconnecting) doesn't fail the calls of other sessions waiting for the same key
+        task = asyncio.create_task(self._fetch(key, fetch))
+        self._in_flight[key] = task
+        task.add_done_callback(_retrieve_exception)
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key: Hashable, fetch: Callable[[], Awaitable[V]]) -> V:
+        """Fetch and cache the value of a key, falling back to a stale one if possible."""
+        try:
+            value = await fetch()
+        except UpstreamUnavailableError as e:
+            stale = self.get_stale(key)
+            if stale is None:
+                raise
+            logger.warning(
+                "Serving a stale %s entry, as the SDMX API is unavailable: %s", self.name, e
+            )
+            self._stats.stale += 1
+            record_cache_lookup(self.name, "stale")
+            return stale
+        else:
+            if self._cacheable is None or self._cacheable(value):
+                self.put(key, value)
+            return value
+        finally:
+            if self._in_flight.get(key) is asyncio.current_task():
+                del self._in_flight[key]
+
+    def record_lookup(self, outcome: Literal["subset", "partial"]) -> None:
+        """Count a lookup answered from other entries than its own, e.g. a `subset` lookup."""
+        if outcome == "subset":
+            self._stats.subset += 1
+        else:
+            self._stats.partial += 1
+        record_cache_lookup(self.name, outcome)
+
+    def clear(self) -> None:
+        """Remove every entry and reset the counters."""
+        self._entries.clear()
+        self._size_bytes = 0
+        self._stats = CacheStats(max_bytes=self.max_bytes)
+
+    @property
+    def stats(self) -> CacheStats:
+        """Current counters, entry count and size of the cache."""
+        self._stats.entries = len(self._entries)
+        self._stats.size_bytes = self._size_bytes
+        stats = self._stats
+        lookups = stats.hits + stats.misses + stats.coalesced + stats.subset + stats.partial
+        served = stats.hits + stats.coalesced + stats.subset
+        stats.hit_ratio = round(served / lookups, 4) if lookups else 0.0
+        return stats
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._entries.pop(key)
+        self._size_bytes -= entry.size
+
+
+def _retrieve_exception(task: asyncio.Task[Any]) -> None:
+    """Mark the error of a fetch as retrieved, as its callers may all have been cancelled."""
+    if not task.cancelled():
+        task.exception()
+
+
+_caches: dict[str, ResultCache[Any]] = {}
+
+
+def get_cache_stats() -> dict[str, dict[str, float]]:
+    """Return the counters of every cache, by cache name."""
+    return {name: asdict(cache.stats) for name, cache in _caches.items()}
+
+
+def clear_caches() -> None:
+    """Clear every cache."""
+    for cache in _caches.values():
+        cache.clear()
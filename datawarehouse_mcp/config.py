@@ -2,10 +2,28 @@ from pathlib import Path
 
 import yaml
 from logging_config import get_logger
-from schemas import Config, ServerConfig
+from schemas import (
+    CacheConfig,
+    Config,
+    DiskCacheConfig,
+    HttpConfig,
+    MirrorConfig,
+    PrefetchConfig,
+    ProfilingConfig,
+    QueryConfig,
+    ResultStoreConfig,
+    SchedulerConfig,
+    SearchConfig,
+    ServerConfig,
+    UpstreamConfig,
+)
 
 logger = get_logger(__name__)
 
+# The libyaml loader, if PyYAML was built with it, is about 15x faster, and the config is loaded
+# at startup
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
 
 def load_config(config_path: Path | None = None) -> Config:
     """Load configuration from YAML file.
@@ -29,7 +47,7 @@ def load_config(config_path: Path | None = None) -> Config:
         raise FileNotFoundError(msg, config_path)
 
     with config_path.open() as f:
-        config_data = yaml.safe_load(f)
+        config_data = yaml.load(f, Loader=_YAML_LOADER)  # noqa: S506 - both loaders are safe
 
     valid_transports = ("stdio", "sse", "streamable-http")
     transport = config_data["server"]["transport"]
@@ -38,13 +56,137 @@ def load_config(config_path: Path | None = None) -> Config:
         logger.error(msg, transport, valid_transports)
         raise ValueError(msg, transport, valid_transports)
 
+    http_config = HttpConfig(**config_data.get("http", {}))
+    _validate_positive("http", vars(http_config))
+    upstream_config = UpstreamConfig(**config_data.get("upstream", {}))
+    _validate_upstream(upstream_config)
+    scheduler_config = SchedulerConfig(**config_data.get("scheduler", {}))
+    _validate_positive("scheduler", vars(scheduler_config))
+    cache_config = CacheConfig(**config_data.get("cache", {}))
+    _validate_positive(
+        "cache",
+        {
+            name: value
+            for name, value in vars(cache_config).items()
+            if name not in ("max_stale_seconds", "serve_subsets")
+        },
+    )
+    if cache_config.max_stale_seconds < 0:
+        msg = "Invalid cache.max_stale_seconds: %s. Must be 0 (disabled) or greater"
+        logger.error(msg, cache_config.max_stale_seconds)
+        raise ValueError(msg, cache_config.max_stale_seconds)
+    results_config = ResultStoreConfig(**config_data.get("results", {}))
+    _validate_positive("results", vars(results_config))
+    disk_cache_config = DiskCacheConfig(**config_data.get("disk_cache", {}))
+    _validate_positive(
+        "disk_cache",
+        {
+            "ttl_seconds": disk_cache_config.ttl_seconds,
+            "max_stale_seconds": disk_cache_config.max_stale_seconds,
+            "max_bytes": disk_cache_config.max_bytes,
+        },
+    )
+    mirror_config = MirrorConfig(**config_data.get("mirror", {}))
+    profiling_config = ProfilingConfig(**config_data.get("profiling", {}))
+    _validate_positive(
+        "profiling",
+        {
+            "interval_seconds": profiling_config.interval_seconds,
+            "max_profiles": profiling_config.max_profiles,
+        },
+    )
+    for name in ("every_n_calls", "slow_call_seconds"):
+        value = getattr(profiling_config, name)
+        if value < 0:
+            msg = "Invalid profiling.%s: %s. Must be 0 (disabled) or greater"
+            logger.error(msg, name, value)
+            raise ValueError(msg, name, value)
+    search_config = SearchConfig(**config_data.get("search", {}))
+    _validate_positive("search", {"index_ttl_seconds": search_config.index_ttl_seconds})
+    query_config = QueryConfig(**config_data.get("query", {}))
+    _validate_positive(
+        "query",
+        {
+            name: value
+            for name, value in vars(query_config).items()
+            if name not in ("wire_format", "validate_codes")
+        },
+    )
+    valid_wire_formats = ("json", "csv")
+    if query_config.wire_format not in valid_wire_formats:
+        msg = "Invalid query.wire_format: %s. Must be one of %s"
+        logger.error(msg, query_config.wire_format, valid_wire_formats)
+        raise ValueError(msg, query_config.wire_format, valid_wire_formats)
+    prefetch_config = PrefetchConfig(**config_data.get("prefetch", {}))
+    _validate_prefetch(prefetch_config)
+
     return Config(
         server=ServerConfig(
             host=config_data["server"]["host"],
             port=config_data["server"]["port"],
             transport=transport,
-        )
+        ),
+        http=http_config,
+        upstream=upstream_config,
+        scheduler=scheduler_config,
+        cache=cache_config,
+        results=results_config,
+        disk_cache=disk_cache_config,
+        mirror=mirror_config,
+        profiling=profiling_config,
+        search=search_config,
+        query=query_config,
+        prefetch=prefetch_config,
+    )
+
+
+def _validate_positive(section: str, values: dict[str, float]) -> None:
+    """Raise a `ValueError` if any of the numeric settings of a section is not positive."""
+    for name, value in values.items():
+        if value <= 0:
+            msg = "Invalid %s.%s: %s. Must be greater than 0"
+            logger.error(msg, section, name, value)
+            raise ValueError(msg, section, name, value)
+
+
+def _validate_upstream(upstream: UpstreamConfig) -> None:
+    """Raise a `ValueError` if any of the settings of the upstream policy is invalid."""
+    _validate_positive(
+        "upstream",
+        {
+            name: value
+            for name, value in vars(upstream).items()
+            if name not in ("hedging", "max_retries")
+        },
+    )
+    if upstream.max_retries < 0:
+        msg = "Invalid upstream.max_retries: %s. Must be 0 (no retries) or greater"
+        logger.error(msg, upstream.max_retries)
+        raise ValueError(msg, upstream.max_retries)
+    if upstream.hedge_percentile >= 100:  # noqa: PLR2004
+        msg = "Invalid upstream.hedge_percentile: %s. Must be less than 100"
+        logger.error(msg, upstream.hedge_percentile)
+        raise ValueError(msg, upstream.hedge_percentile)
+    if upstream.min_timeout_seconds > upstream.max_timeout_seconds:
+        msg = "Invalid upstream.min_timeout_seconds: %s. Must not exceed max_timeout_seconds (%s)"
+        logger.error(msg, upstream.min_timeout_seconds, upstream.max_timeout_seconds)
+        raise ValueError(msg, upstream.min_timeout_seconds, upstream.max_timeout_seconds)
+
+
+def _validate_prefetch(prefetch: PrefetchConfig) -> None:
+    """Raise a `ValueError` if any of the settings of the prefetching is invalid."""
+    _validate_positive(
+        "prefetch",
+        {
+            name: value
+            for name, value in vars(prefetch).items()
+            if name not in ("enabled", "startup_delay_seconds", "popularity_path")
+        },
     )
+    if prefetch.startup_delay_seconds < 0:
+        msg = "Invalid prefetch.startup_delay_seconds: %s. Must be 0 (no delay) or greater"
+        logger.error(msg, prefetch.startup_delay_seconds)
+        raise ValueError(msg, prefetch.startup_delay_seconds)
 
 
 config = load_config()
@@ -0,0 +1,410 @@
+import asyncio
+import dataclasses
+from collections.abc import Awaitable, Callable, Hashable
+from logging import getLogger
+
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+from cache import ResultCache
+from exceptions import DataWarehouseAPIError, NoDataFoundError, UpstreamUnavailableError
+from metrics import span
+from schemas import DataQuery, DataResult
+from sdmx_parser import concat_frames
+from workers import run_in_worker
+
+logger = getLogger(__name__)
+
+IntArray = npt.NDArray[np.int64]
+
+# Columns of the row index, without which a result can't answer other queries
+INDEX_COLUMNS = ("REF_AREA", "INDICATOR", "TIME_PERIOD")
+# Memory of the row index of a cached result, per row: its position and its year
+ROW_INDEX_BYTES = 16
+
+
+def estimate_frame_size(data: pd.DataFrame) -> int:
+    """Return the memory used by a DataFrame, in bytes."""
+    return int(data.memory_usage(index=True, deep=True).sum())
+
+
+def limit_rows(result: DataResult, max_rows: int | None) -> DataResult:
+    """Cut a result at `max_rows` rows, flagging it as truncated if it had more.
+
+    The data is fetched with `rows_to_fetch`, one row more than `max_rows`, so that a result of
+    exactly `max_rows` rows is told apart from a cut one.
+    """
+    if max_rows is None or len(result.data) <= max_rows:
+        return result
+    return dataclasses.replace(
+        result,
+        data=result.data.iloc[:max_rows].reset_index(drop=True),
+        truncated=True,
+    )
+
+
+def rows_to_fetch(max_rows: int | None) -> int | None:
+    """Number of rows to fetch for a result of `max_rows` rows, see `limit_rows`."""
+    return None if max_rows is None else max_rows + 1
+
+
+class RowIndex:
+    """Positions of the rows of a result by ref area and indicator, and the year of every row."""
+
+    def __init__(self, data: pd.DataFrame) -> None:
+        self.num_rows = len(data)
+        groups = data.groupby(
+            ["REF_AREA", "INDICATOR"], observed=True, sort=False, dropna=False
+        ).indices
+        self._positions: dict[Hashable, dict[Hashable, IntArray]] = {}
+        for (ref_area, indicator), rows in groups.items():
+            self._positions.setdefault(_normalize(ref_area), {})[_normalize(indicator)] = rows
+
+        periods = pd.Categorical(data["TIME_PERIOD"])
+        period_years = [
+            int(period[:4]) if period[:4].isdigit() else -1
+            for period in periods.categories.astype(str)
+        ]
+        # Missing periods have code -1, which picks the extra last year
+        self._years = np.array([*period_years, -1], dtype=np.int64)[periods.codes]
+
+    def find_rows(
+        self,
+        ref_areas: tuple[str, ...],
+        indicators: tuple[str, ...],
+        period_range: tuple[int | None, int | None],
+    ) -> IntArray:
+        """Positions of the rows of the ref areas and indicators (all if empty) within the years.
+
+        Args:
+            ref_areas: Ref area codes, matched case-insensitively.
+            indicators: Indicator codes, matched case-insensitively.
+            period_range: First and last year of the rows, `None` where it is open. Like the SDMX
+                API, periods without a year only match an open range.
+
+        Returns:
+            IntArray: Positions of the rows, in their order in the result.
+        """
+        if not ref_areas and not indicators:
+            rows = np.arange(self.num_rows)
+        else:
+            by_ref_area = (
+                [self._positions.get(code.upper(), {}) for code in ref_areas]
+                if ref_areas
+                else self._positions.values()
+            )
+            parts = [
+                positions
+                for by_indicator in by_ref_area
+                for positions in (
+                    [by_indicator.get(code.upper()) for code in indicators]
+                    if indicators
+                    else by_indicator.values()
+                )
+                if positions is not None
+            ]
+            rows = np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+
+        start, end = period_range
+        if start is None and end is None:
+            return rows
+        years = self._years[rows]
+        mask = years >= (start if start is not None else 0)
+        if end is not None:
+            mask &= years <= end
+        return rows[mask]
+
+
+class _CachedResult:
+    """Cached result, with its row index once it answered another query."""
+
+    def __init__(self, result: DataResult) -> None:
+        self.result = result
+        self.indexable = all(column in result.data for column in INDEX_COLUMNS)
+        self._index: RowIndex | None = None
+
+    @property
+    def index(self) -> RowIndex:
+        """Row index of the result, built on first use."""
+        if self._index is None:
+            self._index = RowIndex(self.result.data)
+        return self._index
+
+
+class DataCache:
+    """Cache of data results that also answers the queries contained in a cached result.
+
+    A cached result covers the ref areas, indicators and period range of its query (every code of
+    a dimension the query didn't filter). A query within the coverage of a cached result is
+    answered by looking up its rows in an index of that result, built on the first such lookup,
+    instead of a request. If cached results only cover a query in part, the best of them answers
+    that part and the rest is fetched, as up to two queries that are cached too, and merged in.
+
+    Queries with `last_n_observations` are only contained in results with the same
+    `last_n_observations` and periods, and truncated results don't contain other queries. Results
+    with errors (failed chunks) are not cached, so the next call retries them. Entries expire and
+    are evicted like in `ResultCache`, counting the memory of their index.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        ttl_seconds: float,
+        max_bytes: int,
+        max_stale_seconds: float = 0.0,
+        *,
+        serve_subsets: bool = True,
+    ) -> None:
+        self.serve_subsets = serve_subsets
+        self._results: ResultCache[_CachedResult] = ResultCache(
+            name,
+            ttl_seconds=ttl_seconds,
+            max_bytes=max_bytes,
+            sizeof=lambda cached: (
+                estimate_frame_size(cached.result.data) + ROW_INDEX_BYTES * len(cached.result.data)
+            ),
+            cacheable=lambda cached: not cached.result.errors,
+            max_stale_seconds=max_stale_seconds,
+        )
+        # Queries fetched, by dataflow, to find the cached results containing a query
+        self._queries: dict[str, dict[DataQuery, None]] = {}
+
+    async def get_or_fetch(
+        self,
+        query: DataQuery,
+        fetch: Callable[[DataQuery], Awaitable[DataResult]],
+        *,
+        refresh_within_seconds: float = 0.0,
+    ) -> DataResult:
+        """Return the result of a query from the cache, fetching what it doesn't cover.
+
+        Args:
+            query: Normalized query.
+            fetch: Coroutine function fetching the result of a query, called with `query` or the
+                parts of it that no cached result covers.
+            refresh_within_seconds: Fetch the result of the query itself if it isn't cached, or
+                expires within this many seconds, instead of answering it from other results.
+
+        Returns:
+            DataResult: Cached, filtered, merged or freshly fetched result.
+
+        Raises:
+            NoDataFoundError: If a cached result covering the query has no rows for it.
+        """
+        if self.serve_subsets and not refresh_within_seconds and self._results.get(query) is None:
+            result = await self._get_from_cached(query, fetch)
+            if result is not None:
+                return result
+        return await self._fetch(query, fetch, refresh_within_seconds)
+
+    async def _fetch(
+        self,
+        query: DataQuery,
+        fetch: Callable[[DataQuery], Awaitable[DataResult]],
+        refresh_within_seconds: float = 0.0,
+    ) -> DataResult:
+        async def fetch_and_track() -> _CachedResult:
+            result = await fetch(query)
+            self._queries.setdefault(query.dataflow_id, {})[query] = None
+            return _CachedResult(result)
+
+        cached = await self._results.get_or_fetch(
+            query, fetch_and_track, refresh_within_seconds=refresh_within_seconds
+        )
+        return cached.result
+
+    async def _get_from_cached(
+        self, query: DataQuery, fetch: Callable[[DataQuery], Awaitable[DataResult]]
+    ) -> DataResult | None:
+        """Answer a query from the cached results of its dataflow, `None` if none covers it."""
+        containing: list[tuple[DataQuery, _CachedResult]] = []
+        best_part: tuple[float, DataQuery, _CachedResult, DataQuery, list[DataQuery]] | None = None
+        for cached_query, cached in self._cached_results(query.dataflow_id):
+            split = _split(cached_query, query)
+            if split is None:
+                continue
+            covered, rest = split
+            if not rest:
+                containing.append((cached_query, cached))
+                continue
+            share = _share(covered, query)
+            if best_part is None or share > best_part[0]:
+                best_part = (share, cached_query, cached, covered, rest)
+
+        if containing:
+            cached_query, cached = min(containing, key=lambda item: len(item[1].result.data))
+            with span("subset"):
+                result = await run_in_worker(_select, cached, cached_query, query)
+            if result is not None:
+                self._results.get(cached_query)  # Mark it as recently used
+                self._results.record_lookup("subset")
+                if result.data.empty:
+                    msg = f"No data found for {query.key}"
+                    raise NoDataFoundError(msg)
+                return limit_rows(result, query.max_rows)
+
+        # The rest of a query with a year has no data for it in some cases, changing the result
+        if best_part is None or query.year is not None:
+            return None
+        _, cached_query, cached, covered, rest = best_part
+        logger.info(
+            "Answering %s of dataflow %s from the cached %s, fetching %s",
+            query.key,
+            query.dataflow_id,
+            cached_query.key,
+            ", ".join(part.key for part in rest),
+        )
+        self._results.get(cached_query)
+        self._results.record_lookup("partial")
+        with span("subset"):
+            local = await run_in_worker(_select, cached, cached_query, covered)
+        fetched = await asyncio.gather(
+            *(self._fetch(part, fetch) for part in rest), return_exceptions=True
+        )
+        return await _merge(query, local, rest, fetched)
+
+    def _cached_results(self, dataflow_id: str) -> list[tuple[DataQuery, _CachedResult]]:
+        """Fresh and complete cached results of a dataflow, forgetting those no longer cached."""
+        queries = self._queries.get(dataflow_id, {})
+        results: list[tuple[DataQuery, _CachedResult]] = []
+        for query in list(queries):
+            cached = self._results.peek(query)
+            if cached is None:
+                del queries[query]
+            elif cached.indexable and not cached.result.truncated:
+                results.append((query, cached))
+        return results
+
+
+def _normalize(code: Hashable) -> Hashable:
+    return code.upper() if isinstance(code, str) else code
+
+
+def _split(cached: DataQuery, query: DataQuery) -> tuple[DataQuery, list[DataQuery]] | None:
+    """Split a query into the part a cached query covers and queries for the rest.
+
+    Returns:
+        tuple[DataQuery, list[DataQuery]] | None: Covered part, and up to two queries for the
+            rest: the ref areas not covered, and the covered ref areas with the indicators not
+            covered. `None` if no part is covered.
+    """
+    if cached.last_n_observations is not None or query.last_n_observations is not None:
+        # The latest observations of a series depend on the periods of the query
+        if (cached.last_n_observations, cached.period_range) != (
+            query.last_n_observations,
+            query.period_range,
+        ):
+            return None
+    else:
+        (cached_start, cached_end), (start, end) = cached.period_range, query.period_range
+        if cached_start is not None and (start is None or start < cached_start):
+            return None
+        if cached_end is not None and (end is None or end > cached_end):
+            return None
+
+    ref_areas = _split_codes(cached.ref_areas, query.ref_areas)
+    indicators = _split_codes(cached.indicators, query.indicators)
+    if ref_areas is None or indicators is None:
+        return None
+    (covered_ref_areas, other_ref_areas), (covered_indicators, other_indicators) = (
+        ref_areas,
+        indicators,
+    )
+
+    rest: list[DataQuery] = []
+    if other_ref_areas:
+        rest.append(dataclasses.replace(query, ref_areas=other_ref_areas))
+    if other_indicators:
+        rest.append(
+            dataclasses.replace(query, ref_areas=covered_ref_areas, indicators=other_indicators)
+        )
+    covered = dataclasses.replace(query, ref_areas=covered_ref_areas, indicators=covered_indicators)
+    return covered, rest
+
+
+def _split_codes(
+    cached: tuple[str, ...], wanted: tuple[str, ...]
+) -> tuple[tuple[str, ...], tuple[str, ...]] | None:
+    """Codes of a dimension covered by a cached query and the others, `None` if none is covered.
+
+    Empty codes are every code of the dimension. If the query wants every code and the cached
+    query has only some, the others can't be expressed in a data key, so none is covered.
+    """
+    if not cached:
+        return wanted, ()
+    if not wanted:
+        return None
+    cached_codes = set(cached)
+    covered = tuple(code for code in wanted if code in cached_codes)
+    if not covered:
+        return None
+    return covered, tuple(code for code in wanted if code not in cached_codes)
+
+
+def _share(covered: DataQuery, query: DataQuery) -> float:
+    """Share of the series of a query in its covered part, counting codes of either dimension."""
+    share = 1.0
+    for covered_codes, codes in (
+        (covered.ref_areas, query.ref_areas),
+        (covered.indicators, query.indicators),
+    ):
+        if codes:
+            share *= len(covered_codes) / len(codes)
+    return share
+
+
+def _select(cached: _CachedResult, cached_query: DataQuery, query: DataQuery) -> DataResult | None:
+    """Rows of a query from a cached result containing it.
+
+    A query with a year and no data for it gets every year of its series, like from the SDMX API,
+    if the cached result has them. Otherwise it can't be answered from the cached result.
+
+    Returns:
+        DataResult | None: Rows of the query, maybe none, or `None` if it can't be answered.
+    """
+    index = cached.index
+    # Results with the latest observations only contain queries with the same periods
+    period_range = query.period_range if cached_query.last_n_observations is None else (None, None)
+    rows = index.find_rows(query.ref_areas, query.indicators, period_range)
+    if not len(rows) and query.year is not None:
+        if cached_query.last_n_observations is not None or cached_query.period_range != (
+            None,
+            None,
+        ):
+            return None
+        rows = index.find_rows(query.ref_areas, query.indicators, (None, None))
+    return DataResult(data=cached.result.data.iloc[rows].reset_index(drop=True))
+
+
+async def _merge(
+    query: DataQuery,
+    local: DataResult | None,
+    rest: list[DataQuery],
+    fetched: list[DataResult | BaseException],
+) -> DataResult:
+    """Merge the rows of a query found in the cache with those fetched for the rest of it."""
+    frames = [local.data] if local is not None and not local.data.empty else []
+    errors: list[str] = []
+    truncated = False
+    for part, result in zip(rest, fetched, strict=True):
+        if isinstance(result, NoDataFoundError):
+            continue
+        if isinstance(result, Exception):
+            errors.append(f"{part.key}: {result}")
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            frames.append(result.data)
+            errors.extend(result.errors)
+            truncated |= result.truncated
+
+    if not frames:
+        if errors:
+            unavailable = any(isinstance(r, UpstreamUnavailableError) for r in fetched)
+            error_type = UpstreamUnavailableError if unavailable else DataWarehouseAPIError
+            raise error_type("; ".join(errors))
+        msg = f"No data found for {query.key}"
+        raise NoDataFoundError(msg)
+
+    data = await run_in_worker(concat_frames, frames)
+    return limit_rows(DataResult(data=data, errors=errors, truncated=truncated), query.max_rows)
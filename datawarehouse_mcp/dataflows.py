@@ -0,0 +1,43 @@
+import json
+from pathlib import Path
+
+from schemas import Dataflow
+
+DATAFLOWS_PATH = Path(__file__).with_name("dataflows.json")
+
+
+def load_dataflows(path: Path = DATAFLOWS_PATH) -> tuple[Dataflow, ...]:
+    """Load the curated list of dataflows.
+
+    Args:
+        path: JSON file with the `id` and `description` of every dataflow.
+
+    Returns:
+        tuple[Dataflow, ...]: Dataflows, in the order of the file.
+    """
+    with path.open("r", encoding="utf-8") as fp:
+        return tuple(Dataflow(**item) for item in json.load(fp))
+
+
+def render_dataflows(dataflows: tuple[Dataflow, ...]) -> str:
+    """List dataflows as `- <id>: <description>` lines."""
+    return "\n".join(f"- {dataflow.id}: {dataflow.description}" for dataflow in dataflows)
+
+
+# Loaded once at startup, as the list only changes with a new release
+CURATED_DATAFLOWS = load_dataflows()
+_DATAFLOWS_LISTING = render_dataflows(CURATED_DATAFLOWS)
+
+
+def get_curated_dataflow_ids() -> list[str]:
+    """IDs of the dataflows listed in `dataflows.json`."""
+    return [dataflow.id for dataflow in CURATED_DATAFLOWS]
+
+
+def handle_get_available_dataflows() -> str:
+    """Get information about available dataflows.
+
+    Returns:
+        String containing descriptions of available dataflows and their purposes
+    """
+    return _DATAFLOWS_LISTING
@@ -0,0 +1,269 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import zlib
+from collections.abc import Callable
+from dataclasses import dataclass
+from logging import getLogger
+from pathlib import Path
+from types import TracebackType
+from typing import BinaryIO, Self
+
+logger = getLogger(__name__)
+
+# Faster than the default level 9 and still shrinks SDMX-JSON responses about 10x
+COMPRESS_LEVEL = 3
+# Writes sweep the directory at most this often, or once a tenth of `max_bytes` was written since
+SWEEP_INTERVAL_SECONDS = 60.0
+
+
+@dataclass
+class DiskCacheEntry:
+    """Raw SDMX response stored on disk, with its HTTP validators."""
+
+    body: bytes
+    etag: str | None
+    last_modified: str | None
+    age_seconds: float
+
+
+class DiskCacheReader:
+    """Open disk cache entry, whose body is decompressed as it is read."""
+
+    def __init__(
+        self, fp: BinaryIO, etag: str | None, last_modified: str | None, age_seconds: float
+    ) -> None:
+        self.etag = etag
+        self.last_modified = last_modified
+        self.age_seconds = age_seconds
+        self._fp = fp
+        # Reads the gzip stream from the current position of `fp`, after the header line
+        self._body = gzip.GzipFile(fileobj=fp, mode="rb")
+
+    def read(self, size: int = -1) -> bytes:
+        """Read up to `size` bytes of the body (all of it by default), `b""` at its end."""
+        return self._body.read(size)
+
+    def close(self) -> None:
+        """Close the entry file."""
+        self._body.close()
+        self._fp.close()
+
+    def __enter__(self) -> Self:
+        """Use the entry in a `with` block, closing it at the end."""
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        """Close the entry file."""
+        self.close()
+
+
+class DiskCacheWriter:
+    """Entry being written to the disk cache, compressed chunk by chunk.
+
+    The entry is written to a temporary file, which `commit` renames to the entry atomically, so
+    an entry whose body is not complete (e.g. a download that failed or was stopped early) is
+    never read.
+    """
+
+    def __init__(self, path: Path, header: bytes, on_commit: Callable[[Path], None]) -> None:
+        self._path = path
+        self._on_commit = on_commit
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_name = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        self._temp_path = Path(temp_name)
+        self._fp = os.fdopen(fd, "wb")
+        # A gzip stream (wbits 16 + 15), like `gzip.compress`
+        self._compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 31)
+        try:
+            self._fp.write(header)
+        except BaseException:
+            self.abort()
+            raise
+
+    def write(self, chunk: bytes) -> None:
+        """Append a chunk of the body."""
+        try:
+            self._fp.write(self._compressor.compress(chunk))
+        except BaseException:
+            self.abort()
+            raise
+
+    def commit(self) -> None:
+        """Finish the entry, atomically replacing the previous one."""
+        try:
+            self._fp.write(self._compressor.flush())
+            self._fp.close()
+            self._temp_path.replace(self._path)
+        except BaseException:
+            self.abort()
+            raise
+        self._on_commit(self._path)
+
+    def abort(self) -> None:
+        """Drop the entry, leaving the previous one, if any, in place."""
+        self._fp.close()
+        self._temp_path.unlink(missing_ok=True)
+
+
+class DiskCache:
+    """Persistent cache of raw SDMX responses, shareable by several server processes.
+
+    Each response is a single file named after the hash of its URL, holding a JSON header line with
+    the URL and its `ETag`/`Last-Modified` validators followed by the gzip-compressed body. Files
+    are written to a temporary file and atomically renamed, so concurrent readers always see a
+    complete entry. The file modification time is the time the entry was last fetched or
+    revalidated.
+
+    Writes regularly sweep the directory (see `sweep`), so entries of URLs that are never
+    requested again don't pile up, and the cache stays within `max_bytes`.
+    """
+
+    def __init__(
+        self, directory: Path, max_age_seconds: float, max_bytes: int | None = None
+    ) -> None:
+        """Create a cache in `directory`.
+
+        Args:
+            directory: Directory of the cache, created on first write.
+            max_age_seconds: Age after which entries are deleted instead of returned.
+            max_bytes: Size of the entries beyond which the least recently fetched are deleted,
+                `None` for no limit.
+        """
+        self.directory = directory
+        self.max_age_seconds = max_age_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+        self._written_since_sweep = 0
+
+    def read(self, url: str) -> DiskCacheEntry | None:
+        """Return the entry stored for `url`, or `None` if there is none or it is too old."""
+        reader = self.open(url)
+        if reader is None:
+            return None
+        with reader:
+            body = reader.read()
+        return DiskCacheEntry(
+            body=body,
+            etag=reader.etag,
+            last_modified=reader.last_modified,
+            age_seconds=reader.age_seconds,
+        )
+
+    def open(self, url: str) -> DiskCacheReader | None:
+        """Open the entry stored for `url`, to read its body in chunks.
+
+        Returns:
+            DiskCacheReader | None: Open entry, to be closed by the caller, or `None` if there is
+                none or it is too old.
+        """
+        path = self._path(url)
+        try:
+            fp = path.open("rb")
+        except FileNotFoundError:
+            return None
+        except OSError:
+            logger.warning("Ignoring unreadable disk cache entry %s", path, exc_info=True)
+            return None
+
+        try:
+            age_seconds = time.time() - os.fstat(fp.fileno()).st_mtime
+            header = json.loads(fp.readline())
+        except (OSError, ValueError):
+            fp.close()
+            logger.warning("Ignoring unreadable disk cache entry %s", path, exc_info=True)
+            return None
+
+        if header.get("url") != url:
+            fp.close()
+            return None
+        if age_seconds > self.max_age_seconds:
+            fp.close()
+            path.unlink(missing_ok=True)
+            return None
+
+        return DiskCacheReader(fp, header.get("etag"), header.get("last_modified"), age_seconds)
+
+    def write(self, url: str, body: bytes, etag: str | None, last_modified: str | None) -> None:
+        """Store the response for `url`, replacing any previous entry atomically."""
+        writer = self.writer(url, etag, last_modified)
+        writer.write(body)
+        writer.commit()
+
+    def writer(self, url: str, etag: str | None, last_modified: str | None) -> DiskCacheWriter:
+        """Start storing the response for `url`, to write its body in chunks.
+
+        Returns:
+            DiskCacheWriter: Entry being written, to be committed or aborted by the caller.
+        """
+        header = json.dumps({"url": url, "etag": etag, "last_modified": last_modified})
+        return DiskCacheWriter(self._path(url), header.encode() + b"\n", self._record_write)
+
+    def sweep(self) -> int:
+        """Delete the entries older than `max_age_seconds`, then the oldest beyond `max_bytes`.
+
+        Entries are looked up on disk, so those written by other processes sharing the directory
+        count too. Temporary files left by interrupted writes are deleted once too old.
+
+        Returns:
+            int: Number of files deleted.
+        """
+        now = time.time()
+        entries: list[tuple[float, int, Path]] = []
+        deleted = 0
+        for path in self.directory.glob("*/*"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if now - stat.st_mtime > self.max_age_seconds:
+                path.unlink(missing_ok=True)
+                deleted += 1
+            elif path.name.endswith(".sdmx.gz"):
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        size = sum(entry_size for _, entry_size, _ in entries)
+        if self.max_bytes is not None and size > self.max_bytes:
+            for _, entry_size, path in sorted(entries):
+                path.unlink(missing_ok=True)
+                deleted += 1
+                size -= entry_size
+                if size <= self.max_bytes:
+                    break
+        if deleted:
+            logger.info("Deleted %s disk cache entries, %s bytes left", deleted, size)
+        return deleted
+
+    def _record_write(self, path: Path) -> None:
+        """Sweep the directory if it is due after writing an entry."""
+        with self._lock:
+            self._written_since_sweep += path.stat().st_size
+            due = time.monotonic() - self._last_sweep >= SWEEP_INTERVAL_SECONDS or (
+                self.max_bytes is not None and self._written_since_sweep * 10 >= self.max_bytes
+            )
+            if due:
+                self._last_sweep = time.monotonic()
+                self._written_since_sweep = 0
+        if due:
+            self.sweep()
+
+    def touch(self, url: str) -> None:
+        """Mark the entry for `url` as fresh, after the server confirmed it is unchanged."""
+        try:
+            os.utime(self._path(url))
+        except FileNotFoundError:
+            logger.debug("Disk cache entry for %s was removed before being touched", url)
+
+    def _path(self, url: str) -> Path:
+        digest = hashlib.sha256(url.encode()).hexdigest()
+        return self.directory / digest[:2] / f"{digest}.sdmx.gz"
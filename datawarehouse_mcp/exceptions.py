@@ -2,3 +2,15 @@ class DataWarehouseAPIError(Exception):
     """Custom exception for data warehouse API errors."""
 
     pass
+
+
+class NoDataFoundError(DataWarehouseAPIError):
+    """Raised when the data warehouse has no data matching a query."""
+
+    pass
+
+
+class UpstreamUnavailableError(DataWarehouseAPIError):
+    """Raised when the SDMX API is failing, or deemed down by the circuit breaker."""
+
+    pass
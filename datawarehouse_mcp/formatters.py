@@ -0,0 +1,117 @@
+import json
+from collections.abc import Callable
+from typing import Any
+
+import pandas as pd
+from exceptions import DataWarehouseAPIError
+
+# Compact JSON, the whitespace of the default separators is paid in tokens on every value
+_SEPARATORS = (",", ":")
+
+
+def to_table(data: pd.DataFrame) -> str:
+    """Render the data as a whitespace-aligned text table."""
+    return data.to_string(max_rows=None, max_cols=None, na_rep="None")
+
+
+def to_csv(data: pd.DataFrame) -> str:
+    """Render the data as CSV with a header row, missing values are empty fields."""
+    return data.to_csv(index=False)
+
+
+def to_records(data: pd.DataFrame) -> str:
+    """Render the data as a JSON list of `{column: value}` objects, one per row."""
+    return data.to_json(orient="records", force_ascii=False)
+
+
+def to_columnar(data: pd.DataFrame) -> str:
+    """Render the data as compact JSON with constant columns factored out.
+
+    Columns with a single value on every row go under `constants`, as `{column: value}`. The
+    others go under `columns`: categorical columns as `{"values": [...], "codes": [...]}`, where
+    each code is the position of the row's value in `values`, and other columns as a list of
+    values. Missing values are `null`.
+    """
+    constants: dict[str, Any] = {}
+    columns: dict[str, Any] = {}
+    for name, column in data.items():
+        unique = column.unique()
+        if len(data) > 0 and len(unique) == 1:
+            constants[str(name)] = _to_python(unique[0])
+        elif isinstance(column.dtype, pd.CategoricalDtype):
+            used = column.cat.remove_unused_categories()
+            codes = used.cat.codes.astype(object).where(used.cat.codes >= 0, None)
+            columns[str(name)] = {
+                "values": used.cat.categories.tolist(),
+                "codes": codes.tolist(),
+            }
+        else:
+            columns[str(name)] = column.astype(object).where(column.notna(), None).tolist()
+
+    return json.dumps(
+        {"num_rows": len(data), "constants": constants, "columns": columns},
+        ensure_ascii=False,
+        separators=_SEPARATORS,
+    )
+
+
+def _to_python(value: Any) -> Any:  # noqa: ANN401
+    """Convert a scalar from a DataFrame into a JSON-serializable Python value."""
+    if pd.isna(value):
+        return None
+    return value.item() if hasattr(value, "item") else value
+
+
+OUTPUT_FORMATS: dict[str, Callable[[pd.DataFrame], str]] = {
+    "table": to_table,
+    "csv": to_csv,
+    "records": to_records,
+    "columnar": to_columnar,
+}
+
+
+def get_formatter(output_format: str) -> Callable[[pd.DataFrame], str]:
+    """Return the function rendering data in `output_format`.
+
+    Args:
+        output_format: One of `table`, `csv`, `records` or `columnar`.
+
+    Returns:
+        Callable[[pd.DataFrame], str]: Function rendering a DataFrame as a string.
+
+    Raises:
+        DataWarehouseAPIError: If the output format is not supported.
+    """
+    try:
+        return OUTPUT_FORMATS[output_format]
+    except KeyError:
+        msg = f"Invalid output_format: {output_format}. Must be one of {', '.join(OUTPUT_FORMATS)}"
+        raise DataWarehouseAPIError(msg) from None
+
+
+def select_columns(data: pd.DataFrame, columns: str | None) -> pd.DataFrame:
+    """Keep only the requested columns of the data, in the requested order.
+
+    Args:
+        data: Data to project.
+        columns: Plus-separated column names, e.g. `REF_AREA+TIME_PERIOD+OBS_VALUE`. All the
+            columns are kept if `None` or empty.
+
+    Returns:
+        pd.DataFrame: Data with the requested columns.
+
+    Raises:
+        DataWarehouseAPIError: If some of the columns are not in the data.
+    """
+    if not columns:
+        return data
+
+    names = list(dict.fromkeys(name.strip() for name in columns.split("+") if name.strip()))
+    unknown = [name for name in names if name not in data.columns]
+    if unknown:
+        msg = (
+            f"Unknown columns: {', '.join(unknown)}. "
+            f"Available columns: {', '.join(map(str, data.columns))}"
+        )
+        raise DataWarehouseAPIError(msg)
+    return data[names]
@@ -1,40 +1,75 @@
-import json
-import urllib.parse
+import asyncio
+import dataclasses
+import secrets
+import time
+from collections.abc import AsyncIterator
+from contextlib import aclosing
 from logging import getLogger
-from pathlib import Path
 
+import httpx
 import pandas as pd
-import requests
-from constants import BASE_URL
-from exceptions import DataWarehouseAPIError
-from schemas import Dataflow
-from sdmx_parser import build_df_from_json
+from aggregations import LATEST_OBSERVATIONS, LATEST_OPERATIONS, OPERATIONS, aggregate
+from cache import ResultCache
+from config import config
+from data_cache import DataCache, estimate_frame_size, limit_rows, rows_to_fetch
+from exceptions import DataWarehouseAPIError, NoDataFoundError, UpstreamUnavailableError
+from http_client import stream_bytes
+from metrics import record_rows_parsed, record_stage, span
+from mirror import get_mirror
+from popularity import get_query_popularity
+from schemas import (
+    BatchQuery,
+    DataflowStructure,
+    DataPage,
+    DataQuery,
+    DataResult,
+    IndicatorSearchResult,
+)
+from sdmx_parser import build_df_from_csv, concat_frames
+from search import IndicatorIndex, estimate_index_size, load_indicator_index
+from streaming_parser import SdmxJsonStreamParser
+from structure import get_cached_dataflow_structure, get_dataflow_structure
+from validation import validate_query_codes
+from workers import run_in_worker
 
 logger = getLogger(__name__)
 
 
-def handle_get_available_dataflows() -> str:
-    """Get information about available dataflows.
+_data_cache = DataCache(
+    "data",
+    ttl_seconds=config.cache.data_ttl_seconds,
+    max_bytes=config.cache.data_max_bytes,
+    max_stale_seconds=config.cache.max_stale_seconds,
+    serve_subsets=config.cache.serve_subsets,
+)
 
-    Returns:
-        String containing descriptions of available dataflows and their purposes
-    """
-    try:
-        dataflows_path = Path(__file__).with_name("dataflows.json")
-        with dataflows_path.open("r", encoding="utf-8") as fp:
-            raw_items = json.load(fp)
 
-        dataflows = [Dataflow(**item) for item in raw_items]
+# Large results kept for paging, by result handle
+_result_store: ResultCache[pd.DataFrame] = ResultCache(
+    "results",
+    ttl_seconds=config.results.ttl_seconds,
+    max_bytes=config.results.max_bytes,
+    sizeof=estimate_frame_size,
+)
 
-        info_on_dataflows = "\n".join(f"- {item.id}: {item.description}" for item in dataflows)
-    except Exception as e:
-        logger.exception("Error loading available dataflows")
-        raise DataWarehouseAPIError(str(e)) from e
 
-    return info_on_dataflows
+# Index of the indicators of every curated dataflow. A partial index (some structures failed) is
+# not cached, so the next search retries the failed dataflows; the others are in the structure cache
+_indicator_index: ResultCache[IndicatorIndex] = ResultCache(
+    "search",
+    ttl_seconds=config.search.index_ttl_seconds,
+    max_bytes=config.cache.structure_max_bytes,
+    sizeof=estimate_index_size,
+    cacheable=lambda index: not index.errors,
+)
+
+# Dataflows whose structure is fetched in the background to validate the next queries, and the
+# tasks doing it (referenced so they aren't GC'd)
+_prefetching: set[str] = set()
+_background_tasks: set[asyncio.Task[DataflowStructure]] = set()
 
 
-def handle_get_all_indicators_for_dataflow(dataflow_id: str) -> dict[str, str]:
+async def handle_get_all_indicators_for_dataflow(dataflow_id: str) -> dict[str, str]:
     """Get information on indicators for a specific dataflow.
 
     Args:
@@ -45,64 +80,554 @@ def handle_get_all_indicators_for_dataflow(dataflow_id: str) -> dict[str, str]:
     """
     logger.info("Getting indicators info for dataflow %s", dataflow_id)
     try:
-        url = urllib.parse.urljoin(BASE_URL, f"data/{dataflow_id}/All?format=sdmx-json")
-        data = requests.get(url, timeout=200).json()
-        data_structure = data["data"]["structure"]
-        indicators_info = {
-            val["id"]: val["name"]
-            for i, attr in enumerate(data_structure["dimensions"]["series"])
-            for _, val in enumerate(attr["values"])
-            if i == 1
-        }
-
-    except (requests.RequestException, ValueError, KeyError) as e:
+        structure = await get_dataflow_structure(dataflow_id)
+        indicator_dimension = structure.get_dimension("INDICATOR")
+    except KeyError as e:
         logger.exception("Error getting indicators info for dataflow %s", dataflow_id)
         raise DataWarehouseAPIError(str(e)) from e
 
+    indicators_info = {code.id: code.name for code in indicator_dimension.codes}
+
     logger.info("Returning indicators info for dataflow %s", dataflow_id)
     return indicators_info
 
 
-def handle_get_data_for_dataflow(
+async def handle_search_indicators(query: str, limit: int = 10) -> IndicatorSearchResult:
+    """Search the indicators of every curated dataflow by code, name and description.
+
+    The index is loaded from its prebuilt file or built from the dataflow structures on the first
+    search, and kept in memory, so later searches take milliseconds.
+
+    Args:
+        query: Free text, e.g. `measles vaccination`. Prefixes and single typos match too.
+        limit: Maximum number of matches to return.
+
+    Returns:
+        IndicatorSearchResult: Matches, best first, and the dataflows missing from the index.
+    """
+    if not query.strip():
+        msg = "query is required"
+        raise DataWarehouseAPIError(msg)
+    if limit < 1:
+        msg = f"limit must be at least 1, got {limit}"
+        raise DataWarehouseAPIError(msg)
+
+    index = await _indicator_index.get_or_fetch("curated", load_indicator_index)
+    return IndicatorSearchResult(matches=index.search(query, limit), errors=index.errors)
+
+
+async def handle_get_data_for_dataflow(  # noqa: PLR0913
     dataflow_id: str,
     ref_areas: str,
     indicators: str,
     year: int | None = None,
-) -> pd.DataFrame:
+    start_year: int | None = None,
+    end_year: int | None = None,
+    last_n_observations: int | None = None,
+    max_rows: int | None = None,
+) -> DataResult:
     """Get data for a specific dataflow.
 
-    Returns all available data that matches the criteria.
-    If the year is not found, it will return all data for that country and indicator.
+    Returns all available data that matches the criteria. Period filters are sent to the SDMX API
+    as `startPeriod`/`endPeriod`/`lastNObservations`, so only the requested periods are downloaded.
+    If the year is not found, it will return all data for that country and indicator, at the cost
+    of a second request.
+
+    Queries with many ref areas or indicators are split into chunks that are fetched concurrently
+    and concatenated in order. A chunk that fails is reported in the result's `errors` instead of
+    failing the whole call.
+
+    Responses are parsed as they are downloaded, so the raw body is never held in memory whole.
+    Dataflows synced into the local mirror (if enabled) are answered from it instead.
+
+    Results are cached, and a query contained in a cached result (e.g. fewer countries or a single
+    year of it) is answered by filtering that result, fetching only what no cached result covers
+    (see `data_cache.DataCache`). Successful queries are counted, so the most popular ones are kept
+    cached in the background (see `prefetch.Prefetcher`).
+
+    With `query.validate_codes`, ref areas and indicators are first checked against the cached
+    structure of the dataflow (see `validation.validate_query_codes`), without any request:
+    unknown codes are left out and reported in the result's `errors`, and a query with no known
+    code of a dimension is rejected.
 
     Args:
         dataflow_id: Dataflow ID to get data for
         ref_areas: Plus-separated string of ISO-3 codes to filter by.
         indicators: Plus-separated string of indicator codes to retrieve.
         year: The year of the data to retrieve.
+        start_year: First year of the data to retrieve. Can't be combined with `year`.
+        end_year: Last year of the data to retrieve. Can't be combined with `year`.
+        last_n_observations: Only retrieve the latest N observations of every series.
+        max_rows: Stop parsing once this many rows have been received, and return only them.
 
     Returns:
-        pd.DataFrame: DataFrame containing the requested data
+        DataResult: DataFrame containing the requested data, and errors of failed chunks and
+            unknown codes
+
+    Raises:
+        DataWarehouseAPIError: If the arguments are invalid, e.g. no ref area is known.
     """
     logger.info("Getting data for dataflow %s", dataflow_id)
-    try:
-        url = urllib.parse.urljoin(
-            BASE_URL,
-            f"data/{dataflow_id}/{ref_areas}.{indicators}?format=sdmx-json",
+    query = DataQuery(
+        dataflow_id=dataflow_id,
+        ref_areas=split_codes(ref_areas),
+        indicators=split_codes(indicators),
+        year=year,
+        start_year=start_year,
+        end_year=end_year,
+        last_n_observations=last_n_observations,
+        max_rows=max_rows,
+    )
+    if max_rows is not None and max_rows < 1:
+        msg = f"max_rows must be at least 1, got {max_rows}"
+        raise DataWarehouseAPIError(msg)
+    query, unknown_codes = _validate_codes(query)
+    params = _get_period_params(query)
+
+    # Parts of the query not covered by the cache have the same periods, so the same parameters
+    result = await _data_cache.get_or_fetch(query, lambda part: _get_data(part, params))
+    get_query_popularity().record(query)
+    if unknown_codes:
+        result = dataclasses.replace(result, errors=[*unknown_codes, *result.errors])
+    return result
+
+
+async def warm_data_cache(query: DataQuery, refresh_within_seconds: float = 0.0) -> None:
+    """Fetch the result of a validated query into the data cache, without counting it.
+
+    Args:
+        query: Query, as recorded by `handle_get_data_for_dataflow`.
+        refresh_within_seconds: Also fetch the result if the cached one expires within this many
+            seconds.
+    """
+    params = _get_period_params(query)
+    await _data_cache.get_or_fetch(
+        query,
+        lambda part: _get_data(part, params),
+        refresh_within_seconds=refresh_within_seconds,
+    )
+
+
+async def handle_get_data_for_dataflows(queries: list[BatchQuery]) -> list[DataResult | Exception]:
+    """Get the data of several queries, of the same or different dataflows, concurrently.
+
+    Up to `query.max_parallel_queries` queries are fetched at the same time, each of them like in
+    `handle_get_data_for_dataflow` (so sharing its cache), and a query that fails doesn't fail the
+    others, so the batch takes about as long as its slowest query.
+
+    Args:
+        queries: Queries to run, at most `query.max_batch_queries`.
+
+    Returns:
+        list[DataResult | Exception]: Result of every query, in order, or the error it raised.
+    """
+    if not queries:
+        msg = "At least one query is required"
+        raise DataWarehouseAPIError(msg)
+    if len(queries) > config.query.max_batch_queries:
+        msg = f"At most {config.query.max_batch_queries} queries are allowed, got {len(queries)}"
+        raise DataWarehouseAPIError(msg)
+
+    logger.info("Getting data for a batch of %s queries", len(queries))
+    semaphore = asyncio.Semaphore(config.query.max_parallel_queries)
+
+    async def get_data(query: BatchQuery) -> DataResult:
+        async with semaphore:
+            return await handle_get_data_for_dataflow(**dataclasses.asdict(query))
+
+    results = await asyncio.gather(*(get_data(q) for q in queries), return_exceptions=True)
+    checked: list[DataResult | Exception] = []
+    for result in results:
+        if isinstance(result, BaseException) and not isinstance(result, Exception):
+            raise result
+        checked.append(result)
+    return checked
+
+
+def combine_results(
+    queries: list[BatchQuery], results: list[DataResult | Exception]
+) -> pd.DataFrame:
+    """Stack the data of a batch in long format, aligned on ref area and period.
+
+    Rows are tagged with their dataflow in a `DATAFLOW` column and sorted by `REF_AREA`,
+    `TIME_PERIOD`, `DATAFLOW` and `INDICATOR`, so the values of different dataflows for the same
+    country and year are next to each other. Dimensions missing from some dataflows are empty.
+
+    Args:
+        queries: Queries of the batch.
+        results: Results of `handle_get_data_for_dataflows`, failed queries are skipped.
+
+    Returns:
+        pd.DataFrame: Rows of every successful query.
+
+    Raises:
+        DataWarehouseAPIError: If no query returned data.
+    """
+    frames: list[pd.DataFrame] = []
+    for query, result in zip(queries, results, strict=True):
+        if isinstance(result, DataResult) and not result.data.empty:
+            # Shallow copy, as cached results are shared
+            frame = result.data.copy(deep=False)
+            frame.insert(0, "DATAFLOW", pd.Categorical([query.dataflow_id] * len(frame)))
+            frames.append(frame)
+    if not frames:
+        msg = "No query of the batch returned data"
+        raise DataWarehouseAPIError(msg)
+
+    data = concat_frames(frames)
+    keys = [c for c in ("REF_AREA", "TIME_PERIOD", "DATAFLOW", "INDICATOR") if c in data.columns]
+    return data.sort_values(
+        keys, key=lambda column: column.astype(str), kind="stable", ignore_index=True
+    )
+
+
+async def handle_aggregate_data_for_dataflow(  # noqa: PLR0913
+    dataflow_id: str,
+    ref_areas: str,
+    indicators: str,
+    operation: str,
+    group_by: str | None = None,
+    n: int = 10,
+    start_year: int | None = None,
+    end_year: int | None = None,
+) -> DataResult:
+    """Aggregate the data of a dataflow in the server, returning only the small result.
+
+    The data is fetched like in `handle_get_data_for_dataflow`, so it is shared with its cache.
+    Operations that only need the latest observation of every series only download the last
+    `LATEST_OBSERVATIONS` ones, to fall back on the previous values if the latest is missing.
+
+    Args:
+        dataflow_id: Dataflow ID to get data for
+        ref_areas: Plus-separated string of ISO-3 codes to filter by.
+        indicators: Plus-separated string of indicator codes to retrieve.
+        operation: Aggregation, one of `aggregations.OPERATIONS`.
+        group_by: Plus-separated columns to group by for statistics and rankings.
+        n: Number of series of `top` and `bottom` rankings.
+        start_year: First year of the data to aggregate.
+        end_year: Last year of the data to aggregate.
+
+    Returns:
+        DataResult: Aggregated data, and errors of failed chunks
+    """
+    logger.info("Aggregating data for dataflow %s with %s", dataflow_id, operation)
+    if operation not in OPERATIONS:
+        msg = f"Invalid operation: {operation}. Must be one of {', '.join(OPERATIONS)}"
+        raise DataWarehouseAPIError(msg)
+
+    result = await handle_get_data_for_dataflow(
+        dataflow_id=dataflow_id,
+        ref_areas=ref_areas,
+        indicators=indicators,
+        start_year=start_year,
+        end_year=end_year,
+        last_n_observations=LATEST_OBSERVATIONS if operation in LATEST_OPERATIONS else None,
+    )
+    structure = await get_dataflow_structure(dataflow_id)
+    group_by_columns = list(dict.fromkeys(c.strip() for c in (group_by or "").split("+")))
+    with span("aggregate"):
+        aggregated = await run_in_worker(
+            aggregate,
+            result.data,
+            [dimension.id for dimension in structure.series_dimensions],
+            operation,
+            [column for column in group_by_columns if column] or None,
+            n,
         )
+    return DataResult(data=aggregated, errors=result.errors)
+
+
+def store_result(data: pd.DataFrame) -> str | None:
+    """Keep a result in memory so that its pages can be fetched later without downloading it again.
+
+    Stored results expire after `results.ttl_seconds`, and the least recently used ones are
+    dropped when the store exceeds `results.max_bytes`.
+
+    Args:
+        data: Result to store, treated as read-only from now on.
+
+    Returns:
+        str | None: Handle of the result, or `None` if it is larger than the whole store.
+    """
+    if estimate_frame_size(data) > config.results.max_bytes:
+        logger.warning("Result of %s rows is too large to store for paging", len(data))
+        return None
+
+    result_handle = secrets.token_hex(8)
+    _result_store.put(result_handle, data)
+    return result_handle
+
+
+def handle_get_data_page(result_handle: str, offset: int = 0, limit: int | None = None) -> DataPage:
+    """Get a page of a stored result.
+
+    Args:
+        result_handle: Handle returned with the first page of the result.
+        offset: Position of the first row of the page.
+        limit: Maximum number of rows of the page. Defaults to `results.page_size` and can't be
+            more than `results.max_page_size`.
+
+    Returns:
+        DataPage: Rows of the page and position of the next one.
+
+    Raises:
+        DataWarehouseAPIError: If the handle is unknown or expired, or the range is invalid.
+    """
+    data = _result_store.get(result_handle)
+    if data is None:
+        msg = f"Unknown or expired result handle: {result_handle}. Run the query again"
+        raise DataWarehouseAPIError(msg)
+
+    return get_page(data, offset, limit)
+
+
+def get_page(data: pd.DataFrame, offset: int = 0, limit: int | None = None) -> DataPage:
+    """Slice a page of rows out of a result.
+
+    Args:
+        data: Whole result.
+        offset: Position of the first row of the page.
+        limit: Maximum number of rows of the page. Defaults to `results.page_size` and can't be
+            more than `results.max_page_size`.
+
+    Returns:
+        DataPage: Rows of the page and position of the next one.
+
+    Raises:
+        DataWarehouseAPIError: If the offset or limit are out of range.
+    """
+    if limit is None:
+        limit = config.results.page_size
+    if not 1 <= limit <= config.results.max_page_size:
+        msg = f"limit must be between 1 and {config.results.max_page_size}, got {limit}"
+        raise DataWarehouseAPIError(msg)
+    if not 0 <= offset <= len(data):
+        msg = f"offset must be between 0 and {len(data)}, got {offset}"
+        raise DataWarehouseAPIError(msg)
+
+    return DataPage(data=data.iloc[offset : offset + limit], offset=offset, num_rows=len(data))
+
+
+def split_codes(codes: str) -> tuple[str, ...]:
+    """Split a plus-separated string of codes into a sorted tuple without duplicates.
+
+    Args:
+        codes: Plus-separated codes, e.g. `URY+ARG`.
+
+    Returns:
+        tuple[str, ...]: Sorted unique codes, e.g. `("ARG", "URY")`.
+    """
+    return tuple(sorted({code.strip() for code in codes.split("+") if code.strip()}))
+
+
+def _validate_codes(query: DataQuery) -> tuple[DataQuery, list[str]]:
+    """Validate the codes of a query if the structure of its dataflow is cached.
+
+    Otherwise the query is sent as is, and the structure is fetched in the background so that
+    the next queries of the dataflow are validated.
+    """
+    if not config.query.validate_codes:
+        return query, []
+
+    structure = get_cached_dataflow_structure(query.dataflow_id)
+    if structure is not None:
+        return validate_query_codes(query, structure)
 
-        data = requests.get(url, timeout=200).json()
+    if query.dataflow_id not in _prefetching:
+        _prefetching.add(query.dataflow_id)
+        task = asyncio.create_task(get_dataflow_structure(query.dataflow_id))
+        _background_tasks.add(task)
 
-        if "errors" in data:
-            logger.error("Error getting data for dataflow %s", dataflow_id)
-            raise DataWarehouseAPIError(str(data["errors"]))
+        def done(
+            task: asyncio.Task[DataflowStructure], dataflow_id: str = query.dataflow_id
+        ) -> None:
+            _background_tasks.discard(task)
+            _prefetching.discard(dataflow_id)
+            if not task.cancelled() and task.exception() is not None:
+                logger.warning(
+                    "Prefetching the structure of %s failed: %s", dataflow_id, task.exception()
+                )
 
-        data = build_df_from_json(data["data"])
-    except (requests.RequestException, ValueError, KeyError) as e:
-        logger.exception("Error getting data for dataflow %s", dataflow_id)
+        task.add_done_callback(done)
+    return query, []
+
+
+async def _get_data(query: DataQuery, params: dict[str, str]) -> DataResult:
+    """Get the data of a query, falling back to all years if its year has no data."""
+    try:
+        result = await _fetch_chunks(query, params)
+    except NoDataFoundError:
+        if query.year is None:
+            raise
+        result = None
+
+    if query.year is not None and (result is None or result.data.empty):
+        logger.info("No data for year %s, getting data for all years", query.year)
+        params = {k: v for k, v in params.items() if k not in ("startPeriod", "endPeriod")}
+        result = await _fetch_chunks(query, params)
+
+    return result
+
+
+async def _fetch_chunks(query: DataQuery, params: dict[str, str]) -> DataResult:
+    """Fetch the chunks of a query concurrently and concatenate them in order."""
+    mirror = get_mirror()
+    if mirror is not None and mirror.has(query.dataflow_id):
+        structure = await get_dataflow_structure(query.dataflow_id)
+        with span("mirror"):
+            data = await run_in_worker(mirror.read, query, params, structure)
+        return limit_rows(DataResult(data=data), query.max_rows)
+
+    chunks = _split_query(query)
+    if len(chunks) == 1:
+        return limit_rows(DataResult(data=await _fetch_data(query, params)), query.max_rows)
+
+    logger.info("Splitting query for dataflow %s in %s chunks", query.dataflow_id, len(chunks))
+    semaphore = asyncio.Semaphore(config.query.max_parallel_requests)
+
+    async def fetch_chunk(chunk: DataQuery) -> pd.DataFrame:
+        async with semaphore:
+            return await _fetch_data(chunk, params)
+
+    results = await asyncio.gather(*(fetch_chunk(c) for c in chunks), return_exceptions=True)
+
+    frames: list[pd.DataFrame] = []
+    errors: list[str] = []
+    for chunk, result in zip(chunks, results, strict=True):
+        if isinstance(result, NoDataFoundError):
+            continue
+        if isinstance(result, Exception):
+            errors.append(f"{chunk.key}: {result}")
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            frames.append(result)
+
+    if not frames:
+        if errors:
+            # Kept as unavailable if any chunk was, so that the data cache can serve a stale result
+            unavailable = any(isinstance(r, UpstreamUnavailableError) for r in results)
+            error_type = UpstreamUnavailableError if unavailable else DataWarehouseAPIError
+            raise error_type("; ".join(errors))
+        msg = f"No data found for {query.key}"
+        raise NoDataFoundError(msg)
+
+    return limit_rows(DataResult(data=concat_frames(frames), errors=errors), query.max_rows)
+
+
+def _split_query(query: DataQuery) -> list[DataQuery]:
+    """Split a query into queries with a bounded number of ref areas and indicators each."""
+
+    def chunk(codes: tuple[str, ...], size: int) -> list[tuple[str, ...]]:
+        return [codes[i : i + size] for i in range(0, len(codes), size)] or [codes]
+
+    return [
+        dataclasses.replace(query, ref_areas=ref_areas, indicators=indicators)
+        for ref_areas in chunk(query.ref_areas, config.query.max_ref_areas_per_request)
+        for indicators in chunk(query.indicators, config.query.max_indicators_per_request)
+    ]
+
+
+async def _fetch_data(query: DataQuery, params: dict[str, str]) -> pd.DataFrame:
+    """Request the data of a query from the SDMX API and parse it into a DataFrame."""
+    if config.query.wire_format == "csv":
+        return await _fetch_csv_data(query, params)
+
+    parser = SdmxJsonStreamParser(max_rows=rows_to_fetch(query.max_rows))
+    # Parsing is interleaved with the download, so its time is summed over the chunks
+    parse_seconds = 0.0
+    try:
+        async with aclosing(
+            stream_bytes(
+                f"data/{query.dataflow_id}/{query.key}",
+                params={"format": "sdmx-json", **params},
+            )
+        ) as chunks:
+            async for chunk in chunks:
+                start = time.perf_counter()
+                await run_in_worker(parser.feed, chunk)
+                parse_seconds += time.perf_counter() - start
+
+        if parser.errors is not None:
+            logger.error("Error getting data for dataflow %s", query.dataflow_id)
+            raise DataWarehouseAPIError(str(parser.errors))
+
+        start = time.perf_counter()
+        data = await run_in_worker(parser.close)
+        parse_seconds += time.perf_counter() - start
+    except (httpx.HTTPError, ValueError, KeyError) as e:
+        logger.exception("Error getting data for dataflow %s", query.dataflow_id)
         raise DataWarehouseAPIError(str(e)) from e
+    else:
+        record_stage("parse", parse_seconds)
+        record_rows_parsed(len(data))
+        return data
+
+
+async def _fetch_csv_data(query: DataQuery, params: dict[str, str]) -> pd.DataFrame:
+    """Request the data of a query as SDMX-CSV and parse it with the dataflow structure."""
+    # The structure is cached, so this only costs a request the first time a dataflow is queried
+    structure = await get_dataflow_structure(query.dataflow_id)
+    try:
+        body = await _read_csv_rows(
+            stream_bytes(
+                f"data/{query.dataflow_id}/{query.key}",
+                params={"format": "csv", "labels": "id", **params},
+            ),
+            rows_to_fetch(query.max_rows),
+        )
+        with span("parse"):
+            data = await run_in_worker(
+                build_df_from_csv, body, structure, rows_to_fetch(query.max_rows)
+            )
+    except (httpx.HTTPError, ValueError) as e:
+        logger.exception("Error getting data for dataflow %s", query.dataflow_id)
+        raise DataWarehouseAPIError(str(e)) from e
+    else:
+        record_rows_parsed(len(data))
+        return data
+
+
+async def _read_csv_rows(chunks: AsyncIterator[bytes], max_rows: int | None) -> bytes:
+    """Read a CSV body, stopping the download once the header and `max_rows` rows are received."""
+    received: list[bytes] = []
+    num_lines = 0
+    async with aclosing(chunks):
+        async for chunk in chunks:
+            received.append(chunk)
+            num_lines += chunk.count(b"\n")
+            if max_rows is not None and num_lines > max_rows:
+                break
+
+    body = b"".join(received)
+    if max_rows is not None and num_lines > max_rows:
+        # Drop the incomplete last row, `build_df_from_csv` keeps the first `max_rows` ones
+        body = body[: body.rindex(b"\n") + 1]
+    return body
+
+
+def _get_period_params(query: DataQuery) -> dict[str, str]:
+    """Translate the period filters of a query into SDMX query parameters."""
+    year, start_year, end_year = query.year, query.start_year, query.end_year
+    last_n_observations = query.last_n_observations
+    if year is not None and (start_year is not None or end_year is not None):
+        msg = "year can't be combined with start_year or end_year"
+        raise DataWarehouseAPIError(msg)
+    if start_year is not None and end_year is not None and start_year > end_year:
+        msg = f"start_year ({start_year}) is after end_year ({end_year})"
+        raise DataWarehouseAPIError(msg)
+    if last_n_observations is not None and last_n_observations < 1:
+        msg = f"last_n_observations must be at least 1, got {last_n_observations}"
+        raise DataWarehouseAPIError(msg)
 
-    if year is not None and str(year) in data["TIME_PERIOD"].unique():
-        logger.info("Filtering data for year %s", year)
-        data = data[data["TIME_PERIOD"] == str(year)]
+    if year is not None:
+        start_year = end_year = year
 
-    return data
+    params: dict[str, str] = {}
+    if start_year is not None:
+        params["startPeriod"] = str(start_year)
+    if end_year is not None:
+        params["endPeriod"] = str(end_year)
+    if last_n_observations is not None:
+        params["lastNObservations"] = str(last_n_observations)
+    return params
@@ -0,0 +1,374 @@
+import asyncio
+import json
+import time
+from collections.abc import AsyncIterator
+from contextlib import AbstractAsyncContextManager, aclosing
+from logging import getLogger
+from pathlib import Path
+from typing import Any
+
+import httpx
+from config import config
+from constants import BASE_URL
+from disk_cache import DiskCache, DiskCacheWriter
+from exceptions import NoDataFoundError
+from metrics import record_download, record_stage, record_upstream_response, span
+from scheduler import Admission, RequestScheduler
+from upstream import UpstreamPolicy, endpoint_of
+from workers import run_in_worker
+
+logger = getLogger(__name__)
+
+# Size of the chunks of streamed bodies handed to parsers
+STREAM_CHUNK_SIZE = 256 * 1024
+
+_client: httpx.AsyncClient | None = None
+_client_loop: asyncio.AbstractEventLoop | None = None
+
+# Timeouts, hedging, retries and circuit breaker of every request, shared by the whole process
+_policy = UpstreamPolicy(config.upstream)
+# Admission control of every request, across sessions
+_scheduler = RequestScheduler(config.scheduler)
+
+_disk_cache: DiskCache | None = (
+    DiskCache(
+        Path(config.disk_cache.directory),
+        max_age_seconds=config.disk_cache.ttl_seconds + config.disk_cache.max_stale_seconds,
+        max_bytes=config.disk_cache.max_bytes,
+    )
+    if config.disk_cache.enabled
+    else None
+)
+# URLs being revalidated in the background, and the tasks doing it (referenced so they aren't GC'd)
+_revalidating: set[str] = set()
+_background_tasks: set[asyncio.Task[bytes]] = set()
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the process-wide HTTP client for the SDMX API.
+
+    The client keeps connections alive between calls, so only the first request to the SDMX host
+    pays the TCP and TLS handshakes. A client is bound to the event loop it was created in, so a
+    new one is created if the running loop changes (e.g. between `asyncio.run` calls).
+
+    Returns:
+        httpx.AsyncClient: Shared client with connection pooling and the configured timeouts.
+    """
+    global _client, _client_loop  # noqa: PLW0603
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        http_config = config.http
+        _client = httpx.AsyncClient(
+            base_url=BASE_URL,
+            limits=httpx.Limits(
+                max_connections=http_config.max_connections_per_host,
+                max_keepalive_connections=http_config.max_keepalive_connections,
+                keepalive_expiry=http_config.keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(
+                connect=http_config.connect_timeout,
+                read=http_config.read_timeout,
+                write=http_config.connect_timeout,
+                pool=http_config.read_timeout,
+            ),
+        )
+        _client_loop = loop
+    return _client
+
+
+async def close_http_client() -> None:
+    """Close the shared HTTP client and its pooled connections."""
+    global _client, _client_loop  # noqa: PLW0603
+    if _client is not None:
+        await _client.aclose()
+    _client = None
+    _client_loop = None
+
+
+async def get_bytes(path: str, params: dict[str, str] | None = None) -> bytes:
+    """Send a GET request to the SDMX API and return the raw body.
+
+    If the disk cache is enabled, fresh entries are served from disk and stale entries are served
+    right away while they are revalidated in the background with a conditional GET. Entries older
+    than the allowed staleness are dropped and downloaded again.
+
+    Requests are sent with the upstream policy (see `upstream.UpstreamPolicy`): latency-aware
+    timeouts, hedging, retries and circuit breaker. They first wait for admission by the scheduler
+    (see `scheduler.RequestScheduler`), which bounds the downloads in flight and caps the bandwidth
+    of background requests.
+
+    Args:
+        path: Path relative to the SDMX API base URL, e.g. `data/DM/URY.DM_BRTS`.
+        params: Query parameters.
+
+    Returns:
+        bytes: Body of the response.
+
+    Raises:
+        NoDataFoundError: If the SDMX API has no data for the query (HTTP 404).
+        UpstreamUnavailableError: If the SDMX API is failing or deemed down.
+        httpx.HTTPError: If the body can't be downloaded.
+    """
+    request = get_http_client().build_request("GET", path, params=params)
+    if _disk_cache is not None:
+        return await _get_body(_disk_cache, request)
+    return await _download(request)
+
+
+async def get_json(path: str, params: dict[str, str] | None = None) -> Any:  # noqa: ANN401
+    """Send a GET request to the SDMX API and decode the JSON body in the worker pool.
+
+    Args:
+        path: Path relative to the SDMX API base URL, e.g. `data/DM/URY.DM_BRTS`.
+        params: Query parameters.
+
+    Returns:
+        Any: Decoded JSON body.
+
+    Raises:
+        NoDataFoundError: If the SDMX API has no data for the query (HTTP 404).
+        UpstreamUnavailableError: If the SDMX API is failing or deemed down.
+        httpx.HTTPError: If the body can't be downloaded.
+        ValueError: If the body is not valid JSON.
+    """
+    body = await get_bytes(path, params)
+    with span("parse"):
+        return await run_in_worker(json.loads, body)
+
+
+async def stream_bytes(
+    path: str,
+    params: dict[str, str] | None = None,
+) -> AsyncIterator[bytes]:
+    """Send a GET request to the SDMX API and yield the body in chunks as it is downloaded.
+
+    Closing the iterator early (e.g. with `contextlib.aclosing`) closes the connection, so the
+    rest of the body is not downloaded. A download failing once the body started to be yielded is
+    not retried, but counts towards the circuit breaker.
+
+    If the disk cache is enabled, it is used as in `get_bytes`, still a chunk at a time: cached
+    bodies are decompressed from their file as they are yielded, and downloaded ones are
+    compressed into a new entry, only kept if the whole body was read.
+
+    Args:
+        path: Path relative to the SDMX API base URL, e.g. `data/DM/URY.DM_BRTS`.
+        params: Query parameters.
+
+    Yields:
+        bytes: Chunks of the body of the response.
+
+    Raises:
+        NoDataFoundError: If the SDMX API has no data for the query (HTTP 404).
+        UpstreamUnavailableError: If the SDMX API is failing or deemed down.
+        httpx.HTTPError: If the body can't be downloaded.
+    """
+    request = get_http_client().build_request("GET", path, params=params)
+    if _disk_cache is None:
+        chunks = _stream(request)
+    else:
+        chunks = _stream_through_disk_cache(_disk_cache, request)
+    async with aclosing(chunks):
+        async for chunk in chunks:
+            yield chunk
+
+
+async def _stream_through_disk_cache(
+    disk_cache: DiskCache, request: httpx.Request
+) -> AsyncIterator[bytes]:
+    """Yield the body of a request from the disk cache, or download it into the cache."""
+    url = str(request.url)
+    reader = await run_in_worker(disk_cache.open, url)
+    if reader is None:
+        async with aclosing(_stream(request, disk_cache)) as chunks:
+            async for chunk in chunks:
+                yield chunk
+        return
+
+    if reader.age_seconds >= config.disk_cache.ttl_seconds:
+        _revalidate_in_background(disk_cache, url, reader.etag, reader.last_modified)
+    try:
+        while chunk := await run_in_worker(reader.read, STREAM_CHUNK_SIZE):
+            yield chunk
+    finally:
+        reader.close()
+
+
+async def _stream(
+    request: httpx.Request, disk_cache: DiskCache | None = None
+) -> AsyncIterator[bytes]:
+    """Send a request and yield its body as it is downloaded.
+
+    With `disk_cache`, a complete body is stored in it, and a 304 response to a conditional
+    request marks the cached entry as fresh.
+    """
+    # The slot is held until the whole body is read, or the iterator closed
+    async with _admit(request) as admission:
+        start = time.perf_counter()
+        response = await _policy.send(get_http_client(), request)
+        # Time waiting for the response and its chunks, not the time the caller spends on them
+        download_seconds = time.perf_counter() - start
+        writer: DiskCacheWriter | None = None
+        try:
+            logger.debug("GET %s returned %s", response.url, response.status_code)
+            record_upstream_response(response.status_code)
+            _raise_for_no_data(response)
+            if disk_cache is not None and response.status_code == httpx.codes.NOT_MODIFIED:
+                await run_in_worker(disk_cache.touch, str(request.url))
+                return
+            if disk_cache is not None and response.status_code == httpx.codes.OK:
+                writer = await run_in_worker(
+                    disk_cache.writer,
+                    str(request.url),
+                    response.headers.get("ETag"),
+                    response.headers.get("Last-Modified"),
+                )
+            start = time.perf_counter()
+            async for chunk in response.aiter_bytes(STREAM_CHUNK_SIZE):
+                download_seconds += time.perf_counter() - start
+                record_download(len(chunk))
+                admission.record_bytes(len(chunk))
+                await admission.throttle(len(chunk))
+                if writer is not None:
+                    await run_in_worker(writer.write, chunk)
+                yield chunk
+                start = time.perf_counter()
+            if writer is not None:
+                await run_in_worker(writer.commit)
+                writer = None
+        except httpx.TransportError:
+            _policy.breaker.record_failure()
+            raise
+        finally:
+            if writer is not None:
+                writer.abort()
+            record_stage("download", download_seconds)
+            await response.aclose()
+
+
+async def _download(request: httpx.Request) -> bytes:
+    """Send a request without involving the disk cache."""
+    async with _admit(request) as admission:
+        with span("download"):
+            response = await _policy.send(get_http_client(), request)
+            body = await _read_body(response)
+        admission.record_bytes(len(body))
+        await admission.throttle(len(body))
+    logger.debug("GET %s returned %s", response.url, response.status_code)
+    record_upstream_response(response.status_code)
+    record_download(len(body))
+    _raise_for_no_data(response)
+    return body
+
+
+async def _get_body(disk_cache: DiskCache, request: httpx.Request) -> bytes:
+    """Get the body of a request from the disk cache, revalidating it if needed."""
+    url = str(request.url)
+    # Entries older than the TTL plus the allowed staleness are never returned
+    entry = await run_in_worker(disk_cache.read, url)
+
+    if entry is None:
+        return await _download_into(disk_cache, request)
+
+    if entry.age_seconds >= config.disk_cache.ttl_seconds:
+        _revalidate_in_background(disk_cache, url, entry.etag, entry.last_modified)
+    return entry.body
+
+
+def _revalidate_in_background(
+    disk_cache: DiskCache, url: str, etag: str | None, last_modified: str | None
+) -> None:
+    """Refresh a stale disk cache entry without making the caller wait for it."""
+    # While the circuit breaker is open the request would be rejected, and the entry still served
+    if url in _revalidating or _policy.breaker.state == "open":
+        return
+
+    _revalidating.add(url)
+    task = asyncio.create_task(_revalidate(disk_cache, url, etag, last_modified))
+    _background_tasks.add(task)
+
+    def done(task: asyncio.Task[None]) -> None:
+        _background_tasks.discard(task)
+        _revalidating.discard(url)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Background revalidation of %s failed: %s", url, task.exception())
+
+    task.add_done_callback(done)
+
+
+async def _revalidate(
+    disk_cache: DiskCache, url: str, etag: str | None, last_modified: str | None
+) -> None:
+    """Request `url` conditionally on the validators of its cached entry, and update the entry."""
+    headers: dict[str, str] = {}
+    if etag is not None:
+        headers["If-None-Match"] = etag
+    if last_modified is not None:
+        headers["If-Modified-Since"] = last_modified
+
+    request = get_http_client().build_request("GET", url, headers=headers)
+    # The body is written to the cache a chunk at a time, never held whole
+    async with aclosing(_stream(request, disk_cache)) as chunks:
+        async for _ in chunks:
+            pass
+
+
+async def _download_into(disk_cache: DiskCache, request: httpx.Request) -> bytes:
+    """Send a request, storing its body in the disk cache."""
+    async with _admit(request) as admission:
+        with span("download"):
+            response = await _policy.send(get_http_client(), request)
+            body = await _read_body(response)
+        admission.record_bytes(len(body))
+        await admission.throttle(len(body))
+    logger.debug("GET %s returned %s", response.url, response.status_code)
+    record_upstream_response(response.status_code)
+    record_download(len(body))
+
+    _raise_for_no_data(response)
+    if response.status_code == httpx.codes.OK:
+        await run_in_worker(
+            disk_cache.write,
+            str(request.url),
+            body,
+            response.headers.get("ETag"),
+            response.headers.get("Last-Modified"),
+        )
+    return body
+
+
+async def _read_body(response: httpx.Response) -> bytes:
+    """Read the whole body of a streamed response, counting a failure towards the breaker."""
+    try:
+        return await response.aread()
+    except httpx.TransportError:
+        _policy.breaker.record_failure()
+        raise
+    finally:
+        await response.aclose()
+
+
+def _admit(request: httpx.Request) -> AbstractAsyncContextManager[Admission]:
+    """Wait for the scheduler to admit a request, holding its slot in the context."""
+    return _scheduler.admit(endpoint_of(get_http_client().base_url, request.url))
+
+
+def get_upstream_policy() -> UpstreamPolicy:
+    """Return the policy every request to the SDMX API is sent with."""
+    return _policy
+
+
+def get_request_scheduler() -> RequestScheduler:
+    """Return the scheduler every request to the SDMX API waits for."""
+    return _scheduler
+
+
+async def wait_for_revalidations() -> None:
+    """Wait until every background revalidation of the disk cache has finished."""
+    await asyncio.gather(*_background_tasks, return_exceptions=True)
+
+
+def _raise_for_no_data(response: httpx.Response) -> None:
+    """Raise `NoDataFoundError` if the SDMX API has no data for the request."""
+    if response.status_code == httpx.codes.NOT_FOUND:
+        msg = f"No data found for {response.url}"
+        raise NoDataFoundError(msg)
@@ -0,0 +1,359 @@
+import functools
+import threading
+import time
+from collections.abc import Awaitable, Callable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import ParamSpec, TypeVar
+
+from logging_config import get_logger, update_logger_context
+
+logger = get_logger(__name__)
+
+P = ParamSpec("P")
+T = TypeVar("T")
+
+# Upper bounds of the histogram buckets, in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_lock = threading.Lock()
+
+
+class Counter:
+    """Prometheus counter, with a value per combination of label values."""
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values: dict[tuple[str, ...], float] = {}
+        _metrics.append(self)
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        """Add `amount` to the counter of the label values."""
+        key = tuple(labels[label] for label in self.labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        """Current value of the counter of the label values."""
+        return self._values.get(tuple(labels[label] for label in self.labels), 0)
+
+    def render(self) -> list[str]:
+        """Lines of the counter in the Prometheus text format."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with _lock:
+            values = sorted(self._values.items())
+        lines.extend(
+            f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+            for key, value in values
+        )
+        return lines
+
+    def clear(self) -> None:
+        """Reset every value."""
+        with _lock:
+            self._values.clear()
+
+
+class Histogram:
+    """Prometheus histogram, with buckets per combination of label values."""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DURATION_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        # Count of every bucket (not cumulative), plus the sum and count of the observations
+        self._values: dict[tuple[str, ...], tuple[list[int], float, int]] = {}
+        _metrics.append(self)
+
+    def observe(self, value: float, **labels: str) -> None:
+        """Add an observation of the label values."""
+        key = tuple(labels[label] for label in self.labels)
+        with _lock:
+            counts, total, count = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value, count + 1)
+
+    def count(self, **labels: str) -> int:
+        """Number of observations of the label values."""
+        return self._values.get(tuple(labels[label] for label in self.labels), ([], 0.0, 0))[2]
+
+    def render(self) -> list[str]:
+        """Lines of the histogram in the Prometheus text format."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with _lock:
+            values = sorted((key, (list(c), s, n)) for key, (c, s, n) in self._values.items())
+        label_names = (*self.labels, "le")
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts, strict=True):
+                cumulative += bucket_count
+                labels = _format_labels(label_names, (*key, _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(label_names, (*key, "+Inf"))
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+    def clear(self) -> None:
+        """Reset every value."""
+        with _lock:
+            self._values.clear()
+
+
+class Gauge:
+    """Prometheus gauge, with a value per combination of label values."""
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values: dict[tuple[str, ...], float] = {}
+        _metrics.append(self)
+
+    def set(self, value: float, **labels: str) -> None:
+        """Set the gauge of the label values."""
+        key = tuple(labels[label] for label in self.labels)
+        with _lock:
+            self._values[key] = value
+
+    def value(self, **labels: str) -> float:
+        """Current value of the gauge of the label values."""
+        return self._values.get(tuple(labels[label] for label in self.labels), 0)
+
+    def render(self) -> list[str]:
+        """Lines of the gauge in the Prometheus text format."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        with _lock:
+            values = sorted(self._values.items())
+        lines.extend(
+            f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+            for key, value in values
+        )
+        return lines
+
+    def clear(self) -> None:
+        """Reset every value."""
+        with _lock:
+            self._values.clear()
+
+
+_metrics: list[Counter | Histogram | Gauge] = []
+
+TOOL_DURATION = Histogram(
+    "datawarehouse_tool_duration_seconds",
+    "Duration of tool calls, by tool and outcome.",
+    ("tool", "outcome"),
+)
+STAGE_DURATION = Histogram(
+    "datawarehouse_stage_duration_seconds",
+    "Duration of the stages of tool calls: download, parse, mirror, aggregate, combine, render.",
+    ("stage",),
+)
+UPSTREAM_RESPONSES = Counter(
+    "datawarehouse_upstream_responses_total",
+    "Responses of the SDMX API, by HTTP status code.",
+    ("status",),
+)
+UPSTREAM_BYTES = Counter(
+    "datawarehouse_upstream_bytes_total",
+    "Bytes of response bodies downloaded from the SDMX API.",
+)
+ROWS_PARSED = Counter(
+    "datawarehouse_rows_parsed_total",
+    "Rows parsed from SDMX responses.",
+)
+UPSTREAM_EVENTS = Counter(
+    "datawarehouse_upstream_events_total",
+    "Retries, hedged requests and circuit breaker events of SDMX API requests, by event.",
+    ("event",),
+)
+UPSTREAM_QUEUE_DEPTH = Gauge(
+    "datawarehouse_upstream_queue_depth",
+    "Requests to the SDMX API waiting for admission, by priority.",
+    ("priority",),
+)
+UPSTREAM_QUEUE_WAIT = Histogram(
+    "datawarehouse_upstream_queue_wait_seconds",
+    "Time requests to the SDMX API waited for admission, by priority.",
+    ("priority",),
+)
+UPSTREAM_IN_FLIGHT = Gauge(
+    "datawarehouse_upstream_in_flight",
+    "Requests to the SDMX API admitted and not finished yet.",
+)
+UPSTREAM_RESERVED_BYTES = Gauge(
+    "datawarehouse_upstream_reserved_bytes",
+    "Expected size of the responses of the requests to the SDMX API in flight.",
+)
+CACHE_LOOKUPS = Counter(
+    "datawarehouse_cache_lookups_total",
+    "Lookups of the in-process caches, by cache and outcome "
+    "(hit, miss, coalesced, stale, subset or partial).",
+    ("cache", "outcome"),
+)
+PREFETCHES = Counter(
+    "datawarehouse_prefetches_total",
+    "Dataflow structures and popular data queries warmed up in the background, by kind and "
+    "outcome (ok or error).",
+    ("kind", "outcome"),
+)
+
+
+@dataclass
+class RequestMetrics:
+    """Stage timings and counters of a tool call.
+
+    The same instance is shared by every task of the call, so timings of stages run concurrently
+    (e.g. the chunks of a large query) are summed.
+    """
+
+    timings_ms: dict[str, float] = field(default_factory=dict)
+    counters: dict[str, int] = field(default_factory=dict)
+
+
+_request_metrics: ContextVar[RequestMetrics | None] = ContextVar("request_metrics", default=None)
+
+
+def get_request_metrics() -> RequestMetrics | None:
+    """Timings and counters of the current tool call, if any."""
+    return _request_metrics.get()
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    """Record the duration of a stage in the histogram and in the current tool call."""
+    STAGE_DURATION.observe(seconds, stage=stage)
+    request = _request_metrics.get()
+    if request is not None:
+        request.timings_ms[stage] = request.timings_ms.get(stage, 0.0) + seconds * 1000
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """Time the enclosed code as a stage of the current tool call.
+
+    Example:
+        with span("render"):
+            text = await run_in_worker(formatter, data)
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+def count(name: str, amount: int = 1) -> None:
+    """Add to a counter of the current tool call, e.g. `rows_parsed`."""
+    request = _request_metrics.get()
+    if request is not None:
+        request.counters[name] = request.counters.get(name, 0) + amount
+
+
+def record_upstream_response(status_code: int) -> None:
+    """Count a response of the SDMX API."""
+    UPSTREAM_RESPONSES.inc(status=str(status_code))
+    count(f"upstream_{status_code}")
+
+
+def record_upstream_event(event: str) -> None:
+    """Count an event of the upstream policy, e.g. a `retry` or a `hedge`."""
+    UPSTREAM_EVENTS.inc(event=event)
+    count(f"upstream_{event}")
+
+
+def record_download(num_bytes: int) -> None:
+    """Count bytes downloaded from the SDMX API."""
+    UPSTREAM_BYTES.inc(num_bytes)
+    count("bytes_downloaded", num_bytes)
+
+
+def record_rows_parsed(num_rows: int) -> None:
+    """Count rows parsed from an SDMX response."""
+    ROWS_PARSED.inc(num_rows)
+    count("rows_parsed", num_rows)
+
+
+def record_cache_lookup(cache: str, outcome: str) -> None:
+    """Count a lookup of a cache, e.g. a `hit` of the `data` cache."""
+    CACHE_LOOKUPS.inc(cache=cache, outcome=outcome)
+    count(f"{cache}_cache_{outcome}")
+
+
+def instrument_tool(function: Callable[P, Awaitable[T]]) -> Callable[P, Awaitable[T]]:
+    """Measure the calls of a tool and log their stage timings and counters.
+
+    The timings and counters of the call are added to `logger_context` (as `tool`, `timings_ms`
+    and `counters`), so every log record of the call carries them. Calls returning a dictionary
+    with an `error` are counted with the `error` outcome.
+    """
+
+    @functools.wraps(function)
+    async def wrapper(*args: P.args, **kwargs: P.kwargs) -> T:
+        request = RequestMetrics()
+        token = _request_metrics.set(request)
+        update_logger_context(
+            tool=function.__name__, timings_ms=request.timings_ms, counters=request.counters
+        )
+        start = time.perf_counter()
+        outcome = "exception"
+        try:
+            result = await function(*args, **kwargs)
+            outcome = "error" if isinstance(result, dict) and "error" in result else "ok"
+            return result
+        finally:
+            seconds = time.perf_counter() - start
+            TOOL_DURATION.observe(seconds, tool=function.__name__, outcome=outcome)
+            logger.info(
+                "Tool %s finished (%s) in %.1f ms. Stages: %s. Counters: %s",
+                function.__name__,
+                outcome,
+                seconds * 1000,
+                ", ".join(f"{stage} {ms:.1f} ms" for stage, ms in request.timings_ms.items())
+                or "none",
+                ", ".join(f"{name} {value}" for name, value in request.counters.items()) or "none",
+            )
+            _request_metrics.reset(token)
+
+    return wrapper
+
+
+def render_metrics() -> str:
+    """Every metric in the Prometheus text exposition format."""
+    return "\n".join(line for metric in _metrics for line in metric.render()) + "\n"
+
+
+def clear_metrics() -> None:
+    """Reset every metric."""
+    for metric in _metrics:
+        metric.clear()
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    escaped = (
+        value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in values
+    )
+    return (
+        "{"
+        + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped, strict=True))
+        + "}"
+    )
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
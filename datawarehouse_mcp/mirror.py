@@ -0,0 +1,459 @@
+import argparse
+import asyncio
+import copy
+import itertools
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+from collections.abc import Callable
+from contextlib import aclosing
+from dataclasses import dataclass
+from datetime import UTC, datetime
+from logging import getLogger
+from pathlib import Path
+from typing import IO, Any
+
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+from config import config
+from dataflows import get_curated_dataflow_ids
+from exceptions import DataWarehouseAPIError, NoDataFoundError
+from http_client import close_http_client, stream_bytes
+from schemas import DataflowStructure, DataQuery
+from sdmx_parser import concat_frames, conform_to_structure
+from streaming_parser import SdmxJsonStreamParser
+
+try:
+    import pyarrow as pa
+except ImportError:  # Optional dependency, installed with the `mirror` extra
+    pa = None
+
+logger = getLogger(__name__)
+
+# Mirror files are sorted by these columns, so the rows of a query are found by binary search
+INDEX_COLUMNS = ("INDICATOR", "REF_AREA")
+
+IntArray = npt.NDArray[np.int64]
+
+
+@dataclass
+class _Snapshot:
+    """Memory-mapped data of a mirrored dataflow, with the codes of its lookup columns."""
+
+    table: "pa.Table"
+    structure: dict[str, Any]
+    synced_at: str
+    # Modification time and size of the metadata file when it was loaded
+    version: tuple[int, int]
+    indicator_ids: dict[str, int]
+    indicator_codes: IntArray
+    ref_area_ids: dict[str, int]
+    ref_area_codes: IntArray
+    period_codes: IntArray
+    # Year of every TIME_PERIOD code, -1 if it has none. The extra last item is for missing periods
+    # (code -1), so that `period_years[period_codes]` needs no special case
+    period_years: IntArray
+
+
+class Mirror:
+    """Local copy of dataflows, queried without contacting the SDMX API.
+
+    Each dataflow is an Arrow IPC file `<dataflow>.arrow` with the columns of
+    `build_df_from_json`, dictionary-encoded and sorted by `INDEX_COLUMNS`, next to a metadata file
+    `<dataflow>.json` with its SDMX-JSON structure and the time of its last sync. Files are
+    memory-mapped when first queried and mapped again when a sync replaces them, so queries only
+    touch the pages of the rows they return. Files are written atomically, so syncing while the
+    server is running is safe.
+    """
+
+    def __init__(self, directory: Path) -> None:
+        """Open the mirror in `directory`.
+
+        Args:
+            directory: Directory of the mirror, created on first sync.
+
+        Raises:
+            DataWarehouseAPIError: If pyarrow is not installed.
+        """
+        if pa is None:
+            msg = "The mirror needs pyarrow, install it with `uv sync --extra mirror`"
+            raise DataWarehouseAPIError(msg)
+        self.directory = directory
+        self._snapshots: dict[str, _Snapshot] = {}
+        self._lock = threading.Lock()
+
+    def has(self, dataflow_id: str) -> bool:
+        """Whether the dataflow has been synced into the mirror."""
+        return self._metadata_path(dataflow_id).exists()
+
+    def read_structure(self, dataflow_id: str) -> dict[str, Any] | None:
+        """Return the SDMX-JSON structure of a mirrored dataflow, or `None` if it isn't mirrored."""
+        snapshot = self._snapshot(dataflow_id)
+        return None if snapshot is None else snapshot.structure
+
+    def read(
+        self,
+        query: DataQuery,
+        params: dict[str, str],
+        structure: DataflowStructure,
+    ) -> pd.DataFrame:
+        """Get the data of a query from the mirror.
+
+        Ref area and indicator filters are binary searches over the sorted codes, and period
+        filters are applied to the codes of the matching rows only, so only the returned rows are
+        read from the file.
+
+        Args:
+            query: Query to answer; empty ref areas or indicators match all of them.
+            params: Period filters, as sent to the SDMX API (`startPeriod`, `endPeriod` and
+                `lastNObservations`).
+            structure: Structure of the dataflow, to give the data the schema of
+                `build_df_from_json`.
+
+        Returns:
+            pd.DataFrame: Rows of the query, grouped by indicator and ref area.
+
+        Raises:
+            NoDataFoundError: If the dataflow isn't mirrored or no rows match the query.
+        """
+        snapshot = self._snapshot(query.dataflow_id)
+        if snapshot is None:
+            msg = f"Dataflow {query.dataflow_id} is not in the mirror"
+            raise NoDataFoundError(msg)
+
+        rows = _find_rows(snapshot, query)
+        rows = _filter_periods(snapshot, rows, params)
+        data = snapshot.table.take(pa.array(rows)).to_pandas()
+        if "lastNObservations" in params:
+            data = _last_observations(data, structure, int(params["lastNObservations"]))
+        if data.empty:
+            msg = f"No data found for {query.key} in the mirror"
+            raise NoDataFoundError(msg)
+
+        return conform_to_structure(data, structure)
+
+    async def sync(self, dataflow_id: str, *, full: bool = False) -> int:
+        """Download a dataflow into the mirror, or only what changed since its last sync.
+
+        Refreshes request the observations updated since the previous sync (`updatedAfter`) and
+        merge them into the mirrored data, replacing observations with the same dimensions.
+
+        Args:
+            dataflow_id: Dataflow ID to sync.
+            full: Download the whole dataflow even if it is already mirrored.
+
+        Returns:
+            int: Number of observations received.
+
+        Raises:
+            NoDataFoundError: If the dataflow has no data.
+            DataWarehouseAPIError: If the SDMX API reports an error.
+        """
+        previous = None if full else self._snapshot(dataflow_id)
+        # Taken before downloading, so that updates made during the download are fetched next time
+        synced_at = datetime.now(UTC).strftime("%Y-%m-%dT%H:%M:%S")
+        params = {"format": "sdmx-json"}
+        if previous is not None:
+            params["updatedAfter"] = previous.synced_at
+
+        try:
+            data, structure = await _download(dataflow_id, params)
+        except NoDataFoundError:
+            if previous is None:
+                raise
+            logger.info("No updates of dataflow %s since %s", dataflow_id, previous.synced_at)
+            self._write_metadata(dataflow_id, previous.structure, synced_at)
+            return 0
+
+        num_observations = len(data)
+        if previous is not None:
+            structure = merge_structures(previous.structure, structure)
+            data = merge_updates(previous.table.to_pandas(), data, structure)
+
+        self.write(dataflow_id, data, structure, synced_at)
+        logger.info("Synced %s observations of dataflow %s", num_observations, dataflow_id)
+        return num_observations
+
+    def write(
+        self,
+        dataflow_id: str,
+        data: pd.DataFrame,
+        structure: dict[str, Any],
+        synced_at: str,
+    ) -> None:
+        """Replace the mirrored data of a dataflow.
+
+        Args:
+            dataflow_id: Dataflow ID of the data.
+            data: Data as built by `build_df_from_json`.
+            structure: `data.structure` object of the SDMX-JSON response.
+            synced_at: UTC time the data was requested at, e.g. `2025-01-31T12:00:00`.
+        """
+        table = pa.Table.from_pandas(_sort_for_lookup(data), preserve_index=False)
+        # A single record batch, so that every column has a single dictionary
+        table = table.combine_chunks()
+
+        def write_table(fp: IO[bytes]) -> None:
+            with pa.ipc.new_file(fp, table.schema) as writer:
+                writer.write_table(table)
+
+        _write_atomically(self._data_path(dataflow_id), write_table)
+        # The metadata is written last, as it marks the dataflow as mirrored
+        self._write_metadata(dataflow_id, structure, synced_at)
+
+    def _write_metadata(self, dataflow_id: str, structure: dict[str, Any], synced_at: str) -> None:
+        metadata = json.dumps({"synced_at": synced_at, "structure": structure}).encode()
+        _write_atomically(self._metadata_path(dataflow_id), lambda fp: fp.write(metadata))
+
+    def _snapshot(self, dataflow_id: str) -> _Snapshot | None:
+        """Return the loaded data of a dataflow, loading it again if a sync replaced it."""
+        try:
+            stat = self._metadata_path(dataflow_id).stat()
+        except FileNotFoundError:
+            return None
+        version = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            snapshot = self._snapshots.get(dataflow_id)
+            if snapshot is None or snapshot.version != version:
+                snapshot = self._load(dataflow_id, version)
+                self._snapshots[dataflow_id] = snapshot
+        return snapshot
+
+    def _load(self, dataflow_id: str, version: tuple[int, int]) -> _Snapshot:
+        logger.info("Loading dataflow %s from the mirror", dataflow_id)
+        metadata = json.loads(self._metadata_path(dataflow_id).read_bytes())
+        # The memory map stays open as long as the table references it
+        source = pa.memory_map(str(self._data_path(dataflow_id)))
+        table = pa.ipc.open_file(source).read_all()
+
+        indicators, indicator_codes = _dictionary_codes(table.column("INDICATOR"))
+        ref_areas, ref_area_codes = _dictionary_codes(table.column("REF_AREA"))
+        periods, period_codes = _dictionary_codes(table.column("TIME_PERIOD"))
+        period_years = [int(p[:4]) if p[:4].isdigit() else -1 for p in periods]
+
+        return _Snapshot(
+            table=table,
+            structure=metadata["structure"],
+            synced_at=metadata["synced_at"],
+            version=version,
+            indicator_ids={code: i for i, code in enumerate(indicators)},
+            indicator_codes=indicator_codes,
+            ref_area_ids={code: i for i, code in enumerate(ref_areas)},
+            ref_area_codes=ref_area_codes,
+            period_codes=period_codes,
+            period_years=np.array([*period_years, -1], dtype=np.int64),
+        )
+
+    def _data_path(self, dataflow_id: str) -> Path:
+        return self.directory / f"{dataflow_id}.arrow"
+
+    def _metadata_path(self, dataflow_id: str) -> Path:
+        return self.directory / f"{dataflow_id}.json"
+
+
+def merge_updates(
+    data: pd.DataFrame,
+    updates: pd.DataFrame,
+    structure: dict[str, Any],
+) -> pd.DataFrame:
+    """Merge updated observations into mirrored data, replacing those with the same dimensions.
+
+    Args:
+        data: Mirrored data.
+        updates: Observations updated since the data was synced.
+        structure: Merged SDMX-JSON structure of both.
+
+    Returns:
+        pd.DataFrame: Rows of `data` that weren't updated, followed by the updates.
+    """
+    dimensions = structure["dimensions"]["series"] + structure["dimensions"]["observation"]
+    keys = [dimension["id"] for dimension in dimensions if dimension["id"] in updates]
+    merged = concat_frames([data, updates])
+    return merged.drop_duplicates(subset=keys, keep="last", ignore_index=True)
+
+
+def merge_structures(structure: dict[str, Any], updates: dict[str, Any]) -> dict[str, Any]:
+    """Merge the SDMX-JSON structure of an update into the one of the mirrored data.
+
+    The structure of an update only lists the codes of the updated observations, so the codes of
+    every component are unioned, keeping the names of the update.
+
+    Args:
+        structure: `data.structure` object of the mirrored data.
+        updates: `data.structure` object of the update.
+
+    Returns:
+        dict[str, Any]: Structure listing the codes of both.
+    """
+    merged = copy.deepcopy(structure)
+    for section in ("dimensions", "attributes"):
+        for level in ("series", "observation"):
+            components = merged[section][level]
+            by_id = {component["id"]: component for component in components}
+            for component in updates[section][level]:
+                if component["id"] not in by_id:
+                    components.append(copy.deepcopy(component))
+                    continue
+                existing = by_id[component["id"]]
+                values = {value["id"]: value for value in existing.get("values", [])}
+                values.update({value["id"]: value for value in component.get("values", [])})
+                existing["values"] = list(values.values())
+    return merged
+
+
+async def _download(
+    dataflow_id: str,
+    params: dict[str, str],
+) -> tuple[pd.DataFrame, dict[str, Any]]:
+    """Download all the data of a dataflow matching `params`, and its SDMX-JSON structure."""
+    parser = SdmxJsonStreamParser()
+    async with aclosing(stream_bytes(f"data/{dataflow_id}/All", params=params)) as chunks:
+        async for chunk in chunks:
+            parser.feed(chunk)
+
+    if parser.errors is not None:
+        raise DataWarehouseAPIError(str(parser.errors))
+    data = parser.close()
+    # `close` has checked that the structure was received
+    return data, parser.structure or {}
+
+
+def _sort_for_lookup(data: pd.DataFrame) -> pd.DataFrame:
+    """Sort rows by `INDEX_COLUMNS`, with sorted categories so that codes follow the same order."""
+    data = data.copy()
+    for column in INDEX_COLUMNS:
+        categorical = pd.Categorical(data[column]).remove_unused_categories()
+        data[column] = categorical.reorder_categories(sorted(categorical.categories))
+    # lexsort is stable and sorts by the last key first
+    order = np.lexsort([data[column].cat.codes.to_numpy() for column in reversed(INDEX_COLUMNS)])
+    return data.iloc[order].reset_index(drop=True)
+
+
+def _dictionary_codes(column: "pa.ChunkedArray") -> tuple[list[str], IntArray]:
+    """Values and codes of a dictionary-encoded column, with -1 for missing values."""
+    # Mirror files have a single record batch, so there is nothing to concatenate
+    array = column.combine_chunks()
+    codes = array.indices.fill_null(-1).to_numpy().astype(np.int64)
+    return array.dictionary.to_pylist(), codes
+
+
+def _find_rows(snapshot: _Snapshot, query: DataQuery) -> IntArray:
+    """Positions of the rows of the query's indicators and ref areas, by binary search."""
+    ranges = [(0, len(snapshot.indicator_codes))]
+    if query.ref_areas and not query.indicators:
+        # Ref area codes are only sorted within the range of every indicator, searched one by one
+        bounds = [0, *(np.flatnonzero(np.diff(snapshot.indicator_codes)) + 1).tolist()]
+        ranges = list(itertools.pairwise([*bounds, len(snapshot.indicator_codes)]))
+    for codes, ids, wanted in (
+        (snapshot.indicator_codes, snapshot.indicator_ids, query.indicators),
+        (snapshot.ref_area_codes, snapshot.ref_area_ids, query.ref_areas),
+    ):
+        if not wanted:
+            continue
+        targets = sorted(ids[code] for code in wanted if code in ids)
+        ranges = [
+            (
+                start + int(np.searchsorted(codes[start:end], target, side="left")),
+                start + int(np.searchsorted(codes[start:end], target, side="right")),
+            )
+            for start, end in ranges
+            for target in targets
+        ]
+
+    return np.concatenate(
+        [np.arange(start, end) for start, end in ranges] or [np.empty(0, dtype=np.int64)]
+    )
+
+
+def _filter_periods(snapshot: _Snapshot, rows: IntArray, params: dict[str, str]) -> IntArray:
+    """Keep the rows with periods within `startPeriod` and `endPeriod`, like the SDMX API."""
+    if "startPeriod" not in params and "endPeriod" not in params:
+        return rows
+    years = snapshot.period_years[snapshot.period_codes[rows]]
+    mask = years >= int(params.get("startPeriod", 0))
+    if "endPeriod" in params:
+        mask &= years <= int(params["endPeriod"])
+    return rows[mask]
+
+
+def _last_observations(data: pd.DataFrame, structure: DataflowStructure, n: int) -> pd.DataFrame:
+    """Keep the latest `n` observations of every series, in their original order."""
+    series_dimensions = [d.id for d in structure.series_dimensions if d.id in data]
+    order = np.argsort(data["TIME_PERIOD"].astype(str).to_numpy(), kind="stable")
+    grouped = data.iloc[order].groupby(series_dimensions, observed=True, sort=False, dropna=False)
+    return grouped.tail(n).sort_index()
+
+
+def _write_atomically(path: Path, write: Callable[[IO[bytes]], Any]) -> None:
+    """Write a file through a temporary file, renamed over `path` once it is complete."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp_name = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as fp:
+            write(fp)
+        Path(temp_name).replace(path)
+    except BaseException:
+        Path(temp_name).unlink(missing_ok=True)
+        raise
+
+
+_mirror: Mirror | None = Mirror(Path(config.mirror.directory)) if config.mirror.enabled else None
+
+
+def get_mirror() -> Mirror | None:
+    """Return the mirror queries are answered from, or `None` if it is disabled."""
+    return _mirror
+
+
+async def sync_mirror(dataflow_ids: list[str], *, full: bool = False) -> list[str]:
+    """Sync dataflows into the configured mirror directory, one at a time.
+
+    Args:
+        dataflow_ids: Dataflows to sync.
+        full: Download whole dataflows instead of the updates since their last sync.
+
+    Returns:
+        list[str]: Dataflows that failed to sync.
+    """
+    target = _mirror or Mirror(Path(config.mirror.directory))
+    failed: list[str] = []
+    try:
+        for dataflow_id in dataflow_ids:
+            try:
+                await target.sync(dataflow_id, full=full)
+            except (DataWarehouseAPIError, OSError, ValueError):
+                logger.exception("Error syncing dataflow %s", dataflow_id)
+                failed.append(dataflow_id)
+    finally:
+        await close_http_client()
+    return failed
+
+
+def main() -> int:
+    """Sync the curated dataflows, or the ones given, into the mirror."""
+    parser = argparse.ArgumentParser(
+        description="Download dataflows into the local mirror, or refresh them incrementally."
+    )
+    parser.add_argument(
+        "dataflow_ids", nargs="*", help="Dataflows to sync, all curated ones if none"
+    )
+    parser.add_argument("--full", action="store_true", help="Download whole dataflows again")
+    args = parser.parse_args()
+
+    failed = asyncio.run(
+        sync_mirror(args.dataflow_ids or get_curated_dataflow_ids(), full=args.full)
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    sys.exit(main())
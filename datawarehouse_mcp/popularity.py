@@ -0,0 +1,102 @@
+import json
+import os
+import tempfile
+from collections import Counter
+from dataclasses import asdict
+from logging import getLogger
+from pathlib import Path
+
+from config import config
+from schemas import DataQuery
+
+logger = getLogger(__name__)
+
+
+class QueryPopularity:
+    """Number of calls of every data query, to prefetch the most popular ones.
+
+    At most `max_queries` queries are tracked: beyond it, the least called one is forgotten, the
+    oldest first, so that a newly seen query gets a chance to become popular.
+    """
+
+    def __init__(self, max_queries: int) -> None:
+        self.max_queries = max_queries
+        self._calls: Counter[DataQuery] = Counter()
+
+    def record(self, query: DataQuery, calls: int = 1) -> None:
+        """Count calls of a normalized query."""
+        if query not in self._calls and len(self._calls) >= self.max_queries:
+            del self._calls[min(self._calls, key=self._calls.__getitem__)]
+        self._calls[query] += calls
+
+    def calls(self, query: DataQuery) -> int:
+        """Number of calls of a query."""
+        return self._calls[query]
+
+    def top(self, k: int) -> list[DataQuery]:
+        """The `k` most called queries, most called first."""
+        return [query for query, _ in self._calls.most_common(k)]
+
+    def copy(self) -> "QueryPopularity":
+        """A copy of the counts, to save them while calls keep being counted."""
+        popularity = QueryPopularity(self.max_queries)
+        popularity._calls = self._calls.copy()
+        return popularity
+
+    def clear(self) -> None:
+        """Forget every query."""
+        self._calls.clear()
+
+    def load(self, path: Path) -> None:
+        """Add the calls saved with `save` to the counts, if the file exists and is readable."""
+        try:
+            raw_queries = json.loads(path.read_bytes())["queries"]
+            saved = [
+                (
+                    DataQuery(
+                        **{
+                            **raw["query"],
+                            "ref_areas": tuple(raw["query"]["ref_areas"]),
+                            "indicators": tuple(raw["query"]["indicators"]),
+                        }
+                    ),
+                    int(raw["calls"]),
+                )
+                for raw in raw_queries
+            ]
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, KeyError, TypeError):
+            logger.warning("Ignoring unreadable query popularity %s", path, exc_info=True)
+            return
+        for query, calls in saved:
+            self.record(query, calls)
+        logger.info("Loaded the popularity of %s queries from %s", len(saved), path)
+
+    def save(self, path: Path) -> None:
+        """Write the counts, atomically replacing the previous file."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        body = json.dumps(
+            {
+                "queries": [
+                    {"query": asdict(query), "calls": calls}
+                    for query, calls in self._calls.most_common()
+                ]
+            }
+        )
+        fd, temp_name = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as fp:
+                fp.write(body)
+            Path(temp_name).replace(path)
+        except BaseException:
+            Path(temp_name).unlink(missing_ok=True)
+            raise
+
+
+_popularity = QueryPopularity(config.prefetch.max_tracked_queries)
+
+
+def get_query_popularity() -> QueryPopularity:
+    """Return the call counts of the data queries of this process."""
+    return _popularity
@@ -0,0 +1,143 @@
+import asyncio
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager
+from importlib import import_module
+from logging import getLogger
+from pathlib import Path
+
+from config import config
+from dataflows import get_curated_dataflow_ids
+from exceptions import UpstreamUnavailableError
+from metrics import PREFETCHES
+from popularity import QueryPopularity, get_query_popularity
+from scheduler import request_priority
+from schemas import PrefetchConfig
+from workers import run_in_worker
+
+logger = getLogger(__name__)
+
+
+class Prefetcher:
+    """Background warm-up of the caches, so the first tool calls after a deploy are cache hits.
+
+    `startup_delay_seconds` after startup, then every `interval_seconds`, the structures of the
+    curated dataflows and the results of the `top_queries` most called data queries are fetched
+    into the caches. Entries still cached past the next warm-up are left alone, the others are
+    refreshed, so popular results don't expire between tool calls.
+
+    Requests are sent one at a time with the `background` priority (see `scheduler.PRIORITIES`):
+    they go after every waiting tool call request, within `scheduler.background_bytes_per_second`.
+    A warm-up stops early if the SDMX API is unavailable.
+    """
+
+    def __init__(self, prefetch_config: PrefetchConfig, popularity: QueryPopularity) -> None:
+        self.config = prefetch_config
+        self.popularity = popularity
+
+    async def run(self) -> None:
+        """Warm up the caches until cancelled, saving the query popularity after every warm-up."""
+        await asyncio.sleep(self.config.startup_delay_seconds)
+        while True:
+            try:
+                await self.warm_up()
+            except Exception:
+                logger.exception("Warm-up of the caches failed")
+            # Copied on the event loop, as tool calls keep counting queries while it is written
+            await run_in_worker(self._save, self.popularity.copy())
+            await asyncio.sleep(self.config.interval_seconds)
+
+    async def warm_up(self) -> int:
+        """Fetch the curated dataflow structures and the popular queries into the caches.
+
+        Returns:
+            int: Number of structures and queries that could not be prefetched.
+        """
+        # `handlers` loads pandas, which would block the event loop for a while on a cold start
+        handlers = await run_in_worker(import_module, "handlers")
+        from structure import get_dataflow_structure  # noqa: PLC0415
+
+        refresh_within_seconds = self.config.interval_seconds
+        queries = self.popularity.top(self.config.top_queries)
+        logger.info(
+            "Warming up the caches with %s dataflow structures and %s queries",
+            len(get_curated_dataflow_ids()),
+            len(queries),
+        )
+        failures = 0
+        try:
+            with request_priority("background"):
+                for dataflow_id in get_curated_dataflow_ids():
+                    failures += not await self._prefetch(
+                        "structure",
+                        dataflow_id,
+                        lambda dataflow_id=dataflow_id: get_dataflow_structure(
+                            dataflow_id, refresh_within_seconds=refresh_within_seconds
+                        ),
+                    )
+                for query in queries:
+                    failures += not await self._prefetch(
+                        "query",
+                        f"{query.dataflow_id}/{query.key}",
+                        lambda query=query: handlers.warm_data_cache(query, refresh_within_seconds),
+                    )
+        except UpstreamUnavailableError as e:
+            logger.warning("Stopping the warm-up, the SDMX API is unavailable: %s", e)
+            failures += 1
+        return failures
+
+    def save_popularity(self) -> None:
+        """Save the query popularity to `popularity_path`, for the next processes to start with."""
+        self._save(self.popularity)
+
+    def _save(self, popularity: QueryPopularity) -> None:
+        """Save query counts to `popularity_path`, logging a failure to write them."""
+        path = Path(self.config.popularity_path)
+        try:
+            popularity.save(path)
+        except OSError:
+            logger.warning("Could not save the query popularity to %s", path, exc_info=True)
+
+    async def _prefetch(self, kind: str, name: str, fetch: Callable[[], Awaitable[object]]) -> bool:
+        """Prefetch a structure or query, counting the outcome.
+
+        Returns:
+            bool: Whether it was prefetched.
+
+        Raises:
+            UpstreamUnavailableError: If the SDMX API is unavailable, to stop the warm-up.
+        """
+        try:
+            await fetch()
+        except UpstreamUnavailableError:
+            PREFETCHES.inc(kind=kind, outcome="error")
+            raise
+        except Exception as e:  # noqa: BLE001
+            logger.warning("Could not prefetch %s %s: %s", kind, name, e)
+            PREFETCHES.inc(kind=kind, outcome="error")
+            return False
+        PREFETCHES.inc(kind=kind, outcome="ok")
+        return True
+
+
+@asynccontextmanager
+async def prefetching(prefetch_config: PrefetchConfig = config.prefetch) -> AsyncIterator[None]:
+    """Warm up the caches in the background while the enclosed code runs, if enabled.
+
+    The saved query popularity is loaded first, and saved again on exit.
+
+    Example:
+        async with prefetching():
+            await mcp.run_stdio_async()
+    """
+    if not prefetch_config.enabled:
+        yield
+        return
+
+    prefetcher = Prefetcher(prefetch_config, get_query_popularity())
+    prefetcher.popularity.load(Path(prefetch_config.popularity_path))
+    task = asyncio.create_task(prefetcher.run())
+    try:
+        yield
+    finally:
+        task.cancel()
+        prefetcher.save_popularity()
@@ -0,0 +1,264 @@
+import asyncio
+import functools
+import inspect
+import itertools
+import json
+import threading
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager
+from datetime import UTC, datetime
+from logging import getLogger
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, ParamSpec, TypeVar
+
+from config import config
+from exceptions import DataWarehouseAPIError
+from metrics import get_request_metrics
+from workers import run_in_worker
+
+if TYPE_CHECKING:
+    from pyinstrument import Profiler
+
+logger = getLogger(__name__)
+
+P = ParamSpec("P")
+T = TypeVar("T")
+
+# Allocation sites listed in the memory summaries, and frames of each
+TOP_ALLOCATIONS = 20
+ALLOCATION_STACK_DEPTH = 5
+
+# Profiles being written in the background (referenced so they aren't GC'd)
+_background_tasks: set[asyncio.Task[None]] = set()
+
+
+class CallProfiler:
+    """Profiler of a sample of the tool calls, and of the slow ones.
+
+    Every call is profiled with pyinstrument while `slow_call_seconds` is set, but its profile is
+    only kept if the call turns out to be slow or it is one of the every `every_n_calls` sampled
+    ones. With `memory`, sampled calls are tracked by memray instead, as both profilers hook into
+    the interpreter in the same way. They are process-wide, so a single call is profiled at a time
+    and calls made meanwhile run unprofiled.
+
+    pyinstrument samples the event loop thread, so work sent to the worker pool (parsing, rendering)
+    shows up as time awaiting `run_in_worker`; memray tracks the allocations of every thread.
+
+    Each profile is a set of files named `<time>-<tool>-<call number>` in `directory`: `.html`
+    (pyinstrument) or `.memray` and `.memory.txt` (memray data and summary of the largest
+    allocations at the peak), and `.json` (tool, arguments, duration and stage timings), written
+    last. Only the `max_profiles` most recent profiles are kept.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        directory: Path,
+        every_n_calls: int,
+        slow_call_seconds: float,
+        max_profiles: int,
+        interval_seconds: float = 0.001,
+        *,
+        memory: bool = False,
+    ) -> None:
+        """Create a profiler writing to `directory`.
+
+        Args:
+            directory: Directory of the profiles, created on first write.
+            every_n_calls: Calls sampled, every Nth one. 0 to only keep slow calls.
+            slow_call_seconds: Duration from which a call is slow. 0 to only keep sampled calls.
+            max_profiles: Profiles kept, the oldest ones are deleted beyond it.
+            interval_seconds: CPU sampling interval.
+            memory: Track the allocations of sampled calls.
+
+        Raises:
+            DataWarehouseAPIError: If pyinstrument, or memray with `memory`, is not installed.
+        """
+        # Imported here rather than at startup, as they are only needed with profiling enabled
+        try:
+            import pyinstrument
+
+            if memory:
+                import memray  # noqa: F401
+        except ImportError as e:
+            msg = (
+                "Profiling needs the `profiling` extra, install it with `uv sync --extra profiling`"
+            )
+            raise DataWarehouseAPIError(msg) from e
+        self.directory = directory
+        self.every_n_calls = every_n_calls
+        self.slow_call_seconds = slow_call_seconds
+        self.max_profiles = max_profiles
+        self.interval_seconds = interval_seconds
+        self.memory = memory
+        self._profiler_class = pyinstrument.Profiler
+        self._calls = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @asynccontextmanager
+    async def profile(self, tool: str, arguments: dict[str, Any]) -> AsyncIterator[None]:
+        """Profile the enclosed tool call if it is sampled or may turn out to be slow.
+
+        Args:
+            tool: Name of the tool.
+            arguments: Arguments of the call, saved with its profile.
+        """
+        call_number = next(self._calls)
+        sampled = self.every_n_calls > 0 and call_number % self.every_n_calls == 0
+        if not (sampled or self.slow_call_seconds > 0) or not self._lock.acquire(blocking=False):
+            yield
+            return
+
+        name = f"{datetime.now(UTC):%Y%m%dT%H%M%S.%f}-{tool}-{call_number}"
+        memory_path = self.directory / f"{name}.memray" if sampled and self.memory else None
+        try:
+            if memory_path is not None:
+                self.directory.mkdir(parents=True, exist_ok=True)
+        except OSError:
+            logger.exception("Error creating the profile directory %s", self.directory)
+            memory_path = None
+        # Both profilers replace the interpreter's profile function, so a call only gets one of them
+        profiler: Profiler | None = None
+        if memory_path is not None:
+            import memray
+
+            tracker = memray.Tracker(
+                memory_path, file_format=memray.FileFormat.AGGREGATED_ALLOCATIONS
+            )
+        else:
+            profiler = tracker = self._profiler_class(
+                interval=self.interval_seconds, async_mode="enabled"
+            )
+        start = time.perf_counter()
+        try:
+            with tracker:
+                yield
+        finally:
+            self._lock.release()
+            seconds = time.perf_counter() - start
+            slow = self.slow_call_seconds > 0 and seconds >= self.slow_call_seconds
+            if sampled or slow:
+                request = get_request_metrics()
+                metadata = {
+                    "tool": tool,
+                    "arguments": arguments,
+                    "call_number": call_number,
+                    "reason": "slow" if slow else "sampled",
+                    "duration_seconds": round(seconds, 3),
+                    "timings_ms": dict(request.timings_ms) if request is not None else {},
+                }
+                task = asyncio.create_task(
+                    run_in_worker(self._write, name, profiler, memory_path, metadata)
+                )
+                _background_tasks.add(task)
+                task.add_done_callback(_done_writing)
+
+    def _write(
+        self,
+        name: str,
+        profiler: "Profiler | None",
+        memory_path: Path | None,
+        metadata: dict[str, Any],
+    ) -> None:
+        """Write the files of a profile, then delete the oldest profiles beyond `max_profiles`."""
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            if profiler is not None:
+                html = profiler.output_html()
+                (self.directory / f"{name}.html").write_text(html, encoding="utf-8")
+            if memory_path is not None:
+                summary = summarize_allocations(memory_path)
+                (self.directory / f"{name}.memory.txt").write_text(summary, encoding="utf-8")
+            (self.directory / f"{name}.json").write_text(
+                json.dumps(metadata, indent=2, default=str), encoding="utf-8"
+            )
+            logger.info(
+                "Profiled %s call (%s, %.1f s) to %s",
+                metadata["tool"],
+                metadata["reason"],
+                metadata["duration_seconds"],
+                self.directory / name,
+            )
+            rotate_profiles(self.directory, self.max_profiles)
+        except OSError:
+            logger.exception("Error writing profile %s", name)
+
+
+def _done_writing(task: asyncio.Task[None]) -> None:
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("Writing a profile failed: %s", task.exception())
+
+
+def summarize_allocations(path: Path) -> str:
+    """Peak memory of a memray capture and the allocation sites holding the most memory at it."""
+    import memray
+
+    reader = memray.FileReader(path)
+    records = sorted(
+        reader.get_high_watermark_allocation_records(merge_threads=True),
+        key=lambda record: record.size,
+        reverse=True,
+    )
+    lines = [
+        f"Peak memory: {reader.metadata.peak_memory / 2**20:.1f} MiB",
+        f"Allocations: {reader.metadata.total_allocations}",
+        "",
+        f"Largest allocations at the peak (top {TOP_ALLOCATIONS}):",
+    ]
+    for record in records[:TOP_ALLOCATIONS]:
+        stack = " <- ".join(
+            f"{function} ({filename}:{line})"
+            for function, filename, line in record.stack_trace(max_stacks=ALLOCATION_STACK_DEPTH)
+        )
+        lines.append(
+            f"{record.size / 2**20:10.2f} MiB in {record.n_allocations} allocations: "
+            f"{stack or 'unknown'}"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def rotate_profiles(directory: Path, max_profiles: int) -> None:
+    """Delete the files of the oldest profiles of a directory beyond `max_profiles`."""
+    names = sorted(path.name.removesuffix(".json") for path in directory.glob("*.json"))
+    for name in names[: max(0, len(names) - max_profiles)]:
+        for path in directory.glob(f"{name}.*"):
+            path.unlink(missing_ok=True)
+
+
+def profile_tool(function: Callable[P, Awaitable[T]]) -> Callable[P, Awaitable[T]]:
+    """Profile calls of a tool with the configured profiler.
+
+    With profiling disabled, the tool is returned as is, so it costs nothing.
+    """
+    if _profiler is None:
+        return function
+    profiler = _profiler
+    signature = inspect.signature(function)
+
+    @functools.wraps(function)
+    async def wrapper(*args: P.args, **kwargs: P.kwargs) -> T:
+        arguments = signature.bind_partial(*args, **kwargs).arguments
+        async with profiler.profile(function.__name__, arguments):
+            return await function(*args, **kwargs)
+
+    return wrapper
+
+
+async def wait_for_profiles() -> None:
+    """Wait until every profile being written in the background has been written."""
+    await asyncio.gather(*_background_tasks, return_exceptions=True)
+
+
+_profiler: CallProfiler | None = (
+    CallProfiler(
+        Path(config.profiling.directory),
+        config.profiling.every_n_calls,
+        config.profiling.slow_call_seconds,
+        config.profiling.max_profiles,
+        config.profiling.interval_seconds,
+        memory=config.profiling.memory,
+    )
+    if config.profiling.enabled
+    else None
+)
@@ -0,0 +1,300 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from collections.abc import AsyncIterator, Callable, Hashable, Iterator
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from logging import getLogger
+
+from mcp.server.lowlevel.server import request_ctx
+from metrics import (
+    UPSTREAM_IN_FLIGHT,
+    UPSTREAM_QUEUE_DEPTH,
+    UPSTREAM_QUEUE_WAIT,
+    UPSTREAM_RESERVED_BYTES,
+    record_stage,
+)
+from schemas import SchedulerConfig
+
+logger = getLogger(__name__)
+
+# Priorities of the requests to the SDMX API, most urgent first: dataflow structures are small
+# and needed to answer most tool calls, data responses can be large, and background requests (e.g.
+# prefetching popular queries) only go when no tool call is waiting
+PRIORITIES = ("metadata", "data", "background")
+# Weight of the latest response in the expected size of the responses of an endpoint
+SIZE_WEIGHT = 0.3
+
+_priority: ContextVar[str] = ContextVar("request_priority", default="data")
+
+
+@contextmanager
+def request_priority(priority: str) -> Iterator[None]:
+    """Send the SDMX requests of the enclosed code, and of the tasks it starts, with a priority.
+
+    Background work stays in the background: requests it sends with another priority (e.g. the
+    structure fetched to answer a prefetched query) are still sent as `background`.
+
+    Example:
+        with request_priority("metadata"):
+            data = await get_json(f"data/{dataflow_id}/All", params=params)
+    """
+    if priority not in PRIORITIES:
+        msg = f"Unknown request priority: {priority}. Must be one of {', '.join(PRIORITIES)}"
+        raise ValueError(msg)
+    if _priority.get() == "background":
+        priority = "background"
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> str:
+    """Priority the SDMX requests of the current code are sent with."""
+    return _priority.get()
+
+
+def current_session() -> Hashable:
+    """Key of the MCP session of the current tool call, `None` outside of one."""
+    try:
+        context = request_ctx.get()
+    except LookupError:
+        return None
+    return id(context.session)
+
+
+class BandwidthLimiter:
+    """Token bucket capping the bytes downloaded per second, allowing bursts of a second's worth."""
+
+    def __init__(
+        self, bytes_per_second: float, clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        self.bytes_per_second = bytes_per_second
+        self._clock = clock
+        self._available = bytes_per_second
+        self._updated = clock()
+
+    def delay(self, num_bytes: int) -> float:
+        """Take downloaded bytes out of the bucket.
+
+        Returns:
+            float: Seconds to wait before downloading more, to stay within the rate.
+        """
+        now = self._clock()
+        self._available = min(
+            self.bytes_per_second,
+            self._available + (now - self._updated) * self.bytes_per_second,
+        )
+        self._updated = now
+        self._available -= num_bytes
+        return max(0.0, -self._available / self.bytes_per_second)
+
+
+class Admission:
+    """Slot of a request admitted by the scheduler, counting the bytes of its response."""
+
+    def __init__(self, reserved_bytes: int, limiter: BandwidthLimiter | None = None) -> None:
+        self.reserved_bytes = reserved_bytes
+        self.received_bytes = 0
+        self._limiter = limiter
+
+    def record_bytes(self, num_bytes: int) -> None:
+        """Count bytes of the response received."""
+        self.received_bytes += num_bytes
+
+    async def throttle(self, num_bytes: int) -> None:
+        """Wait after receiving bytes if the request is over its bandwidth cap, if any.
+
+        The slot is held meanwhile, so a throttled download also keeps others of its priority
+        waiting instead of buffering their responses.
+        """
+        if self._limiter is not None:
+            delay = self._limiter.delay(num_bytes)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+
+@dataclass
+class _Waiter:
+    future: asyncio.Future[None]
+    priority: str
+    session: Hashable
+    admission: Admission
+
+
+class RequestScheduler:
+    """Admission control and fair scheduling of the requests to the SDMX API.
+
+    - At most `max_concurrent_requests` requests are in flight, from their first byte sent to the
+      last byte of their response read, across every session.
+    - Every request reserves the expected size of its response: a moving average of the recent
+      responses of its endpoint (e.g. `data/DM`), or `default_response_bytes` before any. Requests
+      are held back while the reservations in flight would exceed `memory_budget_bytes`, but one
+      is always let through when none is in flight, so larger responses are still downloaded.
+    - Waiting requests are admitted by priority (see `PRIORITIES`), and within a priority the
+      sessions take turns, in the order of their oldest waiting request, so a session sending many
+      requests doesn't hold back the others. A request waiting for memory holds back the less
+      urgent ones, but not those of the same priority that fit.
+    - Background requests share a bandwidth cap of `background_bytes_per_second`, so they leave
+      most of the link to the tool calls.
+    """
+
+    def __init__(self, config: SchedulerConfig) -> None:
+        self.config = config
+        self._background_limiter = BandwidthLimiter(config.background_bytes_per_second)
+        self._queues: dict[str, OrderedDict[Hashable, deque[_Waiter]]] = {
+            priority: OrderedDict() for priority in PRIORITIES
+        }
+        self._in_flight = 0
+        self._reserved_bytes = 0
+        self._expected_sizes: dict[str, float] = {}
+
+    @property
+    def in_flight(self) -> int:
+        """Requests admitted and not finished yet."""
+        return self._in_flight
+
+    @property
+    def reserved_bytes(self) -> int:
+        """Expected size of the responses of the requests in flight."""
+        return self._reserved_bytes
+
+    def queued(self, priority: str) -> int:
+        """Requests of a priority waiting for admission."""
+        return sum(len(waiters) for waiters in self._queues[priority].values())
+
+    def expected_size(self, endpoint: str) -> int:
+        """Expected size in bytes of the response of a request to `endpoint`."""
+        return int(self._expected_sizes.get(endpoint, self.config.default_response_bytes))
+
+    @asynccontextmanager
+    async def admit(
+        self, endpoint: str, priority: str | None = None, session: Hashable = None
+    ) -> AsyncIterator[Admission]:
+        """Wait until a request can be sent, and hold its slot until the response is read.
+
+        Args:
+            endpoint: Endpoint of the request, e.g. `data/DM`, to expect the size of its response.
+            priority: One of `PRIORITIES`, by default the one set with `request_priority`.
+            session: Key of the session sending the request, by default the MCP session of the
+                current tool call.
+
+        Yields:
+            Admission: Slot of the request, to count (and throttle) the bytes of its response with.
+        """
+        priority = priority or current_priority()
+        if session is None:
+            session = current_session()
+        admission = Admission(
+            self.expected_size(endpoint),
+            self._background_limiter if priority == "background" else None,
+        )
+
+        start = time.perf_counter()
+        if not any(self._queues.values()) and self._fits(admission):
+            self._start(admission)
+        else:
+            logger.debug(
+                "Request to %s waits for admission, %s in flight", endpoint, self._in_flight
+            )
+            await self._wait(
+                _Waiter(asyncio.get_running_loop().create_future(), priority, session, admission)
+            )
+            record_stage("queue", time.perf_counter() - start)
+        UPSTREAM_QUEUE_WAIT.observe(time.perf_counter() - start, priority=priority)
+
+        try:
+            yield admission
+        finally:
+            self._finish(admission, endpoint)
+
+    def reset(self) -> None:
+        """Forget the expected response sizes. Requests in flight or waiting are kept."""
+        self._expected_sizes.clear()
+
+    async def _wait(self, waiter: _Waiter) -> None:
+        """Queue a request until `_dispatch` admits it."""
+        self._queues[waiter.priority].setdefault(waiter.session, deque()).append(waiter)
+        self._update_gauges()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Admitted, but cancelled before it could start
+                self._finish(waiter.admission)
+            else:
+                self._remove(waiter)
+            raise
+
+    def _fits(self, admission: Admission) -> bool:
+        if self._in_flight >= self.config.max_concurrent_requests:
+            return False
+        return (
+            self._in_flight == 0
+            or self._reserved_bytes + admission.reserved_bytes <= self.config.memory_budget_bytes
+        )
+
+    def _start(self, admission: Admission) -> None:
+        self._in_flight += 1
+        self._reserved_bytes += admission.reserved_bytes
+        self._update_gauges()
+
+    def _finish(self, admission: Admission, endpoint: str | None = None) -> None:
+        """Free the slot of a request, learning the size of its response, and admit others."""
+        self._in_flight -= 1
+        self._reserved_bytes -= admission.reserved_bytes
+        if endpoint is not None and admission.received_bytes:
+            expected = self._expected_sizes.get(endpoint)
+            self._expected_sizes[endpoint] = (
+                admission.received_bytes
+                if expected is None
+                else expected + SIZE_WEIGHT * (admission.received_bytes - expected)
+            )
+        self._dispatch()
+
+    def _remove(self, waiter: _Waiter) -> None:
+        """Take a cancelled request out of its queue, letting the next ones through if they fit."""
+        sessions = self._queues[waiter.priority]
+        waiters = sessions.get(waiter.session)
+        if waiters is not None and waiter in waiters:
+            waiters.remove(waiter)
+            if not waiters:
+                del sessions[waiter.session]
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Admit waiting requests as long as they fit."""
+        while (waiter := self._next_waiter()) is not None:
+            if waiter.future.cancelled():
+                continue
+            self._start(waiter.admission)
+            waiter.future.set_result(None)
+        self._update_gauges()
+
+    def _next_waiter(self) -> _Waiter | None:
+        """Take the next request to admit out of its queue, `None` if none can be admitted."""
+        for priority in PRIORITIES:
+            sessions = self._queues[priority]
+            if not sessions:
+                continue
+            # The first session whose next request fits goes, then waits for the others' turn
+            for session in sessions:
+                if self._fits(sessions[session][0].admission):
+                    break
+            else:
+                return None
+            waiters = sessions.pop(session)
+            waiter = waiters.popleft()
+            if waiters:
+                sessions[session] = waiters
+            return waiter
+        return None
+
+    def _update_gauges(self) -> None:
+        for priority in PRIORITIES:
+            UPSTREAM_QUEUE_DEPTH.set(self.queued(priority), priority=priority)
+        UPSTREAM_IN_FLIGHT.set(self._in_flight)
+        UPSTREAM_RESERVED_BYTES.set(self._reserved_bytes)
@@ -1,5 +1,9 @@
-from dataclasses import dataclass
-from typing import Literal
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import TYPE_CHECKING, Literal
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 Transport = Literal["stdio", "sse", "streamable-http"]
 
@@ -12,6 +16,156 @@ class Dataflow:
     description: str
 
 
+@dataclass(frozen=True)
+class DataQuery:
+    """Normalized data request, used as the key of the data cache."""
+
+    dataflow_id: str
+    ref_areas: tuple[str, ...]
+    indicators: tuple[str, ...]
+    year: int | None = None
+    start_year: int | None = None
+    end_year: int | None = None
+    last_n_observations: int | None = None
+    max_rows: int | None = None
+
+    @property
+    def key(self) -> str:
+        """SDMX data key, e.g. `ARG+URY.DM_BRTS`."""
+        return f"{'+'.join(self.ref_areas)}.{'+'.join(self.indicators)}"
+
+    @property
+    def period_range(self) -> tuple[int | None, int | None]:
+        """First and last year of the query, `None` where it is open."""
+        if self.year is not None:
+            return self.year, self.year
+        return self.start_year, self.end_year
+
+
+@dataclass
+class BatchQuery:
+    """Data query of a batch, with the arguments of `get_data_for_dataflow`."""
+
+    dataflow_id: str
+    ref_areas: str
+    indicators: str
+    year: int | None = None
+    start_year: int | None = None
+    end_year: int | None = None
+    last_n_observations: int | None = None
+
+
+@dataclass
+class DataResult:
+    """Data returned for a query, with the errors of the parts of it that failed."""
+
+    data: "pd.DataFrame"
+    errors: list[str] = field(default_factory=list)
+    # Whether rows were left out because the query's `max_rows` was reached
+    truncated: bool = False
+
+
+@dataclass
+class DataPage:
+    """Rows of a stored result, from `offset` on."""
+
+    data: "pd.DataFrame"
+    offset: int
+    num_rows: int
+
+    @property
+    def next_offset(self) -> int | None:
+        """Offset of the next page, or `None` if this is the last one."""
+        end = self.offset + len(self.data)
+        return end if end < self.num_rows else None
+
+
+@dataclass(frozen=True)
+class IndicatorEntry:
+    """Indicator of a dataflow, as indexed for search."""
+
+    dataflow_id: str
+    indicator: str
+    name: str
+    description: str = ""
+
+
+@dataclass
+class IndicatorMatch:
+    """Indicator matching a search, with its relevance score."""
+
+    dataflow_id: str
+    indicator: str
+    name: str
+    score: float
+
+
+@dataclass
+class IndicatorSearchResult:
+    """Ranked matches of a search, with the dataflows missing from the index."""
+
+    matches: list[IndicatorMatch]
+    errors: list[str] = field(default_factory=list)
+
+
+@dataclass(frozen=True)
+class Code:
+    """Single code (value) of an SDMX dimension or attribute."""
+
+    id: str
+    name: str
+    description: str = ""
+
+
+@dataclass
+class Component:
+    """SDMX dimension or attribute together with the codes it takes."""
+
+    id: str
+    name: str
+    codes: list[Code]
+
+
+@dataclass
+class DataflowStructure:
+    """Dimensions and attributes of a dataflow, as described by the SDMX structure."""
+
+    dataflow_id: str
+    series_dimensions: list[Component]
+    observation_dimensions: list[Component]
+    series_attributes: list[Component]
+    observation_attributes: list[Component]
+
+    def get_dimension(self, dimension_id: str) -> Component:
+        """Get a dimension by its ID, regardless of its key position.
+
+        Args:
+            dimension_id: ID of the dimension, e.g. `INDICATOR` or `REF_AREA`.
+
+        Returns:
+            Component: The requested dimension.
+
+        Raises:
+            KeyError: If the dataflow has no dimension with the given ID.
+        """
+        for dimension in self.series_dimensions + self.observation_dimensions:
+            if dimension.id == dimension_id:
+                return dimension
+        msg = f"Dimension {dimension_id} not found in dataflow {self.dataflow_id}"
+        raise KeyError(msg)
+
+    @cached_property
+    def code_ids(self) -> dict[str, dict[str, str]]:
+        """IDs of the codes of every series dimension, by dimension ID and upper-case code ID.
+
+        Built on first use and kept with the structure, so checking a code is a dict lookup.
+        """
+        return {
+            dimension.id: {code.id.upper(): code.id for code in dimension.codes}
+            for dimension in self.series_dimensions
+        }
+
+
 @dataclass
 class ServerConfig:
     """Server configuration settings."""
@@ -21,8 +175,147 @@ class ServerConfig:
     transport: Transport
 
 
+@dataclass
+class HttpConfig:
+    """Settings of the process-wide HTTP client used for SDMX requests."""
+
+    max_connections_per_host: int = 10
+    max_keepalive_connections: int = 10
+    keepalive_expiry: float = 30.0
+    connect_timeout: float = 10.0
+    read_timeout: float = 200.0
+    worker_threads: int = 4
+
+
+@dataclass
+class CacheConfig:
+    """Settings of the in-process response caches."""
+
+    data_ttl_seconds: float = 900.0
+    data_max_bytes: int = 256 * 1024 * 1024
+    structure_ttl_seconds: float = 24 * 60 * 60.0
+    structure_max_bytes: int = 64 * 1024 * 1024
+    max_stale_seconds: float = 24 * 60 * 60.0
+    serve_subsets: bool = True
+
+
+@dataclass
+class UpstreamConfig:
+    """Settings of the timeouts, hedging, retries and circuit breaker of SDMX requests."""
+
+    min_timeout_seconds: float = 10.0
+    max_timeout_seconds: float = 120.0
+    timeout_multiplier: float = 3.0
+    latency_window: int = 100
+    min_samples: int = 20
+    hedging: bool = True
+    hedge_percentile: float = 95.0
+    min_hedge_delay_seconds: float = 1.0
+    max_retries: int = 2
+    retry_base_delay_seconds: float = 0.5
+    retry_max_delay_seconds: float = 10.0
+    failure_threshold: int = 5
+    open_seconds: float = 30.0
+
+
+@dataclass
+class SchedulerConfig:
+    """Settings of the admission control and scheduling of SDMX requests."""
+
+    max_concurrent_requests: int = 8
+    memory_budget_bytes: int = 512 * 1024 * 1024
+    default_response_bytes: int = 8 * 1024 * 1024
+    background_bytes_per_second: int = 2 * 1024 * 1024
+
+
+@dataclass
+class ResultStoreConfig:
+    """Settings of the store of large results, fetched page by page by handle."""
+
+    page_size: int = 1000
+    max_page_size: int = 10000
+    ttl_seconds: float = 1800.0
+    max_bytes: int = 512 * 1024 * 1024
+
+
+@dataclass
+class DiskCacheConfig:
+    """Settings of the optional on-disk cache of raw SDMX responses."""
+
+    enabled: bool = False
+    directory: str = "/tmp/datawarehouse_mcp/cache"  # noqa: S108
+    ttl_seconds: float = 3600.0
+    max_stale_seconds: float = 7 * 24 * 60 * 60.0
+    max_bytes: int = 1024 * 1024 * 1024
+
+
+@dataclass
+class MirrorConfig:
+    """Settings of the optional local mirror of the curated dataflows."""
+
+    enabled: bool = False
+    directory: str = "/tmp/datawarehouse_mcp/mirror"  # noqa: S108
+
+
+@dataclass
+class ProfilingConfig:
+    """Settings of the optional profiling of tool calls."""
+
+    enabled: bool = False
+    every_n_calls: int = 100
+    slow_call_seconds: float = 5.0
+    memory: bool = False
+    interval_seconds: float = 0.001
+    directory: str = "/tmp/datawarehouse_mcp/profiles"  # noqa: S108
+    max_profiles: int = 50
+
+
+@dataclass
+class SearchConfig:
+    """Settings of the indicator search index."""
+
+    index_path: str = "/tmp/datawarehouse_mcp/indicator_index.json"  # noqa: S108
+    index_ttl_seconds: float = 24 * 60 * 60.0
+
+
+@dataclass
+class QueryConfig:
+    """Settings for splitting large data queries into concurrent requests."""
+
+    max_ref_areas_per_request: int = 50
+    max_indicators_per_request: int = 20
+    max_parallel_requests: int = 4
+    max_batch_queries: int = 10
+    max_parallel_queries: int = 4
+    wire_format: str = "json"
+    validate_codes: bool = True
+
+
+@dataclass
+class PrefetchConfig:
+    """Settings of the background warm-up of the caches with popular queries."""
+
+    enabled: bool = True
+    startup_delay_seconds: float = 5.0
+    interval_seconds: float = 600.0
+    top_queries: int = 20
+    max_tracked_queries: int = 1000
+    popularity_path: str = "/tmp/datawarehouse_mcp/popularity.json"  # noqa: S108
+
+
 @dataclass
 class Config:
     """Configuration settings."""
 
     server: ServerConfig
+    http: HttpConfig = field(default_factory=HttpConfig)
+    upstream: UpstreamConfig = field(default_factory=UpstreamConfig)
+    scheduler: SchedulerConfig = field(default_factory=SchedulerConfig)
+    cache: CacheConfig = field(default_factory=CacheConfig)
+    results: ResultStoreConfig = field(default_factory=ResultStoreConfig)
+    disk_cache: DiskCacheConfig = field(default_factory=DiskCacheConfig)
+    mirror: MirrorConfig = field(default_factory=MirrorConfig)
+    profiling: ProfilingConfig = field(default_factory=ProfilingConfig)
+    search: SearchConfig = field(default_factory=SearchConfig)
+    query: QueryConfig = field(default_factory=QueryConfig)
+    prefetch: PrefetchConfig = field(default_factory=PrefetchConfig)
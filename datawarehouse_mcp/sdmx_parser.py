@@ -1,116 +1,357 @@
+import io
+from dataclasses import dataclass
+from itertools import chain
 from typing import Any
 
+import numpy as np
+import numpy.typing as npt
 import pandas as pd
+from pandas.api.types import union_categoricals
+from schemas import Component, DataflowStructure
+
+# Number of observations decoded into arrays at once, bounds the size of the pending Python lists
+FLUSH_SIZE = 100_000
+
+IntArray = npt.NDArray[np.int32]
+FloatArray = npt.NDArray[np.float64]
 
 
 def build_df_from_json(json_data: dict[str, Any]) -> pd.DataFrame:
     """Build a CSV DataFrame from SDMX-JSON data.
 
+    Dimension and attribute columns are `pd.Categorical` built straight from the positions in the
+    SDMX-JSON keys and the value lists of the structure, and `OBS_VALUE` is float64.
+
     Args:
         json_data: JSON data from API response
 
     Returns:
         DataFrame containing the requested data
     """
-    data_structure = json_data["structure"]
+    buffer = ObservationBuffer()
+    for series_key, series_data in json_data["dataSets"][0]["series"].items():
+        buffer.add_series(series_key, series_data)
 
-    # Get dimension and attribute definitions upfront
-    dimensions = {
-        "observation": [d["id"] for d in data_structure["dimensions"]["observation"]],
-        "series": [d["id"] for d in data_structure["dimensions"]["series"]],
-    }
-    attributes = {
-        "observation": [a["id"] for a in data_structure["attributes"]["observation"]],
-        "series": [a["id"] for a in data_structure["attributes"]["series"]],
-    }
+    return buffer.to_frame(json_data["structure"])
+
+
+def build_df_from_csv(
+    csv_data: bytes,
+    structure: DataflowStructure,
+    max_rows: int | None = None,
+) -> pd.DataFrame:
+    """Build a DataFrame from SDMX-CSV data, with the same schema as `build_df_from_json`.
+
+    The CSV is read by the pandas C parser straight into categorical columns. Columns are ordered
+    and categories sorted following the dataflow structure, which SDMX-CSV does not carry.
+
+    Args:
+        csv_data: SDMX-CSV body of an API response, requested with `labels=id`.
+        structure: Structure of the dataflow the data belongs to.
+        max_rows: Only read the first `max_rows` rows, all of them if `None`.
+
+    Returns:
+        DataFrame containing the requested data
+
+    Raises:
+        ValueError: If the body is not SDMX-CSV, e.g. an error message.
+    """
+    header = csv_data.split(b"\n", 1)[0].decode("utf-8", errors="replace")
+    if "OBS_VALUE" not in header.split(","):
+        msg = f"Unexpected SDMX-CSV response: {csv_data[:200]!r}"
+        raise ValueError(msg)
+
+    component_ids = {component.id for component in _components(structure)}
+    # Only the C parser reads codes as strings; pyarrow infers types of categories, e.g. 2020 as int
+    data = pd.read_csv(
+        io.BytesIO(csv_data),
+        engine="c",
+        dtype={**dict.fromkeys(component_ids, "category"), "OBS_VALUE": object},
+        usecols=lambda column: column == "OBS_VALUE" or column in component_ids,
+        keep_default_na=False,
+        na_values=[""],
+        nrows=max_rows,
+    )
+    data["OBS_VALUE"] = pd.to_numeric(data["OBS_VALUE"], errors="coerce")
+
+    return conform_to_structure(data, structure)
+
+
+def conform_to_structure(data: pd.DataFrame, structure: DataflowStructure) -> pd.DataFrame:
+    """Give data read from another source the schema of `build_df_from_json`.
 
-    # Create lookup dictionaries for faster value retrieval
-    value_lookups = {
-        ("dimensions", "observation"): {
-            (i, val_pos): val["id"]
-            for i, dim in enumerate(data_structure["dimensions"]["observation"])
-            for val_pos, val in enumerate(dim["values"])
-        },
-        ("dimensions", "series"): {
-            (i, val_pos): val["id"]
-            for i, dim in enumerate(data_structure["dimensions"]["series"])
-            for val_pos, val in enumerate(dim["values"])
-        },
-        ("attributes", "observation"): {
-            (i, val_pos): val["id"]
-            for i, attr in enumerate(data_structure["attributes"]["observation"])
-            for val_pos, val in enumerate(attr["values"])
-        },
-        ("attributes", "series"): {
-            (i, val_pos): val["id"]
-            for i, attr in enumerate(data_structure["attributes"]["series"])
-            for val_pos, val in enumerate(attr["values"])
-        },
+    Columns are ordered like the structure's components, with `OBS_VALUE` last as float64, and
+    components missing from the data are added as empty columns. Categories are sorted like the
+    component's codes, and unused ones are dropped.
+
+    Args:
+        data: Dimension and attribute columns (categorical or strings) and `OBS_VALUE`.
+        structure: Structure of the dataflow the data belongs to.
+
+    Returns:
+        DataFrame with the same columns and dtypes as `build_df_from_json`.
+    """
+    columns: dict[str, Any] = {
+        component.id: _sort_categories(data[component.id], component)
+        if component.id in data
+        else pd.Categorical.from_codes(
+            np.full(len(data), -1), categories=pd.Index([], dtype=object)
+        )
+        for component in _components(structure)
     }
-    data = json_data["dataSets"][0]["series"]
-    # Process all series at once using list comprehension
-    rows = [
-        (
-            # Observation dimensions
-            get_values(
-                [int(x) for x in obs_dims.split(":")],
-                "dimensions",
-                "observation",
-                value_lookups,
-            )
-            + [None] * (len(dimensions["observation"]) - len(obs_dims.split(":")))
-            +
-            # Series dimensions
-            get_values(
-                [int(x) for x in series_id.split(":")],
-                "dimensions",
-                "series",
-                value_lookups,
+    columns["OBS_VALUE"] = data["OBS_VALUE"].to_numpy(dtype=np.float64)
+
+    return pd.DataFrame(columns)
+
+
+def _components(structure: DataflowStructure) -> list[Component]:
+    """Components of a structure, in the column order of `build_df_from_json`."""
+    return (
+        structure.observation_dimensions
+        + structure.series_dimensions
+        + structure.observation_attributes
+        + structure.series_attributes
+    )
+
+
+def _sort_categories(column: pd.Series, component: Component) -> pd.Categorical:
+    """Order the categories of a column like the component's codes, dropping unused ones."""
+    categorical = pd.Categorical(column).remove_unused_categories()
+    categories: pd.Index = categorical.categories.astype(object)
+    observed = set(categories)
+    order = [code.id for code in component.codes if code.id in observed]
+    known = set(order)
+    order += [category for category in categories if category not in known]
+    return categorical.set_categories(pd.Index(order, dtype=object))
+
+
+@dataclass
+class _DecodedChunk:
+    """Observations of a group of series, decoded into integer code arrays."""
+
+    series_codes: IntArray
+    series_attributes: IntArray
+    observation_counts: npt.NDArray[np.int64]
+    observation_codes: IntArray
+    observation_attributes: IntArray
+    observation_values: FloatArray
+
+
+class ObservationBuffer:
+    """Accumulates SDMX-JSON series as columnar integer codes instead of Python rows.
+
+    Series are added one at a time and decoded in bulk every `FLUSH_SIZE` observations, so only a
+    bounded amount of raw JSON values is held at any point. The structure is only needed when
+    building the final DataFrame, so series may be added before the structure is known.
+    """
+
+    def __init__(self) -> None:
+        self.num_observations = 0
+        self._series_keys: list[str] = []
+        self._series_attributes: list[list[int | None]] = []
+        self._observation_counts: list[int] = []
+        self._observation_keys: list[str] = []
+        self._observations: list[list[Any]] = []
+        self._chunks: list[_DecodedChunk] = []
+
+    def add_series(self, series_key: str, series_data: dict[str, Any]) -> None:
+        """Add a series and its observations.
+
+        Args:
+            series_key: Colon-separated positions of the series dimension values, e.g. `0:3:1`.
+            series_data: Series object, with `attributes` and `observations`.
+        """
+        if "observations" not in series_data or "attributes" not in series_data:
+            return
+
+        observations: dict[str, list[Any]] = series_data["observations"]
+        self._series_keys.append(series_key)
+        self._series_attributes.append(series_data["attributes"])
+        self._observation_counts.append(len(observations))
+        self._observation_keys.extend(observations.keys())
+        self._observations.extend(observations.values())
+        self.num_observations += len(observations)
+
+        if len(self._observations) >= FLUSH_SIZE:
+            self.flush()
+
+    def flush(self) -> None:
+        """Decode the pending series into integer code arrays."""
+        if not self._series_keys:
+            return
+
+        observation_values, observation_attributes = _decode_observations(self._observations)
+        self._chunks.append(
+            _DecodedChunk(
+                series_codes=_decode_keys(self._series_keys),
+                series_attributes=_decode_codes(self._series_attributes),
+                observation_counts=np.array(self._observation_counts, dtype=np.int64),
+                observation_codes=_decode_keys(self._observation_keys),
+                observation_attributes=observation_attributes,
+                observation_values=observation_values,
             )
-            + [None] * (len(dimensions["series"]) - len(series_id.split(":")))
-            +
-            # Observation attributes
-            get_values(obs_attrs[1:], "attributes", "observation", value_lookups)
-            +
-            # Series attributes
-            get_values(series_data["attributes"], "attributes", "series", value_lookups)
-            + [None] * (len(attributes["series"]) - len(series_data["attributes"]))
-            +
-            # Observation value
-            [obs_attrs[0]]
         )
-        for series_id, series_data in data.items()
-        if "observations" in series_data and "attributes" in series_data
-        for obs_dims, obs_attrs in series_data["observations"].items()
-    ]
-
-    column_names = (
-        dimensions["observation"]
-        + dimensions["series"]
-        + attributes["observation"]
-        + attributes["series"]
-        + ["OBS_VALUE"]
-    )
+        self._series_keys = []
+        self._series_attributes = []
+        self._observation_counts = []
+        self._observation_keys = []
+        self._observations = []
+
+    def to_frame(self, json_structure: dict[str, Any]) -> pd.DataFrame:
+        """Build the DataFrame of all the series added so far.
+
+        Args:
+            json_structure: `structure` object of the SDMX-JSON response.
+
+        Returns:
+            DataFrame with observation dimensions, series dimensions, observation attributes,
+            series attributes and `OBS_VALUE`, in that order.
+        """
+        self.flush()
+
+        series_dimensions = json_structure["dimensions"]["series"]
+        observation_dimensions = json_structure["dimensions"]["observation"]
+        series_attributes = json_structure["attributes"]["series"]
+        observation_attributes = json_structure["attributes"]["observation"]
+
+        def stack(field: str, width: int) -> IntArray:
+            matrices = [_pad_columns(getattr(chunk, field), width) for chunk in self._chunks]
+            if not matrices:
+                return np.empty((0, width), dtype=np.int32)
+            return np.concatenate(matrices)
+
+        counts = np.concatenate(
+            [chunk.observation_counts for chunk in self._chunks] or [np.empty(0, dtype=np.int64)]
+        )
+        series_codes = np.repeat(stack("series_codes", len(series_dimensions)), counts, axis=0)
+        series_attribute_codes = np.repeat(
+            stack("series_attributes", len(series_attributes)), counts, axis=0
+        )
+        observation_codes = stack("observation_codes", len(observation_dimensions))
+        observation_attribute_codes = stack("observation_attributes", len(observation_attributes))
+
+        columns: dict[str, Any] = {}
+        for components, codes in (
+            (observation_dimensions, observation_codes),
+            (series_dimensions, series_codes),
+            (observation_attributes, observation_attribute_codes),
+            (series_attributes, series_attribute_codes),
+        ):
+            for i, component in enumerate(components):
+                columns[component["id"]] = _to_categorical(codes[:, i], component)
+
+        columns["OBS_VALUE"] = np.concatenate(
+            [chunk.observation_values for chunk in self._chunks] or [np.empty(0)]
+        )
+
+        return pd.DataFrame(columns)
 
-    return pd.DataFrame(rows, columns=column_names)
 
+def _decode_keys(keys: list[str]) -> IntArray:
+    """Decode colon-separated SDMX-JSON keys into an (n, positions) matrix of codes."""
+    width = keys[0].count(":") + 1
+    positions = ":".join(keys).split(":")
+    if len(positions) == len(keys) * width:
+        return np.array(positions, dtype=np.int32).reshape(len(keys), width)
 
-def get_values(
-    ids: list[int],
-    structure_type: str,
-    dimension_type: str,
-    value_lookups: dict[tuple[str, str], dict[tuple[int, int], str]],
-) -> list[str | None]:
-    """Get values from lookup dictionary based on IDs and structure type.
+    # Keys of different lengths, missing trailing positions are padded with -1 (no value)
+    return _decode_codes([[int(p) for p in key.split(":")] for key in keys])
+
+
+def _decode_codes(rows: list[list[int | None]]) -> IntArray:
+    """Decode rows of value positions (with `None` for missing values) into a matrix of codes."""
+    width = max(len(row) for row in rows)
+    flat = _flatten(rows, width)
+    matrix = np.array(flat, dtype=np.float64).reshape(len(rows), width)
+    return np.nan_to_num(matrix, nan=-1).astype(np.int32)
+
+
+def _decode_observations(observations: list[list[Any]]) -> tuple[FloatArray, IntArray]:
+    """Decode observation arrays (`[value, attribute positions...]`) into values and codes."""
+    width = max(len(observation) for observation in observations)
+    flat = _flatten(observations, width)
+    try:
+        matrix = np.array(flat, dtype=np.float64).reshape(len(observations), width)
+    except ValueError:
+        # Non-numeric values, coerce them column-wise instead
+        objects = np.array(flat, dtype=object).reshape(len(observations), width)
+        values = pd.to_numeric(objects[:, 0], errors="coerce").astype(np.float64)
+        return np.asarray(values), _decode_codes(objects[:, 1:].tolist())
+
+    return matrix[:, 0].copy(), np.nan_to_num(matrix[:, 1:], nan=-1).astype(np.int32)
+
+
+def _flatten(rows: list[list[Any]], width: int) -> list[Any]:
+    """Flatten rows into a single list, padding short rows with `None`."""
+    flat = list(chain.from_iterable(rows))
+    if len(flat) == len(rows) * width:
+        return flat
+    return list(chain.from_iterable(row + [None] * (width - len(row)) for row in rows))
+
+
+def _pad_columns(matrix: IntArray, width: int) -> IntArray:
+    """Trim or pad a code matrix with -1 (no value) so that it has `width` columns."""
+    if matrix.shape[1] >= width:
+        return matrix[:, :width]
+    padding = np.full((matrix.shape[0], width - matrix.shape[1]), -1, dtype=np.int32)
+    return np.hstack([matrix, padding])
+
+
+def _to_categorical(codes: IntArray, component: dict[str, Any]) -> pd.Categorical:
+    """Build a categorical column from value positions and the component's value list."""
+    categories = pd.Index([value["id"] for value in component["values"]], dtype=object)
+    codes = np.where(codes < len(categories), codes, -1)
+    if not categories.is_unique:
+        unique_categories = categories.unique()
+        remap = unique_categories.get_indexer(categories)
+        codes = np.where(codes >= 0, remap[codes], -1)
+        categories = unique_categories
+    return pd.Categorical.from_codes(codes, categories=categories)
+
+
+def concat_frames(frames: list[pd.DataFrame]) -> pd.DataFrame:
+    """Concatenate DataFrames built by `build_df_from_json`, keeping categorical columns.
+
+    `pd.concat` turns categorical columns whose categories differ into object columns, so the
+    categories of every column are unioned instead. Columns missing from some of the frames are
+    filled with missing values.
 
     Args:
-        ids: List of integer IDs to look up
-        structure_type: Type of structure ('dimensions' or 'attributes')
-        dimension_type: Type of dimension ('observation' or 'series')
-        value_lookups: Dictionary containing lookup mappings
+        frames: DataFrames to concatenate, in order.
 
     Returns:
-        List of values corresponding to the provided IDs
+        DataFrame with the rows of every frame, in order, and a fresh `RangeIndex`.
     """
-    lookup = value_lookups[(structure_type, dimension_type)]
-    return [lookup.get((i, id_val)) for i, id_val in enumerate(ids)]
+    if len(frames) == 1:
+        return frames[0].reset_index(drop=True)
+
+    column_names = list(dict.fromkeys(chain.from_iterable(frame.columns for frame in frames)))
+    if "OBS_VALUE" in column_names:
+        column_names.remove("OBS_VALUE")
+        column_names.append("OBS_VALUE")
+
+    columns: dict[str, Any] = {}
+    for name in column_names:
+        if name == "OBS_VALUE":
+            columns[name] = np.concatenate(
+                [
+                    frame[name].to_numpy(dtype=np.float64)
+                    if name in frame
+                    else np.full(len(frame), np.nan)
+                    for frame in frames
+                ]
+            )
+            continue
+
+        columns[name] = union_categoricals(
+            [
+                pd.Categorical(frame[name])
+                if name in frame
+                else pd.Categorical.from_codes(
+                    np.full(len(frame), -1), categories=pd.Index([], dtype=object)
+                )
+                for frame in frames
+            ]
+        )
+
+    return pd.DataFrame(columns)
@@ -0,0 +1,319 @@
+import argparse
+import asyncio
+import bisect
+import json
+import logging
+import math
+import os
+import re
+import sys
+import tempfile
+import time
+import unicodedata
+from collections import defaultdict
+from dataclasses import asdict
+from logging import getLogger
+from pathlib import Path
+
+from config import config
+from dataflows import get_curated_dataflow_ids
+from exceptions import DataWarehouseAPIError
+from http_client import close_http_client
+from schemas import IndicatorEntry, IndicatorMatch
+from structure import get_dataflow_structure
+from workers import run_in_worker
+
+logger = getLogger(__name__)
+
+# Weight of a term by the field it appears in
+FIELD_WEIGHTS = {"indicator": 3.0, "name": 2.0, "description": 1.0}
+# Weight of a vocabulary term by how it matches a query term
+EXACT_MATCH = 1.0
+PREFIX_MATCH = 0.8
+FUZZY_MATCH = 0.5
+# Query terms shorter than these don't match by prefix or with typos, as they match too much
+MIN_PREFIX_LENGTH = 3
+MIN_FUZZY_LENGTH = 5
+MAX_PREFIX_EXPANSIONS = 50
+
+_STOPWORDS = frozenset(
+    ("a", "an", "and", "as", "at", "by", "for", "from", "in", "into", "of", "on", "or", "per")
+    + ("the", "to", "with", "without")
+)
+# Suffixes stripped so that e.g. "vaccination" and "vaccines" match, longest first
+_SUFFIXES = ("ations", "ation", "ated", "ates", "ing", "ies", "es", "ed", "e", "s")
+_MIN_STEM_LENGTH = 4
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> list[str]:
+    """Split text into lowercase, accent-free and stemmed terms, without stopwords.
+
+    Args:
+        text: Text to split, e.g. `Measles-containing vaccine (MCV1)`.
+
+    Returns:
+        list[str]: Terms in order, e.g. `["measl", "contain", "vaccin", "mcv1"]`.
+    """
+    ascii_text = unicodedata.normalize("NFKD", text.lower()).encode("ascii", "ignore").decode()
+    return [_stem(token) for token in _TOKEN.findall(ascii_text) if token not in _STOPWORDS]
+
+
+def _stem(token: str) -> str:
+    for suffix in _SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= _MIN_STEM_LENGTH:
+            return token[: -len(suffix)]
+    return token
+
+
+def _deletions(term: str) -> set[str]:
+    """Variants of a term with one character deleted, to match terms with a typo."""
+    return {term[:i] + term[i + 1 :] for i in range(len(term))}
+
+
+class IndicatorIndex:
+    """Inverted index over the code, name and description of the indicators of many dataflows.
+
+    Every term maps to the indicators it appears in, with the weight of the most important field
+    it appears in. Query terms match vocabulary terms exactly, as a prefix (`vacc` matches
+    `vaccin`) or with one typo (`measels` matches `measl`), through a sorted vocabulary and a map
+    of single-character deletions, so a search only touches the postings of the matching terms.
+    """
+
+    def __init__(self, entries: list[IndicatorEntry], errors: list[str] | None = None) -> None:
+        """Build the index.
+
+        Args:
+            entries: Indicators to index.
+            errors: Dataflows that could not be indexed, reported with every search.
+        """
+        self.entries = entries
+        self.errors = errors or []
+        postings: defaultdict[str, dict[int, float]] = defaultdict(dict)
+        for position, entry in enumerate(entries):
+            for field, weight in FIELD_WEIGHTS.items():
+                for term in tokenize(getattr(entry, field)):
+                    documents = postings[term]
+                    documents[position] = max(documents.get(position, 0.0), weight)
+
+        self._postings = dict(postings)
+        self._vocabulary = sorted(self._postings)
+        self._idf = {
+            term: math.log(1 + len(entries) / len(documents))
+            for term, documents in self._postings.items()
+        }
+        deletions: defaultdict[str, set[str]] = defaultdict(set)
+        for term in self._vocabulary:
+            if len(term) >= MIN_FUZZY_LENGTH - 1:
+                for variant in _deletions(term) | {term}:
+                    deletions[variant].add(term)
+        self._deletions = dict(deletions)
+
+    def search(self, query: str, limit: int = 10) -> list[IndicatorMatch]:
+        """Find the indicators best matching a query.
+
+        Every query term adds the score of its best matching term in each indicator: the term's
+        IDF times the weight of its field and of its kind of match. The sum is scaled by the share
+        of query terms the indicator matches, so that indicators matching every term rank first.
+
+        Args:
+            query: Free text, e.g. `measles vaccination`.
+            limit: Maximum number of matches to return.
+
+        Returns:
+            list[IndicatorMatch]: Matches, best first.
+        """
+        query_terms = list(dict.fromkeys(tokenize(query)))
+        if not query_terms:
+            return []
+
+        scores: defaultdict[int, float] = defaultdict(float)
+        matched_terms: defaultdict[int, int] = defaultdict(int)
+        for query_term in query_terms:
+            term_scores: dict[int, float] = {}
+            for term, match_weight in self._match(query_term).items():
+                idf = self._idf[term]
+                for position, field_weight in self._postings[term].items():
+                    score = idf * field_weight * match_weight
+                    if score > term_scores.get(position, 0.0):
+                        term_scores[position] = score
+            for position, score in term_scores.items():
+                scores[position] += score
+                matched_terms[position] += 1
+
+        ranked = sorted(
+            (
+                (score * matched_terms[position] / len(query_terms), position)
+                for position, score in scores.items()
+            ),
+            key=lambda item: (-item[0], item[1]),
+        )
+        return [
+            IndicatorMatch(
+                dataflow_id=self.entries[position].dataflow_id,
+                indicator=self.entries[position].indicator,
+                name=self.entries[position].name,
+                score=round(score, 3),
+            )
+            for score, position in ranked[:limit]
+        ]
+
+    def _match(self, query_term: str) -> dict[str, float]:
+        """Vocabulary terms matching a query term, with the weight of their kind of match."""
+        matches: dict[str, float] = {}
+        if len(query_term) >= MIN_FUZZY_LENGTH:
+            for variant in _deletions(query_term) | {query_term}:
+                for term in self._deletions.get(variant, ()):
+                    matches[term] = FUZZY_MATCH
+        if len(query_term) >= MIN_PREFIX_LENGTH:
+            start = bisect.bisect_left(self._vocabulary, query_term)
+            for term in self._vocabulary[start : start + MAX_PREFIX_EXPANSIONS]:
+                if not term.startswith(query_term):
+                    break
+                matches[term] = PREFIX_MATCH
+        if query_term in self._postings:
+            matches[query_term] = EXACT_MATCH
+        return matches
+
+
+def estimate_index_size(index: IndicatorIndex) -> int:
+    """Roughly estimate the memory used by an index, in bytes."""
+    # Per-entry overhead of an `IndicatorEntry` and its postings, plus the characters themselves
+    entry_overhead = 500
+    return sum(
+        entry_overhead + len(entry.indicator) + len(entry.name) + len(entry.description)
+        for entry in index.entries
+    )
+
+
+async def build_index_entries(dataflow_ids: list[str]) -> tuple[list[IndicatorEntry], list[str]]:
+    """Get the indicators of dataflows from their structures, fetched concurrently.
+
+    Args:
+        dataflow_ids: Dataflows to index.
+
+    Returns:
+        tuple[list[IndicatorEntry], list[str]]: Indicators of every dataflow, in order, and the
+            errors of the dataflows whose structure could not be fetched.
+    """
+    semaphore = asyncio.Semaphore(config.query.max_parallel_requests)
+
+    async def get_entries(dataflow_id: str) -> list[IndicatorEntry]:
+        async with semaphore:
+            structure = await get_dataflow_structure(dataflow_id)
+        try:
+            indicator_dimension = structure.get_dimension("INDICATOR")
+        except KeyError as e:
+            raise DataWarehouseAPIError(str(e)) from e
+        return [
+            IndicatorEntry(dataflow_id, code.id, code.name, code.description)
+            for code in indicator_dimension.codes
+        ]
+
+    results = await asyncio.gather(
+        *(get_entries(dataflow_id) for dataflow_id in dataflow_ids), return_exceptions=True
+    )
+
+    entries: list[IndicatorEntry] = []
+    errors: list[str] = []
+    for dataflow_id, result in zip(dataflow_ids, results, strict=True):
+        if isinstance(result, Exception):
+            logger.warning("Not indexing dataflow %s: %s", dataflow_id, result)
+            errors.append(f"{dataflow_id}: {result}")
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            entries.extend(result)
+    return entries, errors
+
+
+def read_index_file(path: Path, max_age_seconds: float) -> list[IndicatorEntry] | None:
+    """Read the indicators of a prebuilt index file.
+
+    Returns:
+        list[IndicatorEntry] | None: Indexed indicators, or `None` if the file is missing,
+            unreadable or older than `max_age_seconds`.
+    """
+    try:
+        if time.time() - path.stat().st_mtime > max_age_seconds:
+            return None
+        raw_entries = json.loads(path.read_bytes())["indicators"]
+        return [IndicatorEntry(**raw_entry) for raw_entry in raw_entries]
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, TypeError):
+        logger.warning("Ignoring unreadable indicator index %s", path, exc_info=True)
+        return None
+
+
+def write_index_file(path: Path, entries: list[IndicatorEntry]) -> None:
+    """Write the indicators of an index, atomically replacing the previous file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    body = json.dumps({"indicators": [asdict(entry) for entry in entries]}, ensure_ascii=False)
+    fd, temp_name = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as fp:
+            fp.write(body)
+        Path(temp_name).replace(path)
+    except BaseException:
+        Path(temp_name).unlink(missing_ok=True)
+        raise
+
+
+async def load_indicator_index() -> IndicatorIndex:
+    """Load the index of the curated dataflows from its file, or build it and save it.
+
+    Returns:
+        IndicatorIndex: Index of every curated dataflow that could be indexed.
+
+    Raises:
+        DataWarehouseAPIError: If no dataflow could be indexed.
+    """
+    path = Path(config.search.index_path)
+    # Reading the file and building the index take a while on large indexes, so they run in the
+    # worker pool instead of stalling the other sessions
+    entries = await run_in_worker(read_index_file, path, config.search.index_ttl_seconds)
+    if entries is not None:
+        logger.info("Loaded %s indicators from %s", len(entries), path)
+        return await run_in_worker(IndicatorIndex, entries)
+
+    entries, errors = await build_index_entries(get_curated_dataflow_ids())
+    if not entries:
+        raise DataWarehouseAPIError("; ".join(errors) or "No indicators to index")
+    # A partial index is only kept in memory, so that the next load retries the failed dataflows
+    if not errors:
+        try:
+            await run_in_worker(write_index_file, path, entries)
+        except OSError:
+            logger.warning("Could not save the indicator index to %s", path, exc_info=True)
+    logger.info("Indexed %s indicators", len(entries))
+    return await run_in_worker(IndicatorIndex, entries, errors)
+
+
+async def _build_index_file(path: Path) -> int:
+    try:
+        entries, errors = await build_index_entries(get_curated_dataflow_ids())
+    finally:
+        await close_http_client()
+    if errors:
+        logger.error("Not writing an incomplete index: %s", "; ".join(errors))
+        return 1
+    write_index_file(path, entries)
+    logger.info("Wrote %s indicators to %s", len(entries), path)
+    return 0
+
+
+def main() -> int:
+    """Prebuild the indicator index file of the curated dataflows."""
+    parser = argparse.ArgumentParser(description="Prebuild the indicator search index file.")
+    parser.add_argument("--output", type=Path, default=Path(config.search.index_path))
+    args = parser.parse_args()
+    return asyncio.run(_build_index_file(args.output))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    sys.exit(main())
@@ -1,13 +1,25 @@
-from typing import Any
+import asyncio
+from collections.abc import Callable
+from dataclasses import asdict
+from typing import TYPE_CHECKING, Any
 
+from cache import get_cache_stats
 from config import config
+from dataflows import handle_get_available_dataflows
 from exceptions import DataWarehouseAPIError
-from handlers import (
-    handle_get_all_indicators_for_dataflow,
-    handle_get_available_dataflows,
-    handle_get_data_for_dataflow,
-)
 from mcp.server.fastmcp import FastMCP
+from metrics import instrument_tool, render_metrics, span
+from prefetch import prefetching
+from profiling import profile_tool
+from schemas import BatchQuery, DataResult
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse
+from workers import run_in_worker
+
+# `handlers` and `formatters` load pandas, which takes most of the startup time, so the tools import
+# them on first use. Clients spawning a server per session (stdio) get their first response sooner
+if TYPE_CHECKING:
+    import pandas as pd
 
 mcp = FastMCP("Data Warehouse MCP", host=config.server.host, port=config.server.port)
 
@@ -17,7 +29,9 @@ logger = get_logger(__name__)
 
 
 @mcp.tool()
-def get_available_dataflows() -> dict[str, str | dict[str, Any]]:
+@instrument_tool
+@profile_tool
+async def get_available_dataflows() -> dict[str, str | dict[str, Any]]:
     """Get the available dataflows and their descriptions.
 
     Returns:
@@ -42,7 +56,9 @@ def get_available_dataflows() -> dict[str, str | dict[str, Any]]:
 
 
 @mcp.tool()
-def get_all_indicators_for_dataflow(
+@instrument_tool
+@profile_tool
+async def get_all_indicators_for_dataflow(
     dataflow_id: str,
 ) -> dict[str, str | dict[str, str]]:
     """Get all indicators for the dataflow.
@@ -60,7 +76,9 @@ def get_all_indicators_for_dataflow(
         raise DataWarehouseAPIError(msg)
 
     try:
-        indicators_info = handle_get_all_indicators_for_dataflow(dataflow_id)
+        from handlers import handle_get_all_indicators_for_dataflow
+
+        indicators_info = await handle_get_all_indicators_for_dataflow(dataflow_id)
     except Exception as e:
         logger.exception("Error getting indicators for dataflow %s", dataflow_id)
         return {
@@ -76,25 +94,92 @@ def get_all_indicators_for_dataflow(
 
 
 @mcp.tool()
-def get_data_for_dataflow(
+@instrument_tool
+@profile_tool
+async def search_indicators(query: str, limit: int = 10) -> dict[str, Any]:
+    """Search indicators across all the available dataflows by code, name and description.
+
+    Use this tool to find which dataflow and indicator code answer a question, instead of listing
+    the indicators of every dataflow. Prefixes ("vacc") and single typos ("measels") also match.
+
+    Args:
+        query: Words describing the indicator, e.g. "measles vaccination" or "under-five mortality".
+        limit: Maximum number of matches to return.
+
+    Returns:
+        Dictionary containing the "matches", best first, each with its "dataflow_id",
+        "indicator" code, "name" and relevance "score", and input arguments.
+    """
+    logger.info("Searching indicators for %s", query)
+    input_arguments = {"query": query, "limit": str(limit)}
+
+    try:
+        from handlers import handle_search_indicators
+
+        result = await handle_search_indicators(query, limit)
+    except Exception as e:
+        logger.exception("Error searching indicators for %s", query)
+        return {
+            "error": str(e),
+            "input_arguments": input_arguments,
+        }
+    else:
+        logger.info("Returning %s indicators for %s", len(result.matches), query)
+        response: dict[str, Any] = {
+            "matches": [asdict(match) for match in result.matches],
+            "input_arguments": input_arguments,
+        }
+        if result.errors:
+            response["errors"] = result.errors
+        return response
+
+
+@mcp.tool()
+@instrument_tool
+@profile_tool
+async def get_data_for_dataflow(  # noqa: PLR0913
     dataflow_id: str,
     ref_areas: str,
     indicators: str,
     year: int | None = None,
-) -> dict[str, str | dict[str, str]]:
+    start_year: int | None = None,
+    end_year: int | None = None,
+    last_n_observations: int | None = None,
+    output_format: str = "table",
+    columns: str | None = None,
+    max_rows: int | None = None,
+) -> dict[str, str | int | bool | list[str] | dict[str, str]]:
     """Get data for a specific dataflow.
 
     Returns all available data that matches the criteria.
     If the year is not found, it will return all data for that country and indicator.
+    Unknown ref areas or indicators are left out and listed under "errors" with suggestions; if
+    none is known, the call fails with suggestions instead of querying the data warehouse.
+    Large results are returned one page at a time: only the first rows are included, along with
+    a "result_handle", the total "num_rows" and the "next_offset" to pass to `get_data_page`.
 
     Args:
         dataflow_id: Dataflow ID to get data for
         ref_areas: Plus-separated string of ISO-3 codes to filter by.
         indicators: Plus-separated string of indicator codes to retrieve.
         year: The year of the data to retrieve.
+        start_year: First year of a range of years to retrieve. Can't be combined with `year`.
+        end_year: Last year of a range of years to retrieve. Can't be combined with `year`.
+        last_n_observations: Only retrieve the latest N observations of every series, e.g. 1
+            for the most recent value.
+        output_format: How the data is rendered: "table" (aligned text), "csv", "records" (JSON
+            list of row objects) or "columnar" (JSON with the columns that have the same value
+            on every row listed once under "constants", and repeated codes as positions in a
+            list of values). "csv" and "columnar" are the most compact.
+        columns: Plus-separated columns to return, e.g. "REF_AREA+TIME_PERIOD+OBS_VALUE".
+            All columns are returned if not set.
+        max_rows: Stop after this many rows, to get a sample of a large dataflow quickly. If the
+            result was cut, "truncated" is true in the response.
 
     Returns:
-        Dictionary containing data and input arguments.
+        Dictionary containing data and input arguments. If part of a large query failed, the
+        errors of the failed parts are listed under "errors". Paging fields are included if the
+        result has more rows than a page.
     """
     logger.info("Getting data for dataflow %s", dataflow_id)
     if dataflow_id == "":
@@ -102,35 +187,348 @@ def get_data_for_dataflow(
         logger.error(msg)
         raise DataWarehouseAPIError(msg)
 
+    input_arguments = {
+        "dataflow_id": dataflow_id,
+        "ref_areas": ref_areas,
+        "indicators": indicators,
+        "year": str(year) if year is not None else "",
+        "start_year": str(start_year) if start_year is not None else "",
+        "end_year": str(end_year) if end_year is not None else "",
+        "last_n_observations": (
+            str(last_n_observations) if last_n_observations is not None else ""
+        ),
+        "output_format": output_format,
+        "columns": columns or "",
+        "max_rows": str(max_rows) if max_rows is not None else "",
+    }
+
     try:
-        data = handle_get_data_for_dataflow(
+        from formatters import get_formatter
+        from handlers import handle_get_data_for_dataflow
+
+        formatter = get_formatter(output_format)
+        result = await handle_get_data_for_dataflow(
             dataflow_id=dataflow_id,
             ref_areas=ref_areas,
             indicators=indicators,
             year=year,
+            start_year=start_year,
+            end_year=end_year,
+            last_n_observations=last_n_observations,
+            max_rows=max_rows,
         )
+        response = await _render_result(result, formatter, columns)
     except Exception as e:
         logger.exception("Error getting data for dataflow %s", dataflow_id)
         return {
             "error": str(e),
-            "input_arguments": {
-                "dataflow_id": dataflow_id,
-                "ref_areas": ref_areas,
-                "indicators": indicators,
-                "year": str(year) if year is not None else "",
-            },
+            "input_arguments": input_arguments,
         }
     else:
         logger.info("Returning data for dataflow %s", dataflow_id)
+        response["input_arguments"] = input_arguments
+        return response
+
+
+@mcp.tool()
+@instrument_tool
+@profile_tool
+async def get_data_for_dataflows(
+    queries: list[BatchQuery],
+    output_format: str = "table",
+    columns: str | None = None,
+    combine: bool = False,  # noqa: FBT001, FBT002
+) -> dict[str, Any]:
+    """Get data for several dataflows, or several queries of a dataflow, in one call.
+
+    Prefer this tool over several `get_data_for_dataflow` calls for cross-topic questions, e.g.
+    stunting, child mortality and immunization for the same countries: the queries are run
+    concurrently, so the call takes about as long as the slowest one.
+
+    Args:
+        queries: Queries to run, each with the "dataflow_id", "ref_areas" and "indicators" of
+            `get_data_for_dataflow`, and optionally "year", "start_year", "end_year" and
+            "last_n_observations".
+        output_format: How the data is rendered, as in `get_data_for_dataflow`.
+        columns: Plus-separated columns to return, as in `get_data_for_dataflow`.
+        combine: Return the data of every query as a single table in long format, with a
+            "DATAFLOW" column and sorted by REF_AREA and TIME_PERIOD, instead of a table per
+            query. Handy to compare indicators of different dataflows by country and year.
+
+    Returns:
+        Dictionary containing the "results" of every query, in order, and input arguments. Each
+        result has the "dataflow_id" and either its "data" (with the same paging fields as
+        `get_data_for_dataflow`) or its "error". With `combine`, results only have the number of
+        rows ("num_rows") of every query, and the combined table is under "data".
+    """
+    logger.info("Getting data for a batch of %s queries", len(queries))
+    input_arguments: dict[str, Any] = {
+        "queries": [asdict(query) for query in queries],
+        "output_format": output_format,
+        "columns": columns or "",
+        "combine": str(combine),
+    }
+
+    try:
+        from formatters import get_formatter
+        from handlers import combine_results, handle_get_data_for_dataflows
+
+        formatter = get_formatter(output_format)
+        results = await handle_get_data_for_dataflows(queries)
+        query_responses: list[dict[str, Any]] = []
+        for query, result in zip(queries, results, strict=True):
+            query_response: dict[str, Any] = {"dataflow_id": query.dataflow_id}
+            if isinstance(result, Exception):
+                query_response["error"] = str(result)
+            elif combine:
+                query_response["num_rows"] = len(result.data)
+                if result.errors:
+                    query_response["errors"] = result.errors
+            else:
+                try:
+                    query_response |= await _render_result(result, formatter, columns)
+                except DataWarehouseAPIError as e:
+                    query_response["error"] = str(e)
+            query_responses.append(query_response)
+
+        response: dict[str, Any] = {}
+        if combine:
+            with span("combine"):
+                combined = await run_in_worker(combine_results, queries, results)
+            response = await _render_result(DataResult(data=combined), formatter, columns)
+    except Exception as e:
+        logger.exception("Error getting data for a batch of %s queries", len(queries))
         return {
-            "data": data.to_string(max_rows=None, max_cols=None),  # type: ignore[misc]
-            "input_arguments": {
-                "dataflow_id": dataflow_id,
-                "ref_areas": ref_areas,
-                "indicators": indicators,
-                "year": str(year) if year is not None else "",
-            },
+            "error": str(e),
+            "input_arguments": input_arguments,
         }
+    else:
+        logger.info("Returning data for a batch of %s queries", len(queries))
+        response["results"] = query_responses
+        response["input_arguments"] = input_arguments
+        return response
+
+
+async def _render_result(
+    result: DataResult,
+    formatter: Callable[["pd.DataFrame"], str],
+    columns: str | None,
+) -> dict[str, Any]:
+    """Render the first page of a result, keeping the rest for `get_data_page`.
+
+    Returns:
+        Dictionary containing the rendered "data", "truncated" if the result was cut at
+        `max_rows`, paging fields if it has more rows than a page, and the "errors" of the result.
+    """
+    from formatters import select_columns
+    from handlers import get_page, store_result
+
+    selected = select_columns(result.data, columns)
+    page = get_page(selected)
+    with span("render"):
+        response: dict[str, Any] = {"data": await run_in_worker(formatter, page.data)}
+    if result.truncated:
+        response["truncated"] = True
+    errors = list(result.errors)
+    if page.next_offset is not None:
+        result_handle = store_result(selected)
+        if result_handle is not None:
+            response["result_handle"] = result_handle
+            response["next_offset"] = page.next_offset
+        else:
+            errors.append(
+                f"Only the first {len(page.data)} rows are returned, the result is too large "
+                "to keep for paging. Narrow down the query to get the rest."
+            )
+        response["num_rows"] = page.num_rows
+    if errors:
+        response["errors"] = errors
+    return response
+
+
+@mcp.tool()
+@instrument_tool
+@profile_tool
+async def get_data_page(
+    result_handle: str,
+    offset: int,
+    limit: int | None = None,
+    output_format: str = "table",
+) -> dict[str, str | int | dict[str, str]]:
+    """Get more rows of a large result of `get_data_for_dataflow`, without querying it again.
+
+    Results are kept for a limited time; if the handle has expired, run the query again.
+
+    Args:
+        result_handle: "result_handle" returned by `get_data_for_dataflow`.
+        offset: Position of the first row to return, e.g. the "next_offset" of the previous page.
+        limit: Maximum number of rows to return. Defaults to the page size of the server.
+        output_format: How the data is rendered, as in `get_data_for_dataflow`.
+
+    Returns:
+        Dictionary containing the rows, the total "num_rows" and, unless this is the last page,
+        the "next_offset".
+    """
+    logger.info("Getting page at %s of result %s", offset, result_handle)
+    input_arguments = {
+        "result_handle": result_handle,
+        "offset": str(offset),
+        "limit": str(limit) if limit is not None else "",
+        "output_format": output_format,
+    }
+
+    try:
+        from formatters import get_formatter
+        from handlers import handle_get_data_page
+
+        formatter = get_formatter(output_format)
+        page = handle_get_data_page(result_handle, offset, limit)
+        with span("render"):
+            data = await run_in_worker(formatter, page.data)
+    except Exception as e:
+        logger.exception("Error getting page of result %s", result_handle)
+        return {
+            "error": str(e),
+            "input_arguments": input_arguments,
+        }
+    else:
+        response: dict[str, str | int | dict[str, str]] = {
+            "data": data,
+            "num_rows": page.num_rows,
+            "input_arguments": input_arguments,
+        }
+        if page.next_offset is not None:
+            response["next_offset"] = page.next_offset
+        return response
+
+
+@mcp.tool()
+@instrument_tool
+@profile_tool
+async def aggregate_data_for_dataflow(  # noqa: PLR0913
+    dataflow_id: str,
+    ref_areas: str,
+    indicators: str,
+    operation: str,
+    group_by: str | None = None,
+    n: int = 10,
+    start_year: int | None = None,
+    end_year: int | None = None,
+    output_format: str = "table",
+) -> dict[str, str | list[str] | dict[str, str]]:
+    """Aggregate data of a dataflow in the server and return only the result.
+
+    Prefer this tool over `get_data_for_dataflow` for questions like "latest value per country",
+    "regional average" or "change since 2015", instead of reading every observation.
+
+    Args:
+        dataflow_id: Dataflow ID to get data for
+        ref_areas: Plus-separated string of ISO-3 codes to filter by.
+        indicators: Plus-separated string of indicator codes to retrieve.
+        operation: One of:
+            "latest": latest observation with a value of every series.
+            "min", "max", "mean", "median", "sum", "count": statistic of the observations of
+            every group of `group_by` columns, with the number of observations used.
+            "yoy": change of every observation from the same period a year earlier, e.g.
+            2020-Q1 from 2019-Q1.
+            "change": change between the first and the latest observation of every series in
+            the period, e.g. with start_year=2015 for "change since 2015".
+            "top", "bottom": the `n` series with the highest or lowest latest value, within
+            every group of `group_by` columns.
+        group_by: Plus-separated columns to group by for statistics and rankings, e.g.
+            "INDICATOR+TIME_PERIOD" for a yearly average across countries. Defaults to
+            "INDICATOR".
+        n: Number of series returned by "top" and "bottom".
+        start_year: First year of the data to aggregate.
+        end_year: Last year of the data to aggregate.
+        output_format: How the result is rendered, as in `get_data_for_dataflow`.
+
+    Returns:
+        Dictionary containing the aggregated data and input arguments.
+    """
+    logger.info("Aggregating data for dataflow %s with %s", dataflow_id, operation)
+    if dataflow_id == "":
+        msg = "Dataflow ID is required"
+        logger.error(msg)
+        raise DataWarehouseAPIError(msg)
+
+    input_arguments = {
+        "dataflow_id": dataflow_id,
+        "ref_areas": ref_areas,
+        "indicators": indicators,
+        "operation": operation,
+        "group_by": group_by or "",
+        "n": str(n),
+        "start_year": str(start_year) if start_year is not None else "",
+        "end_year": str(end_year) if end_year is not None else "",
+        "output_format": output_format,
+    }
+
+    try:
+        from formatters import get_formatter
+        from handlers import handle_aggregate_data_for_dataflow
+
+        formatter = get_formatter(output_format)
+        result = await handle_aggregate_data_for_dataflow(
+            dataflow_id=dataflow_id,
+            ref_areas=ref_areas,
+            indicators=indicators,
+            operation=operation,
+            group_by=group_by,
+            n=n,
+            start_year=start_year,
+            end_year=end_year,
+        )
+        with span("render"):
+            data = await run_in_worker(formatter, result.data)
+    except Exception as e:
+        logger.exception("Error aggregating data for dataflow %s", dataflow_id)
+        return {
+            "error": str(e),
+            "input_arguments": input_arguments,
+        }
+    else:
+        logger.info("Returning aggregated data for dataflow %s", dataflow_id)
+        response: dict[str, str | list[str] | dict[str, str]] = {
+            "data": data,
+            "input_arguments": input_arguments,
+        }
+        if result.errors:
+            response["errors"] = result.errors
+        return response
+
+
+@mcp.custom_route("/metrics", methods=["GET"])
+async def metrics(_request: Request) -> PlainTextResponse:
+    """Serve tool and stage durations, upstream responses and cache lookups for Prometheus.
+
+    Only served by the `sse` and `streamable-http` transports.
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@mcp.custom_route("/cache/stats", methods=["GET"])
+async def cache_stats(_request: Request) -> JSONResponse:
+    """Report hit, miss, coalescing and eviction counters of the response caches.
+
+    Only served by the `sse` and `streamable-http` transports.
+    """
+    return JSONResponse(get_cache_stats())
+
+
+async def serve(transport: str) -> None:
+    """Run the server with a transport, warming up the caches in the background meanwhile.
+
+    Args:
+        transport: One of `stdio`, `sse` or `streamable-http`.
+    """
+    async with prefetching():
+        if transport == "stdio":
+            await mcp.run_stdio_async()
+        elif transport == "sse":
+            await mcp.run_sse_async()
+        else:
+            await mcp.run_streamable_http_async()
 
 
 if __name__ == "__main__":
@@ -142,4 +540,4 @@ if __name__ == "__main__":
         config.server.transport,
     )
 
-    mcp.run(config.server.transport)
+    asyncio.run(serve(config.server.transport))
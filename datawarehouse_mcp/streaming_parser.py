@@ -0,0 +1,234 @@
+import codecs
+import json
+from dataclasses import dataclass
+from typing import Any
+
+import pandas as pd
+from sdmx_parser import ObservationBuffer
+
+# Paths (keys, and 0 for the first item of a list) of the containers that are walked into instead
+# of being decoded whole. Everything else is decoded with the C JSON scanner in one go.
+_ROOT: tuple[str | int, ...] = ()
+_CONTAINERS = {
+    _ROOT,
+    ("data",),
+    ("data", "dataSets"),
+    ("data", "dataSets", 0),
+    ("data", "dataSets", 0, "series"),
+}
+_SERIES_PATH = ("data", "dataSets", 0, "series")
+_STRUCTURE_PATH = ("data", "structure")
+_ERRORS_PATH = ("errors",)
+
+_WHITESPACE = " \t\n\r"
+
+
+class _NeedMoreData(Exception):  # noqa: N818
+    """The buffer ends before the next JSON value does."""
+
+
+@dataclass
+class _Frame:
+    """Container being walked into: an object or a list, and how many members it had so far."""
+
+    path: tuple[str | int, ...]
+    is_object: bool
+    count: int = 0
+
+
+class SdmxJsonStreamParser:
+    """Incremental SDMX-JSON parser, fed the body of a response as it is downloaded.
+
+    Only the containers leading to the series are walked into: every series is decoded on its
+    own with the C JSON scanner as soon as it has been received, and added to an
+    `ObservationBuffer`. The raw body is dropped as it is consumed, so memory stays proportional to
+    the decoded observations instead of the whole body plus its Python object tree.
+
+    With `max_rows`, series received after the limit is reached are skipped. SDMX-JSON sends the
+    structure after the series, so the rest of the body is still read to get it.
+    """
+
+    def __init__(self, max_rows: int | None = None) -> None:
+        """Create a parser.
+
+        Args:
+            max_rows: Maximum number of observations to keep, all of them if `None`.
+        """
+        self.max_rows = max_rows
+        self.errors: Any = None
+        self._observations = ObservationBuffer()
+        self._structure: dict[str, Any] | None = None
+        self._decoder = json.JSONDecoder()
+        self._text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._position = 0
+        self._final = False
+        # Received text not parsed yet, and how much of it the next attempt at parsing needs
+        self._chunks: list[str] = []
+        self._pending = 0
+        self._min_pending = 0
+        # Containers being walked into, and whether a value is expected next (vs. `,` or the end)
+        self._stack: list[_Frame] = []
+        self._expect_value = True
+        self._done = False
+        self._head = ""
+
+    @property
+    def full(self) -> bool:
+        """Whether `max_rows` observations have been kept."""
+        return self.max_rows is not None and self._observations.num_observations >= self.max_rows
+
+    @property
+    def structure(self) -> dict[str, Any] | None:
+        """`data.structure` object of the message, once it has been received."""
+        return self._structure
+
+    def feed(self, chunk: bytes) -> None:
+        """Parse the next chunk of the body, keeping the incomplete trailing value for later."""
+        text = self._text_decoder.decode(chunk)
+        if len(self._head) < 200:  # noqa: PLR2004
+            self._head += text[: 200 - len(self._head)]
+        self._chunks.append(text)
+        self._pending += len(text)
+        # A value that didn't fit in the buffer is only decoded again once the buffer has doubled,
+        # so that large values (e.g. the structure) spanning many chunks are decoded a few times
+        if self._pending >= self._min_pending:
+            self._parse()
+
+    def close(self) -> pd.DataFrame:
+        """Parse the end of the body and build the DataFrame of the observations.
+
+        Returns:
+            pd.DataFrame: Same DataFrame as `build_df_from_json`, cut at `max_rows` rows.
+
+        Raises:
+            ValueError: If the body is not complete, valid SDMX-JSON.
+        """
+        self._chunks.append(self._text_decoder.decode(b"", final=True))
+        self._final = True
+        self._parse()
+
+        if not self._done:
+            msg = f"Incomplete SDMX-JSON response: {self._head!r}"
+            raise ValueError(msg)
+        if self._structure is None:
+            msg = f"Unexpected SDMX-JSON response: {self._head!r}"
+            raise ValueError(msg)
+
+        data = self._observations.to_frame(self._structure)
+        if self.max_rows is not None and len(data) > self.max_rows:
+            data = data.iloc[: self.max_rows].reset_index(drop=True)
+        return data
+
+    def _parse(self) -> None:
+        self._buffer = self._buffer[self._position :] + "".join(self._chunks)
+        self._position = 0
+        self._chunks = []
+        self._min_pending = 0
+        while not self._done:
+            position = self._position
+            try:
+                self._step()
+            except _NeedMoreData:
+                self._position = position
+                break
+        self._pending = len(self._buffer) - self._position
+        self._min_pending = 2 * self._pending
+
+    def _step(self) -> None:
+        """Consume a single token or value at the current position."""
+        if not self._stack:
+            self._skip_whitespace()
+            self._walk_into(_ROOT)
+            return
+
+        frame = self._stack[-1]
+        self._skip_whitespace()
+        char = self._buffer[self._position]
+
+        if not self._expect_value:
+            # After a member: either the next one or the end of the container
+            self._position += 1
+            if char == ",":
+                self._expect_value = True
+            elif char in "}]":
+                self._stack.pop()
+                self._done = not self._stack
+            else:
+                self._syntax_error()
+            return
+
+        if char in "}]" and frame.count == 0:
+            self._position += 1
+            self._stack.pop()
+            self._expect_value = False
+            self._done = not self._stack
+            return
+
+        key: str | int
+        if frame.is_object:
+            key, end = self._decode_value()
+            self._position = end
+            self._skip_whitespace()
+            if self._buffer[self._position] != ":":
+                self._syntax_error()
+            self._position += 1
+            self._skip_whitespace()
+        else:
+            key = frame.count
+        path = (*frame.path, key)
+
+        if path in _CONTAINERS:
+            self._walk_into(path)
+        else:
+            value, end = self._decode_value()
+            self._position = end
+            self._on_value(path, value)
+            self._expect_value = False
+        frame.count += 1
+
+    def _walk_into(self, path: tuple[str | int, ...]) -> None:
+        char = self._buffer[self._position]
+        if char not in "{[":
+            self._syntax_error()
+        self._position += 1
+        self._stack.append(_Frame(path, is_object=char == "{"))
+        self._expect_value = True
+
+    def _on_value(self, path: tuple[str | int, ...], value: Any) -> None:  # noqa: ANN401
+        if path[:-1] == _SERIES_PATH:
+            if not self.full:
+                self._observations.add_series(str(path[-1]), value)
+        elif path == _STRUCTURE_PATH:
+            self._structure = value
+        elif path == _ERRORS_PATH:
+            self.errors = value
+
+    def _decode_value(self) -> tuple[Any, int]:
+        """Decode the JSON value at the current position, if it has been received whole."""
+        try:
+            value, end = self._decoder.raw_decode(self._buffer, self._position)
+        except json.JSONDecodeError as e:
+            if self._final:
+                msg = f"Invalid SDMX-JSON response ({e}): {self._head!r}"
+                raise ValueError(msg) from e
+            raise _NeedMoreData from None
+        # A number at the end of the buffer may continue in the next chunk
+        if end == len(self._buffer) and not self._final:
+            raise _NeedMoreData
+        return value, end
+
+    def _skip_whitespace(self) -> None:
+        buffer, position = self._buffer, self._position
+        while position < len(buffer) and buffer[position] in _WHITESPACE:
+            position += 1
+        self._position = position
+        if position == len(buffer):
+            if self._final:
+                msg = f"Incomplete SDMX-JSON response: {self._head!r}"
+                raise ValueError(msg)
+            raise _NeedMoreData
+
+    def _syntax_error(self) -> None:
+        msg = f"Invalid SDMX-JSON at character {self._position}: {self._head!r}"
+        raise ValueError(msg)
@@ -0,0 +1,142 @@
+from logging import getLogger
+from typing import Any
+
+import httpx
+from cache import ResultCache
+from config import config
+from exceptions import DataWarehouseAPIError
+from http_client import get_json
+from mirror import get_mirror
+from scheduler import request_priority
+from schemas import Code, Component, DataflowStructure
+
+logger = getLogger(__name__)
+
+
+def estimate_structure_size(structure: DataflowStructure) -> int:
+    """Roughly estimate the memory used by a parsed structure, in bytes."""
+    # Per-object overhead of a `Code` and its three strings, plus the characters themselves
+    code_overhead = 250
+    return sum(
+        code_overhead + len(code.id) + len(code.name) + len(code.description)
+        for component in (
+            structure.series_dimensions
+            + structure.observation_dimensions
+            + structure.series_attributes
+            + structure.observation_attributes
+        )
+        for code in component.codes
+    )
+
+
+# Parsed structures are small and change rarely, so they are kept much longer than data
+_structures: ResultCache[DataflowStructure] = ResultCache(
+    "structure",
+    ttl_seconds=config.cache.structure_ttl_seconds,
+    max_bytes=config.cache.structure_max_bytes,
+    sizeof=estimate_structure_size,
+    max_stale_seconds=config.cache.max_stale_seconds,
+)
+
+
+async def get_dataflow_structure(
+    dataflow_id: str, *, refresh_within_seconds: float = 0.0
+) -> DataflowStructure:
+    """Get the structure of a dataflow, fetching it only if it is not cached.
+
+    The structure is requested with `detail=serieskeysonly`, so the response carries the
+    dimension and attribute codelists (restricted to the codes with data) and the series keys, but
+    no observations.
+
+    Args:
+        dataflow_id: Dataflow ID to get the structure for.
+        refresh_within_seconds: Also fetch the structure if the cached one expires within this
+            many seconds.
+
+    Returns:
+        DataflowStructure: Parsed structure of the dataflow.
+
+    Raises:
+        DataWarehouseAPIError: If the structure can't be retrieved or parsed.
+    """
+    return await _structures.get_or_fetch(
+        dataflow_id,
+        lambda: _fetch_structure(dataflow_id),
+        refresh_within_seconds=refresh_within_seconds,
+    )
+
+
+def get_cached_dataflow_structure(dataflow_id: str) -> DataflowStructure | None:
+    """Get the structure of a dataflow if it is cached, without fetching it.
+
+    Args:
+        dataflow_id: Dataflow ID to get the structure for.
+
+    Returns:
+        DataflowStructure | None: Cached structure, or `None` if it is missing or expired.
+    """
+    return _structures.get(dataflow_id)
+
+
+async def _fetch_structure(dataflow_id: str) -> DataflowStructure:
+    """Request the structure of a dataflow from the SDMX API, unless it is mirrored locally."""
+    mirror = get_mirror()
+    json_structure = mirror.read_structure(dataflow_id) if mirror is not None else None
+    if json_structure is not None:
+        return parse_dataflow_structure(dataflow_id, json_structure)
+
+    logger.info("Fetching structure for dataflow %s", dataflow_id)
+    try:
+        # Structures are small and needed to answer most calls, so they go before data requests
+        with request_priority("metadata"):
+            data = await get_json(
+                f"data/{dataflow_id}/All",
+                params={"format": "sdmx-json", "detail": "serieskeysonly"},
+            )
+
+        if "errors" in data:
+            raise DataWarehouseAPIError(str(data["errors"]))
+
+        structure = parse_dataflow_structure(dataflow_id, data["data"]["structure"])
+    except (httpx.HTTPError, ValueError, KeyError) as e:
+        logger.exception("Error getting structure for dataflow %s", dataflow_id)
+        raise DataWarehouseAPIError(str(e)) from e
+
+    return structure
+
+
+def parse_dataflow_structure(dataflow_id: str, json_structure: dict[str, Any]) -> DataflowStructure:
+    """Parse the `structure` section of an SDMX-JSON data message.
+
+    Args:
+        dataflow_id: Dataflow ID the structure belongs to.
+        json_structure: `data.structure` object of an SDMX-JSON response.
+
+    Returns:
+        DataflowStructure: Parsed structure.
+    """
+    return DataflowStructure(
+        dataflow_id=dataflow_id,
+        series_dimensions=_parse_components(json_structure["dimensions"]["series"]),
+        observation_dimensions=_parse_components(json_structure["dimensions"]["observation"]),
+        series_attributes=_parse_components(json_structure["attributes"]["series"]),
+        observation_attributes=_parse_components(json_structure["attributes"]["observation"]),
+    )
+
+
+def _parse_components(json_components: list[dict[str, Any]]) -> list[Component]:
+    return [
+        Component(
+            id=component["id"],
+            name=component.get("name", component["id"]),
+            codes=[
+                Code(
+                    id=value["id"],
+                    name=value.get("name", value["id"]),
+                    description=value.get("description", ""),
+                )
+                for value in component.get("values", [])
+            ],
+        )
+        for component in json_components
+    ]
@@ -0,0 +1,294 @@
+import asyncio
+import math
+import random
+import time
+from collections import deque
+from collections.abc import Callable, Iterable
+from logging import getLogger
+
+import httpx
+from exceptions import UpstreamUnavailableError
+from metrics import record_upstream_event, record_upstream_response
+from schemas import UpstreamConfig
+
+logger = getLogger(__name__)
+
+# Rate limited, or failing upstream: worth retrying a GET
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+
+class LatencyTracker:
+    """Latencies of the most recent responses of an endpoint."""
+
+    def __init__(self, window: int) -> None:
+        self._latencies: deque[float] = deque(maxlen=window)
+
+    def __len__(self) -> int:
+        """Number of latencies kept."""
+        return len(self._latencies)
+
+    def observe(self, seconds: float) -> None:
+        """Add the latency of a response, dropping the oldest one beyond the window."""
+        self._latencies.append(seconds)
+
+    def percentile(self, percent: float) -> float:
+        """Latency within which `percent` % of the recent responses arrived (nearest rank)."""
+        latencies = sorted(self._latencies)
+        rank = math.ceil(percent / 100 * len(latencies))
+        return latencies[max(rank, 1) - 1]
+
+
+class CircuitBreaker:
+    """Circuit breaker of the requests to the SDMX API.
+
+    While closed, every request is sent. After `failure_threshold` consecutive failures it opens,
+    and requests are rejected for `open_seconds`. It is then half-open: a single request is let
+    through to probe the SDMX API, closing the breaker if it succeeds and opening it again if it
+    fails. A probe that never reports back (e.g. it was cancelled) is replaced after `open_seconds`.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int,
+        open_seconds: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self._clock = clock
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._probe_started_at: float | None = None
+
+    @property
+    def state(self) -> str:
+        """`closed`, `open` or `half_open`."""
+        if self._opened_at is None:
+            return "closed"
+        if self._clock() - self._opened_at < self.open_seconds:
+            return "open"
+        return "half_open"
+
+    def allow_request(self) -> bool:
+        """Whether a request can be sent, taking the probe slot if the breaker is half-open."""
+        state = self.state
+        if state != "half_open":
+            return state == "closed"
+        now = self._clock()
+        if self._probe_started_at is not None and now - self._probe_started_at < self.open_seconds:
+            return False
+        self._probe_started_at = now
+        return True
+
+    def record_success(self) -> None:
+        """Close the breaker, as the SDMX API answered."""
+        if self._opened_at is not None:
+            logger.info("The SDMX API answered again, closing the circuit breaker")
+            record_upstream_event("circuit_closed")
+        self._failures = 0
+        self._opened_at = None
+        self._probe_started_at = None
+
+    def record_failure(self) -> None:
+        """Count a failed request, opening the breaker at the threshold or if a probe failed."""
+        self._failures += 1
+        probe_failed = self._probe_started_at is not None
+        if probe_failed or (self._opened_at is None and self._failures >= self.failure_threshold):
+            logger.warning(
+                "Opening the circuit breaker for %s s after %s consecutive failures",
+                self.open_seconds,
+                self._failures,
+            )
+            record_upstream_event("circuit_opened")
+            self._opened_at = self._clock()
+            self._probe_started_at = None
+
+    def reset(self) -> None:
+        """Close the breaker and forget the failures."""
+        self._failures = 0
+        self._opened_at = None
+        self._probe_started_at = None
+
+
+class UpstreamPolicy:
+    """Latency-aware timeouts, hedging, retries and circuit breaking of SDMX API requests.
+
+    - The time allowed for the response headers is `timeout_multiplier` times the p99 latency of
+      the recent responses of the endpoint (e.g. `data/DM`), within `min_timeout_seconds` and
+      `max_timeout_seconds`. The body is then read with the client's read timeout between chunks.
+    - With `hedging`, a request still unanswered after the `hedge_percentile` latency is sent a
+      second time, and the first response wins; the other request is cancelled.
+    - Connection errors, timeouts and 429/5xx responses are retried up to `max_retries` times,
+      after a random delay of up to `retry_base_delay_seconds * 2 ** (retry - 1)` (full jitter) or
+      the `Retry-After` of the response, capped at `retry_max_delay_seconds`.
+    - Every failed attempt counts towards the circuit breaker, which rejects requests right away
+      while the SDMX API is deemed down.
+
+    Only meant for idempotent requests (GETs), as they may be sent more than once.
+    """
+
+    def __init__(self, config: UpstreamConfig) -> None:
+        self.config = config
+        self.breaker = CircuitBreaker(config.failure_threshold, config.open_seconds)
+        self._latencies: dict[str, LatencyTracker] = {}
+
+    def timeout(self, endpoint: str) -> float:
+        """Seconds allowed for the response headers of a request to `endpoint`."""
+        tracker = self._latencies.get(endpoint)
+        if tracker is None or len(tracker) < self.config.min_samples:
+            return self.config.max_timeout_seconds
+        timeout = tracker.percentile(99) * self.config.timeout_multiplier
+        return min(max(timeout, self.config.min_timeout_seconds), self.config.max_timeout_seconds)
+
+    def hedge_delay(self, endpoint: str) -> float | None:
+        """Seconds after which a request to `endpoint` is hedged, `None` to not hedge it."""
+        tracker = self._latencies.get(endpoint)
+        if not self.config.hedging or tracker is None or len(tracker) < self.config.min_samples:
+            return None
+        return max(
+            tracker.percentile(self.config.hedge_percentile), self.config.min_hedge_delay_seconds
+        )
+
+    def retry_delay(self, retry: int, response: httpx.Response | None = None) -> float:
+        """Seconds to wait before the `retry`-th retry (from 1) of a request."""
+        backoff = self.config.retry_base_delay_seconds * 2 ** (retry - 1)
+        # Jitter spreads the retries of concurrent requests; it's not used for anything secret
+        delay = random.uniform(0, min(backoff, self.config.retry_max_delay_seconds))  # noqa: S311
+        retry_after = response.headers.get("Retry-After", "") if response is not None else ""
+        if retry_after.isdigit():
+            delay = max(delay, float(retry_after))
+        return min(delay, self.config.retry_max_delay_seconds)
+
+    async def send(self, client: httpx.AsyncClient, request: httpx.Request) -> httpx.Response:
+        """Send a GET request with the policy, returning the response with its body not read yet.
+
+        The response is streamed, so the caller reads the body (e.g. with `aread` or `aiter_bytes`)
+        and must close it.
+
+        Args:
+            client: Client to send the request with.
+            request: Request to send, possibly more than once.
+
+        Returns:
+            httpx.Response: First response with a status that isn't retried, e.g. 200 or 404.
+
+        Raises:
+            UpstreamUnavailableError: If the circuit breaker is open, or the request still failed
+                after the retries.
+        """
+        endpoint = endpoint_of(client.base_url, request.url)
+        retry = 0
+        while True:
+            if not self.breaker.allow_request():
+                record_upstream_event("rejected")
+                msg = (
+                    "The SDMX API is unavailable after repeated failures, try again later "
+                    f"({request.url})"
+                )
+                raise UpstreamUnavailableError(msg)
+
+            failed_response: httpx.Response | None = None
+            cause: httpx.TransportError | None = None
+            try:
+                response, latency = await self._send_hedged(client, request, endpoint)
+            except httpx.TransportError as e:
+                cause = e
+                error = f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+            else:
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    self.breaker.record_success()
+                    self._latencies.setdefault(
+                        endpoint, LatencyTracker(self.config.latency_window)
+                    ).observe(latency)
+                    return response
+                await response.aclose()
+                record_upstream_response(response.status_code)
+                failed_response = response
+                error = f"HTTP {response.status_code}"
+
+            self.breaker.record_failure()
+            if retry >= self.config.max_retries:
+                msg = f"The SDMX API failed to answer {request.url} ({retry + 1} attempts): {error}"
+                raise UpstreamUnavailableError(msg) from cause
+            retry += 1
+            delay = self.retry_delay(retry, failed_response)
+            logger.warning(
+                "Request to %s failed (%s), retry %s of %s in %.2f s",
+                request.url,
+                error,
+                retry,
+                self.config.max_retries,
+                delay,
+            )
+            record_upstream_event("retry")
+            await asyncio.sleep(delay)
+
+    async def _send_hedged(
+        self, client: httpx.AsyncClient, request: httpx.Request, endpoint: str
+    ) -> tuple[httpx.Response, float]:
+        """Send a request, and a copy if it is slow; return the first response and its latency."""
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        deadline = start + self.timeout(endpoint)
+        hedge_delay = self.hedge_delay(endpoint)
+        hedge_at = start + hedge_delay if hedge_delay is not None else None
+        # Start time of every request sent
+        tasks = {asyncio.create_task(client.send(request, stream=True)): start}
+        winner: asyncio.Task[httpx.Response] | None = None
+        error: httpx.TransportError | None = None
+        try:
+            while True:
+                now = loop.time()
+                if hedge_at is not None and now >= hedge_at:
+                    hedge_at = None
+                    record_upstream_event("hedge")
+                    hedge = client.build_request(
+                        request.method, request.url, headers=request.headers
+                    )
+                    tasks[asyncio.create_task(client.send(hedge, stream=True))] = now
+
+                pending = [task for task in tasks if not task.done()]
+                if not pending and error is not None:
+                    raise error
+                if now >= deadline:
+                    record_upstream_event("timeout")
+                    msg = f"No response from the SDMX API within {deadline - start:.1f} s"
+                    raise httpx.ReadTimeout(msg, request=request)
+
+                wake_at = deadline if hedge_at is None else min(hedge_at, deadline)
+                done, _ = await asyncio.wait(
+                    pending, timeout=wake_at - now, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    exception = task.exception()
+                    if exception is None:
+                        winner = task
+                        if len(tasks) > 1 and task is not next(iter(tasks)):
+                            record_upstream_event("hedge_won")
+                        return task.result(), loop.time() - tasks[task]
+                    if not isinstance(exception, httpx.TransportError):
+                        raise exception
+                    error = exception
+        finally:
+            await _discard(task for task in tasks if task is not winner)
+
+    def reset(self) -> None:
+        """Forget the latencies and close the circuit breaker."""
+        self._latencies.clear()
+        self.breaker.reset()
+
+
+async def _discard(tasks: Iterable[asyncio.Task[httpx.Response]]) -> None:
+    """Cancel requests that lost the race, closing the responses of those that got one."""
+    losers = list(tasks)
+    for task in losers:
+        task.cancel()
+    for result in await asyncio.gather(*losers, return_exceptions=True):
+        if isinstance(result, httpx.Response):
+            await result.aclose()
+
+
+def endpoint_of(base_url: httpx.URL, url: httpx.URL) -> str:
+    """Endpoint of a URL, its first two path segments below the base URL, e.g. `data/DM`."""
+    path = url.path.removeprefix(base_url.path).strip("/")
+    return "/".join(path.split("/")[:2])
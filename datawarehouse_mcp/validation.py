@@ -0,0 +1,99 @@
+import dataclasses
+from difflib import get_close_matches
+
+from exceptions import DataWarehouseAPIError
+from schemas import DataflowStructure, DataQuery
+
+# Codes suggested for an unknown code
+MAX_SUGGESTIONS = 3
+# Similarity of the code IDs suggested, from 0 to 1 (see `difflib.get_close_matches`)
+SUGGESTION_CUTOFF = 0.6
+# Unknown codes shorter than this aren't looked up in the names of the codes, as they match too much
+MIN_NAME_MATCH_LENGTH = 3
+# Dimensions of the data key that are validated, with the query field and the name of their codes
+VALIDATED_DIMENSIONS = {
+    "REF_AREA": ("ref_areas", "ref areas"),
+    "INDICATOR": ("indicators", "indicators"),
+}
+
+
+def validate_query_codes(
+    query: DataQuery, structure: DataflowStructure
+) -> tuple[DataQuery, list[str]]:
+    """Check the ref areas and indicators of a query against the codes of its dataflow.
+
+    Codes are matched case-insensitively and replaced by the codes of the structure. Unknown codes
+    are left out of the query, unless no code of the dimension is known, in which case the query
+    is rejected. Either way, codes close to the unknown ones are suggested.
+
+    Args:
+        query: Query to validate.
+        structure: Structure of the dataflow of the query, with the codes that have data.
+
+    Returns:
+        tuple[DataQuery, list[str]]: Query with the known codes only, and a message for every
+            dimension with unknown codes.
+
+    Raises:
+        DataWarehouseAPIError: If no code of a filtered dimension is known.
+    """
+    changes: dict[str, tuple[str, ...]] = {}
+    messages: list[str] = []
+    for dimension_id, (field, label) in VALIDATED_DIMENSIONS.items():
+        codes: tuple[str, ...] = getattr(query, field)
+        known = structure.code_ids.get(dimension_id)
+        if not codes or known is None:
+            continue
+
+        valid = tuple(sorted({known[code.upper()] for code in codes if code.upper() in known}))
+        unknown = [code for code in codes if code.upper() not in known]
+        if not unknown:
+            if valid != codes:
+                changes[field] = valid
+            continue
+
+        described = ", ".join(_describe_unknown(code, structure, dimension_id) for code in unknown)
+        if not valid:
+            msg = (
+                f"Unknown {label} for dataflow {query.dataflow_id}: {described}. "
+                "Use get_all_indicators_for_dataflow or search_indicators to find valid codes"
+            )
+            raise DataWarehouseAPIError(msg)
+        messages.append(f"Unknown {label} for dataflow {query.dataflow_id} left out: {described}")
+        changes[field] = valid
+
+    return dataclasses.replace(query, **changes) if changes else query, messages
+
+
+def suggest_codes(code: str, structure: DataflowStructure, dimension_id: str) -> list[str]:
+    """Codes of a dimension close to an unknown code.
+
+    Codes whose name contains the unknown code come first (e.g. `URY` for `uruguay`), then codes
+    with a similar ID (e.g. `DM_BRTS` for `DM_BRT`).
+
+    Args:
+        code: Unknown code.
+        structure: Structure of the dataflow.
+        dimension_id: Dimension of the code, e.g. `REF_AREA`.
+
+    Returns:
+        list[str]: Up to `MAX_SUGGESTIONS` codes, best first.
+    """
+    dimension = structure.get_dimension(dimension_id)
+    needle = code.casefold()
+    by_name = (
+        [c.id for c in dimension.codes if needle in c.name.casefold()]
+        if len(needle) >= MIN_NAME_MATCH_LENGTH
+        else []
+    )
+    known = structure.code_ids[dimension_id]
+    by_id = [
+        known[match]
+        for match in get_close_matches(code.upper(), known, MAX_SUGGESTIONS, SUGGESTION_CUTOFF)
+    ]
+    return list(dict.fromkeys(by_name + by_id))[:MAX_SUGGESTIONS]
+
+
+def _describe_unknown(code: str, structure: DataflowStructure, dimension_id: str) -> str:
+    suggestions = suggest_codes(code, structure, dimension_id)
+    return f"{code} (did you mean {' or '.join(suggestions)}?)" if suggestions else code
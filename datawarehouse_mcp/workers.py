@@ -0,0 +1,38 @@
+import asyncio
+import functools
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import ParamSpec, TypeVar
+
+from config import config
+
+P = ParamSpec("P")
+T = TypeVar("T")
+
+_executor: ThreadPoolExecutor | None = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Return the process-wide worker pool, creating it on first use."""
+    global _executor  # noqa: PLW0603
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=config.http.worker_threads,
+            thread_name_prefix="datawarehouse-worker",
+        )
+    return _executor
+
+
+async def run_in_worker(func: Callable[P, T], *args: P.args, **kwargs: P.kwargs) -> T:
+    """Run a CPU-bound function in the worker pool so the event loop stays responsive.
+
+    Args:
+        func: Function to run, e.g. JSON decoding or DataFrame building.
+        *args: Positional arguments for `func`.
+        **kwargs: Keyword arguments for `func`.
+
+    Returns:
+        T: Whatever `func` returns.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(func, *args, **kwargs))
@@ -0,0 +1,142 @@
+import copy
+import json
+from collections.abc import AsyncIterator, Iterator
+from pathlib import Path
+from typing import Any
+
+import pytest
+from cache import clear_caches
+from exceptions import NoDataFoundError
+from http_client import get_request_scheduler, get_upstream_policy
+from schemas import DataflowStructure
+from sdmx_parser import build_df_from_json
+from structure import parse_dataflow_structure
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+
+# Small chunks, so that values of the fixture responses are split across chunks
+STREAM_CHUNK_SIZE = 100
+
+
+@pytest.fixture
+def dm_sdmx_json() -> dict[str, Any]:
+    """SDMX-JSON response for two countries and two indicators of the DM dataflow."""
+    with (FIXTURES_DIR / "dm_sdmx.json").open(encoding="utf-8") as fp:
+        return json.load(fp)
+
+
+@pytest.fixture(autouse=True)
+def empty_caches() -> Iterator[None]:
+    """Make sure every test starts and ends with empty response caches."""
+    clear_caches()
+    yield
+    clear_caches()
+
+
+@pytest.fixture(autouse=True)
+def healthy_upstream() -> Iterator[None]:
+    """Make sure every test starts and ends with no recorded latencies and a closed breaker."""
+    get_upstream_policy().reset()
+    get_request_scheduler().reset()
+    yield
+    get_upstream_policy().reset()
+    get_request_scheduler().reset()
+
+
+def query_sdmx_json(sdmx_json: dict[str, Any], path: str, params: dict[str, str]) -> dict[str, Any]:
+    """Answer a data query from an SDMX-JSON message like the SDMX API would.
+
+    Series are filtered by the data key at the end of `path` (e.g. `data/DM/ARG+URY.DM_BRTS`, an
+    empty position matches everything) and observations by `startPeriod`/`endPeriod`, keeping the
+    last `lastNObservations` of every series, missing values included.
+
+    Raises:
+        NoDataFoundError: If no observation matches the query.
+    """
+    result = copy.deepcopy(sdmx_json)
+    structure = result["data"]["structure"]
+    key_parts = path.rsplit("/", 1)[-1].split(".")
+    allowed_positions = [
+        {i for i, value in enumerate(dimension["values"]) if value["id"] in part.split("+")}
+        if part
+        else None
+        for dimension, part in zip(structure["dimensions"]["series"], key_parts, strict=False)
+    ]
+    periods = structure["dimensions"]["observation"][0]["values"]
+    start = int(params.get("startPeriod", "0"))
+    end = int(params.get("endPeriod", "9999"))
+
+    series = result["data"]["dataSets"][0]["series"]
+    for series_key in list(series):
+        positions = [int(p) for p in series_key.split(":")]
+        if any(
+            allowed is not None and position not in allowed
+            for position, allowed in zip(positions, allowed_positions, strict=False)
+        ):
+            del series[series_key]
+            continue
+        series[series_key]["observations"] = {
+            position: observation
+            for position, observation in series[series_key]["observations"].items()
+            if start <= int(periods[int(position)]["id"]) <= end
+        }
+        if "lastNObservations" in params:
+            latest = sorted(series[series_key]["observations"], key=lambda p: periods[int(p)]["id"])
+            latest = latest[-int(params["lastNObservations"]) :]
+            series[series_key]["observations"] = {
+                position: series[series_key]["observations"][position] for position in latest
+            }
+        if not series[series_key]["observations"]:
+            del series[series_key]
+
+    if not series:
+        msg = "NoResultsFound"
+        raise NoDataFoundError(msg)
+    return result
+
+
+def to_sdmx_csv(sdmx_json: dict[str, Any]) -> bytes:
+    """Convert an SDMX-JSON message to the SDMX-CSV body the SDMX API returns with `labels=id`."""
+    data = build_df_from_json(sdmx_json["data"])
+    data = data.astype(object).where(data.notna(), None)
+    data.insert(0, "DATAFLOW", "UNICEF:DM(1.0)")
+    return data.to_csv(index=False).encode()
+
+
+async def stream_body(body: bytes) -> AsyncIterator[bytes]:
+    """Yield a response body in chunks, like `http_client.stream_bytes`."""
+    for start in range(0, len(body), STREAM_CHUNK_SIZE):
+        yield body[start : start + STREAM_CHUNK_SIZE]
+
+
+@pytest.fixture
+def fake_upstream(
+    monkeypatch: pytest.MonkeyPatch,
+    dm_sdmx_json: dict[str, Any],
+) -> list[tuple[str, dict[str, str]]]:
+    """Answer data requests from the DM fixture and record the requested paths and params.
+
+    Requests are answered in SDMX-JSON or, if `format` is `csv`, in SDMX-CSV.
+    """
+    requests: list[tuple[str, dict[str, str]]] = []
+
+    async def fake_stream_bytes(
+        path: str,
+        params: dict[str, str] | None = None,
+    ) -> AsyncIterator[bytes]:
+        params = params or {}
+        requests.append((path, params))
+        result = query_sdmx_json(dm_sdmx_json, path, params)
+        if params.get("format") == "csv":
+            body = to_sdmx_csv(result)
+        else:
+            body = json.dumps(result).encode()
+        async for chunk in stream_body(body):
+            yield chunk
+
+    async def fake_get_dataflow_structure(dataflow_id: str) -> DataflowStructure:
+        return parse_dataflow_structure(dataflow_id, dm_sdmx_json["data"]["structure"])
+
+    monkeypatch.setattr("handlers.stream_bytes", fake_stream_bytes)
+    monkeypatch.setattr("handlers.get_dataflow_structure", fake_get_dataflow_structure)
+    return requests
@@ -0,0 +1,171 @@
+import asyncio
+from typing import Any
+
+import pandas as pd
+import pytest
+from aggregations import LATEST_OBSERVATIONS, aggregate
+from exceptions import DataWarehouseAPIError
+from handlers import handle_aggregate_data_for_dataflow
+from sdmx_parser import build_df_from_json
+
+SERIES_DIMENSIONS = ["REF_AREA", "INDICATOR", "RESIDENCE", "SEX", "AGE"]
+
+
+@pytest.fixture
+def dm_data(dm_sdmx_json: dict[str, Any]) -> pd.DataFrame:
+    """DataFrame of the DM fixture."""
+    return build_df_from_json(dm_sdmx_json["data"])
+
+
+def as_records(data: pd.DataFrame, columns: list[str]) -> list[tuple[Any, ...]]:
+    """Return some columns of the data as sorted tuples of Python values."""
+    return sorted(data[columns].astype(object).itertuples(index=False, name=None))
+
+
+class TestAggregate:
+    """Test suite for the server-side aggregations."""
+
+    def test_latest(self, dm_data: pd.DataFrame) -> None:
+        """Test that the latest observation of every series is returned."""
+        result = aggregate(dm_data, SERIES_DIMENSIONS, "latest")
+
+        assert as_records(result, ["REF_AREA", "INDICATOR", "TIME_PERIOD", "OBS_VALUE"]) == [
+            ("ARG", "DM_BRTS", "2021", 631.2),
+            ("ARG", "DM_DEATHS", "2021", 311.4),
+            ("URY", "DM_BRTS", "2021", 35.9),
+            ("URY", "DM_DEATHS", "2020", 35.961),
+        ]
+
+    def test_statistics(self, dm_data: pd.DataFrame) -> None:
+        """Test that statistics are computed by group with their number of observations."""
+        result = aggregate(dm_data, SERIES_DIMENSIONS, "max", group_by=["REF_AREA"])
+
+        assert as_records(result, ["REF_AREA", "OBS_VALUE", "NUM_OBSERVATIONS"]) == [
+            ("ARG", 660.1, 4),
+            ("URY", 35.961, 5),
+        ]
+
+    def test_mean_by_indicator_and_year(self, dm_data: pd.DataFrame) -> None:
+        """Test that averages across countries can be computed for every year."""
+        result = aggregate(
+            dm_data, SERIES_DIMENSIONS, "mean", group_by=["INDICATOR", "TIME_PERIOD"]
+        )
+        brts_2020 = result[(result["INDICATOR"] == "DM_BRTS") & (result["TIME_PERIOD"] == "2020")]
+
+        assert brts_2020["OBS_VALUE"].item() == pytest.approx((35.383 + 645.9) / 2)
+        assert brts_2020["NUM_OBSERVATIONS"].item() == 2  # noqa: PLR2004
+
+    def test_year_over_year(self, dm_data: pd.DataFrame) -> None:
+        """Test that changes from the previous year of every series are computed."""
+        result = aggregate(dm_data, SERIES_DIMENSIONS, "yoy")
+        ury_brts = result[(result["REF_AREA"] == "URY") & (result["INDICATOR"] == "DM_BRTS")]
+
+        assert list(ury_brts["TIME_PERIOD"]) == ["2020", "2021"]
+        assert list(ury_brts["CHANGE"]) == pytest.approx([0.517, 0.517])
+        assert ury_brts["PCT_CHANGE"].iloc[0] == pytest.approx(0.517 / 34.866 * 100)
+
+    def test_year_over_year_matches_periods(self) -> None:
+        """Test that quarters are compared with the same quarter of the previous year."""
+        data = pd.DataFrame(
+            {
+                "REF_AREA": "URY",
+                "TIME_PERIOD": ["2019-Q1", "2019-Q2", "2019-Q4", "2020-Q1", "2020-Q2", "2020-Q3"],
+                "OBS_VALUE": [10.0, 20.0, 40.0, 12.0, 25.0, 33.0],
+            }
+        )
+
+        result = aggregate(data, ["REF_AREA"], "yoy")
+
+        assert as_records(result, ["TIME_PERIOD", "CHANGE"]) == [("2020-Q1", 2.0), ("2020-Q2", 5.0)]
+
+    def test_change(self, dm_data: pd.DataFrame) -> None:
+        """Test that the change between the first and latest observation is computed."""
+        result = aggregate(dm_data, SERIES_DIMENSIONS, "change")
+        arg_brts = result[(result["REF_AREA"] == "ARG") & (result["INDICATOR"] == "DM_BRTS")]
+
+        assert as_records(arg_brts, ["START_PERIOD", "END_PERIOD"]) == [("2019", "2021")]
+        assert arg_brts["CHANGE"].item() == pytest.approx(631.2 - 660.1)
+
+    def test_top_and_bottom(self, dm_data: pd.DataFrame) -> None:
+        """Test that series are ranked by their latest value within every indicator."""
+        top = aggregate(dm_data, SERIES_DIMENSIONS, "top", n=1)
+        bottom = aggregate(dm_data, SERIES_DIMENSIONS, "bottom", n=1)
+
+        assert as_records(top, ["INDICATOR", "REF_AREA", "RANK"]) == [
+            ("DM_BRTS", "ARG", 1),
+            ("DM_DEATHS", "ARG", 1),
+        ]
+        assert as_records(bottom, ["INDICATOR", "REF_AREA", "RANK"]) == [
+            ("DM_BRTS", "URY", 1),
+            ("DM_DEATHS", "URY", 1),
+        ]
+
+    def test_ranking_by_attribute(self, dm_data: pd.DataFrame) -> None:
+        """Test that series can be ranked within groups of a column that is not a dimension."""
+        top = aggregate(dm_data, SERIES_DIMENSIONS, "top", group_by=["UNIT_MEASURE"], n=2)
+
+        assert as_records(top, ["UNIT_MEASURE", "REF_AREA", "INDICATOR", "RANK"]) == [
+            ("PS", "ARG", "DM_BRTS", 1),
+            ("PS", "ARG", "DM_DEATHS", 2),
+        ]
+
+    def test_invalid_arguments(self, dm_data: pd.DataFrame) -> None:
+        """Test that invalid operations, columns and sizes are rejected."""
+        with pytest.raises(DataWarehouseAPIError, match="Invalid operation"):
+            aggregate(dm_data, SERIES_DIMENSIONS, "mode")
+        with pytest.raises(DataWarehouseAPIError, match="Unknown group_by columns: REGION"):
+            aggregate(dm_data, SERIES_DIMENSIONS, "mean", group_by=["REGION"])
+        with pytest.raises(DataWarehouseAPIError, match="n must be at least 1"):
+            aggregate(dm_data, SERIES_DIMENSIONS, "top", n=0)
+
+
+class TestHandleAggregateDataForDataflow:
+    """Test suite for handle_aggregate_data_for_dataflow."""
+
+    def test_latest_only_downloads_latest_observations(
+        self,
+        fake_upstream: list[tuple[str, dict[str, str]]],
+    ) -> None:
+        """Test that operations on the latest values only request the last observations."""
+        result = asyncio.run(
+            handle_aggregate_data_for_dataflow("DM", "URY+ARG", "DM_BRTS", "top", n=1)
+        )
+
+        assert fake_upstream[0][1]["lastNObservations"] == str(LATEST_OBSERVATIONS)
+        assert list(result.data["REF_AREA"]) == ["ARG"]
+
+    def test_latest_skips_missing_values(
+        self,
+        dm_sdmx_json: dict[str, Any],
+        fake_upstream: list[tuple[str, dict[str, str]]],  # noqa: ARG002
+    ) -> None:
+        """Test that a series whose latest observation is missing falls back on the previous one."""
+        # 2021 observation of ARG births
+        dm_sdmx_json["data"]["dataSets"][0]["series"]["1:0:0:0:0"]["observations"]["2"][0] = None
+
+        result = asyncio.run(
+            handle_aggregate_data_for_dataflow("DM", "URY+ARG", "DM_BRTS", "latest")
+        )
+
+        assert as_records(result.data, ["REF_AREA", "TIME_PERIOD", "OBS_VALUE"]) == [
+            ("ARG", "2020", 645.9),
+            ("URY", "2021", 35.9),
+        ]
+
+    def test_group_by_keeps_order(self, fake_upstream: list[tuple[str, dict[str, str]]]) -> None:
+        """Test that group_by columns are plus-separated and keep their order."""
+        result = asyncio.run(
+            handle_aggregate_data_for_dataflow(
+                "DM", "URY+ARG", "DM_BRTS", "mean", group_by="TIME_PERIOD+REF_AREA"
+            )
+        )
+
+        assert "lastNObservations" not in fake_upstream[0][1]
+        assert list(result.data.columns[:2]) == ["TIME_PERIOD", "REF_AREA"]
+
+    def test_invalid_operation(self, fake_upstream: list[tuple[str, dict[str, str]]]) -> None:
+        """Test that an invalid operation is rejected before requesting any data."""
+        with pytest.raises(DataWarehouseAPIError, match="Invalid operation"):
+            asyncio.run(handle_aggregate_data_for_dataflow("DM", "URY", "DM_BRTS", "mode"))
+
+        assert fake_upstream == []
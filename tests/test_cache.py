@@ -0,0 +1,170 @@
+import asyncio
+
+import pytest
+from cache import ResultCache, get_cache_stats
+from exceptions import UpstreamUnavailableError
+
+
+def make_cache(ttl_seconds: float = 60, max_bytes: int = 10) -> ResultCache[str]:
+    """Create a cache of strings whose size is their length."""
+    return ResultCache("test", ttl_seconds=ttl_seconds, max_bytes=max_bytes, sizeof=len)
+
+
+class TestResultCache:
+    """Test suite for ResultCache."""
+
+    def test_hit_after_miss(self) -> None:
+        """Test that a fetched value is served from the cache the second time."""
+        cache = make_cache()
+        calls: list[str] = []
+
+        async def fetch() -> str:
+            calls.append("fetch")
+            return "value"
+
+        async def get_twice() -> tuple[str, str]:
+            return await cache.get_or_fetch("k", fetch), await cache.get_or_fetch("k", fetch)
+
+        assert asyncio.run(get_twice()) == ("value", "value")
+        assert calls == ["fetch"]
+        assert cache.stats.hits == 1
+        assert cache.stats.misses == 1
+
+    def test_concurrent_requests_are_coalesced(self) -> None:
+        """Test that concurrent requests for the same key share one fetch."""
+        cache = make_cache()
+        calls: list[str] = []
+
+        async def fetch() -> str:
+            calls.append("fetch")
+            await asyncio.sleep(0.01)
+            return "value"
+
+        async def get_concurrently() -> list[str]:
+            return list(await asyncio.gather(*(cache.get_or_fetch("k", fetch) for _ in range(5))))
+
+        assert asyncio.run(get_concurrently()) == ["value"] * 5
+        assert calls == ["fetch"]
+        assert cache.stats.coalesced == 4  # noqa: PLR2004
+
+    def test_errors_are_shared_and_not_cached(self) -> None:
+        """Test that a failed fetch is reported to every waiter and retried afterwards."""
+        cache = make_cache()
+        calls: list[str] = []
+
+        async def fetch() -> str:
+            calls.append("fetch")
+            await asyncio.sleep(0.01)
+            raise ValueError
+
+        async def get_concurrently() -> list[BaseException | str]:
+            return await asyncio.gather(
+                cache.get_or_fetch("k", fetch),
+                cache.get_or_fetch("k", fetch),
+                return_exceptions=True,
+            )
+
+        results = asyncio.run(get_concurrently())
+
+        assert all(isinstance(result, ValueError) for result in results)
+        with pytest.raises(ValueError):  # noqa: PT011
+            asyncio.run(cache.get_or_fetch("k", fetch))
+        assert calls == ["fetch", "fetch"]
+
+    def test_cancelled_caller_doesnt_fail_waiters(self) -> None:
+        """Test that cancelling the call that started a fetch doesn't cancel the coalesced ones."""
+        cache = make_cache()
+
+        async def fetch() -> str:
+            await asyncio.sleep(0.01)
+            return "value"
+
+        async def cancel_first() -> str:
+            first = asyncio.create_task(cache.get_or_fetch("k", fetch))
+            await asyncio.sleep(0)
+            waiter = asyncio.create_task(cache.get_or_fetch("k", fetch))
+            await asyncio.sleep(0)
+            first.cancel()
+            return await waiter
+
+        assert asyncio.run(cancel_first()) == "value"
+        assert cache.stats.coalesced == 1
+        assert cache.get("k") == "value"
+
+    def test_least_recently_used_is_evicted(self) -> None:
+        """Test that entries are evicted in LRU order to stay within the size limit."""
+        cache = make_cache(max_bytes=10)
+        cache.put("a", "aaaa")
+        cache.put("b", "bbbb")
+        cache.get("a")
+        cache.put("c", "cccc")
+
+        assert cache.get("a") == "aaaa"
+        assert cache.get("b") is None
+        assert cache.get("c") == "cccc"
+        assert cache.stats.evictions == 1
+        assert cache.stats.size_bytes == 8  # noqa: PLR2004
+
+    def test_oversized_values_are_not_cached(self) -> None:
+        """Test that a value larger than the whole cache is not stored."""
+        cache = make_cache(max_bytes=3)
+        cache.put("a", "aaaa")
+
+        assert cache.get("a") is None
+
+    def test_expired_entries_are_dropped(self) -> None:
+        """Test that entries older than the TTL are not served."""
+        cache = make_cache(ttl_seconds=0.001)
+        cache.put("a", "aaaa")
+        asyncio.run(asyncio.sleep(0.01))
+
+        assert cache.get("a") is None
+        assert cache.stats.expirations == 1
+
+    def test_stale_entry_served_while_upstream_is_unavailable(self) -> None:
+        """Test that an expired entry is served only if fetching fails with the SDMX API down."""
+        cache = ResultCache(
+            "test", ttl_seconds=0.001, max_bytes=10, sizeof=len, max_stale_seconds=60
+        )
+        cache.put("k", "old")
+
+        async def unavailable() -> str:
+            raise UpstreamUnavailableError
+
+        async def fetch() -> str:
+            return "new"
+
+        async def get() -> tuple[str, str]:
+            await asyncio.sleep(0.01)
+            return await cache.get_or_fetch("k", unavailable), await cache.get_or_fetch("k", fetch)
+
+        assert cache.get("k") == "old"
+        assert asyncio.run(get()) == ("old", "new")
+        assert cache.stats.stale == 1
+        with pytest.raises(UpstreamUnavailableError):
+            asyncio.run(make_cache().get_or_fetch("k", unavailable))
+
+    def test_entry_expiring_soon_is_refreshed(self) -> None:
+        """Test that `refresh_within_seconds` fetches a value that would expire within it."""
+        cache = make_cache(ttl_seconds=60)
+        cache.put("k", "old")
+
+        async def fetch() -> str:
+            return "new"
+
+        async def get(refresh_within_seconds: float) -> str:
+            return await cache.get_or_fetch(
+                "k", fetch, refresh_within_seconds=refresh_within_seconds
+            )
+
+        assert asyncio.run(get(30)) == "old"
+        assert asyncio.run(get(120)) == "new"
+        assert cache.get("k") == "new"
+
+    def test_stats_are_reported_by_name(self) -> None:
+        """Test that every cache reports its counters by name."""
+        import handlers  # noqa: F401, PLC0415 - creates the data cache, imported lazily by the server
+
+        make_cache()
+
+        assert {"data", "structure", "test"} <= set(get_cache_stats())
@@ -0,0 +1,113 @@
+import asyncio
+
+import pandas as pd
+import pytest
+from cache import get_cache_stats
+from data_cache import RowIndex
+from handlers import handle_get_data_for_dataflow
+from schemas import DataResult
+
+Requests = list[tuple[str, dict[str, str]]]
+
+
+def get_data(ref_areas: str = "", indicators: str = "", **kwargs: int) -> DataResult:
+    """Get data of the DM dataflow."""
+    return asyncio.run(handle_get_data_for_dataflow("DM", ref_areas, indicators, **kwargs))
+
+
+def rows(result: DataResult) -> list[tuple[str, str, str]]:
+    """Ref area, indicator and period of every row of a result."""
+    data = result.data[["REF_AREA", "INDICATOR", "TIME_PERIOD"]].astype(str)
+    return list(data.itertuples(index=False, name=None))
+
+
+def test_row_index() -> None:
+    """Test that rows are found by code, case-insensitively, and year, in their order."""
+    data = pd.DataFrame(
+        {
+            "REF_AREA": pd.Categorical(["URY", "URY", "ARG", "URY"]),
+            "INDICATOR": pd.Categorical(["A", "B", "A", "A"]),
+            "TIME_PERIOD": pd.Categorical(["2019", "2020", "2020", "2021-06"]),
+        }
+    )
+    index = RowIndex(data)
+
+    assert index.find_rows((), (), (None, None)).tolist() == [0, 1, 2, 3]
+    assert index.find_rows(("ury",), ("A",), (None, None)).tolist() == [0, 3]
+    assert index.find_rows((), ("A",), (2020, None)).tolist() == [2, 3]
+    assert index.find_rows(("ARG", "URY"), (), (None, 2020)).tolist() == [0, 1, 2]
+    assert index.find_rows(("BRA",), (), (None, None)).tolist() == []
+
+
+class TestSubsetQueries:
+    """Test suite for answering queries from cached results that contain them."""
+
+    def test_subset_is_answered_from_cache(self, fake_upstream: Requests) -> None:
+        """Test that fewer codes and a single year are filtered out of a cached result."""
+        get_data()
+        result = get_data("URY", "DM_BRTS", year=2020)
+
+        assert len(fake_upstream) == 1
+        assert rows(result) == [("URY", "DM_BRTS", "2020")]
+        stats = get_cache_stats()["data"]
+        assert (stats["misses"], stats["subset"], stats["hit_ratio"]) == (1, 1, 0.5)
+
+    def test_subset_matches_upstream(self, fake_upstream: Requests) -> None:
+        """Test that a filtered result has the rows the SDMX API returns for the query."""
+        expected = get_data("ARG+URY", "DM_DEATHS", start_year=2020)
+        get_data()
+        result = get_data("URY+ARG", "DM_DEATHS", start_year=2020)
+
+        assert len(fake_upstream) == 2  # noqa: PLR2004
+        assert rows(result) == rows(expected)
+
+    def test_year_without_data_gets_all_years(self, fake_upstream: Requests) -> None:
+        """Test that a year without data falls back to every year of the cached series."""
+        get_data()
+        result = get_data("ARG", "DM_DEATHS", year=2019)
+
+        assert len(fake_upstream) == 1
+        assert rows(result) == [("ARG", "DM_DEATHS", "2021")]
+
+    def test_year_fallback_needs_every_year(self, fake_upstream: Requests) -> None:
+        """Test that a year without data is requested if the cached result lacks other years."""
+        get_data(year=2019)
+        result = get_data("ARG", "DM_DEATHS", year=2019)
+
+        assert len(fake_upstream) == 3  # noqa: PLR2004
+        assert rows(result) == [("ARG", "DM_DEATHS", "2021")]
+
+    def test_last_observations_need_the_same_periods(self, fake_upstream: Requests) -> None:
+        """Test that latest observations are only filtered out of results of the same query."""
+        get_data(last_n_observations=1)
+        get_data("URY", last_n_observations=1)
+        get_data("URY", last_n_observations=2)
+
+        assert [params.get("lastNObservations") for _, params in fake_upstream] == ["1", "2"]
+
+    def test_uncovered_codes_are_fetched(self, fake_upstream: Requests) -> None:
+        """Test that only the ref areas missing from the cached result are requested."""
+        get_data("URY")
+        result = get_data("ARG+URY", "DM_BRTS")
+
+        assert [path for path, _ in fake_upstream] == ["data/DM/URY.", "data/DM/ARG.DM_BRTS"]
+        assert sorted(rows(result)) == sorted(
+            (ref_area, "DM_BRTS", year)
+            for ref_area in ("ARG", "URY")
+            for year in ("2019", "2020", "2021")
+        )
+        assert get_cache_stats()["data"]["partial"] == 1
+
+        # Both parts are cached now
+        get_data("ARG+URY", "DM_BRTS")
+        assert len(fake_upstream) == 2  # noqa: PLR2004
+
+    def test_serving_subsets_can_be_disabled(
+        self, monkeypatch: pytest.MonkeyPatch, fake_upstream: Requests
+    ) -> None:
+        """Test that only identical queries are answered from the cache if disabled."""
+        monkeypatch.setattr("handlers._data_cache.serve_subsets", False)
+        get_data()
+        get_data("URY")
+
+        assert len(fake_upstream) == 2  # noqa: PLR2004
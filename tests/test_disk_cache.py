@@ -0,0 +1,206 @@
+import asyncio
+import os
+import time
+from collections.abc import Awaitable, Callable
+from contextlib import aclosing
+from pathlib import Path
+
+import httpx
+import pytest
+from config import config
+from disk_cache import DiskCache
+from http_client import get_json, stream_bytes, wait_for_revalidations
+
+URL = "https://sdmx.example.org/rest/data/DM/URY.DM_BRTS?format=sdmx-json"
+BODY = b'{"data": {"value": 1}}'
+
+
+def age_entry(cache_dir: Path, seconds: float) -> None:
+    """Make every entry of the disk cache `seconds` older."""
+    for path in cache_dir.rglob("*.sdmx.gz"):
+        mtime = path.stat().st_mtime - seconds
+        os.utime(path, (mtime, mtime))
+
+
+class TestDiskCache:
+    """Test suite for DiskCache."""
+
+    def test_write_and_read(self, tmp_path: Path) -> None:
+        """Test that a response is stored compressed and read back with its validators."""
+        cache = DiskCache(tmp_path, max_age_seconds=60)
+        cache.write(URL, BODY * 100, etag='"v1"', last_modified=None)
+
+        entry = cache.read(URL)
+
+        assert entry is not None
+        assert entry.body == BODY * 100
+        assert entry.etag == '"v1"'
+        assert entry.last_modified is None
+        assert entry.age_seconds < 60  # noqa: PLR2004
+        assert sum(p.stat().st_size for p in tmp_path.rglob("*.sdmx.gz")) < len(BODY) * 100
+
+    def test_missing_entry(self, tmp_path: Path) -> None:
+        """Test that a URL that was never stored is a miss."""
+        assert DiskCache(tmp_path, max_age_seconds=60).read(URL) is None
+
+    def test_too_old_entry_is_deleted(self, tmp_path: Path) -> None:
+        """Test that entries older than the maximum age are removed."""
+        cache = DiskCache(tmp_path, max_age_seconds=60)
+        cache.write(URL, BODY, etag=None, last_modified=None)
+        age_entry(tmp_path, 120)
+
+        assert cache.read(URL) is None
+        assert not list(tmp_path.rglob("*.sdmx.gz"))
+
+    def test_touch_makes_entry_fresh(self, tmp_path: Path) -> None:
+        """Test that touching an entry resets its age."""
+        cache = DiskCache(tmp_path, max_age_seconds=600)
+        cache.write(URL, BODY, etag=None, last_modified=None)
+        age_entry(tmp_path, 300)
+
+        cache.touch(URL)
+        entry = cache.read(URL)
+
+        assert entry is not None
+        assert entry.age_seconds < 300  # noqa: PLR2004
+
+    def test_sweep_deletes_entries_never_read_again(self, tmp_path: Path) -> None:
+        """Test that writes sweep the entries of other URLs once they are too old."""
+        cache = DiskCache(tmp_path, max_age_seconds=60)
+        cache.write(URL, BODY, etag=None, last_modified=None)
+        age_entry(tmp_path, 120)
+        cache._last_sweep = 0.0  # noqa: SLF001 - the first write swept already
+
+        cache.write(f"{URL}&other", BODY, etag=None, last_modified=None)
+
+        assert len(list(tmp_path.rglob("*.sdmx.gz"))) == 1
+        assert cache.read(f"{URL}&other") is not None
+
+    def test_sweep_keeps_the_cache_within_max_bytes(self, tmp_path: Path) -> None:
+        """Test that the least recently fetched entries are deleted beyond the size limit."""
+        cache = DiskCache(tmp_path, max_age_seconds=600)
+        for i in range(3):
+            cache.write(f"{URL}&{i}", BODY, etag=None, last_modified=None)
+            age_entry(tmp_path, 10)
+        entry_size = next(tmp_path.rglob("*.sdmx.gz")).stat().st_size
+        cache.max_bytes = 2 * entry_size
+
+        assert cache.sweep() == 1
+        assert cache.read(f"{URL}&0") is None
+        assert cache.read(f"{URL}&1") is not None
+        assert cache.read(f"{URL}&2") is not None
+
+    def test_no_temporary_files_are_left(self, tmp_path: Path) -> None:
+        """Test that atomic writes don't leave temporary files behind."""
+        cache = DiskCache(tmp_path, max_age_seconds=60)
+        cache.write(URL, BODY, etag=None, last_modified=None)
+        cache.write(URL, BODY, etag=None, last_modified=None)
+
+        assert [p.name for p in tmp_path.rglob("*") if p.is_file()] == [
+            next(tmp_path.rglob("*.sdmx.gz")).name
+        ]
+
+
+class TestGetJsonWithDiskCache:
+    """Test suite for the disk cache integration of get_json."""
+
+    @pytest.fixture
+    def upstream(
+        self,
+        monkeypatch: pytest.MonkeyPatch,
+        tmp_path: Path,
+    ) -> list[httpx.Request]:
+        """Enable the disk cache and serve requests from a mock SDMX API with an ETag."""
+        requests: list[httpx.Request] = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            requests.append(request)
+            if request.headers.get("If-None-Match") == '"v1"':
+                return httpx.Response(304)
+            return httpx.Response(200, content=BODY, headers={"ETag": '"v1"'})
+
+        def get_mock_client() -> httpx.AsyncClient:
+            return httpx.AsyncClient(
+                base_url="https://sdmx.example.org/rest/",
+                transport=httpx.MockTransport(handler),
+            )
+
+        ttl = config.disk_cache.ttl_seconds
+        monkeypatch.setattr("http_client.get_http_client", get_mock_client)
+        monkeypatch.setattr("http_client._disk_cache", DiskCache(tmp_path, ttl * 10))
+        return requests
+
+    @staticmethod
+    def run(coroutine_function: Callable[[], Awaitable[object]]) -> None:
+        """Run a coroutine function together with the revalidations it triggers."""
+
+        async def run_and_wait() -> None:
+            await coroutine_function()
+            await wait_for_revalidations()
+
+        asyncio.run(run_and_wait())
+
+    def test_fresh_entry_is_served_from_disk(self, upstream: list[httpx.Request]) -> None:
+        """Test that a fresh entry is served without contacting the SDMX API."""
+        self.run(lambda: get_json("data/DM/URY.DM_BRTS"))
+        self.run(lambda: get_json("data/DM/URY.DM_BRTS"))
+
+        assert len(upstream) == 1
+
+    def test_stale_entry_is_revalidated(
+        self,
+        upstream: list[httpx.Request],
+        tmp_path: Path,
+    ) -> None:
+        """Test that a stale entry is served and revalidated with a conditional GET."""
+        self.run(lambda: get_json("data/DM/URY.DM_BRTS"))
+        age_entry(tmp_path, config.disk_cache.ttl_seconds + 1)
+
+        results: list[object] = []
+
+        async def get() -> None:
+            results.append(await get_json("data/DM/URY.DM_BRTS"))
+
+        self.run(get)
+
+        assert results == [{"data": {"value": 1}}]
+        assert len(upstream) == 2  # noqa: PLR2004
+        assert upstream[1].headers["If-None-Match"] == '"v1"'
+        entry = next(tmp_path.rglob("*.sdmx.gz"))
+        assert time.time() - entry.stat().st_mtime < config.disk_cache.ttl_seconds
+
+    def test_streamed_body_is_cached_and_read_in_chunks(
+        self, monkeypatch: pytest.MonkeyPatch, upstream: list[httpx.Request]
+    ) -> None:
+        """Test that a streamed body is stored, then streamed from disk a chunk at a time."""
+        monkeypatch.setattr("http_client.STREAM_CHUNK_SIZE", 4)
+        streams: list[list[bytes]] = []
+
+        async def stream() -> None:
+            streams.append([chunk async for chunk in stream_bytes("data/DM/URY.DM_BRTS")])
+
+        self.run(stream)
+        self.run(stream)
+
+        assert len(upstream) == 1
+        assert [b"".join(chunks) for chunks in streams] == [BODY, BODY]
+        assert max(len(chunk) for chunk in streams[1]) == 4  # noqa: PLR2004
+
+    def test_incomplete_stream_is_not_cached(
+        self,
+        monkeypatch: pytest.MonkeyPatch,
+        upstream: list[httpx.Request],
+        tmp_path: Path,
+    ) -> None:
+        """Test that a body whose stream was closed early is not stored."""
+        monkeypatch.setattr("http_client.STREAM_CHUNK_SIZE", 4)
+
+        async def read_first_chunk() -> None:
+            async with aclosing(stream_bytes("data/DM/URY.DM_BRTS")) as chunks:
+                async for _ in chunks:
+                    break
+
+        self.run(read_first_chunk)
+
+        assert len(upstream) == 1
+        assert [p for p in tmp_path.rglob("*") if p.is_file()] == []
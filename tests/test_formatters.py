@@ -0,0 +1,88 @@
+import json
+from typing import Any
+
+import pandas as pd
+import pytest
+from exceptions import DataWarehouseAPIError
+from formatters import get_formatter, select_columns, to_columnar, to_csv, to_records, to_table
+from sdmx_parser import build_df_from_json
+
+
+@pytest.fixture
+def dm_data(dm_sdmx_json: dict[str, Any]) -> pd.DataFrame:
+    """DataFrame of the DM fixture."""
+    return build_df_from_json(dm_sdmx_json["data"])
+
+
+class TestFormatters:
+    """Test suite for the output formats of the data."""
+
+    def test_formats_are_smaller_than_table(self, dm_data: pd.DataFrame) -> None:
+        """Test that the compact formats are smaller than the text table."""
+        table_size = len(to_table(dm_data))
+
+        assert len(to_csv(dm_data)) < table_size
+        assert len(to_columnar(dm_data)) < len(to_records(dm_data))
+        assert len(to_columnar(dm_data)) < table_size / 2
+
+    def test_records(self, dm_data: pd.DataFrame) -> None:
+        """Test that records have one object per row, with null for missing values."""
+        records = json.loads(to_records(dm_data))
+
+        assert len(records) == len(dm_data)
+        assert records[1]["TIME_PERIOD"] == "2020"
+        assert records[1]["OBS_CONF"] is None
+        assert records[1]["OBS_VALUE"] == pytest.approx(35.383)
+
+    def test_columnar_round_trip(self, dm_data: pd.DataFrame) -> None:
+        """Test that the columnar format factors out constants and decodes to the same rows."""
+        columnar = json.loads(to_columnar(dm_data))
+
+        assert columnar["num_rows"] == len(dm_data)
+        assert columnar["constants"]["SEX"] == "_T"
+        assert columnar["constants"]["OBS_CONF"] is None
+        assert set(columnar["columns"]["REF_AREA"]["values"]) == {"ARG", "URY"}
+
+        decoded = {
+            name: [column["values"][code] if code is not None else None for code in column["codes"]]
+            if isinstance(column, dict)
+            else column
+            for name, column in columnar["columns"].items()
+        }
+        expected = dm_data.astype(object).where(dm_data.notna(), None)
+        for name, values in decoded.items():
+            assert values == expected[name].tolist()
+        for name, value in columnar["constants"].items():
+            assert set(expected[name]) == {value}
+
+    def test_columnar_empty(self, dm_data: pd.DataFrame) -> None:
+        """Test that empty data keeps every column and no constants."""
+        columnar = json.loads(to_columnar(dm_data.iloc[:0]))
+
+        assert columnar["constants"] == {}
+        assert list(columnar["columns"]) == list(dm_data.columns)
+
+    def test_invalid_format(self) -> None:
+        """Test that unknown output formats are rejected."""
+        with pytest.raises(DataWarehouseAPIError, match="Must be one of table, csv"):
+            get_formatter("xml")
+
+
+class TestSelectColumns:
+    """Test suite for select_columns."""
+
+    def test_select_columns(self, dm_data: pd.DataFrame) -> None:
+        """Test that columns are kept in the requested order, without duplicates."""
+        data = select_columns(dm_data, "OBS_VALUE+REF_AREA+OBS_VALUE")
+
+        assert list(data.columns) == ["OBS_VALUE", "REF_AREA"]
+
+    def test_all_columns_by_default(self, dm_data: pd.DataFrame) -> None:
+        """Test that every column is kept when no columns are requested."""
+        assert select_columns(dm_data, None) is dm_data
+        assert select_columns(dm_data, "") is dm_data
+
+    def test_unknown_columns(self, dm_data: pd.DataFrame) -> None:
+        """Test that unknown columns are reported with the available ones."""
+        with pytest.raises(DataWarehouseAPIError, match="Unknown columns: UNIT"):
+            select_columns(dm_data, "REF_AREA+UNIT")
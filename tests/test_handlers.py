@@ -0,0 +1,422 @@
+import asyncio
+import json
+import time
+from collections.abc import AsyncIterator
+from typing import Any
+
+import pandas as pd
+import pytest
+from cache import clear_caches
+from config import config
+from conftest import stream_body
+from exceptions import DataWarehouseAPIError, NoDataFoundError
+from handlers import (
+    combine_results,
+    estimate_frame_size,
+    handle_get_data_for_dataflow,
+    handle_get_data_for_dataflows,
+    handle_get_data_page,
+    store_result,
+)
+from schemas import BatchQuery, DataResult
+
+# Number of observations in the DM fixture
+DM_FIXTURE_ROWS = 9
+
+
+class TestHandleGetDataForDataflow:
+    """Test suite for handle_get_data_for_dataflow."""
+
+    def test_get_data(self, fake_upstream: list[tuple[str, dict[str, str]]]) -> None:
+        """Test that the SDMX-JSON response is parsed into a DataFrame."""
+        data = asyncio.run(handle_get_data_for_dataflow("DM", "URY+ARG", "DM_BRTS+DM_DEATHS")).data
+
+        assert fake_upstream == [("data/DM/ARG+URY.DM_BRTS+DM_DEATHS", {"format": "sdmx-json"})]
+        assert len(data) == DM_FIXTURE_ROWS
+        assert list(data.columns[:6]) == [
+            "TIME_PERIOD",
+            "REF_AREA",
+            "INDICATOR",
+            "RESIDENCE",
+            "SEX",
+            "AGE",
+        ]
+
+    def test_get_data_as_csv(
+        self,
+        monkeypatch: pytest.MonkeyPatch,
+        fake_upstream: list[tuple[str, dict[str, str]]],
+    ) -> None:
+        """Test that the SDMX-CSV wire format gives the same DataFrame as SDMX-JSON."""
+        expected = asyncio.run(handle_get_data_for_dataflow("DM", "URY+ARG", "DM_BRTS")).data
+        monkeypatch.setattr(config.query, "wire_format", "csv")
+        clear_caches()
+
+        data = asyncio.run(handle_get_data_for_dataflow("DM", "URY+ARG", "DM_BRTS", year=2020)).data
+
+        assert fake_upstream[1] == (
+            "data/DM/ARG+URY.DM_BRTS",
+            {"format": "csv", "labels": "id", "startPeriod": "2020", "endPeriod": "2020"},
+        )
+        pd.testing.assert_frame_equal(
+            data,
+            expected[expected["TIME_PERIOD"] == "2020"].reset_index(drop=True),
+            check_categorical=False,
+        )
+
+    def test_get_data_for_year(self, fake_upstream: list[tuple[str, dict[str, str]]]) -> None:
+        """Test that the year is sent to the SDMX API and only one request is made."""
+        data = asyncio.run(handle_get_data_for_dataflow("DM", "URY", "DM_BRTS", year=2020)).data
+
+        assert set(data["TIME_PERIOD"]) == {"2020"}
+        assert len(fake_upstream) == 1
+        assert fake_upstream[0][1]["startPeriod"] == "2020"
+        assert fake_upstream[0][1]["endPeriod"] == "2020"
+
+    def test_get_data_for_missing_year(
+        self,
+        fake_upstream: list[tuple[str, dict[str, str]]],
+    ) -> None:
+        """Test that all the data is returned when the requested year is not available."""
+        data = asyncio.run(handle_get_data_for_dataflow("DM", "URY", "DM_BRTS", year=1990)).data
+
+        assert set(data["TIME_PERIOD"]) == {"2019", "2020", "2021"}
+        assert len(fake_upstream) == 2  # noqa: PLR2004
+        assert "startPeriod" not in fake_upstream[1][1]
+
+    def test_get_data_for_year_range(
+        self,
+        fake_upstream: list[tuple[str, dict[str, str]]],
+    ) -> None:
+        """Test that start and end years become SDMX period parameters."""
+        data = asyncio.run(
+            handle_get_data_for_dataflow(
+                "DM",
+                "URY",
+                "DM_BRTS",
+                start_year=2020,
+                end_year=2021,
+                last_n_observations=1,
+            )
+        ).data
+
+        assert list(data["TIME_PERIOD"]) == ["2021"]
+        assert fake_upstream[0][1] == {
+            "format": "sdmx-json",
+            "startPeriod": "2020",
+            "endPeriod": "2021",
+            "lastNObservations": "1",
+        }
+
+    def test_get_data_for_empty_year_range(
+        self,
+        fake_upstream: list[tuple[str, dict[str, str]]],
+    ) -> None:
+        """Test that a range without data is an error and does not fall back to all years."""
+        with pytest.raises(NoDataFoundError):
+            asyncio.run(handle_get_data_for_dataflow("DM", "URY", "DM_BRTS", end_year=1990))
+
+    @pytest.mark.parametrize(
+        "period",
+        [
+            {"year": 2020, "start_year": 2019},
+            {"start_year": 2021, "end_year": 2020},
+            {"last_n_observations": 0},
+        ],
+    )
+    def test_get_data_invalid_period(
+        self,
+        fake_upstream: list[tuple[str, dict[str, str]]],
+        period: dict[str, int],
+    ) -> None:
+        """Test that inconsistent period filters are rejected before any request."""
+        with pytest.raises(DataWarehouseAPIError):
+            asyncio.run(handle_get_data_for_dataflow("DM", "URY", "DM_BRTS", **period))
+
+        assert fake_upstream == []
+
+    def test_equivalent_queries_are_cached(
+        self,
+        fake_upstream: list[tuple[str, dict[str, str]]],
+    ) -> None:
+        """Test that queries differing only in code order or duplicates share a cache entry."""
+
+        async def get_both() -> None:
+            await handle_get_data_for_dataflow("DM", "URY+ARG", "DM_BRTS", year=2020)
+            await handle_get_data_for_dataflow("DM", "ARG+URY+URY", "DM_BRTS", year=2020)
+
+        asyncio.run(get_both())
+
+        assert len(fake_upstream) == 1
+
+    @pytest.mark.parametrize("wire_format", ["json", "csv"])
+    def test_get_data_max_rows(
+        self,
+        monkeypatch: pytest.MonkeyPatch,
+        fake_upstream: list[tuple[str, dict[str, str]]],  # noqa: ARG002
+        wire_format: str,
+    ) -> None:
+        """Test that results are cut at `max_rows` rows and flagged as truncated."""
+        monkeypatch.setattr(config.query, "wire_format", wire_format)
+
+        result = asyncio.run(
+            handle_get_data_for_dataflow("DM", "URY+ARG", "DM_BRTS+DM_DEATHS", max_rows=5)
+        )
+        complete = asyncio.run(
+            handle_get_data_for_dataflow("DM", "URY+ARG", "DM_BRTS+DM_DEATHS", max_rows=100)
+        )
+
+        assert len(result.data) == 5  # noqa: PLR2004
+        assert result.truncated
+        assert len(complete.data) == DM_FIXTURE_ROWS
+        assert not complete.truncated
+
+    @pytest.mark.parametrize("wire_format", ["json", "csv"])
+    def test_get_data_max_rows_boundary(
+        self,
+        monkeypatch: pytest.MonkeyPatch,
+        fake_upstream: list[tuple[str, dict[str, str]]],  # noqa: ARG002
+        wire_format: str,
+    ) -> None:
+        """Test that a result of exactly `max_rows` rows isn't flagged as truncated."""
+        monkeypatch.setattr(config.query, "wire_format", wire_format)
+
+        exact = asyncio.run(
+            handle_get_data_for_dataflow(
+                "DM", "URY+ARG", "DM_BRTS+DM_DEATHS", max_rows=DM_FIXTURE_ROWS
+            )
+        )
+        cut = asyncio.run(
+            handle_get_data_for_dataflow(
+                "DM", "URY+ARG", "DM_BRTS+DM_DEATHS", max_rows=DM_FIXTURE_ROWS - 1
+            )
+        )
+
+        assert len(exact.data) == DM_FIXTURE_ROWS
+        assert not exact.truncated
+        assert len(cut.data) == DM_FIXTURE_ROWS - 1
+        assert cut.truncated
+
+    def test_get_data_invalid_max_rows(
+        self,
+        fake_upstream: list[tuple[str, dict[str, str]]],
+    ) -> None:
+        """Test that a non-positive `max_rows` is rejected before requesting any data."""
+        with pytest.raises(DataWarehouseAPIError, match="max_rows"):
+            asyncio.run(handle_get_data_for_dataflow("DM", "URY", "DM_BRTS", max_rows=0))
+
+        assert fake_upstream == []
+
+    def test_get_data_upstream_errors(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test that errors reported by the SDMX API are raised."""
+
+        async def fake_stream_bytes(
+            path: str,
+            params: dict[str, str] | None = None,
+        ) -> AsyncIterator[bytes]:
+            async for chunk in stream_body(b'{"errors": ["NoResultsFound"]}'):
+                yield chunk
+
+        monkeypatch.setattr("handlers.stream_bytes", fake_stream_bytes)
+
+        with pytest.raises(DataWarehouseAPIError):
+            asyncio.run(handle_get_data_for_dataflow("DM", "XXX", "DM_BRTS"))
+
+
+class TestChunkedQueries:
+    """Test suite for splitting large queries into concurrent chunks."""
+
+    @pytest.fixture(autouse=True)
+    def small_chunks(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Split queries into one ref area and one indicator per request."""
+        monkeypatch.setattr(config.query, "max_ref_areas_per_request", 1)
+        monkeypatch.setattr(config.query, "max_indicators_per_request", 1)
+
+    def test_chunks_match_single_request(
+        self,
+        monkeypatch: pytest.MonkeyPatch,
+        fake_upstream: list[tuple[str, dict[str, str]]],
+    ) -> None:
+        """Test that chunked results have the same rows and dtypes as a single request."""
+        chunked = asyncio.run(handle_get_data_for_dataflow("DM", "URY+ARG", "DM_BRTS+DM_DEATHS"))
+        monkeypatch.setattr(config.query, "max_ref_areas_per_request", 10)
+        monkeypatch.setattr(config.query, "max_indicators_per_request", 10)
+        clear_caches()
+        single = asyncio.run(handle_get_data_for_dataflow("DM", "ARG+URY", "DM_BRTS+DM_DEATHS"))
+
+        assert [path for path, _ in fake_upstream] == [
+            "data/DM/ARG.DM_BRTS",
+            "data/DM/ARG.DM_DEATHS",
+            "data/DM/URY.DM_BRTS",
+            "data/DM/URY.DM_DEATHS",
+            "data/DM/ARG+URY.DM_BRTS+DM_DEATHS",
+        ]
+        assert chunked.errors == []
+        assert list(chunked.data.dtypes) == list(single.data.dtypes)
+
+        def sort(data: pd.DataFrame) -> pd.DataFrame:
+            rows = data.astype(object).where(data.notna(), None)
+            return rows.sort_values(["REF_AREA", "INDICATOR", "TIME_PERIOD"], ignore_index=True)
+
+        pd.testing.assert_frame_equal(sort(chunked.data), sort(single.data))
+
+    def test_failed_chunks_are_reported(
+        self,
+        monkeypatch: pytest.MonkeyPatch,
+        dm_sdmx_json: dict[str, Any],
+    ) -> None:
+        """Test that a failing chunk is reported without failing the whole query."""
+
+        async def fake_stream_bytes(
+            path: str,
+            params: dict[str, str] | None = None,
+        ) -> AsyncIterator[bytes]:
+            if path.startswith("data/DM/URY"):
+                body = b'{"errors": ["Internal Server Error"]}'
+            else:
+                body = json.dumps(dm_sdmx_json).encode()
+            async for chunk in stream_body(body):
+                yield chunk
+
+        monkeypatch.setattr("handlers.stream_bytes", fake_stream_bytes)
+
+        result = asyncio.run(handle_get_data_for_dataflow("DM", "URY+ARG", "DM_BRTS"))
+
+        assert len(result.errors) == 1
+        assert result.errors[0].startswith("URY.DM_BRTS")
+        assert not result.data.empty
+
+    def test_all_chunks_failing_is_an_error(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test that the call fails when every chunk fails."""
+
+        async def fake_stream_bytes(
+            path: str,
+            params: dict[str, str] | None = None,
+        ) -> AsyncIterator[bytes]:
+            async for chunk in stream_body(b'{"errors": ["Internal Server Error"]}'):
+                yield chunk
+
+        monkeypatch.setattr("handlers.stream_bytes", fake_stream_bytes)
+
+        with pytest.raises(DataWarehouseAPIError):
+            asyncio.run(handle_get_data_for_dataflow("DM", "URY+ARG", "DM_BRTS"))
+
+    def test_chunks_without_data_are_skipped(
+        self,
+        fake_upstream: list[tuple[str, dict[str, str]]],
+    ) -> None:
+        """Test that chunks without data are neither rows nor errors."""
+        result = asyncio.run(handle_get_data_for_dataflow("DM", "URY+XXX", "DM_BRTS"))
+
+        assert result.errors == []
+        assert set(result.data["REF_AREA"]) == {"URY"}
+
+
+class TestBatchQueries:
+    """Test suite for batches of queries of several dataflows."""
+
+    def test_results_in_order(self, fake_upstream: list[tuple[str, dict[str, str]]]) -> None:
+        """Test that every query gets its result or its error, in order."""
+        queries = [
+            BatchQuery("DM", "URY", "DM_BRTS"),
+            BatchQuery("DM", "BRA", "DM_BRTS"),
+            BatchQuery("DM_PROJECTIONS", "ARG", "DM_DEATHS", start_year=2020),
+        ]
+
+        results = asyncio.run(handle_get_data_for_dataflows(queries))
+
+        assert isinstance(results[0], DataResult)
+        assert set(results[0].data["REF_AREA"]) == {"URY"}
+        assert isinstance(results[1], NoDataFoundError)
+        assert isinstance(results[2], DataResult)
+        assert set(results[2].data["INDICATOR"]) == {"DM_DEATHS"}
+        assert len(fake_upstream) == len(queries)
+
+    def test_queries_run_concurrently(
+        self,
+        monkeypatch: pytest.MonkeyPatch,
+        dm_sdmx_json: dict[str, Any],
+    ) -> None:
+        """Test that a batch takes about as long as its slowest query, not the sum of them."""
+        delay = 0.5
+        body = json.dumps(dm_sdmx_json).encode()
+
+        async def slow_stream_bytes(path: str, params: dict[str, str]) -> AsyncIterator[bytes]:  # noqa: ARG001
+            await asyncio.sleep(delay)
+            async for chunk in stream_body(body):
+                yield chunk
+
+        monkeypatch.setattr("handlers.stream_bytes", slow_stream_bytes)
+        queries = [BatchQuery(f"DF_{i}", "URY", "DM_BRTS") for i in range(4)]
+
+        start = time.perf_counter()
+        results = asyncio.run(handle_get_data_for_dataflows(queries))
+
+        assert time.perf_counter() - start < len(queries) * delay / 2
+        assert all(isinstance(result, DataResult) for result in results)
+
+    def test_too_many_queries(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test that empty batches and batches over the limit are rejected."""
+        monkeypatch.setattr(config.query, "max_batch_queries", 1)
+
+        with pytest.raises(DataWarehouseAPIError, match="At least one"):
+            asyncio.run(handle_get_data_for_dataflows([]))
+        with pytest.raises(DataWarehouseAPIError, match="At most 1"):
+            asyncio.run(handle_get_data_for_dataflows([BatchQuery("DM", "URY", "DM_BRTS")] * 2))
+
+    def test_combine_results(self, fake_upstream: list[tuple[str, dict[str, str]]]) -> None:  # noqa: ARG002
+        """Test that the data of every query is stacked, tagged and aligned by country and year."""
+        queries = [
+            BatchQuery("DM", "URY+ARG", "DM_BRTS"),
+            BatchQuery("DM", "BRA", "DM_BRTS"),
+            BatchQuery("DM_PROJECTIONS", "URY+ARG", "DM_DEATHS"),
+        ]
+        results = asyncio.run(handle_get_data_for_dataflows(queries))
+
+        data = combine_results(queries, results)
+
+        assert data.columns[0] == "DATAFLOW"
+        assert set(data["DATAFLOW"]) == {"DM", "DM_PROJECTIONS"}
+        keys = data[["REF_AREA", "TIME_PERIOD"]].astype(str).apply(tuple, axis=1).tolist()
+        assert keys == sorted(keys)
+        assert len(data) == DM_FIXTURE_ROWS
+        assert results[0].data.columns[0] != "DATAFLOW"
+
+    def test_combine_without_data(self) -> None:
+        """Test that combining a batch without any data is an error."""
+        error = NoDataFoundError("NoResultsFound")
+
+        with pytest.raises(DataWarehouseAPIError, match="No query of the batch"):
+            combine_results([BatchQuery("DM", "BRA", "DM_BRTS")], [error])
+
+
+class TestResultStore:
+    """Test suite for the store of large results."""
+
+    def test_results_are_evicted_over_budget(
+        self,
+        monkeypatch: pytest.MonkeyPatch,
+        fake_upstream: list[tuple[str, dict[str, str]]],  # noqa: ARG002
+    ) -> None:
+        """Test that the oldest results are dropped to stay within the memory budget."""
+        data = asyncio.run(handle_get_data_for_dataflow("DM", "URY+ARG", "DM_BRTS")).data
+        monkeypatch.setattr(
+            "handlers._result_store.max_bytes", int(estimate_frame_size(data) * 1.5)
+        )
+
+        first, second = store_result(data), store_result(data)
+
+        with pytest.raises(DataWarehouseAPIError, match="Unknown or expired"):
+            handle_get_data_page(first)
+        assert handle_get_data_page(second).num_rows == len(data)
+
+    def test_too_large_results_are_not_stored(
+        self,
+        monkeypatch: pytest.MonkeyPatch,
+        fake_upstream: list[tuple[str, dict[str, str]]],  # noqa: ARG002
+    ) -> None:
+        """Test that results larger than the whole store get no handle."""
+        data = asyncio.run(handle_get_data_for_dataflow("DM", "URY+ARG", "DM_BRTS")).data
+        monkeypatch.setattr(config.results, "max_bytes", 1)
+
+        assert store_result(data) is None
@@ -0,0 +1,120 @@
+import asyncio
+from collections.abc import AsyncIterator
+from contextlib import aclosing
+
+import httpx
+import pytest
+from config import config
+from exceptions import NoDataFoundError
+from http_client import (
+    STREAM_CHUNK_SIZE,
+    close_http_client,
+    get_http_client,
+    get_request_scheduler,
+    stream_bytes,
+)
+
+
+class TestGetHttpClient:
+    """Test suite for the shared HTTP client."""
+
+    def test_client_is_shared_within_a_loop(self) -> None:
+        """Test that every call in the same event loop reuses one pooled client."""
+
+        async def get_clients() -> tuple[httpx.AsyncClient, httpx.AsyncClient]:
+            clients = get_http_client(), get_http_client()
+            await close_http_client()
+            return clients
+
+        first, second = asyncio.run(get_clients())
+
+        assert first is second
+
+    def test_client_uses_configured_timeouts(self) -> None:
+        """Test that connect and read timeouts come from the configuration."""
+
+        async def get_timeout() -> httpx.Timeout:
+            timeout = get_http_client().timeout
+            await close_http_client()
+            return timeout
+
+        timeout = asyncio.run(get_timeout())
+
+        assert timeout.connect == config.http.connect_timeout
+        assert timeout.read == config.http.read_timeout
+
+
+class TestStreamBytes:
+    """Test suite for streaming response bodies."""
+
+    @pytest.fixture
+    def sent_chunks(self, monkeypatch: pytest.MonkeyPatch) -> list[int]:
+        """Serve a body of 10 chunks from a mock SDMX API, recording the chunks sent."""
+        sent: list[int] = []
+
+        async def body() -> AsyncIterator[bytes]:
+            for i in range(10):
+                sent.append(i)
+                yield b"x" * STREAM_CHUNK_SIZE
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            if request.url.path.endswith("MISSING"):
+                return httpx.Response(404)
+            return httpx.Response(200, content=body())
+
+        def get_mock_client() -> httpx.AsyncClient:
+            return httpx.AsyncClient(
+                base_url="https://sdmx.example.org/rest/",
+                transport=httpx.MockTransport(handler),
+            )
+
+        monkeypatch.setattr("http_client.get_http_client", get_mock_client)
+        monkeypatch.setattr("http_client._disk_cache", None)
+        return sent
+
+    def test_whole_body(self, sent_chunks: list[int]) -> None:
+        """Test that the body is yielded in chunks."""
+
+        async def read() -> list[bytes]:
+            return [chunk async for chunk in stream_bytes("data/DM/URY.DM_BRTS")]
+
+        chunks = asyncio.run(read())
+
+        assert len(chunks) == len(sent_chunks) == 10  # noqa: PLR2004
+        assert b"".join(chunks) == b"x" * STREAM_CHUNK_SIZE * 10
+
+    def test_closing_early_stops_the_download(self, sent_chunks: list[int]) -> None:
+        """Test that the rest of the body is not read after the iterator is closed."""
+
+        async def read_first() -> bytes:
+            async with aclosing(stream_bytes("data/DM/URY.DM_BRTS")) as chunks:
+                async for chunk in chunks:
+                    return chunk
+            return b""
+
+        asyncio.run(read_first())
+
+        assert len(sent_chunks) < 10  # noqa: PLR2004
+
+    def test_no_data(self, sent_chunks: list[int]) -> None:  # noqa: ARG002
+        """Test that a 404 response raises NoDataFoundError."""
+
+        async def read() -> list[bytes]:
+            return [chunk async for chunk in stream_bytes("data/DM/MISSING")]
+
+        with pytest.raises(NoDataFoundError):
+            asyncio.run(read())
+
+    def test_slot_is_held_until_the_iterator_is_closed(self, sent_chunks: list[int]) -> None:  # noqa: ARG002
+        """Test that a streamed request is in flight until its body is read or abandoned."""
+        scheduler = get_request_scheduler()
+
+        async def read_first() -> int:
+            async with aclosing(stream_bytes("data/DM/URY.DM_BRTS")) as chunks:
+                async for _ in chunks:
+                    return scheduler.in_flight
+            return 0
+
+        assert asyncio.run(read_first()) == 1
+        assert scheduler.in_flight == 0
+        assert scheduler.expected_size("data/DM") == STREAM_CHUNK_SIZE
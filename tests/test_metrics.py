@@ -0,0 +1,168 @@
+import asyncio
+import logging
+from collections.abc import Iterator
+
+import httpx
+import pytest
+from exceptions import NoDataFoundError
+from http_client import stream_bytes
+from metrics import (
+    CACHE_LOOKUPS,
+    ROWS_PARSED,
+    STAGE_DURATION,
+    TOOL_DURATION,
+    UPSTREAM_BYTES,
+    UPSTREAM_RESPONSES,
+    Counter,
+    Histogram,
+    _metrics,
+    clear_metrics,
+    get_request_metrics,
+    instrument_tool,
+    render_metrics,
+    span,
+)
+from server import get_data_for_dataflow, mcp
+from starlette.testclient import TestClient
+
+# Number of observations in the DM fixture
+DM_FIXTURE_ROWS = 9
+
+
+@pytest.fixture(autouse=True)
+def empty_metrics() -> Iterator[None]:
+    """Make sure every test starts and ends with empty metrics."""
+    clear_metrics()
+    yield
+    clear_metrics()
+
+
+class TestExposition:
+    """Test suite for the Prometheus text format of the metrics."""
+
+    @pytest.fixture
+    def histogram(self) -> Iterator[Histogram]:
+        """Histogram of a test, removed from the exposed metrics afterwards."""
+        histogram = Histogram("test_seconds", "Test histogram.", ("name",), buckets=(0.1, 1.0))
+        yield histogram
+        _metrics.remove(histogram)
+
+    def test_histogram(self, histogram: Histogram) -> None:
+        """Test that buckets are cumulative and end with +Inf."""
+        for value in (0.05, 0.5, 0.5, 5.0):
+            histogram.observe(value, name="a")
+
+        assert histogram.render() == [
+            "# HELP test_seconds Test histogram.",
+            "# TYPE test_seconds histogram",
+            'test_seconds_bucket{name="a",le="0.1"} 1',
+            'test_seconds_bucket{name="a",le="1"} 3',
+            'test_seconds_bucket{name="a",le="+Inf"} 4',
+            'test_seconds_sum{name="a"} 6.05',
+            'test_seconds_count{name="a"} 4',
+        ]
+
+    def test_counter_label_escaping(self) -> None:
+        """Test that quotes, backslashes and newlines of label values are escaped."""
+        counter = Counter("test_total", "Test counter.", ("name",))
+        try:
+            counter.inc(2, name='a "b"\\\n')
+
+            assert counter.render()[-1] == 'test_total{name="a \\"b\\"\\\\\\n"} 2'
+        finally:
+            _metrics.remove(counter)
+
+    def test_metrics_route(self) -> None:
+        """Test that the metrics are served in the Prometheus text format."""
+        UPSTREAM_RESPONSES.inc(status="200")
+
+        with TestClient(mcp.sse_app()) as client:
+            response = client.get("/metrics")
+
+        assert response.status_code == 200  # noqa: PLR2004
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        assert 'datawarehouse_upstream_responses_total{status="200"} 1' in response.text
+        assert response.text == render_metrics()
+
+
+class TestRequestMetrics:
+    """Test suite for the stage timings and counters of tool calls."""
+
+    def test_tool_call(
+        self,
+        fake_upstream: list[tuple[str, dict[str, str]]],  # noqa: ARG002
+        caplog: pytest.LogCaptureFixture,
+    ) -> None:
+        """Test that a tool call records its duration, stages, rows and cache lookups."""
+        with caplog.at_level(logging.INFO, logger="metrics"):
+            asyncio.run(get_data_for_dataflow("DM", "", "", output_format="csv"))
+            asyncio.run(get_data_for_dataflow("DM", "", "", output_format="csv"))
+
+        assert TOOL_DURATION.count(tool="get_data_for_dataflow", outcome="ok") == 2  # noqa: PLR2004
+        assert STAGE_DURATION.count(stage="parse") == 1
+        assert STAGE_DURATION.count(stage="render") == 2  # noqa: PLR2004
+        assert ROWS_PARSED.value() == DM_FIXTURE_ROWS
+        assert CACHE_LOOKUPS.value(cache="data", outcome="miss") == 1
+        assert CACHE_LOOKUPS.value(cache="data", outcome="hit") == 1
+
+        first, second = (r for r in caplog.records if r.getMessage().startswith("Tool "))
+        assert first.tool == "get_data_for_dataflow"
+        assert set(first.timings_ms) == {"parse", "render"}
+        assert first.counters == {"rows_parsed": DM_FIXTURE_ROWS, "data_cache_miss": 1}
+        assert set(second.timings_ms) == {"render"}
+        assert second.counters == {"data_cache_hit": 1}
+
+    def test_error_outcome(self) -> None:
+        """Test that calls answering with an error are counted as errors."""
+        asyncio.run(get_data_for_dataflow("DM", "", "", output_format="xml"))
+
+        assert TOOL_DURATION.count(tool="get_data_for_dataflow", outcome="error") == 1
+
+    def test_concurrent_stages_are_summed(self) -> None:
+        """Test that stages of the tasks of a call are added to the same timings."""
+
+        @instrument_tool
+        async def tool() -> dict[str, float]:
+            async def stage() -> None:
+                with span("download"):
+                    await asyncio.sleep(0.05)
+
+            await asyncio.gather(stage(), stage())
+            request = get_request_metrics()
+            assert request is not None
+            return request.timings_ms
+
+        timings_ms = asyncio.run(tool())
+
+        assert timings_ms["download"] >= 100  # noqa: PLR2004
+        assert get_request_metrics() is None
+
+    def test_download(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test that responses and downloaded bytes of the SDMX API are counted."""
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            if request.url.path.endswith("MISSING"):
+                return httpx.Response(404)
+            return httpx.Response(200, content=b"x" * 1000)
+
+        def get_mock_client() -> httpx.AsyncClient:
+            return httpx.AsyncClient(
+                base_url="https://sdmx.example.org/rest/",
+                transport=httpx.MockTransport(handler),
+            )
+
+        monkeypatch.setattr("http_client.get_http_client", get_mock_client)
+        monkeypatch.setattr("http_client._disk_cache", None)
+
+        async def read(path: str) -> None:
+            async for _ in stream_bytes(path):
+                pass
+
+        asyncio.run(read("data/DM/URY.DM_BRTS"))
+        with pytest.raises(NoDataFoundError):
+            asyncio.run(read("data/DM/MISSING"))
+
+        assert UPSTREAM_RESPONSES.value(status="200") == 1
+        assert UPSTREAM_RESPONSES.value(status="404") == 1
+        assert UPSTREAM_BYTES.value() == 1000  # noqa: PLR2004
+        assert STAGE_DURATION.count(stage="download") == 2  # noqa: PLR2004
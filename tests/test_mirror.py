@@ -0,0 +1,194 @@
+import asyncio
+import copy
+import json
+from collections.abc import AsyncIterator
+from pathlib import Path
+from typing import Any
+
+import pandas as pd
+import pytest
+from conftest import query_sdmx_json, stream_body
+from exceptions import DataWarehouseAPIError, NoDataFoundError
+from handlers import handle_get_all_indicators_for_dataflow, handle_get_data_for_dataflow
+from schemas import DataflowStructure, DataQuery
+from sdmx_parser import build_df_from_json
+from structure import parse_dataflow_structure
+
+pytest.importorskip("pyarrow")
+
+from mirror import Mirror, merge_structures  # noqa: E402
+
+SYNCED_AT = "2025-01-01T00:00:00"
+
+
+@pytest.fixture
+def dm_structure(dm_sdmx_json: dict[str, Any]) -> DataflowStructure:
+    """Parsed structure of the DM fixture."""
+    return parse_dataflow_structure("DM", dm_sdmx_json["data"]["structure"])
+
+
+@pytest.fixture
+def dm_mirror(tmp_path: Path, dm_sdmx_json: dict[str, Any]) -> Mirror:
+    """Mirror with the DM fixture."""
+    mirror = Mirror(tmp_path)
+    data = build_df_from_json(dm_sdmx_json["data"])
+    mirror.write("DM", data, dm_sdmx_json["data"]["structure"], SYNCED_AT)
+    return mirror
+
+
+def sort_rows(data: pd.DataFrame) -> pd.DataFrame:
+    """Sort rows by series and period, so that data in different row orders can be compared."""
+    keys = ["INDICATOR", "REF_AREA", "SEX", "TIME_PERIOD"]
+    return data.sort_values(keys, key=lambda column: column.astype(str)).reset_index(drop=True)
+
+
+class TestMirrorRead:
+    """Test suite for queries answered from the mirror."""
+
+    @pytest.mark.parametrize(
+        ("ref_areas", "indicators", "params"),
+        [
+            (("URY",), ("DM_BRTS",), {}),
+            (("ARG", "URY"), ("DM_BRTS", "DM_DEATHS"), {"startPeriod": "2020"}),
+            (("ARG",), ("DM_BRTS", "DM_DEATHS"), {"startPeriod": "2019", "endPeriod": "2020"}),
+            ((), ("DM_DEATHS",), {}),
+            (("URY",), (), {}),
+            (("ARG", "URY"), (), {}),
+            (("ARG",), (), {"startPeriod": "2020"}),
+        ],
+    )
+    def test_same_data_as_sdmx_api(  # noqa: PLR0913
+        self,
+        dm_mirror: Mirror,
+        dm_sdmx_json: dict[str, Any],
+        dm_structure: DataflowStructure,
+        ref_areas: tuple[str, ...],
+        indicators: tuple[str, ...],
+        params: dict[str, str],
+    ) -> None:
+        """Test that the mirror returns the same observations as the SDMX API for a query."""
+        query = DataQuery(dataflow_id="DM", ref_areas=ref_areas, indicators=indicators)
+        expected = build_df_from_json(
+            query_sdmx_json(dm_sdmx_json, f"data/DM/{query.key}", params)["data"]
+        )
+
+        data = dm_mirror.read(query, params, dm_structure)
+
+        assert list(data.columns) == list(expected.columns)
+        pd.testing.assert_frame_equal(sort_rows(data), sort_rows(expected), check_categorical=False)
+
+    def test_last_observations(self, dm_mirror: Mirror, dm_structure: DataflowStructure) -> None:
+        """Test that only the latest observations of every series are returned."""
+        query = DataQuery(dataflow_id="DM", ref_areas=("URY",), indicators=("DM_DEATHS",))
+
+        data = dm_mirror.read(query, {"lastNObservations": "1"}, dm_structure)
+
+        assert list(data["TIME_PERIOD"]) == ["2020"]
+        assert list(data["OBS_VALUE"]) == [35.961]
+
+    def test_no_data(self, dm_mirror: Mirror, dm_structure: DataflowStructure) -> None:
+        """Test that queries without matching rows raise `NoDataFoundError`, like the SDMX API."""
+        query = DataQuery(dataflow_id="DM", ref_areas=("BRA",), indicators=("DM_BRTS",))
+
+        with pytest.raises(NoDataFoundError):
+            dm_mirror.read(query, {}, dm_structure)
+        with pytest.raises(NoDataFoundError, match="not in the mirror"):
+            dm_mirror.read(DataQuery("CME", ("URY",), ("DM_BRTS",)), {}, dm_structure)
+
+
+class TestHandlersWithMirror:
+    """Test suite for the handlers answering from the mirror."""
+
+    @pytest.fixture(autouse=True)
+    def enable_mirror(self, monkeypatch: pytest.MonkeyPatch, dm_mirror: Mirror) -> None:
+        """Answer from the DM mirror and fail any request to the SDMX API."""
+
+        async def unavailable(*args: Any, **kwargs: Any) -> Any:  # noqa: ANN401
+            msg = "The SDMX API should not be called"
+            raise DataWarehouseAPIError(msg)
+
+        monkeypatch.setattr("mirror._mirror", dm_mirror)
+        monkeypatch.setattr("handlers.stream_bytes", unavailable)
+        monkeypatch.setattr("structure.get_json", unavailable)
+
+    def test_get_data(self) -> None:
+        """Test that data is answered from the mirror, with the year fallback of the API."""
+        result = asyncio.run(handle_get_data_for_dataflow("DM", "URY", "DM_BRTS", year=1990))
+
+        assert sorted(result.data["TIME_PERIOD"]) == ["2019", "2020", "2021"]
+
+    def test_get_indicators(self) -> None:
+        """Test that indicators are answered from the structure in the mirror."""
+        indicators = asyncio.run(handle_get_all_indicators_for_dataflow("DM"))
+
+        assert set(indicators) == {"DM_BRTS", "DM_DEATHS"}
+
+
+class TestMirrorSync:
+    """Test suite for syncing dataflows into the mirror."""
+
+    @pytest.fixture
+    def upstream(
+        self,
+        monkeypatch: pytest.MonkeyPatch,
+        dm_sdmx_json: dict[str, Any],
+    ) -> list[dict[str, str]]:
+        """Serve the whole DM fixture, or one updated observation with `updatedAfter`."""
+        requests: list[dict[str, str]] = []
+        update = copy.deepcopy(dm_sdmx_json)
+        series = update["data"]["dataSets"][0]["series"]
+        for series_key in list(series)[1:]:
+            del series[series_key]
+        first_series = next(iter(series.values()))
+        position = next(iter(first_series["observations"]))
+        first_series["observations"] = {
+            position: [999.0, *first_series["observations"][position][1:]]
+        }
+
+        async def fake_stream_bytes(path: str, params: dict[str, str]) -> AsyncIterator[bytes]:
+            requests.append(params)
+            assert path == "data/DM/All"
+            body = json.dumps(update if "updatedAfter" in params else dm_sdmx_json).encode()
+            async for chunk in stream_body(body):
+                yield chunk
+
+        monkeypatch.setattr("mirror.stream_bytes", fake_stream_bytes)
+        return requests
+
+    def test_full_then_incremental_sync(
+        self,
+        tmp_path: Path,
+        upstream: list[dict[str, str]],
+        dm_sdmx_json: dict[str, Any],
+        dm_structure: DataflowStructure,
+    ) -> None:
+        """Test that a refresh only requests updates and replaces the updated observation."""
+        mirror = Mirror(tmp_path)
+        query = DataQuery(dataflow_id="DM", ref_areas=(), indicators=())
+        num_observations = len(build_df_from_json(dm_sdmx_json["data"]))
+
+        assert asyncio.run(mirror.sync("DM")) == num_observations
+        assert asyncio.run(mirror.sync("DM")) == 1
+
+        assert "updatedAfter" not in upstream[0]
+        assert upstream[1]["updatedAfter"] >= SYNCED_AT
+        data = mirror.read(query, {}, dm_structure)
+        assert len(data) == num_observations
+        assert (data["OBS_VALUE"] == 999.0).sum() == 1  # noqa: PLR2004
+
+    def test_merge_structures(self) -> None:
+        """Test that codes of the update are added to the mirrored structure."""
+        empty: dict[str, list[Any]] = {"series": [], "observation": []}
+        structure = {
+            "dimensions": {**empty, "series": [{"id": "REF_AREA", "values": [{"id": "ARG"}]}]},
+            "attributes": empty,
+        }
+        update = {
+            "dimensions": {**empty, "series": [{"id": "REF_AREA", "values": [{"id": "URY"}]}]},
+            "attributes": empty,
+        }
+
+        merged = merge_structures(structure, update)
+
+        assert merged["dimensions"]["series"][0]["values"] == [{"id": "ARG"}, {"id": "URY"}]
+        assert structure["dimensions"]["series"][0]["values"] == [{"id": "ARG"}]
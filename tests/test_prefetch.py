@@ -0,0 +1,195 @@
+import asyncio
+import threading
+from collections.abc import Iterator
+from pathlib import Path
+
+import pytest
+from cache import clear_caches
+from exceptions import UpstreamUnavailableError
+from handlers import handle_get_data_for_dataflow
+from metrics import PREFETCHES, clear_metrics
+from popularity import QueryPopularity, get_query_popularity
+from prefetch import Prefetcher, prefetching
+from scheduler import current_priority
+from schemas import DataQuery, PrefetchConfig
+
+Requests = list[tuple[str, dict[str, str]]]
+
+
+def make_query(ref_areas: str) -> DataQuery:
+    """Query of the DM dataflow."""
+    return DataQuery(dataflow_id="DM", ref_areas=(ref_areas,), indicators=("DM_BRTS",))
+
+
+@pytest.fixture(autouse=True)
+def _clear_popularity() -> Iterator[None]:
+    get_query_popularity().clear()
+    clear_metrics()
+    yield
+    get_query_popularity().clear()
+    clear_metrics()
+
+
+@pytest.fixture
+def structures(monkeypatch: pytest.MonkeyPatch) -> list[tuple[str, str]]:
+    """Record the structures prefetched, and the priority of their requests."""
+    prefetched: list[tuple[str, str]] = []
+
+    async def get_dataflow_structure(dataflow_id: str, **_: float) -> None:
+        prefetched.append((dataflow_id, current_priority()))
+
+    monkeypatch.setattr("structure.get_dataflow_structure", get_dataflow_structure)
+    monkeypatch.setattr("prefetch.get_curated_dataflow_ids", lambda: ["CME", "DM"])
+    return prefetched
+
+
+class TestQueryPopularity:
+    """Test suite for counting the calls of data queries."""
+
+    def test_most_called_first(self) -> None:
+        """Test that the top queries are the most called ones."""
+        popularity = QueryPopularity(max_queries=10)
+        for ref_area in ("URY", "ARG", "ARG", "BRA", "ARG", "BRA"):
+            popularity.record(make_query(ref_area))
+
+        assert popularity.top(2) == [make_query("ARG"), make_query("BRA")]
+
+    def test_least_called_are_forgotten(self) -> None:
+        """Test that a new query replaces the oldest of the least called ones beyond the limit."""
+        popularity = QueryPopularity(max_queries=2)
+        popularity.record(make_query("URY"))
+        popularity.record(make_query("ARG"), calls=2)
+        popularity.record(make_query("BRA"))
+
+        assert popularity.top(3) == [make_query("ARG"), make_query("BRA")]
+
+    def test_saved_and_loaded(self, tmp_path: Path) -> None:
+        """Test that counts are kept across processes through the popularity file."""
+        popularity = QueryPopularity(max_queries=10)
+        popularity.record(make_query("URY"), calls=3)
+        popularity.save(tmp_path / "popularity.json")
+
+        loaded = QueryPopularity(max_queries=10)
+        loaded.load(tmp_path / "popularity.json")
+        loaded.load(tmp_path / "missing.json")
+
+        assert loaded.calls(make_query("URY")) == 3  # noqa: PLR2004
+
+    def test_unreadable_file_is_ignored(self, tmp_path: Path) -> None:
+        """Test that a corrupted popularity file is ignored."""
+        (tmp_path / "popularity.json").write_text("{", encoding="utf-8")
+        popularity = QueryPopularity(max_queries=10)
+        popularity.load(tmp_path / "popularity.json")
+
+        assert popularity.top(1) == []
+
+
+class TestPrefetcher:
+    """Test suite for warming up the caches in the background."""
+
+    def test_popular_queries_are_cached(
+        self, fake_upstream: Requests, structures: list[tuple[str, str]]
+    ) -> None:
+        """Test that the structures and the top queries are fetched, in the background."""
+        asyncio.run(handle_get_data_for_dataflow("DM", "URY", "DM_BRTS"))
+        asyncio.run(handle_get_data_for_dataflow("DM", "URY", "DM_BRTS"))
+        asyncio.run(handle_get_data_for_dataflow("DM", "ARG", "DM_BRTS"))
+        prefetcher = Prefetcher(PrefetchConfig(top_queries=1), get_query_popularity())
+
+        clear_caches()
+        fake_upstream.clear()
+        assert asyncio.run(prefetcher.warm_up()) == 0
+
+        assert structures == [("CME", "background"), ("DM", "background")]
+        assert [path for path, _ in fake_upstream] == ["data/DM/URY.DM_BRTS"]
+        assert PREFETCHES.value(kind="query", outcome="ok") == 1
+        # The first call after the warm-up is a cache hit
+        asyncio.run(handle_get_data_for_dataflow("DM", "URY", "DM_BRTS"))
+        assert len(fake_upstream) == 1
+
+    def test_entries_expiring_before_the_next_warm_up_are_refreshed(
+        self,
+        fake_upstream: Requests,
+        structures: list[tuple[str, str]],  # noqa: ARG002
+    ) -> None:
+        """Test that cached results are only fetched again if they would expire meanwhile."""
+        get_query_popularity().record(make_query("URY"))
+
+        asyncio.run(Prefetcher(PrefetchConfig(), get_query_popularity()).warm_up())
+        asyncio.run(Prefetcher(PrefetchConfig(), get_query_popularity()).warm_up())
+        assert len(fake_upstream) == 1
+
+        # Longer than the data TTL
+        prefetcher = Prefetcher(PrefetchConfig(interval_seconds=10**6), get_query_popularity())
+        asyncio.run(prefetcher.warm_up())
+        assert len(fake_upstream) == 2  # noqa: PLR2004
+
+    def test_unavailable_upstream_stops_the_warm_up(
+        self, monkeypatch: pytest.MonkeyPatch, fake_upstream: Requests
+    ) -> None:
+        """Test that nothing more is requested once the SDMX API is deemed down."""
+
+        async def unavailable(dataflow_id: str, **_: float) -> None:
+            raise UpstreamUnavailableError(dataflow_id)
+
+        monkeypatch.setattr("structure.get_dataflow_structure", unavailable)
+        get_query_popularity().record(make_query("URY"))
+
+        assert asyncio.run(Prefetcher(PrefetchConfig(), get_query_popularity()).warm_up()) == 1
+        assert fake_upstream == []
+
+    def test_popularity_is_loaded_and_saved(self, tmp_path: Path) -> None:
+        """Test that the popularity file is read on startup and written on exit."""
+        path = tmp_path / "popularity.json"
+        popularity = QueryPopularity(max_queries=10)
+        popularity.record(make_query("URY"))
+        popularity.save(path)
+        prefetch_config = PrefetchConfig(startup_delay_seconds=60, popularity_path=str(path))
+
+        async def serve() -> None:
+            async with prefetching(prefetch_config):
+                assert get_query_popularity().top(1) == [make_query("URY")]
+                get_query_popularity().record(make_query("ARG"), calls=2)
+
+        asyncio.run(serve())
+
+        saved = QueryPopularity(max_queries=10)
+        saved.load(path)
+        assert saved.top(2) == [make_query("ARG"), make_query("URY")]
+
+    def test_popularity_is_saved_in_a_worker_after_a_warm_up(
+        self, monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+    ) -> None:
+        """Test that the popularity is written after every warm-up, off the event loop."""
+        path = tmp_path / "popularity.json"
+        prefetcher = Prefetcher(
+            PrefetchConfig(startup_delay_seconds=0, interval_seconds=60, popularity_path=str(path)),
+            get_query_popularity(),
+        )
+        get_query_popularity().record(make_query("URY"))
+        saving_threads: list[int] = []
+        saved_once = threading.Event()
+        save = QueryPopularity.save
+
+        def record_thread(popularity: QueryPopularity, path: Path) -> None:
+            saving_threads.append(threading.get_ident())
+            save(popularity, path)
+            saved_once.set()
+
+        async def warm_up() -> int:
+            return 0
+
+        monkeypatch.setattr(QueryPopularity, "save", record_thread)
+        monkeypatch.setattr(prefetcher, "warm_up", warm_up)
+
+        async def run_once() -> None:
+            task = asyncio.create_task(prefetcher.run())
+            await asyncio.to_thread(saved_once.wait, 5)
+            task.cancel()
+
+        asyncio.run(run_once())
+
+        assert saving_threads != [threading.get_ident()]
+        saved = QueryPopularity(max_queries=10)
+        saved.load(path)
+        assert saved.top(1) == [make_query("URY")]
@@ -0,0 +1,125 @@
+import asyncio
+import json
+from pathlib import Path
+
+import pytest
+from profiling import CallProfiler, profile_tool, rotate_profiles, wait_for_profiles
+
+
+async def tool(dataflow_id: str, delay: float = 0.0) -> dict[str, str]:
+    """Tool sleeping for `delay` seconds."""
+    await asyncio.sleep(delay)
+    return {"dataflow_id": dataflow_id}
+
+
+def test_disabled_profiling_returns_the_tool() -> None:
+    """Test that tools are not wrapped at all while profiling is disabled."""
+    assert profile_tool(tool) is tool
+
+
+def test_rotate_profiles(tmp_path: Path) -> None:
+    """Test that every file of the oldest profiles is deleted."""
+    for name in ("20250101T000000-a-1", "20250101T000001-b-2", "20250101T000002-c-3"):
+        for suffix in (".json", ".html", ".memray"):
+            (tmp_path / f"{name}{suffix}").touch()
+
+    rotate_profiles(tmp_path, max_profiles=2)
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "20250101T000001-b-2.html",
+        "20250101T000001-b-2.json",
+        "20250101T000001-b-2.memray",
+        "20250101T000002-c-3.html",
+        "20250101T000002-c-3.json",
+        "20250101T000002-c-3.memray",
+    ]
+
+
+class TestCallProfiler:
+    """Test suite for profiling tool calls (skipped without pyinstrument)."""
+
+    @pytest.fixture(autouse=True)
+    def _requires_pyinstrument(self) -> None:
+        pytest.importorskip("pyinstrument")
+
+    def profile_calls(
+        self,
+        monkeypatch: pytest.MonkeyPatch,
+        profiler: CallProfiler,
+        delays: list[float],
+    ) -> list[dict[str, str]]:
+        """Call the tool once per delay, one call after the other, with the given profiler."""
+        monkeypatch.setattr("profiling._profiler", profiler)
+        profiled_tool = profile_tool(tool)
+
+        async def run() -> list[dict[str, str]]:
+            results = [await profiled_tool("DM", delay=delay) for delay in delays]
+            await wait_for_profiles()
+            return results
+
+        return asyncio.run(run())
+
+    def metadata(self, directory: Path) -> list[dict]:
+        """Metadata of the profiles of a directory, oldest first."""
+        return [json.loads(path.read_text()) for path in sorted(directory.glob("*.json"))]
+
+    def test_every_nth_call(self, monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+        """Test that every Nth call is profiled and tagged with its arguments."""
+        profiler = CallProfiler(tmp_path, every_n_calls=2, slow_call_seconds=0, max_profiles=10)
+
+        results = self.profile_calls(monkeypatch, profiler, [0, 0, 0, 0])
+
+        assert results == [{"dataflow_id": "DM"}] * 4
+        metadata = self.metadata(tmp_path)
+        assert [m["call_number"] for m in metadata] == [2, 4]
+        assert metadata[0]["tool"] == "tool"
+        assert metadata[0]["arguments"] == {"dataflow_id": "DM", "delay": 0}
+        assert metadata[0]["reason"] == "sampled"
+        assert len(list(tmp_path.glob("*.html"))) == 2  # noqa: PLR2004
+
+    def test_slow_calls(self, monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+        """Test that only the profiles of slow calls are kept without sampling."""
+        profiler = CallProfiler(tmp_path, every_n_calls=0, slow_call_seconds=0.1, max_profiles=10)
+
+        self.profile_calls(monkeypatch, profiler, [0, 0.2, 0])
+
+        metadata = self.metadata(tmp_path)
+        assert [(m["call_number"], m["reason"]) for m in metadata] == [(2, "slow")]
+        assert metadata[0]["duration_seconds"] >= 0.1  # noqa: PLR2004
+
+    def test_max_profiles(self, monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+        """Test that only the most recent profiles are kept."""
+        profiler = CallProfiler(tmp_path, every_n_calls=1, slow_call_seconds=0, max_profiles=2)
+
+        self.profile_calls(monkeypatch, profiler, [0, 0, 0])
+
+        assert [m["call_number"] for m in self.metadata(tmp_path)] == [2, 3]
+        assert len(list(tmp_path.iterdir())) == 4  # noqa: PLR2004
+
+    def test_memory(self, monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+        """Test that sampled calls are tracked by memray with `memory`."""
+        pytest.importorskip("memray")
+        profiler = CallProfiler(
+            tmp_path, every_n_calls=1, slow_call_seconds=0, max_profiles=10, memory=True
+        )
+
+        self.profile_calls(monkeypatch, profiler, [0])
+
+        (summary,) = tmp_path.glob("*.memory.txt")
+        assert summary.read_text().startswith("Peak memory: ")
+        assert len(list(tmp_path.glob("*.memray"))) == 1
+        assert not list(tmp_path.glob("*.html"))
+
+    def test_one_profile_at_a_time(self, monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+        """Test that calls made while another one is profiled run unprofiled."""
+        profiler = CallProfiler(tmp_path, every_n_calls=1, slow_call_seconds=0, max_profiles=10)
+        monkeypatch.setattr("profiling._profiler", profiler)
+        profiled_tool = profile_tool(tool)
+
+        async def run() -> None:
+            await asyncio.gather(profiled_tool("DM", delay=0.1), profiled_tool("CME", delay=0.1))
+            await wait_for_profiles()
+
+        asyncio.run(run())
+
+        assert [m["arguments"]["dataflow_id"] for m in self.metadata(tmp_path)] == ["DM"]
@@ -0,0 +1,177 @@
+import asyncio
+from collections.abc import Iterator
+
+import pytest
+from metrics import UPSTREAM_QUEUE_DEPTH, UPSTREAM_QUEUE_WAIT, clear_metrics
+from scheduler import BandwidthLimiter, RequestScheduler, current_priority, request_priority
+from schemas import SchedulerConfig
+
+
+@pytest.fixture(autouse=True)
+def _clear_metrics() -> Iterator[None]:
+    clear_metrics()
+    yield
+    clear_metrics()
+
+
+async def hold(
+    scheduler: RequestScheduler,
+    name: str,
+    admitted: list[str],
+    release: asyncio.Event,
+    **kwargs: str,
+) -> None:
+    """Send a request through the scheduler, recording its admission, until `release` is set."""
+    async with scheduler.admit("data/DM", **kwargs):
+        admitted.append(name)
+        await release.wait()
+
+
+async def admission_order(
+    scheduler: RequestScheduler, requests: list[tuple[str, dict[str, str]]]
+) -> list[str]:
+    """Queue requests behind a first one, then release them one at a time."""
+    admitted: list[str] = []
+    releases = {name: asyncio.Event() for name in ["first"] + [name for name, _ in requests]}
+    tasks = [asyncio.create_task(hold(scheduler, "first", admitted, releases["first"]))]
+    await asyncio.sleep(0)
+    for name, kwargs in requests:
+        tasks.append(asyncio.create_task(hold(scheduler, name, admitted, releases[name], **kwargs)))
+        await asyncio.sleep(0)
+
+    for i in range(len(releases)):
+        releases[admitted[i]].set()
+        await asyncio.sleep(0.01)
+    await asyncio.gather(*tasks)
+    return admitted[1:]
+
+
+def test_concurrency_is_capped() -> None:
+    """Test that no more than `max_concurrent_requests` requests are in flight."""
+    scheduler = RequestScheduler(SchedulerConfig(max_concurrent_requests=2))
+    in_flight: list[int] = []
+
+    async def request() -> None:
+        async with scheduler.admit("data/DM"):
+            in_flight.append(scheduler.in_flight)
+            await asyncio.sleep(0.01)
+
+    async def run() -> None:
+        await asyncio.gather(*(request() for _ in range(6)))
+
+    asyncio.run(run())
+
+    assert max(in_flight) == 2  # noqa: PLR2004
+    assert scheduler.in_flight == 0
+    assert UPSTREAM_QUEUE_WAIT.count(priority="data") == 6  # noqa: PLR2004
+
+
+def test_metadata_goes_first() -> None:
+    """Test that waiting structure requests are admitted before data requests."""
+    scheduler = RequestScheduler(SchedulerConfig(max_concurrent_requests=1))
+    requests = [("data", {}), ("metadata", {"priority": "metadata"})]
+
+    assert asyncio.run(admission_order(scheduler, requests)) == ["metadata", "data"]
+
+
+def test_sessions_take_turns() -> None:
+    """Test that a session with many waiting requests doesn't hold back another one."""
+    scheduler = RequestScheduler(SchedulerConfig(max_concurrent_requests=1))
+    requests = [(f"a{i}", {"session": "a"}) for i in range(3)] + [("b0", {"session": "b"})]
+
+    assert asyncio.run(admission_order(scheduler, requests)) == ["a0", "b0", "a1", "a2"]
+
+
+def test_memory_budget() -> None:
+    """Test that requests wait while the expected responses exceed the budget."""
+    scheduler = RequestScheduler(
+        SchedulerConfig(memory_budget_bytes=100, default_response_bytes=60)
+    )
+
+    async def run() -> tuple[int, int]:
+        admitted: list[str] = []
+        release = asyncio.Event()
+        tasks = [
+            asyncio.create_task(hold(scheduler, name, admitted, release)) for name in ("a", "b")
+        ]
+        await asyncio.sleep(0.01)
+        held_back = len(admitted)
+        release.set()
+        await asyncio.gather(*tasks)
+        return held_back, len(admitted)
+
+    assert asyncio.run(run()) == (1, 2)
+    assert scheduler.reserved_bytes == 0
+
+
+def test_expected_size_is_learned() -> None:
+    """Test that the expected size of the responses of an endpoint follows the received ones."""
+    scheduler = RequestScheduler(SchedulerConfig(default_response_bytes=1000))
+
+    async def run() -> None:
+        async with scheduler.admit("data/DM") as admission:
+            admission.record_bytes(100)
+
+    asyncio.run(run())
+
+    assert scheduler.expected_size("data/DM") == 100  # noqa: PLR2004
+    assert scheduler.expected_size("data/CME") == 1000  # noqa: PLR2004
+
+
+def test_cancelled_request_leaves_the_queue() -> None:
+    """Test that a request cancelled while waiting is taken out of the queue."""
+    scheduler = RequestScheduler(SchedulerConfig(max_concurrent_requests=1))
+
+    async def run() -> None:
+        release = asyncio.Event()
+        first = asyncio.create_task(hold(scheduler, "first", [], release))
+        await asyncio.sleep(0)
+        waiting = asyncio.create_task(hold(scheduler, "waiting", [], release))
+        await asyncio.sleep(0)
+        assert UPSTREAM_QUEUE_DEPTH.value(priority="data") == 1
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        release.set()
+        await first
+
+    asyncio.run(run())
+
+    assert scheduler.queued("data") == 0
+    assert scheduler.in_flight == 0
+    assert UPSTREAM_QUEUE_DEPTH.value(priority="data") == 0
+
+
+def test_background_goes_last() -> None:
+    """Test that waiting background requests are admitted after every other request."""
+    scheduler = RequestScheduler(SchedulerConfig(max_concurrent_requests=1))
+    requests = [("background", {"priority": "background"}), ("data", {})]
+
+    assert asyncio.run(admission_order(scheduler, requests)) == ["data", "background"]
+
+
+def test_background_priority_is_kept() -> None:
+    """Test that requests of background work stay in the background."""
+    with request_priority("background"), request_priority("metadata"):
+        assert current_priority() == "background"
+    with request_priority("metadata"):
+        assert current_priority() == "metadata"
+
+
+def test_bandwidth_limiter() -> None:
+    """Test that downloads wait once they exceed a second's worth of bytes, at the set rate."""
+    now = [0.0]
+    limiter = BandwidthLimiter(100, clock=lambda: now[0])
+
+    assert limiter.delay(100) == 0
+    assert limiter.delay(50) == 0.5  # noqa: PLR2004
+    now[0] = 1.5
+    # Refilled by 150 bytes, so no more debt, but no more than a second's worth either
+    assert limiter.delay(0) == 0
+    now[0] = 10.0
+    assert limiter.delay(150) == 0.5  # noqa: PLR2004
+
+
+def test_unknown_priority() -> None:
+    """Test that priorities are checked."""
+    with pytest.raises(ValueError, match="Unknown request priority"), request_priority("urgent"):
+        pass
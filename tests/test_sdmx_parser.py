@@ -0,0 +1,177 @@
+from typing import Any
+
+import numpy as np
+import pandas as pd
+import pytest
+from conftest import to_sdmx_csv
+from schemas import DataflowStructure
+from sdmx_parser import build_df_from_csv, build_df_from_json
+from structure import parse_dataflow_structure
+
+EXPECTED_COLUMNS = [
+    "TIME_PERIOD",
+    "REF_AREA",
+    "INDICATOR",
+    "RESIDENCE",
+    "SEX",
+    "AGE",
+    "OBS_STATUS",
+    "OBS_CONF",
+    "COVERAGE_TIME",
+    "FREQ_COLL",
+    "TIME_PERIOD_METHOD",
+    "DATA_SOURCE",
+    "UNIT_MEASURE",
+    "UNIT_MULTIPLIER",
+    "SOURCE_LINK",
+    "SERIES_FOOTNOTE",
+    "OBS_FOOTNOTE",
+    "OBS_VALUE",
+]
+
+
+def as_rows(data: pd.DataFrame) -> list[list[Any]]:
+    """Return the DataFrame values as rows of Python objects, with `None` for missing values."""
+    return data.astype(object).where(data.notna(), None).to_numpy().tolist()
+
+
+class TestBuildDfFromJson:
+    """Test suite for the columnar SDMX-JSON parser."""
+
+    def test_columns_and_dtypes(self, dm_sdmx_json: dict[str, Any]) -> None:
+        """Test that codes are categorical and observation values are float64."""
+        data = build_df_from_json(dm_sdmx_json["data"])
+
+        assert list(data.columns) == EXPECTED_COLUMNS
+        assert data["OBS_VALUE"].dtype == np.float64
+        assert all(isinstance(data[c].dtype, pd.CategoricalDtype) for c in EXPECTED_COLUMNS[:-1])
+
+    def test_values(self, dm_sdmx_json: dict[str, Any]) -> None:
+        """Test that every observation is decoded with its dimensions and attributes."""
+        data = build_df_from_json(dm_sdmx_json["data"])
+        rows = as_rows(data)
+
+        source = (
+            "United Nations, Department of Economic and Social Affairs, Population Division "
+            "(2024). World Population Prospects 2024."
+        )
+        link = "https://population.un.org/wpp/"
+        assert rows[1] == [
+            *["2020", "URY", "DM_BRTS", "_T", "_T", "_T"],
+            *["A", None, None, None, None, source],
+            *["PS", "3", link, None, None],
+            35.383,
+        ]
+        assert rows[-1] == [
+            *["2021", "ARG", "DM_DEATHS", "_T", "_T", "_T"],
+            *["PRED", None, None, None, None, source],
+            *["PS", "3", link, None, "Projected"],
+            311.4,
+        ]
+        assert [row[0] for row in rows] == ["2019", "2020", "2021", "2019", "2020"] + [
+            "2019",
+            "2020",
+            "2021",
+            "2021",
+        ]
+
+    def test_series_without_observations_are_skipped(self, dm_sdmx_json: dict[str, Any]) -> None:
+        """Test that series lacking observations or attributes produce no rows."""
+        series = dm_sdmx_json["data"]["dataSets"][0]["series"]
+        del series["0:0:0:0:0"]["observations"]
+        del series["0:1:0:0:0"]["attributes"]
+
+        data = build_df_from_json(dm_sdmx_json["data"])
+
+        assert len(data) == len(series["1:0:0:0:0"]["observations"]) + 1
+
+    def test_short_observations_are_padded(self, dm_sdmx_json: dict[str, Any]) -> None:
+        """Test that observations with omitted trailing attributes get missing values."""
+        observations = dm_sdmx_json["data"]["dataSets"][0]["series"]["0:0:0:0:0"]["observations"]
+        observations["0"] = [34.866, 0]
+
+        data = build_df_from_json(dm_sdmx_json["data"])
+
+        assert data["OBS_STATUS"].iloc[0] == "A"
+        assert pd.isna(data["DATA_SOURCE"].iloc[0])
+        assert data["DATA_SOURCE"].iloc[1] is not None
+
+    def test_non_numeric_values_are_coerced(self, dm_sdmx_json: dict[str, Any]) -> None:
+        """Test that non-numeric observation values become NaN."""
+        observations = dm_sdmx_json["data"]["dataSets"][0]["series"]["0:0:0:0:0"]["observations"]
+        observations["0"][0] = "<0.1"
+        observations["1"][0] = "35.383"
+
+        data = build_df_from_json(dm_sdmx_json["data"])
+
+        assert np.isnan(data["OBS_VALUE"].iloc[0])
+        assert data["OBS_VALUE"].iloc[1] == pytest.approx(35.383)
+        assert data["OBS_STATUS"].iloc[1] == "A"
+
+    def test_empty_dataset(self, dm_sdmx_json: dict[str, Any]) -> None:
+        """Test that a dataset without series yields an empty DataFrame with all the columns."""
+        dm_sdmx_json["data"]["dataSets"][0]["series"] = {}
+
+        data = build_df_from_json(dm_sdmx_json["data"])
+
+        assert list(data.columns) == EXPECTED_COLUMNS
+        assert data.empty
+
+    def test_chunked_decoding(
+        self,
+        monkeypatch: pytest.MonkeyPatch,
+        dm_sdmx_json: dict[str, Any],
+    ) -> None:
+        """Test that decoding in several chunks gives the same result as a single chunk."""
+        expected = build_df_from_json(dm_sdmx_json["data"])
+        monkeypatch.setattr("sdmx_parser.FLUSH_SIZE", 2)
+
+        data = build_df_from_json(dm_sdmx_json["data"])
+
+        pd.testing.assert_frame_equal(data, expected)
+
+
+class TestBuildDfFromCsv:
+    """Test suite for the SDMX-CSV parser."""
+
+    @pytest.fixture
+    def structure(self, dm_sdmx_json: dict[str, Any]) -> DataflowStructure:
+        """Structure of the DM fixture."""
+        return parse_dataflow_structure("DM", dm_sdmx_json["data"]["structure"])
+
+    def test_same_frame_as_json(
+        self,
+        dm_sdmx_json: dict[str, Any],
+        structure: DataflowStructure,
+    ) -> None:
+        """Test that SDMX-CSV gives the same columns, dtypes and values as SDMX-JSON."""
+        data = build_df_from_csv(to_sdmx_csv(dm_sdmx_json), structure)
+
+        pd.testing.assert_frame_equal(data, build_df_from_json(dm_sdmx_json["data"]))
+
+    def test_codes_are_not_inferred(
+        self,
+        dm_sdmx_json: dict[str, Any],
+        structure: DataflowStructure,
+    ) -> None:
+        """Test that numeric-looking codes stay strings and missing values stay missing."""
+        data = build_df_from_csv(to_sdmx_csv(dm_sdmx_json), structure)
+
+        assert list(data["TIME_PERIOD"].cat.categories) == ["2019", "2020", "2021"]
+        assert data["UNIT_MULTIPLIER"].iloc[1] == "3"
+        assert data["OBS_CONF"].isna().all()
+
+    def test_missing_columns_and_non_numeric_values(self, structure: DataflowStructure) -> None:
+        """Test that absent components become empty columns and bad values become NaN."""
+        body = b"DATAFLOW,REF_AREA,TIME_PERIOD,OBS_VALUE\nUNICEF:DM(1.0),URY,2020,NaN\n"
+
+        data = build_df_from_csv(body, structure)
+
+        assert list(data.columns) == EXPECTED_COLUMNS
+        assert data["INDICATOR"].isna().all()
+        assert np.isnan(data["OBS_VALUE"].iloc[0])
+
+    def test_unexpected_body(self, structure: DataflowStructure) -> None:
+        """Test that a body that is not SDMX-CSV is rejected."""
+        with pytest.raises(ValueError, match="Unexpected SDMX-CSV response"):
+            build_df_from_csv(b"NoResultsFound", structure)
@@ -0,0 +1,157 @@
+import asyncio
+from pathlib import Path
+from typing import Any
+
+import pytest
+from config import config
+from handlers import handle_search_indicators
+from schemas import DataflowStructure, IndicatorEntry
+from search import IndicatorIndex, read_index_file, tokenize, write_index_file
+from server import search_indicators
+from structure import parse_dataflow_structure
+
+ENTRIES = [
+    IndicatorEntry("IMMUNISATION", "IM_MCV1", "Measles-containing vaccine, first dose", ""),
+    IndicatorEntry("IMMUNISATION", "IM_DTP3", "Diphtheria, tetanus and pertussis vaccine", ""),
+    IndicatorEntry("CME", "CME_MRY0T4", "Under-five mortality rate", "Deaths of children"),
+    IndicatorEntry("NUTRITION", "NT_ANT_WHZ_NE2", "Wasting prevalence", "Measles outbreaks"),
+]
+
+
+class TestIndicatorIndex:
+    """Test suite for the indicator search index."""
+
+    def test_tokenize(self) -> None:
+        """Test that terms are lowercased, stemmed and stripped of accents and stopwords."""
+        assert tokenize("Vaccination of the Niños") == ["vaccin", "nino"]
+        assert tokenize("vaccines") == tokenize("Vaccinated") == ["vaccin"]
+
+    def test_ranking(self) -> None:
+        """Test that indicators matching every term in their name rank first."""
+        matches = IndicatorIndex(ENTRIES).search("measles vaccination")
+
+        assert [match.indicator for match in matches] == [
+            "IM_MCV1",
+            "IM_DTP3",
+            "NT_ANT_WHZ_NE2",
+        ]
+        assert matches[0].dataflow_id == "IMMUNISATION"
+        assert matches[0].score > matches[1].score > 0
+
+    @pytest.mark.parametrize(
+        ("query", "expected"),
+        [("mortal", "CME_MRY0T4"), ("measels", "IM_MCV1"), ("cme_mry0t4", "CME_MRY0T4")],
+    )
+    def test_prefix_typo_and_code_matches(self, query: str, expected: str) -> None:
+        """Test that prefixes, single typos and indicator codes match."""
+        matches = IndicatorIndex(ENTRIES).search(query, limit=1)
+
+        assert [match.indicator for match in matches] == [expected]
+
+    def test_no_matches(self) -> None:
+        """Test that queries without known terms return no matches."""
+        assert IndicatorIndex(ENTRIES).search("the of") == []
+        assert IndicatorIndex(ENTRIES).search("xylophone") == []
+
+
+class TestIndexFile:
+    """Test suite for the prebuilt index file."""
+
+    def test_round_trip(self, tmp_path: Path) -> None:
+        """Test that the written indicators are read back."""
+        path = tmp_path / "index.json"
+        write_index_file(path, ENTRIES)
+
+        assert read_index_file(path, max_age_seconds=60) == ENTRIES
+
+    def test_stale_or_missing(self, tmp_path: Path) -> None:
+        """Test that old or missing files are ignored."""
+        path = tmp_path / "index.json"
+        assert read_index_file(path, max_age_seconds=60) is None
+
+        write_index_file(path, ENTRIES)
+        assert read_index_file(path, max_age_seconds=-1) is None
+
+
+class TestSearchIndicators:
+    """Test suite for the search_indicators handler and tool."""
+
+    @pytest.fixture(autouse=True)
+    def fake_structures(
+        self,
+        monkeypatch: pytest.MonkeyPatch,
+        tmp_path: Path,
+        dm_sdmx_json: dict[str, Any],
+    ) -> list[str]:
+        """Index the DM fixture structure for two dataflows, and record the fetched dataflows."""
+        fetched: list[str] = []
+
+        async def fake_get_dataflow_structure(dataflow_id: str) -> DataflowStructure:
+            fetched.append(dataflow_id)
+            return parse_dataflow_structure(dataflow_id, dm_sdmx_json["data"]["structure"])
+
+        monkeypatch.setattr("search.get_dataflow_structure", fake_get_dataflow_structure)
+        monkeypatch.setattr("search.get_curated_dataflow_ids", lambda: ["DM", "DM_PROJECTIONS"])
+        monkeypatch.setattr(config.search, "index_path", str(tmp_path / "index.json"))
+        return fetched
+
+    def test_index_is_built_once(self, fake_structures: list[str]) -> None:
+        """Test that structures are fetched for the first search only."""
+        result = asyncio.run(handle_search_indicators("births"))
+        asyncio.run(handle_search_indicators("deaths"))
+
+        assert [(match.dataflow_id, match.indicator) for match in result.matches] == [
+            ("DM", "DM_BRTS"),
+            ("DM_PROJECTIONS", "DM_BRTS"),
+        ]
+        assert result.errors == []
+        assert sorted(fake_structures) == ["DM", "DM_PROJECTIONS"]
+
+    def test_index_file_is_reused(self, fake_structures: list[str]) -> None:
+        """Test that a saved index file is loaded instead of fetching structures."""
+        write_index_file(Path(config.search.index_path), ENTRIES)
+
+        result = asyncio.run(handle_search_indicators("wasting"))
+
+        assert [match.indicator for match in result.matches] == ["NT_ANT_WHZ_NE2"]
+        assert fake_structures == []
+
+    def test_partial_index(
+        self,
+        monkeypatch: pytest.MonkeyPatch,
+        fake_structures: list[str],
+        dm_sdmx_json: dict[str, Any],
+    ) -> None:
+        """Test that dataflows failing to be indexed are reported, and retried next time."""
+
+        async def flaky_structure(dataflow_id: str) -> DataflowStructure:
+            fetched = fake_structures.count(dataflow_id)
+            fake_structures.append(dataflow_id)
+            if dataflow_id == "DM_PROJECTIONS" and not fetched:
+                msg = "DM_PROJECTIONS unavailable"
+                raise RuntimeError(msg)
+            return parse_dataflow_structure(dataflow_id, dm_sdmx_json["data"]["structure"])
+
+        monkeypatch.setattr("search.get_dataflow_structure", flaky_structure)
+
+        first = asyncio.run(search_indicators("births"))
+
+        assert [match["dataflow_id"] for match in first["matches"]] == ["DM"]
+        assert first["errors"] == ["DM_PROJECTIONS: DM_PROJECTIONS unavailable"]
+        assert not Path(config.search.index_path).exists()
+
+        second = asyncio.run(search_indicators("births"))
+
+        assert len(second["matches"]) == 2  # noqa: PLR2004
+        assert "errors" not in second
+        assert Path(config.search.index_path).exists()
+
+    def test_tool(self) -> None:
+        """Test that the tool returns matches as dictionaries, and reports empty queries."""
+        result = asyncio.run(search_indicators("number of death", limit=1))
+
+        assert len(result["matches"]) == 1
+        assert result["matches"][0]["indicator"] == "DM_DEATHS"
+        assert set(result["matches"][0]) == {"dataflow_id", "indicator", "name", "score"}
+        assert "errors" not in result
+        assert "query is required" in asyncio.run(search_indicators(" "))["error"]
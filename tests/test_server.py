@@ -1,22 +1,65 @@
+import asyncio
+import subprocess
+import sys
+from pathlib import Path
+
 import pytest
+from config import config
+from dataflows import DATAFLOWS_PATH, load_dataflows
 from exceptions import DataWarehouseAPIError
+from schemas import BatchQuery
 from server import (
     get_all_indicators_for_dataflow,
     get_available_dataflows,
     get_data_for_dataflow,
+    get_data_for_dataflows,
+    get_data_page,
 )
 
+# Number of observations in the DM fixture
+DM_FIXTURE_ROWS = 9
+
 
 class TestGetAvailableDataflows:
     """Test suite for get_available_dataflows tool."""
 
     def test_get_available_dataflows_success(self) -> None:
         """Test successful retrieval of available dataflows."""
-        result = get_available_dataflows()
+        result = asyncio.run(get_available_dataflows())
 
         assert result.get("available_dataflows", None) is not None
         assert result.get("input_arguments", None) == {}
 
+    def test_lists_every_curated_dataflow(self) -> None:
+        """Test that the listing has a line per dataflow of dataflows.json."""
+        result = asyncio.run(get_available_dataflows())
+
+        lines = result["available_dataflows"].splitlines()
+        assert [line.split(":")[0] for line in lines] == [
+            f"- {dataflow.id}" for dataflow in load_dataflows(DATAFLOWS_PATH)
+        ]
+
+
+class TestStartup:
+    """Test suite for the cold start of the server."""
+
+    def test_pandas_is_imported_on_first_use(self) -> None:
+        """Test that importing the server doesn't load pandas, only the first data query does."""
+        statement = (
+            "import sys, server; "
+            "assert 'pandas' not in sys.modules and 'handlers' not in sys.modules, "
+            "sorted(name for name in ('pandas', 'handlers') if name in sys.modules)"
+        )
+        result = subprocess.run(  # noqa: S603
+            [sys.executable, "-c", statement],
+            cwd=Path(__file__).parents[1] / "datawarehouse_mcp",
+            capture_output=True,
+            text=True,
+            check=False,
+        )
+
+        assert result.returncode == 0, result.stderr
+
 
 class TestGetAllIndicatorsForDataflow:
     """Test suite for get_all_indicators_for_dataflow tool."""
@@ -43,7 +86,7 @@ class TestGetAllIndicatorsForDataflow:
             ),
         }
 
-        result = get_all_indicators_for_dataflow(dataflow_id)
+        result = asyncio.run(get_all_indicators_for_dataflow(dataflow_id))
 
         assert result.get("all_indicators", None) is not None
         assert result.get("input_arguments", None) == {"dataflow_id": dataflow_id}
@@ -54,7 +97,7 @@ class TestGetAllIndicatorsForDataflow:
         dataflow_id = ""
 
         with pytest.raises(DataWarehouseAPIError):
-            get_all_indicators_for_dataflow(dataflow_id)
+            asyncio.run(get_all_indicators_for_dataflow(dataflow_id))
 
 
 class TestGetDataForDataflow:
@@ -73,7 +116,7 @@ class TestGetDataForDataflow:
             "UnitedNations,DepartmentofEconomicandSocial Affairs, Population Division (2024). "
             "World Population Prospects 2024.PS3https://population.un.org/wpp/NoneNone35.383"
         )
-        result = get_data_for_dataflow(dataflow_id, ref_areas, indicators, year)
+        result = asyncio.run(get_data_for_dataflow(dataflow_id, ref_areas, indicators, year))
         result["data"] = result["data"].replace("\n", "").replace(" ", "")
         assert result == {
             "data": str(expected_result).replace("\n", "").replace(" ", ""),
@@ -82,6 +125,12 @@ class TestGetDataForDataflow:
                 "ref_areas": ref_areas,
                 "indicators": indicators,
                 "year": str(year),
+                "start_year": "",
+                "end_year": "",
+                "last_n_observations": "",
+                "output_format": "table",
+                "columns": "",
+                "max_rows": "",
             },
         }
 
@@ -92,4 +141,149 @@ class TestGetDataForDataflow:
         indicators = "INVALID_IND"
 
         with pytest.raises(DataWarehouseAPIError):
-            get_data_for_dataflow(dataflow_id, ref_areas, indicators)
+            asyncio.run(get_data_for_dataflow(dataflow_id, ref_areas, indicators))
+
+    def test_get_data_output_format_and_columns(
+        self,
+        fake_upstream: list[tuple[str, dict[str, str]]],  # noqa: ARG002
+    ) -> None:
+        """Test that the data is projected and rendered in the requested format."""
+        result = asyncio.run(
+            get_data_for_dataflow(
+                "DM",
+                "URY",
+                "DM_BRTS",
+                start_year=2020,
+                output_format="csv",
+                columns="TIME_PERIOD+OBS_VALUE",
+            )
+        )
+
+        assert result["data"] == "TIME_PERIOD,OBS_VALUE\n2020,35.383\n2021,35.9\n"
+
+    def test_get_data_invalid_output_format(
+        self,
+        fake_upstream: list[tuple[str, dict[str, str]]],
+    ) -> None:
+        """Test that an invalid output format is reported before requesting any data."""
+        result = asyncio.run(get_data_for_dataflow("DM", "URY", "DM_BRTS", output_format="xml"))
+
+        assert "Invalid output_format" in result["error"]
+        assert fake_upstream == []
+
+
+class TestGetDataForDataflows:
+    """Test suite for batches of queries with get_data_for_dataflows."""
+
+    QUERIES = (
+        BatchQuery("DM", "URY", "DM_BRTS", start_year=2020),
+        BatchQuery("DM", "BRA", "DM_BRTS"),
+        BatchQuery("DM_PROJECTIONS", "URY", "DM_DEATHS", start_year=2020),
+    )
+
+    def test_results_per_query(
+        self,
+        fake_upstream: list[tuple[str, dict[str, str]]],  # noqa: ARG002
+    ) -> None:
+        """Test that every query gets its data or its error."""
+        result = asyncio.run(
+            get_data_for_dataflows(
+                list(self.QUERIES), output_format="csv", columns="TIME_PERIOD+OBS_VALUE"
+            )
+        )
+
+        first, missing, last = result["results"]
+        assert first == {
+            "dataflow_id": "DM",
+            "data": "TIME_PERIOD,OBS_VALUE\n2020,35.383\n2021,35.9\n",
+        }
+        assert missing["dataflow_id"] == "DM"
+        assert "NoResultsFound" in missing["error"]
+        assert last["data"].startswith("TIME_PERIOD,OBS_VALUE\n")
+        assert "data" not in result
+
+    def test_combined(self, fake_upstream: list[tuple[str, dict[str, str]]]) -> None:  # noqa: ARG002
+        """Test that the data of every query is returned as a single table."""
+        result = asyncio.run(
+            get_data_for_dataflows(
+                list(self.QUERIES),
+                output_format="csv",
+                columns="DATAFLOW+REF_AREA+TIME_PERIOD+INDICATOR",
+                combine=True,
+            )
+        )
+
+        assert result["data"].splitlines() == [
+            "DATAFLOW,REF_AREA,TIME_PERIOD,INDICATOR",
+            "DM,URY,2020,DM_BRTS",
+            "DM_PROJECTIONS,URY,2020,DM_DEATHS",
+            "DM,URY,2021,DM_BRTS",
+        ]
+        assert [query_result.get("num_rows") for query_result in result["results"]] == [2, None, 1]
+
+    def test_invalid_batch(self) -> None:
+        """Test that invalid batches are reported."""
+        result = asyncio.run(get_data_for_dataflows([]))
+
+        assert "At least one query is required" in result["error"]
+
+
+class TestGetDataPage:
+    """Test suite for paging large results with get_data_page."""
+
+    @pytest.fixture(autouse=True)
+    def small_pages(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Return results in pages of 4 rows."""
+        monkeypatch.setattr(config.results, "page_size", 4)
+
+    def test_pages(self, fake_upstream: list[tuple[str, dict[str, str]]]) -> None:
+        """Test that every row is returned once across pages, with a single upstream request."""
+        first = asyncio.run(
+            get_data_for_dataflow(
+                "DM",
+                "URY+ARG",
+                "DM_BRTS+DM_DEATHS",
+                output_format="csv",
+                columns="REF_AREA+INDICATOR+TIME_PERIOD",
+            )
+        )
+        assert first["num_rows"] == DM_FIXTURE_ROWS
+        assert first["next_offset"] == 4  # noqa: PLR2004
+
+        pages = [first]
+        while "next_offset" in pages[-1]:
+            pages.append(
+                asyncio.run(
+                    get_data_page(
+                        first["result_handle"], pages[-1]["next_offset"], output_format="csv"
+                    )
+                )
+            )
+
+        rows = [row for page in pages for row in page["data"].splitlines()[1:]]
+        assert len(pages) == 3  # noqa: PLR2004
+        assert len(rows) == len(set(rows)) == DM_FIXTURE_ROWS
+        assert len(fake_upstream) == 1
+
+    def test_small_results_have_no_handle(
+        self,
+        fake_upstream: list[tuple[str, dict[str, str]]],  # noqa: ARG002
+    ) -> None:
+        """Test that results that fit in a page are returned whole."""
+        result = asyncio.run(get_data_for_dataflow("DM", "URY", "DM_BRTS"))
+
+        assert "result_handle" not in result
+        assert "num_rows" not in result
+
+    def test_unknown_handle(self) -> None:
+        """Test that unknown or expired handles are reported."""
+        result = asyncio.run(get_data_page("missing", 0))
+
+        assert "Unknown or expired result handle" in result["error"]
+
+    def test_invalid_range(self, fake_upstream: list[tuple[str, dict[str, str]]]) -> None:  # noqa: ARG002
+        """Test that out of range offsets and limits are reported."""
+        first = asyncio.run(get_data_for_dataflow("DM", "URY+ARG", "DM_BRTS+DM_DEATHS"))
+
+        assert "offset must be" in asyncio.run(get_data_page(first["result_handle"], 10))["error"]
+        assert "limit must be" in asyncio.run(get_data_page(first["result_handle"], 0, 0))["error"]
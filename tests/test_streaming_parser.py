@@ -0,0 +1,66 @@
+import json
+from typing import Any
+
+import pandas as pd
+import pytest
+from sdmx_parser import build_df_from_json
+from streaming_parser import SdmxJsonStreamParser
+
+
+def parse(body: bytes, chunk_size: int, max_rows: int | None = None) -> pd.DataFrame:
+    """Feed a body to a streaming parser in chunks of `chunk_size` bytes."""
+    parser = SdmxJsonStreamParser(max_rows=max_rows)
+    for start in range(0, len(body), chunk_size):
+        parser.feed(body[start : start + chunk_size])
+    return parser.close()
+
+
+class TestSdmxJsonStreamParser:
+    """Test suite for the streaming SDMX-JSON parser."""
+
+    @pytest.mark.parametrize("chunk_size", [1, 7, 4096, 1 << 20])
+    def test_same_frame_as_json(self, dm_sdmx_json: dict[str, Any], chunk_size: int) -> None:
+        """Test that any chunking gives the same DataFrame as parsing the whole message."""
+        body = json.dumps(dm_sdmx_json, indent=2, ensure_ascii=False).encode()
+
+        data = parse(body, chunk_size)
+
+        pd.testing.assert_frame_equal(data, build_df_from_json(dm_sdmx_json["data"]))
+
+    def test_multibyte_characters_split_across_chunks(self, dm_sdmx_json: dict[str, Any]) -> None:
+        """Test that UTF-8 characters split between chunks are decoded."""
+        structure = dm_sdmx_json["data"]["structure"]
+        structure["dimensions"]["series"][0]["values"][0]["id"] = "Ñandú"
+        body = json.dumps(dm_sdmx_json, ensure_ascii=False).encode()
+
+        data = parse(body, 3)
+
+        assert "Ñandú" in set(data["REF_AREA"])
+
+    def test_max_rows(self, dm_sdmx_json: dict[str, Any]) -> None:
+        """Test that only the first `max_rows` observations are kept."""
+        body = json.dumps(dm_sdmx_json).encode()
+        expected = build_df_from_json(dm_sdmx_json["data"])
+
+        data = parse(body, 64, max_rows=4)
+
+        pd.testing.assert_frame_equal(data, expected.iloc[:4], check_categorical=False)
+
+    def test_errors(self) -> None:
+        """Test that errors reported by the SDMX API are exposed."""
+        parser = SdmxJsonStreamParser()
+        parser.feed(b'{"errors": [{"code": 500, "message": "Internal Server Error"}]}')
+
+        assert parser.errors == [{"code": 500, "message": "Internal Server Error"}]
+
+    def test_incomplete_body(self, dm_sdmx_json: dict[str, Any]) -> None:
+        """Test that a truncated body is rejected."""
+        body = json.dumps(dm_sdmx_json).encode()
+
+        with pytest.raises(ValueError, match="(Incomplete|Invalid) SDMX-JSON response"):
+            parse(body[: len(body) // 2], 64)
+
+    def test_body_without_structure(self) -> None:
+        """Test that a JSON body that is not an SDMX-JSON message is rejected."""
+        with pytest.raises(ValueError, match="Unexpected SDMX-JSON response"):
+            parse(b'{"data": {"dataSets": []}}', 4)
@@ -0,0 +1,87 @@
+import asyncio
+from typing import Any
+
+import pytest
+from handlers import handle_get_all_indicators_for_dataflow
+from structure import get_dataflow_structure, parse_dataflow_structure
+
+
+class TestParseDataflowStructure:
+    """Test suite for parse_dataflow_structure."""
+
+    def test_parse_dimensions_and_attributes(self, dm_sdmx_json: dict[str, Any]) -> None:
+        """Test that every component group is parsed in order."""
+        structure = parse_dataflow_structure("DM", dm_sdmx_json["data"]["structure"])
+
+        assert [d.id for d in structure.series_dimensions] == [
+            "REF_AREA",
+            "INDICATOR",
+            "RESIDENCE",
+            "SEX",
+            "AGE",
+        ]
+        assert [d.id for d in structure.observation_dimensions] == ["TIME_PERIOD"]
+        assert structure.series_attributes[0].id == "UNIT_MEASURE"
+        assert structure.observation_attributes[0].id == "OBS_STATUS"
+
+    def test_get_dimension_by_id(self, dm_sdmx_json: dict[str, Any]) -> None:
+        """Test that dimensions are resolved by ID and not by key position."""
+        json_structure = dm_sdmx_json["data"]["structure"]
+        json_structure["dimensions"]["series"].reverse()
+        structure = parse_dataflow_structure("DM", json_structure)
+
+        indicator = structure.get_dimension("INDICATOR")
+
+        assert [code.id for code in indicator.codes] == ["DM_BRTS", "DM_DEATHS"]
+
+    def test_get_missing_dimension(self, dm_sdmx_json: dict[str, Any]) -> None:
+        """Test that an unknown dimension raises a KeyError."""
+        structure = parse_dataflow_structure("DM", dm_sdmx_json["data"]["structure"])
+
+        with pytest.raises(KeyError):
+            structure.get_dimension("UNKNOWN")
+
+
+class TestGetDataflowStructure:
+    """Test suite for the structure-only indicator discovery."""
+
+    def test_structure_is_fetched_once(
+        self,
+        monkeypatch: pytest.MonkeyPatch,
+        dm_sdmx_json: dict[str, Any],
+    ) -> None:
+        """Test that the structure is requested without data and then kept in memory."""
+        requested_params: list[dict[str, str] | None] = []
+
+        async def fake_get_json(path: str, params: dict[str, str] | None = None) -> dict[str, Any]:
+            requested_params.append(params)
+            return dm_sdmx_json
+
+        monkeypatch.setattr("structure.get_json", fake_get_json)
+
+        async def get_twice() -> tuple[object, object]:
+            return await get_dataflow_structure("DM"), await get_dataflow_structure("DM")
+
+        first, second = asyncio.run(get_twice())
+
+        assert first is second
+        assert len(requested_params) == 1
+        assert requested_params[0] is not None
+        assert requested_params[0]["detail"] == "serieskeysonly"
+
+    def test_indicators_from_structure(
+        self,
+        monkeypatch: pytest.MonkeyPatch,
+        dm_sdmx_json: dict[str, Any],
+    ) -> None:
+        """Test that the indicators handler reads the INDICATOR codelist."""
+
+        async def fake_get_json(path: str, params: dict[str, str] | None = None) -> dict[str, Any]:
+            return dm_sdmx_json
+
+        monkeypatch.setattr("structure.get_json", fake_get_json)
+
+        assert asyncio.run(handle_get_all_indicators_for_dataflow("DM")) == {
+            "DM_BRTS": "Number of births",
+            "DM_DEATHS": "Number of deaths",
+        }
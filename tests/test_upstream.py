@@ -0,0 +1,250 @@
+import asyncio
+import time
+from collections.abc import Callable, Iterator
+
+import httpx
+import pytest
+from exceptions import UpstreamUnavailableError
+from metrics import UPSTREAM_EVENTS, clear_metrics
+from schemas import UpstreamConfig
+from upstream import CircuitBreaker, LatencyTracker, UpstreamPolicy, endpoint_of
+
+from benchmarks.stub_server import Fault, StubSdmxServer
+
+BASE_URL = "https://sdmx.example.org/rest/"
+# Fast enough for tests, with hedging and adaptive timeouts from the 5th response on
+TEST_CONFIG = UpstreamConfig(
+    min_timeout_seconds=0.2,
+    max_timeout_seconds=5,
+    min_samples=5,
+    min_hedge_delay_seconds=0.05,
+    retry_base_delay_seconds=0.001,
+    retry_max_delay_seconds=0.01,
+    failure_threshold=3,
+)
+
+
+@pytest.fixture(autouse=True)
+def _clear_metrics() -> Iterator[None]:
+    clear_metrics()
+    yield
+    clear_metrics()
+
+
+def send(
+    policy: UpstreamPolicy,
+    handler: Callable[[httpx.Request], httpx.Response],
+    num_requests: int = 1,
+) -> list[httpx.Response | Exception]:
+    """Send GETs of `data/DM` one after the other with the policy, to a mock SDMX API."""
+
+    async def run() -> list[httpx.Response | Exception]:
+        results: list[httpx.Response | Exception] = []
+        async with httpx.AsyncClient(
+            base_url=BASE_URL, transport=httpx.MockTransport(handler)
+        ) as client:
+            for _ in range(num_requests):
+                try:
+                    response = await policy.send(client, client.build_request("GET", "data/DM/."))
+                    await response.aclose()
+                    results.append(response)
+                except UpstreamUnavailableError as e:
+                    results.append(e)
+        return results
+
+    return asyncio.run(run())
+
+
+def test_latency_percentiles() -> None:
+    """Test that percentiles are nearest-rank latencies of the window."""
+    tracker = LatencyTracker(window=100)
+    for latency in range(1, 201):
+        tracker.observe(latency / 100)
+
+    assert len(tracker) == 100  # noqa: PLR2004
+    assert tracker.percentile(50) == 1.5  # noqa: PLR2004
+    assert tracker.percentile(99) == 1.99  # noqa: PLR2004
+
+
+def test_endpoint_of() -> None:
+    """Test that endpoints are the first two segments of the path below the base URL."""
+    url = httpx.URL(BASE_URL).join("data/DM/URY.DM_BRTS?format=csv")
+
+    assert endpoint_of(httpx.URL(BASE_URL), url) == "data/DM"
+
+
+class TestCircuitBreaker:
+    """Test suite for the circuit breaker."""
+
+    def test_opens_after_consecutive_failures(self) -> None:
+        """Test that the breaker opens at the threshold and a success resets the count."""
+        now = [0.0]
+        breaker = CircuitBreaker(failure_threshold=2, open_seconds=10, clock=lambda: now[0])
+
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        assert breaker.state == "closed"
+        breaker.record_failure()
+
+        assert breaker.state == "open"
+        assert not breaker.allow_request()
+
+    def test_single_probe_when_half_open(self) -> None:
+        """Test that a single request probes the SDMX API, closing the breaker on success."""
+        now = [0.0]
+        breaker = CircuitBreaker(failure_threshold=1, open_seconds=10, clock=lambda: now[0])
+        breaker.record_failure()
+        now[0] = 10
+
+        assert breaker.state == "half_open"
+        assert breaker.allow_request()
+        assert not breaker.allow_request()
+        breaker.record_success()
+        assert breaker.state == "closed"
+
+    def test_failed_probe_opens_again(self) -> None:
+        """Test that a failed probe opens the breaker for another `open_seconds`."""
+        now = [0.0]
+        breaker = CircuitBreaker(failure_threshold=1, open_seconds=10, clock=lambda: now[0])
+        breaker.record_failure()
+        now[0] = 10
+        breaker.allow_request()
+        breaker.record_failure()
+
+        assert breaker.state == "open"
+        now[0] = 19
+        assert not breaker.allow_request()
+        now[0] = 20
+        assert breaker.allow_request()
+
+
+class TestUpstreamPolicy:
+    """Test suite for timeouts, hedging and retries of SDMX requests."""
+
+    def test_failures_are_retried(self) -> None:
+        """Test that 503 responses and connection errors are retried until a response."""
+        attempts: list[int] = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            attempts.append(1)
+            if len(attempts) == 1:
+                return httpx.Response(503)
+            if len(attempts) == 2:  # noqa: PLR2004
+                msg = "Connection refused"
+                raise httpx.ConnectError(msg, request=request)
+            return httpx.Response(200)
+
+        (response,) = send(UpstreamPolicy(TEST_CONFIG), handler)
+
+        assert isinstance(response, httpx.Response)
+        assert response.status_code == 200  # noqa: PLR2004
+        assert len(attempts) == 3  # noqa: PLR2004
+        assert UPSTREAM_EVENTS.value(event="retry") == 2  # noqa: PLR2004
+
+    def test_no_data_is_not_retried(self) -> None:
+        """Test that a 404 is returned right away, as the SDMX API answered."""
+        attempts: list[int] = []
+
+        def handler(_: httpx.Request) -> httpx.Response:
+            attempts.append(1)
+            return httpx.Response(404)
+
+        (response,) = send(UpstreamPolicy(TEST_CONFIG), handler)
+
+        assert isinstance(response, httpx.Response)
+        assert response.status_code == 404  # noqa: PLR2004
+        assert len(attempts) == 1
+
+    def test_circuit_breaker_fails_fast(self) -> None:
+        """Test that requests are rejected without being sent once the breaker is open."""
+        attempts: list[int] = []
+
+        def handler(_: httpx.Request) -> httpx.Response:
+            attempts.append(1)
+            return httpx.Response(502)
+
+        first, second = send(UpstreamPolicy(TEST_CONFIG), handler, num_requests=2)
+
+        assert isinstance(first, UpstreamUnavailableError)
+        assert "HTTP 502" in str(first)
+        assert isinstance(second, UpstreamUnavailableError)
+        # max_retries + 1 attempts, the last of which opened the breaker
+        assert len(attempts) == 3  # noqa: PLR2004
+        assert UPSTREAM_EVENTS.value(event="rejected") == 1
+
+    def test_timeout_adapts_to_latencies(self) -> None:
+        """Test that the timeout follows the observed latencies, within the bounds."""
+        policy = UpstreamPolicy(TEST_CONFIG)
+
+        def handler(_: httpx.Request) -> httpx.Response:
+            return httpx.Response(200)
+
+        assert policy.timeout("data/DM") == TEST_CONFIG.max_timeout_seconds
+        send(policy, handler, num_requests=TEST_CONFIG.min_samples)
+
+        assert policy.timeout("data/DM") == TEST_CONFIG.min_timeout_seconds
+        assert policy.timeout("data/CME") == TEST_CONFIG.max_timeout_seconds
+
+
+class TestFaultInjection:
+    """Test suite for the policy against the SDMX API stub with injected faults."""
+
+    def send_to_stub(
+        self, faults: Callable[[int], Fault | None], num_requests: int
+    ) -> tuple[list[float], int]:
+        """Send GETs one after the other to a stub, returning their durations and the requests."""
+        policy = UpstreamPolicy(TEST_CONFIG)
+
+        async def run(base_url: str) -> list[float]:
+            durations: list[float] = []
+            async with httpx.AsyncClient(base_url=base_url) as client:
+                for _ in range(num_requests):
+                    start = time.perf_counter()
+                    response = await policy.send(client, client.build_request("GET", "data/DM/."))
+                    await response.aread()
+                    await response.aclose()
+                    durations.append(time.perf_counter() - start)
+            return durations
+
+        with StubSdmxServer({"DM": b"{}"}, faults=faults) as stub:
+            durations = asyncio.run(run(stub.base_url))
+            return durations, stub.num_requests
+
+    def test_slow_request_is_hedged(self) -> None:
+        """Test that a request slower than usual is sent again and the fast copy wins."""
+        slow_request = TEST_CONFIG.min_samples + 1
+
+        durations, num_requests = self.send_to_stub(
+            lambda n: Fault(delay_seconds=2) if n == slow_request else None,
+            num_requests=slow_request,
+        )
+
+        assert durations[-1] < 1
+        assert num_requests == slow_request + 1
+        assert UPSTREAM_EVENTS.value(event="hedge_won") == 1
+
+    def test_hanging_request_times_out_and_is_retried(self) -> None:
+        """Test that a request hanging past the adaptive timeout is retried."""
+        hanging_request = TEST_CONFIG.min_samples + 1
+
+        durations, num_requests = self.send_to_stub(
+            lambda n: Fault(delay_seconds=3)
+            if n in (hanging_request, hanging_request + 1)
+            else None,
+            num_requests=hanging_request,
+        )
+
+        # Timed out at min_timeout_seconds, after the hedge was sent, then retried
+        assert TEST_CONFIG.min_timeout_seconds <= durations[-1] < 1
+        assert num_requests == hanging_request + 2
+        assert UPSTREAM_EVENTS.value(event="timeout") == 1
+
+    def test_dropped_connections_are_retried(self) -> None:
+        """Test that connections closed without a response are retried."""
+        durations, num_requests = self.send_to_stub(
+            lambda n: Fault(drop=True) if n == 1 else None, num_requests=1
+        )
+
+        assert len(durations) == 1
+        assert num_requests == 2  # noqa: PLR2004
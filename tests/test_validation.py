@@ -0,0 +1,107 @@
+import asyncio
+from typing import Any
+
+import pytest
+from exceptions import DataWarehouseAPIError
+from handlers import handle_get_data_for_dataflow
+from schemas import DataflowStructure, DataQuery
+from structure import parse_dataflow_structure
+from validation import suggest_codes, validate_query_codes
+
+
+@pytest.fixture
+def structure(dm_sdmx_json: dict[str, Any]) -> DataflowStructure:
+    """Structure of the DM fixture: ref areas URY and ARG, indicators DM_BRTS and DM_DEATHS."""
+    return parse_dataflow_structure("DM", dm_sdmx_json["data"]["structure"])
+
+
+def make_query(ref_areas: tuple[str, ...], indicators: tuple[str, ...]) -> DataQuery:
+    """Query of the DM dataflow."""
+    return DataQuery(dataflow_id="DM", ref_areas=ref_areas, indicators=indicators)
+
+
+class TestValidateQueryCodes:
+    """Test suite for validating the codes of queries against a structure."""
+
+    def test_known_codes(self, structure: DataflowStructure) -> None:
+        """Test that known codes are kept and normalized to the case of the structure."""
+        query, messages = validate_query_codes(make_query(("ury", "ARG"), ()), structure)
+
+        assert query == make_query(("ARG", "URY"), ())
+        assert messages == []
+
+    def test_unknown_codes_are_left_out(self, structure: DataflowStructure) -> None:
+        """Test that unknown codes are dropped with suggestions if other codes are known."""
+        query, messages = validate_query_codes(make_query(("URY", "URU"), ("DM_BRTS",)), structure)
+
+        assert query == make_query(("URY",), ("DM_BRTS",))
+        assert messages == ["Unknown ref areas for dataflow DM left out: URU (did you mean URY?)"]
+
+    def test_no_known_code_is_rejected(self, structure: DataflowStructure) -> None:
+        """Test that a query without any known code of a dimension is rejected."""
+        with pytest.raises(DataWarehouseAPIError, match=r"DM_BRT \(did you mean DM_BRTS\?\)"):
+            validate_query_codes(make_query(("URY",), ("DM_BRT",)), structure)
+
+    def test_suggestions_by_name(self, structure: DataflowStructure) -> None:
+        """Test that codes whose name contains the unknown code are suggested first."""
+        assert suggest_codes("argentina", structure, "REF_AREA") == ["ARG"]
+        assert suggest_codes("deaths", structure, "INDICATOR") == ["DM_DEATHS"]
+        assert suggest_codes("XYZ", structure, "REF_AREA") == []
+
+
+class TestGetDataValidation:
+    """Test suite for validating data queries before any request."""
+
+    @pytest.fixture
+    def cached_structure(
+        self, monkeypatch: pytest.MonkeyPatch, structure: DataflowStructure
+    ) -> DataflowStructure:
+        """Serve the DM structure as the cached one."""
+        monkeypatch.setattr("handlers.get_cached_dataflow_structure", lambda _: structure)
+        return structure
+
+    def test_unknown_codes_are_not_requested(
+        self,
+        fake_upstream: list[tuple[str, dict[str, str]]],
+        cached_structure: DataflowStructure,  # noqa: ARG002
+    ) -> None:
+        """Test that unknown codes are left out of the request and reported in the errors."""
+        result = asyncio.run(handle_get_data_for_dataflow("DM", "ury+XXX", "DM_BRTS"))
+
+        assert fake_upstream == [("data/DM/URY.DM_BRTS", {"format": "sdmx-json"})]
+        assert result.errors == ["Unknown ref areas for dataflow DM left out: XXX"]
+        assert set(result.data["REF_AREA"]) == {"URY"}
+
+    def test_invalid_query_is_rejected_without_request(
+        self,
+        fake_upstream: list[tuple[str, dict[str, str]]],
+        cached_structure: DataflowStructure,  # noqa: ARG002
+    ) -> None:
+        """Test that a query without any known ref area fails without contacting the SDMX API."""
+        with pytest.raises(DataWarehouseAPIError, match="Unknown ref areas"):
+            asyncio.run(handle_get_data_for_dataflow("DM", "Uruguay", "DM_BRTS"))
+
+        assert fake_upstream == []
+
+    def test_structure_is_prefetched(
+        self,
+        monkeypatch: pytest.MonkeyPatch,
+        fake_upstream: list[tuple[str, dict[str, str]]],
+    ) -> None:
+        """Test that a query of a dataflow without cached structure is sent as is."""
+        prefetched: list[str] = []
+
+        async def get_dataflow_structure(dataflow_id: str) -> None:
+            prefetched.append(dataflow_id)
+
+        monkeypatch.setattr("handlers.get_dataflow_structure", get_dataflow_structure)
+        monkeypatch.setattr("handlers.get_cached_dataflow_structure", lambda _: None)
+
+        async def get_data() -> None:
+            await handle_get_data_for_dataflow("DM", "URY+XXX", "DM_BRTS")
+            await asyncio.sleep(0)
+
+        asyncio.run(get_data())
+
+        assert fake_upstream == [("data/DM/URY+XXX.DM_BRTS", {"format": "sdmx-json"})]
+        assert prefetched == ["DM"]